@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+GROUPE YAMA+ - Sales rollup backfill
+Rebuilds the sales_daily collection from the full order history.
+Usage: python backfill_sales_daily.py
+"""
+
+import asyncio
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from services.sales_rollup import rebuild_sales_daily
+
+load_dotenv(Path(__file__).parent / '.env')
+
+# Configuration
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'yama_marketplace')
+
+async def backfill():
+    """Recompute sales_daily from orders"""
+    print(f"Connecting to MongoDB: {MONGO_URL}")
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+    
+    orders = await db.orders.count_documents({})
+    print(f"Rebuilding sales_daily from {orders} orders...")
+    
+    state = await rebuild_sales_daily(db)
+    
+    print(f"\n✅ sales_daily rebuilt: {state['rows']} rows ({state['backfilled_at']})")
+    
+    client.close()
+
+if __name__ == '__main__':
+    asyncio.run(backfill())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+GROUPE YAMA+ - Login storm benchmark
+Measures storefront latency in one event loop while a burst of logins is
+being processed, with bcrypt run inline (the former behaviour of the auth
+endpoints) and through PasswordHasher. Storefront requests are simulated
+as a short awaited I/O plus a little CPU, arriving at a fixed rate, so
+their latency is dominated by how long the loop is unavailable. No
+database is needed.
+Usage: python bench_auth_hashing.py [--logins N] [--rounds N] [--rate N]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import bcrypt
+
+from services.password_hashing import PasswordHasher, HashPoolBusy
+
+
+async def storefront_request():
+    await asyncio.sleep(0.002)  # Mongo round trip
+    sum(range(2000))  # serialising the response
+
+
+async def inline_login(hashed: bytes):
+    bcrypt.checkpw(b"motdepasse", hashed)  # what verify_password used to do
+    await asyncio.sleep(0)
+
+
+async def run_scenario(name: str, login, logins: int, rate: int, duration: float):
+    latencies = []
+    rejected = []
+
+    async def timed_request(arrival: float):
+        await storefront_request()
+        latencies.append((time.perf_counter() - arrival) * 1000)
+
+    async def attempt():
+        try:
+            await login()
+        except HashPoolBusy:
+            rejected.append(1)  # a 429 for that client
+
+    async def storm():
+        await asyncio.sleep(duration / 4)
+        if login is not None:
+            await asyncio.gather(*(attempt() for _ in range(logins)))
+
+    storm_task = asyncio.ensure_future(storm())
+    requests = []
+    started = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - started < duration or not storm_task.done():
+        # arrivals follow the wall clock: requests that came in while the loop
+        # was stalled are timed from when they arrived, as clients see them
+        due = int((time.perf_counter() - started) * rate)
+        for number in range(sent, due):
+            requests.append(asyncio.ensure_future(timed_request(started + number / rate)))
+        sent = max(sent, due)
+        await asyncio.sleep(1 / rate)
+    await asyncio.gather(*requests, storm_task)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:<28}{len(latencies):>9}{statistics.median(latencies):>10.1f}ms{p99:>10.1f}ms"
+          f"{latencies[-1]:>10.1f}ms{elapsed:>9.1f}s{len(rejected):>10}")
+
+
+async def bench(logins: int, rounds: int, rate: int):
+    hasher = PasswordHasher(rounds=rounds)
+    hashed = bcrypt.hashpw(b"motdepasse", bcrypt.gensalt(rounds))
+    started = time.perf_counter()
+    bcrypt.checkpw(b"motdepasse", hashed)
+    print(f"One bcrypt check at cost {rounds}: {(time.perf_counter() - started) * 1000:.0f} ms, "
+          f"{logins} logins per storm, storefront at {rate} req/s, hash pool of {hasher.workers} threads\n")
+    duration = max(1.0, logins * (time.perf_counter() - started) / hasher.workers)
+
+    print(f"{'scenario':<28}{'requests':>9}{'p50':>12}{'p99':>12}{'max':>12}{'wall':>10}{'429s':>10}")
+    await run_scenario("no logins", None, logins, rate, duration)
+    await run_scenario("login storm, inline bcrypt", lambda: inline_login(hashed), logins, rate, duration)
+    await run_scenario("login storm, hash pool", lambda: hasher.verify("motdepasse", hashed.decode()), logins, rate, duration)
+    hasher.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Storefront latency during a login storm")
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--rate", type=int, default=200, help="storefront requests per second")
+    args = parser.parse_args()
+    asyncio.run(bench(args.logins, args.rounds, args.rate))
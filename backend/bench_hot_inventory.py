@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+GROUPE YAMA+ - Flash sale hot SKU benchmark
+Fires concurrent checkouts at one flash-sale SKU against a real MongoDB,
+taking its stock on the product document (StockReservations alone) and from
+the hot inventory counter (in-process, or Redis with --redis). Reports
+attempts per second, orders accepted and the stock left once reconciled.
+Runs in a throwaway database, dropped afterwards.
+Usage: MONGO_URL=mongodb://localhost:27017 python bench_hot_inventory.py [--checkouts N] [--stock N] [--redis URL]
+"""
+
+import os
+import uuid
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timezone, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from services.cache import FakeSharedStore, RedisStore
+from services.hot_inventory import HotInventory, HotSkuBusy
+from services.stock_reservation import StockReservations, InsufficientStock
+
+
+def order_doc() -> dict:
+    return {"order_id": f"BENCH-{uuid.uuid4().hex[:10]}", "items": [{"product_id": "hot", "quantity": 1}]}
+
+
+async def run_scenario(name: str, db, checkout, checkouts: int, stock: int, inventory=None):
+    await db.products.delete_many({})
+    await db.orders.delete_many({})
+    await db.products.insert_one({
+        "product_id": "hot", "stock": stock, "is_flash_sale": True,
+        "flash_sale_end": (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+    })
+    if inventory is not None:
+        await inventory.refresh()
+    latencies = []
+    outcomes = {"accepted": 0, "sold_out": 0, "busy": 0}
+
+    async def timed():
+        start = time.perf_counter()
+        try:
+            await checkout(order_doc())
+            outcomes["accepted"] += 1
+        except InsufficientStock:
+            outcomes["sold_out"] += 1
+        except HotSkuBusy:
+            outcomes["busy"] += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed() for _ in range(checkouts)))
+    elapsed = time.perf_counter() - started
+    if inventory is not None:
+        await inventory.refresh()
+
+    product = await db.products.find_one({"product_id": "hot"})
+    latencies.sort()
+    print(f"\n{name}")
+    print(f"  attempts/s        {checkouts / elapsed:.0f}")
+    print(f"  outcomes          {outcomes}")
+    print(f"  orders stored     {await db.orders.count_documents({})}, stock left {product['stock']} (started at {stock})")
+    print(f"  latency p50/p99   {statistics.median(latencies):.1f} / {latencies[int(len(latencies) * 0.99) - 1]:.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkouts", type=int, default=5000)
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--redis", help="Redis URL for the counters (default: in-process)")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), maxPoolSize=100)
+    db_name = f"yama_bench_{uuid.uuid4().hex[:8]}"
+    db = client[db_name]
+    store = RedisStore(args.redis) if args.redis else FakeSharedStore()
+    try:
+        await db.products.create_index("product_id", unique=True)
+        await db.orders.create_index("order_id", unique=True)
+        reservations = StockReservations(client, db)
+        await reservations.detect_transactions()
+
+        await run_scenario("Product document (StockReservations)", db,
+                           reservations.place_order, args.checkouts, args.stock)
+
+        inventory = HotInventory(store, db, namespace=f"{db_name}:hot")
+
+        async def hot_checkout(order):
+            taken = await inventory.admit({"hot": 1})
+            try:
+                await reservations.place_order(order, skip=taken)
+            except BaseException:
+                await inventory.release(taken)
+                raise
+            await inventory.confirm(taken)
+
+        await run_scenario(f"Hot inventory counter ({type(store).__name__})", db,
+                           hot_checkout, args.checkouts, args.stock, inventory)
+    finally:
+        await store.close()
+        await client.drop_database(db_name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+GROUPE YAMA+ - Product search benchmark
+Builds a synthetic catalog (50 000 products by default), indexes it with
+ProductSearchIndex and times typical storefront queries against the former
+behaviour: an unanchored case-insensitive regex over name and description
+on every product (what the $regex filter made Mongo do as a collection
+scan). No database is needed.
+Usage: python bench_product_search.py [--products N] [--repeat N] [--seed N]
+"""
+
+import argparse
+import asyncio
+import random
+import re
+import statistics
+import time
+
+from services.product_search import ProductSearchIndex
+
+CATEGORIES = ["electromenager", "mode", "beaute", "maison", "informatique", "telephonie", "sport", "enfants"]
+BRANDS = ["Samsung", "LG", "Yama", "Hisense", "Tecno", "Infinix", "Nike", "Adidas", "Philips", "Moulinex", None]
+NOUNS = [
+    "Réfrigérateur", "Congélateur", "Climatiseur", "Ventilateur", "Téléviseur", "Smartphone", "Ordinateur",
+    "Robe", "Boubou", "Chemise", "Pantalon", "Sac", "Chaussures", "Montre", "Parfum", "Crème", "Mixeur",
+    "Micro-ondes", "Bouilloire", "Fer à repasser", "Matelas", "Canapé", "Tapis", "Casque", "Enceinte",
+]
+ADJECTIVES = [
+    "wax", "silencieux", "inverter", "élégant", "léger", "cuir", "coton", "bazin", "noir", "blanc",
+    "doré", "rechargeable", "sans fil", "grand modèle", "compact", "premium", "économique", "brodé",
+]
+FILLER = (
+    "Livraison rapide à Dakar. Garantie un an. Qualité supérieure, idéal pour la maison ou le bureau. "
+    "Produit authentique, satisfait ou remboursé, paiement Wave et Orange Money accepté."
+).split()
+
+QUERIES = [
+    "refrigerateur",          # accents folded
+    "robe wax",               # two words
+    "climatiseur inverter",
+    "sams",                   # typeahead prefix
+    "telephone",
+    "fer a repasser",
+    "chaussures nike noir",
+    "electromenager",         # category word
+    "xyzzy",                  # no match
+]
+
+
+def synthetic_catalog(count: int, rng: random.Random) -> list:
+    products = []
+    for index in range(count):
+        noun = rng.choice(NOUNS)
+        brand = rng.choice(BRANDS)
+        name = " ".join(filter(None, [noun, rng.choice(ADJECTIVES), brand, f"{rng.randint(1, 900)}"]))
+        words = rng.sample(FILLER, 18) + [noun.lower(), rng.choice(ADJECTIVES)]
+        rng.shuffle(words)
+        products.append({
+            "product_id": f"prod_{index:06d}",
+            "name": name,
+            "brand": brand,
+            "category": rng.choice(CATEGORIES),
+            "short_description": f"{noun} {rng.choice(ADJECTIVES)}",
+            "description": " ".join(words),
+            "stock": rng.randint(0, 50),
+            "featured": rng.random() < 0.05,
+        })
+    return products
+
+
+def regex_scan(products: list, search: str, limit: int = 50) -> list:
+    """The old filter: {"$or": [{"name": {"$regex": q, "$options": "i"}}, {"description": ...}]}"""
+    pattern = re.compile(search, re.IGNORECASE)
+    matched = [p["product_id"] for p in products if pattern.search(p["name"]) or pattern.search(p["description"])]
+    return matched[:limit]
+
+
+def timed(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples, result
+
+
+class CatalogDB:
+    """Just enough of the Motor API for ProductSearchIndex.build()"""
+
+    class _Cursor:
+        def __init__(self, docs):
+            self.docs = docs
+
+        async def to_list(self, length):
+            return self.docs
+
+    class _Collection:
+        def __init__(self, docs):
+            self.docs = docs
+
+        def find(self, query, projection=None):
+            return CatalogDB._Cursor(self.docs)
+
+        def aggregate(self, pipeline):
+            return CatalogDB._Cursor(self.docs)
+
+    def __init__(self, products: list, sales: list):
+        self.products = self._Collection(products)
+        self.sales_daily = self._Collection(sales)
+
+
+async def bench(count: int, repeat: int, seed: int):
+    rng = random.Random(seed)
+    products = synthetic_catalog(count, rng)
+    sales = [{"_id": p["product_id"], "quantity": rng.randint(1, 200)} for p in rng.sample(products, count // 10)]
+    print(f"Synthetic catalog: {len(products)} products, {len(sales)} with sales")
+
+    index = ProductSearchIndex()
+    started = time.perf_counter()
+    await index.build(CatalogDB(products, sales))
+    print(f"Index build: {(time.perf_counter() - started) * 1000:.0f} ms "
+          f"({index.stats()['terms']} terms)\n")
+
+    print(f"{'query':<24}{'index p50':>11}{'index p95':>11}{'hits':>8}{'regex p50':>11}{'regex hits':>12}")
+    index_medians, regex_medians = [], []
+    for query in QUERIES:
+        samples, (page, total) = timed(lambda: index.search(query, limit=50), repeat)
+        regex_samples, regex_hits = timed(lambda: regex_scan(products, re.escape(query)), max(1, repeat // 10))
+        p50 = statistics.median(samples)
+        p95 = sorted(samples)[int(len(samples) * 0.95) - 1] if len(samples) > 1 else samples[0]
+        index_medians.append(p50)
+        regex_medians.append(statistics.median(regex_samples))
+        print(f"{query:<24}{p50:>9.2f}ms{p95:>9.2f}ms{total:>8}{regex_medians[-1]:>9.1f}ms{len(regex_hits):>12}")
+
+    print(f"\nMedian over queries: index {statistics.median(index_medians):.2f} ms, "
+          f"regex scan {statistics.median(regex_medians):.1f} ms")
+    print("Regex hits are capped at 50 and miss accent/plural variants (e.g. 'refrigerateur').")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the in-memory product search index")
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(bench(args.products, args.repeat, args.seed))
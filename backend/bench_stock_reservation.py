@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+GROUPE YAMA+ - Flash sale checkout benchmark
+Fires concurrent checkouts at one hot SKU (plus a second, well stocked
+product in every order) against a real MongoDB, with the former stock update
+of create_order (one unconditional $inc per item, then the order insert) and
+with StockReservations. Reports orders accepted, units oversold and checkout
+latency. Runs in a throwaway database, dropped afterwards.
+Usage: MONGO_URL=mongodb://localhost:27017 python bench_stock_reservation.py [--checkouts N] [--stock N]
+"""
+
+import os
+import uuid
+import argparse
+import asyncio
+import statistics
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from services.stock_reservation import StockReservations, InsufficientStock
+
+
+def order_doc(n: int) -> dict:
+    return {
+        "order_id": f"BENCH-{n}-{uuid.uuid4().hex[:6]}",
+        "items": [{"product_id": "hot", "quantity": 1}, {"product_id": "side", "quantity": 1}],
+        "payment_status": "pending"
+    }
+
+
+async def legacy_checkout(db, order: dict):
+    """What create_order used to do"""
+    for item in order["items"]:
+        await db.products.update_one({"product_id": item["product_id"]}, {"$inc": {"stock": -item["quantity"]}})
+    await db.orders.insert_one(order)
+
+
+async def run_scenario(name: str, db, checkout, checkouts: int, stock: int):
+    await db.products.delete_many({})
+    await db.orders.delete_many({})
+    await db.products.insert_many([
+        {"product_id": "hot", "stock": stock},
+        {"product_id": "side", "stock": checkouts * 10}
+    ])
+    latencies = []
+    rejected = 0
+
+    async def timed(n: int):
+        nonlocal rejected
+        start = time.perf_counter()
+        try:
+            await checkout(order_doc(n))
+        except InsufficientStock:
+            rejected += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(n) for n in range(checkouts)))
+    elapsed = time.perf_counter() - started
+
+    accepted = await db.orders.count_documents({})
+    hot = await db.products.find_one({"product_id": "hot"})
+    side = await db.products.find_one({"product_id": "side"})
+    latencies.sort()
+    print(f"\n{name}")
+    print(f"  orders accepted   {accepted} / {checkouts} (stock {stock}, {rejected} rejected)")
+    print(f"  hot SKU stock     {hot['stock']}  -> oversold {max(0, -hot['stock'])}")
+    print(f"  side stock drift  {checkouts * 10 - accepted - side['stock']}")
+    print(f"  latency p50/p99   {statistics.median(latencies):.1f} / {latencies[int(len(latencies) * 0.99) - 1]:.1f} ms")
+    print(f"  throughput        {checkouts / elapsed:.0f} checkouts/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkouts", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=100)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), maxPoolSize=100)
+    db_name = f"yama_bench_{uuid.uuid4().hex[:8]}"
+    db = client[db_name]
+    try:
+        await db.products.create_index("product_id", unique=True)
+        await db.orders.create_index("order_id", unique=True)
+
+        await run_scenario("Per-item $inc (former create_order)", db,
+                           lambda order: legacy_checkout(db, order), args.checkouts, args.stock)
+
+        reservations = StockReservations(client, db)
+        await reservations.detect_transactions()
+        mode = "transaction" if reservations.transactions else "compensation"
+        await run_scenario(f"StockReservations ({mode})", db,
+                           reservations.place_order, args.checkouts, args.stock)
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
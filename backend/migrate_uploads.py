@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+GROUPE YAMA+ - Upload storage migration
+Moves files behind legacy /api/uploads/... URLs (uuid names, reviews/) into
+the content-addressed store configured by UPLOAD_STORAGE (local or s3),
+rewrites the references (products, orders, reviews, providers, gift boxes,
+blog, partners, campaigns) and recounts references. Legacy files are left
+in place.
+Usage: python migrate_uploads.py [--dry-run] [--prune] [--grace-days N]
+"""
+
+import argparse
+import asyncio
+import os
+from datetime import timedelta
+from pathlib import Path
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+load_dotenv(Path(__file__).parent / '.env')
+
+from services.upload_storage import (
+    UploadStore, create_storage_backend, migrate_legacy_uploads, STORE_COLLECTION, STORE_INDEXES
+)
+
+# Configuration
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'yama_marketplace')
+UPLOADS_DIR = Path(__file__).parent / "uploads"
+
+async def migrate(dry_run: bool, prune: bool, grace_days: int):
+    """Migrate legacy uploads, then optionally prune unreferenced blobs"""
+    print(f"Connecting to MongoDB: {MONGO_URL}")
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+    
+    for keys, options in STORE_INDEXES:
+        await db[STORE_COLLECTION].create_index(keys, **options)
+    
+    store = UploadStore(db, create_storage_backend(UPLOADS_DIR))
+    print(f"Storage backend: {store.backend.name}{' (dry run)' if dry_run else ''}")
+    
+    stats = await migrate_legacy_uploads(db, store, UPLOADS_DIR, dry_run=dry_run)
+    print(f"\n✅ {stats['documents']} document(s) referencing {stats['files']} legacy file(s)")
+    print(f"   {stats['stored']} stored, {stats['deduplicated']} already in the store")
+    if stats["missing"]:
+        print(f"⚠️  {len(stats['missing'])} referenced file(s) missing on disk (references kept):")
+        for name in stats["missing"][:20]:
+            print(f"   - {name}")
+    if "refs" in stats:
+        print(f"   References recounted: {stats['refs']['referenced']} blob(s) referenced, {stats['refs']['updated']} updated")
+    
+    if prune:
+        pruned = await store.prune(timedelta(days=grace_days), dry_run=dry_run)
+        print(f"\n🧹 Pruned {pruned['blobs']} unreferenced blob(s), {pruned['files']} file(s), {pruned['bytes'] // 1024}KB")
+    
+    client.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migrate uploads to content-addressed storage")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    parser.add_argument("--prune", action="store_true", help="Delete blobs unreferenced for --grace-days")
+    parser.add_argument("--grace-days", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(migrate(args.dry_run, args.prune, args.grace_days))
@@ -9,9 +9,13 @@ from datetime import datetime, timezone, timedelta
 import secrets
 import os
 import base64
+from functools import partial
 
 # PDF Generation
 from services.pdf_service import generate_quote_pdf, generate_invoice_pdf, generate_contract_pdf, generate_partnership_contract_pdf
+from services.pdf_export import (
+    PDFExportRequest, ExportProgress, export_query, stream_pdf_zip, zip_response, EXPORT_MAX_DOCUMENTS
+)
 
 # Email Service
 from services.email_service import send_email_async, get_email_template
@@ -97,9 +101,130 @@ class ContractCreate(BaseModel):
     notes: Optional[str] = None
 
 
-def get_commercial_routes(db, require_admin):
+def get_commercial_routes(db, require_admin, pdf_renderer, pdf_assets):
     """Create commercial routes with database access"""
     
+    # ============== PDF RENDERING ==============
+    # Rendered in the shared process pool and cached per document version:
+    # any change to the document or its partner changes the inputs, hence the key.
+    # Images are prefetched into local files first; rendering never touches the network.
+    
+    def document_date(doc: dict) -> Optional[str]:
+        """Creation date as printed on the PDF, so a cached render stays correct"""
+        created_at = doc.get("created_at")
+        if not created_at:
+            return None
+        try:
+            return datetime.fromisoformat(str(created_at).replace("Z", "+00:00")).strftime("%d/%m/%Y")
+        except ValueError:
+            return None
+    
+    async def quote_pdf(quote: dict, partner: dict) -> bytes:
+        assets = await pdf_assets.prefetch([partner.get("logo_url")])
+        return await pdf_renderer.render(
+            "quote", quote["quote_id"], generate_quote_pdf,
+            quote_number=quote["quote_number"],
+            partner=partner,
+            items=quote["items"],
+            title=quote["title"],
+            description=quote.get("description"),
+            notes=quote.get("notes"),
+            validity_days=quote.get("validity_days", 30),
+            payment_terms=quote.get("payment_terms"),
+            date=document_date(quote),
+            assets=assets
+        )
+    
+    async def invoice_pdf(invoice: dict, partner: dict) -> bytes:
+        assets = await pdf_assets.prefetch([partner.get("logo_url")])
+        return await pdf_renderer.render(
+            "invoice", invoice["invoice_id"], generate_invoice_pdf,
+            invoice_number=invoice["invoice_number"],
+            invoice_type=invoice["invoice_type"],
+            partner=partner,
+            items=invoice["items"],
+            title=invoice["title"],
+            description=invoice.get("description"),
+            notes=invoice.get("notes"),
+            due_date=invoice.get("due_date"),
+            payment_terms=invoice.get("payment_terms"),
+            date=document_date(invoice),
+            status=invoice.get("status", "unpaid"),
+            amount_paid=invoice.get("amount_paid", 0),
+            assets=assets
+        )
+    
+    async def contract_pdf(contract: dict, partner: dict) -> bytes:
+        # Contracts print the company logo only
+        assets = await pdf_assets.prefetch([])
+        return await pdf_renderer.render(
+            "contract", contract["contract_id"], generate_contract_pdf,
+            contract_number=contract["contract_number"],
+            contract_type=contract["contract_type"],
+            partner=partner,
+            clauses=contract["clauses"],
+            title=contract["title"],
+            description=contract.get("description"),
+            start_date=contract.get("start_date"),
+            end_date=contract.get("end_date"),
+            value=contract.get("value"),
+            notes=contract.get("notes"),
+            date=document_date(contract),
+            assets=assets
+        )
+    
+    # ============== BULK PDF EXPORT ==============
+    
+    async def export_documents(collection, kind: str, id_field: str, data: PDFExportRequest,
+                               render, filename: str):
+        """ZIP of every selected document, streamed as the renders complete"""
+        try:
+            query = export_query(data, id_field)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Indiquez des identifiants ou une période (AAAA-MM-JJ)")
+        total = await collection.count_documents(query)
+        if not total:
+            raise HTTPException(status_code=404, detail="Aucun document pour cette sélection")
+        if total > EXPORT_MAX_DOCUMENTS:
+            raise HTTPException(status_code=400, detail=f"Sélection trop large ({total} documents, maximum {EXPORT_MAX_DOCUMENTS})")
+    
+        progress = ExportProgress(db, kind, total)
+        await progress.start()
+    
+        async def jobs():
+            partners = {}
+            async for doc in collection.find(query, {"_id": 0}).sort("created_at", 1):
+                partner_id = doc.get("partner_id")
+                if partner_id not in partners:
+                    partners[partner_id] = await db.partners.find_one({"partner_id": partner_id}, {"_id": 0})
+                yield render(doc, partners[partner_id])
+    
+        return zip_response(stream_pdf_zip(jobs(), pdf_renderer.workers * 2, progress), filename, progress)
+    
+    def missing_partner(doc: dict):
+        async def fail():
+            raise ValueError(f"partenaire {doc.get('partner_id')} introuvable")
+        return fail
+    
+    def quote_job(quote: dict, partner: Optional[dict]):
+        render = partial(quote_pdf, quote, partner) if partner else missing_partner(quote)
+        return f"Devis_{quote['quote_number']}.pdf", render
+    
+    def invoice_job(invoice: dict, partner: Optional[dict]):
+        type_label = "ProForma" if invoice["invoice_type"] == "proforma" else "Facture"
+        render = partial(invoice_pdf, invoice, partner) if partner else missing_partner(invoice)
+        return f"{type_label}_{invoice['invoice_number']}.pdf", render
+    
+    @commercial_router.post("/quotes/export")
+    async def export_quotes_pdf(data: PDFExportRequest, user = Depends(require_admin)):
+        """ZIP of quote PDFs by ids or creation date range; progress on /api/admin/exports/{export_id}"""
+        return await export_documents(db.quotes, "quotes", "quote_id", data, quote_job, "Devis.zip")
+    
+    @commercial_router.post("/invoices/export")
+    async def export_invoices_pdf(data: PDFExportRequest, user = Depends(require_admin)):
+        """ZIP of invoice PDFs by ids or creation date range; progress on /api/admin/exports/{export_id}"""
+        return await export_documents(db.invoices, "invoices", "invoice_id", data, invoice_job, "Factures.zip")
+    
     # ============== PARTNERS ==============
     
     @commercial_router.get("/partners")
@@ -324,6 +449,7 @@ def get_commercial_routes(db, require_admin):
             data.pop(field, None)
         
         await db.quotes.update_one({"quote_id": quote_id}, {"$set": data})
+        await pdf_renderer.invalidate("quote", quote_id)
         
         return {"success": True, "message": "Devis mis à jour"}
     
@@ -383,21 +509,12 @@ def get_commercial_routes(db, require_admin):
         if not partner:
             raise HTTPException(status_code=404, detail="Partenaire non trouvé")
         
-        pdf_buffer = generate_quote_pdf(
-            quote_number=quote["quote_number"],
-            partner=partner,
-            items=quote["items"],
-            title=quote["title"],
-            description=quote.get("description"),
-            notes=quote.get("notes"),
-            validity_days=quote.get("validity_days", 30),
-            payment_terms=quote.get("payment_terms")
-        )
+        pdf = await quote_pdf(quote, partner)
         
         filename = f"Devis_{quote['quote_number']}.pdf"
         
         return Response(
-            content=pdf_buffer.getvalue(),
+            content=pdf,
             media_type="application/pdf",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
@@ -414,16 +531,7 @@ def get_commercial_routes(db, require_admin):
             raise HTTPException(status_code=404, detail="Partenaire non trouvé")
         
         # Generate PDF
-        pdf_buffer = generate_quote_pdf(
-            quote_number=quote["quote_number"],
-            partner=partner,
-            items=quote["items"],
-            title=quote["title"],
-            description=quote.get("description"),
-            notes=quote.get("notes"),
-            validity_days=quote.get("validity_days", 30),
-            payment_terms=quote.get("payment_terms")
-        )
+        pdf = await quote_pdf(quote, partner)
         
         # Prepare email content
         recipient_email = data.recipient_email or partner.get("email")
@@ -457,7 +565,7 @@ def get_commercial_routes(db, require_admin):
         html_content = get_email_template(email_content, f"Devis {quote['quote_number']}")
         
         # Prepare attachment
-        pdf_content = base64.b64encode(pdf_buffer.getvalue()).decode('utf-8')
+        pdf_content = base64.b64encode(pdf).decode('utf-8')
         attachments = [{
             "content": pdf_content,
             "filename": f"Devis_{quote['quote_number']}.pdf"
@@ -642,6 +750,7 @@ def get_commercial_routes(db, require_admin):
             data.pop(field, None)
         
         await db.invoices.update_one({"invoice_id": invoice_id}, {"$set": data})
+        await pdf_renderer.invalidate("invoice", invoice_id)
         
         return {"success": True, "message": "Facture mise à jour"}
     
@@ -656,25 +765,13 @@ def get_commercial_routes(db, require_admin):
         if not partner:
             raise HTTPException(status_code=404, detail="Partenaire non trouvé")
         
-        pdf_buffer = generate_invoice_pdf(
-            invoice_number=invoice["invoice_number"],
-            invoice_type=invoice["invoice_type"],
-            partner=partner,
-            items=invoice["items"],
-            title=invoice["title"],
-            description=invoice.get("description"),
-            notes=invoice.get("notes"),
-            due_date=invoice.get("due_date"),
-            payment_terms=invoice.get("payment_terms"),
-            status=invoice.get("status", "unpaid"),
-            amount_paid=invoice.get("amount_paid", 0)
-        )
+        pdf = await invoice_pdf(invoice, partner)
         
         type_label = "ProForma" if invoice["invoice_type"] == "proforma" else "Facture"
         filename = f"{type_label}_{invoice['invoice_number']}.pdf"
         
         return Response(
-            content=pdf_buffer.getvalue(),
+            content=pdf,
             media_type="application/pdf",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
@@ -691,19 +788,7 @@ def get_commercial_routes(db, require_admin):
             raise HTTPException(status_code=404, detail="Partenaire non trouvé")
         
         # Generate PDF
-        pdf_buffer = generate_invoice_pdf(
-            invoice_number=invoice["invoice_number"],
-            invoice_type=invoice["invoice_type"],
-            partner=partner,
-            items=invoice["items"],
-            title=invoice["title"],
-            description=invoice.get("description"),
-            notes=invoice.get("notes"),
-            due_date=invoice.get("due_date"),
-            payment_terms=invoice.get("payment_terms"),
-            status=invoice.get("status", "unpaid"),
-            amount_paid=invoice.get("amount_paid", 0)
-        )
+        pdf = await invoice_pdf(invoice, partner)
         
         # Prepare email content
         recipient_email = data.recipient_email or partner.get("email")
@@ -740,7 +825,7 @@ def get_commercial_routes(db, require_admin):
         html_content = get_email_template(email_content, f"{type_label} {invoice['invoice_number']}")
         
         # Prepare attachment
-        pdf_content = base64.b64encode(pdf_buffer.getvalue()).decode('utf-8')
+        pdf_content = base64.b64encode(pdf).decode('utf-8')
         file_label = "ProForma" if invoice["invoice_type"] == "proforma" else "Facture"
         attachments = [{
             "content": pdf_content,
@@ -891,6 +976,7 @@ def get_commercial_routes(db, require_admin):
             data.pop(field, None)
         
         await db.contracts.update_one({"contract_id": contract_id}, {"$set": data})
+        await pdf_renderer.invalidate("contract", contract_id)
         
         return {"success": True, "message": "Contrat mis à jour"}
     
@@ -905,23 +991,12 @@ def get_commercial_routes(db, require_admin):
         if not partner:
             raise HTTPException(status_code=404, detail="Partenaire non trouvé")
         
-        pdf_buffer = generate_contract_pdf(
-            contract_number=contract["contract_number"],
-            contract_type=contract["contract_type"],
-            partner=partner,
-            clauses=contract["clauses"],
-            title=contract["title"],
-            description=contract.get("description"),
-            start_date=contract.get("start_date"),
-            end_date=contract.get("end_date"),
-            value=contract.get("value"),
-            notes=contract.get("notes")
-        )
+        pdf = await contract_pdf(contract, partner)
         
         filename = f"Contrat_{contract['contract_number']}.pdf"
         
         return Response(
-            content=pdf_buffer.getvalue(),
+            content=pdf,
             media_type="application/pdf",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
@@ -938,18 +1013,7 @@ def get_commercial_routes(db, require_admin):
             raise HTTPException(status_code=404, detail="Partenaire non trouvé")
         
         # Generate PDF
-        pdf_buffer = generate_contract_pdf(
-            contract_number=contract["contract_number"],
-            contract_type=contract["contract_type"],
-            partner=partner,
-            clauses=contract["clauses"],
-            title=contract["title"],
-            description=contract.get("description"),
-            start_date=contract.get("start_date"),
-            end_date=contract.get("end_date"),
-            value=contract.get("value"),
-            notes=contract.get("notes")
-        )
+        pdf = await contract_pdf(contract, partner)
         
         # Prepare email content
         recipient_email = data.recipient_email or partner.get("email")
@@ -992,7 +1056,7 @@ def get_commercial_routes(db, require_admin):
         html_content = get_email_template(email_content, f"{type_label} {contract['contract_number']}")
         
         # Prepare attachment
-        pdf_content = base64.b64encode(pdf_buffer.getvalue()).decode('utf-8')
+        pdf_content = base64.b64encode(pdf).decode('utf-8')
         attachments = [{
             "content": pdf_content,
             "filename": f"Contrat_{contract['contract_number']}.pdf"
@@ -1192,7 +1256,8 @@ def get_commercial_routes(db, require_admin):
         contract_number = await get_next_contract_number()
         
         # Generate PDF
-        pdf_buffer = generate_partnership_contract_pdf(
+        pdf = await pdf_renderer.run(
+            generate_partnership_contract_pdf,
             contract_number=contract_number,
             partner=partner,
             commission_percent=data.commission_percent,
@@ -1200,13 +1265,14 @@ def get_commercial_routes(db, require_admin):
             payment_method=data.payment_method,
             delivery_responsibility=data.delivery_responsibility,
             delivery_fees=data.delivery_fees,
-            contract_duration=data.contract_duration
+            contract_duration=data.contract_duration,
+            assets=await pdf_assets.prefetch([])
         )
         
         filename = f"Contrat_Partenariat_{contract_number}.pdf"
         
         return Response(
-            content=pdf_buffer.getvalue(),
+            content=pdf,
             media_type="application/pdf",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
@@ -1224,7 +1290,8 @@ def get_commercial_routes(db, require_admin):
         preview_number = f"PREVIEW-{datetime.now().strftime('%Y%m%d%H%M%S')}"
         
         # Generate PDF
-        pdf_buffer = generate_partnership_contract_pdf(
+        pdf = await pdf_renderer.run(
+            generate_partnership_contract_pdf,
             contract_number=preview_number,
             partner=partner,
             commission_percent=data.commission_percent,
@@ -1232,13 +1299,14 @@ def get_commercial_routes(db, require_admin):
             payment_method=data.payment_method,
             delivery_responsibility=data.delivery_responsibility,
             delivery_fees=data.delivery_fees,
-            contract_duration=data.contract_duration
+            contract_duration=data.contract_duration,
+            assets=await pdf_assets.prefetch([])
         )
         
         filename = f"Apercu_Contrat_Partenariat.pdf"
         
         return Response(
-            content=pdf_buffer.getvalue(),
+            content=pdf,
             media_type="application/pdf",
             headers={"Content-Disposition": f"inline; filename={filename}"}
         )
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, UploadFile, File
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, UploadFile, File, Query
+from fastapi.responses import JSONResponse, StreamingResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -16,31 +16,93 @@ import time
 import aiohttp
 import base64
 import secrets
-from collections import defaultdict
+from functools import partial
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr, validator
 from typing import List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
 import httpx
-import bcrypt
 import jwt
 from mailersend import MailerSendClient, EmailBuilder
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
-# Image compression
-from PIL import Image as PILImage
-
 # AI Image Analysis - Using OpenAI SDK directly
 from openai import OpenAI
 
-# PDF Generation
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer, Image
-from reportlab.lib.units import cm, mm
+# PDF Generation (rendered in a process pool, cached per document version)
+from services.pdf_service import generate_order_invoice_pdf
+from services.pdf_renderer import PDFRenderer
+from services.pdf_assets import PDFAssetCache
+from services.pdf_export import (
+    PDFExportRequest, ExportProgress, export_query, stream_pdf_zip, zip_response, get_export_progress,
+    EXPORT_COLLECTION, EXPORT_INDEXES, EXPORT_MAX_DOCUMENTS
+)
+
+# Shared cache, catalog change bus and batched product lookups
+from services.cache import create_cache
+from services.rate_limiter import create_rate_limiter
+from services.analytics import compute_order_analytics, ANALYTICS_INDEXES
+from services.sales_rollup import (
+    ROLLUP_COLLECTION,
+    ROLLUP_INDEXES,
+    record_order,
+    record_order_transition,
+    rollup_ready,
+    compute_rollup_analytics,
+    rollup_totals
+)
+from services.csv_export import (
+    stream_csv,
+    order_rows,
+    client_rows,
+    ORDERS_HEADER,
+    CLIENTS_HEADER
+)
+from pymongo import ReturnDocument
+from services.catalog_events import (
+    CatalogEventBus,
+    PRODUCT_CREATED,
+    PRODUCT_UPDATED,
+    PRODUCT_DELETED,
+    STOCK_CHANGED,
+    FLASH_SALE_CHANGED,
+    GIFTBOX_CHANGED,
+    CATALOG_RESET
+)
+from services.email_service import send_email_mailersend as send_email_http, close_http_session
+from services.email_queue import EmailQueue, QueueFullError, QUEUE_COLLECTION, QUEUE_INDEXES, BULK_COLLECTION
+from services.mailersend_bulk import create_bulk_client
+from services.pagination import paginate, iterate_keyset, InvalidCursor
+from services.static_files import serve_file, IMMUTABLE_CACHE
+from services.upload_storage import (
+    UploadStore, create_storage_backend, content_hash, content_type_for, referenced_urls,
+    STORE_COLLECTION, STORE_INDEXES, REFERENCE_PROJECTIONS, LEGACY_URL
+)
+from services.image_processing import (
+    ImageProcessor, ImagePoolBusy, IMAGE_RETRY_AFTER, pick_variant
+)
+from services.product_search import ProductSearchIndex, text_search_query, INDEXED_FIELDS, FILTER_FIELDS
+from services.search_suggest import SuggestIndex, SUGGEST_FIELDS
+from services.password_hashing import PasswordHasher, HashPoolBusy, AUTH_RETRY_AFTER
+from services.auth_principals import PrincipalCache, Principal
+from services.cart_store import (
+    cart_owner, add_cart_item, set_cart_quantity, remove_cart_item, ensure_cart_indexes
+)
+from services.stock_reservation import (
+    StockReservations, InsufficientStock, order_quantities,
+    ONLINE_PAYMENT_METHODS, RESERVATION_COLLECTION, RESERVATION_INDEXES
+)
+from services.hot_inventory import create_hot_inventory, HotSkuBusy, HOT_RECONCILE_INTERVAL, HOT_RETRY_AFTER
+from services.product_hydration import (
+    product_cache,
+    hydrate_products,
+    first_image,
+    CART_PROJECTION,
+    WISHLIST_PROJECTION,
+    SUMMARY_PROJECTION
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -108,42 +170,103 @@ client = AsyncIOMotorClient(
 )
 db = client[os.environ['DB_NAME']]
 
-# Simple in-memory cache for frequently accessed data
-_cache = {}
-_cache_ttl = {}
+# Shared cache: bounded local LRU tier + optional Redis tier (CACHE_REDIS_URL)
+app_cache = create_cache()
 CACHE_DURATION = 60  # Cache for 60 seconds
 
-def get_cached(key):
+async def get_cached(key):
     """Get value from cache if not expired"""
-    if key in _cache and key in _cache_ttl:
-        if time.time() < _cache_ttl[key]:
-            return _cache[key]
-        else:
-            del _cache[key]
-            del _cache_ttl[key]
-    return None
+    return await app_cache.get(key)
+
+async def set_cached(key, value, ttl=CACHE_DURATION, tags=()):
+    """Set value in cache with TTL and invalidation tags"""
+    await app_cache.set(key, value, ttl=ttl, tags=tags)
 
-def set_cached(key, value, ttl=CACHE_DURATION):
-    """Set value in cache with TTL"""
-    _cache[key] = value
-    _cache_ttl[key] = time.time() + ttl
-
-def clear_cache(prefix=None):
-    """Clear cache, optionally by prefix"""
-    global _cache, _cache_ttl
-    if prefix:
-        keys_to_delete = [k for k in _cache.keys() if k.startswith(prefix)]
-        for k in keys_to_delete:
-            _cache.pop(k, None)
-            _cache_ttl.pop(k, None)
+async def invalidate_cache(*tags):
+    """Invalidate cached entries by tag in every worker, or everything when no tag is given"""
+    if tags:
+        await app_cache.invalidate_tags(*tags)
     else:
-        _cache = {}
-        _cache_ttl = {}
+        await app_cache.clear()
+
+# Catalog reads can be cached for minutes: every product mutation publishes
+# on the catalog bus and the subscribers below drop what depends on it
+PRODUCTS_CACHE_TTL = 300
+FLASH_SALES_CACHE_TTL = 300
+GIFTBOX_CACHE_TTL = 300
+SITEMAP_CACHE_TTL = 3600
+
+catalog_bus = CatalogEventBus()
+if app_cache.shared is not None:
+    catalog_bus.attach_shared(app_cache.shared, f"{app_cache.namespace}:catalog")
+
+CATALOG_CACHE_TAGS = {
+    PRODUCT_CREATED: ("products", "flash_sales", "sitemap"),
+    PRODUCT_UPDATED: ("products", "flash_sales", "sitemap"),
+    PRODUCT_DELETED: ("products", "flash_sales", "sitemap"),
+    STOCK_CHANGED: ("products", "flash_sales"),
+    FLASH_SALE_CHANGED: ("products", "flash_sales"),
+    GIFTBOX_CHANGED: ("giftbox",),
+    CATALOG_RESET: ("products", "flash_sales", "sitemap", "giftbox"),
+}
+
+@catalog_bus.on()
+async def invalidate_catalog_cache_tags(event):
+    """Drop cached catalog reads (the cache relays this to other workers itself)"""
+    if event.local:
+        await invalidate_cache(*CATALOG_CACHE_TAGS.get(event.kind, ()))
+
+@catalog_bus.on(PRODUCT_CREATED, PRODUCT_UPDATED, PRODUCT_DELETED, STOCK_CHANGED, FLASH_SALE_CHANGED, CATALOG_RESET)
+async def invalidate_hydrated_products(event):
+    """Drop per-product entries used by cart/wishlist hydration in this worker"""
+    product_cache.invalidate(event.product_ids or None)
+
+# Full-text product search and typeahead: in-memory indexes per worker, fed by catalog events
+product_search = ProductSearchIndex()
+search_suggest = SuggestIndex()
+SEARCH_EVENT_FIELDS = frozenset(INDEXED_FIELDS + FILTER_FIELDS)
+search_index_build: Optional[asyncio.Task] = None
+
+async def build_search_indexes():
+    await product_search.build(db)
+    # suggestions are ranked with the sales popularity loaded by the search index
+    await search_suggest.build(db, product_search.popularity)
+
+def rebuild_search_index() -> asyncio.Task:
+    """(Re)build the search indexes in the background unless a build is already running"""
+    global search_index_build
+    if search_index_build is None or search_index_build.done():
+        search_index_build = asyncio.create_task(build_search_indexes())
+    return search_index_build
+
+async def refresh_search_indexes():
+    """Periodic rebuild: picks up new sales popularity and other workers' provider changes"""
+    await rebuild_search_index()
+
+@catalog_bus.on(PRODUCT_CREATED, PRODUCT_UPDATED, PRODUCT_DELETED, STOCK_CHANGED, CATALOG_RESET)
+async def update_search_index(event):
+    """Keep this worker's search indexes in step with the catalog"""
+    if event.kind == CATALOG_RESET or not event.product_ids:
+        rebuild_search_index()
+        return
+    fields = set(event.fields)
+    if event.kind != PRODUCT_UPDATED or not fields or fields & SEARCH_EVENT_FIELDS:
+        await product_search.refresh(db, event.product_ids)
+    if event.kind != STOCK_CHANGED and (not fields or fields & SUGGEST_FIELDS):
+        await search_suggest.refresh(db, event.product_ids, product_search.popularity)
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'lumina-senegal-secret-key-2024')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 168  # 7 days
+# Profile fields embedded in tokens, so most requests authenticate without Mongo
+TOKEN_CLAIMS = ("name", "role", "phone", "picture", "created_at")
+USER_PRINCIPAL_PROJECTION = {"_id": 0, "password": 0}
+
+# Resolved users per token, per worker; invalidations relayed through the shared cache
+principal_cache = PrincipalCache(token_lifetime=JWT_EXPIRATION_HOURS * 3600)
+if app_cache.shared is not None:
+    principal_cache.attach_shared(app_cache.shared, f"{app_cache.namespace}:principals")
 
 # Store Configuration
 STORE_NAME = "GROUPE YAMA+"
@@ -247,11 +370,8 @@ api_router = APIRouter(prefix="/api")
 
 # ============== SECURITY MIDDLEWARE ==============
 
-# Rate limiting storage with memory cleanup
-rate_limit_storage = defaultdict(lambda: {"count": 0, "reset_time": 0})
-RATE_LIMIT_REQUESTS = 100  # requests per window
-RATE_LIMIT_WINDOW = 60  # seconds
-MAX_RATE_LIMIT_ENTRIES = 1000  # Prevent memory bloat
+# Sliding-window rate limiter, shared between workers when the cache has a shared tier
+rate_limiter = create_rate_limiter(app_cache.shared)
 
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
     """Add security headers to all responses"""
@@ -272,7 +392,7 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         return response
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
-    """Rate limiting middleware to prevent abuse with memory management"""
+    """Rate limiting middleware: sliding window per client IP, weighted by route cost"""
     async def dispatch(self, request: Request, call_next):
         # Skip rate limiting for static files
         if not request.url.path.startswith("/api/"):
@@ -284,38 +404,23 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         if forwarded_for:
             client_ip = forwarded_for.split(",")[0].strip()
         
-        current_time = time.time()
-        
-        # Clean up old entries to prevent memory bloat
-        if len(rate_limit_storage) > MAX_RATE_LIMIT_ENTRIES:
-            expired_keys = [
-                key for key, data in rate_limit_storage.items()
-                if current_time > data["reset_time"]
-            ]
-            for key in expired_keys[:100]:  # Remove up to 100 expired entries
-                del rate_limit_storage[key]
-        
-        client_data = rate_limit_storage[client_ip]
-        
-        # Reset counter if window has passed
-        if current_time > client_data["reset_time"]:
-            client_data["count"] = 0
-            client_data["reset_time"] = current_time + RATE_LIMIT_WINDOW
-        
-        # Check rate limit
-        if client_data["count"] >= RATE_LIMIT_REQUESTS:
+        result = await rate_limiter.check(client_ip, request.url.path)
+        if not result.allowed:
             return JSONResponse(
                 status_code=429,
-                content={"detail": "Trop de requêtes. Veuillez réessayer dans quelques secondes."}
+                content={"detail": "Trop de requêtes. Veuillez réessayer dans quelques secondes."},
+                headers={
+                    "Retry-After": str(result.retry_after),
+                    "X-RateLimit-Limit": str(result.limit),
+                    "X-RateLimit-Remaining": "0"
+                }
             )
         
-        client_data["count"] += 1
-        
         response = await call_next(request)
         
         # Add rate limit headers
-        response.headers["X-RateLimit-Limit"] = str(RATE_LIMIT_REQUESTS)
-        response.headers["X-RateLimit-Remaining"] = str(RATE_LIMIT_REQUESTS - client_data["count"])
+        response.headers["X-RateLimit-Limit"] = str(result.limit)
+        response.headers["X-RateLimit-Remaining"] = str(result.remaining)
         
         return response
 
@@ -400,6 +505,7 @@ class ProductCreate(ProductBase):
 class Product(ProductBase):
     model_config = ConfigDict(extra="ignore")
     product_id: str
+    image_placeholders: Optional[dict] = None  # {image_url: {lqip, width, height}} for uploaded images
     created_at: datetime
     updated_at: datetime
 
@@ -584,47 +690,88 @@ class GiftBoxConfig(BaseModel):
 
 # ============== AUTH HELPERS ==============
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+# bcrypt runs in its own bounded thread pool so logins never stall the event loop
+password_hasher = PasswordHasher()
+
+def auth_busy() -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Trop de connexions en cours, réessayez dans quelques secondes",
+        headers={"Retry-After": str(AUTH_RETRY_AFTER)}
+    )
+
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except HashPoolBusy:
+        raise auth_busy()
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+async def verify_password(password: str, hashed: str) -> bool:
+    try:
+        return await password_hasher.verify(password, hashed)
+    except HashPoolBusy:
+        raise auth_busy()
 
-def create_token(user_id: str, email: str) -> str:
+async def upgrade_password_hash(collection, id_field: str, doc: dict, password: str):
+    """After a successful login, re-hash at the configured cost if the stored hash uses another one"""
+    if not password_hasher.needs_rehash(doc.get("password", "")):
+        return
+    hashed = await password_hasher.rehash(password)
+    if hashed:
+        # only if the password was not changed meanwhile
+        await collection.update_one(
+            {id_field: doc[id_field], "password": doc["password"]},
+            {"$set": {"password": hashed}}
+        )
+
+def create_token(user_id: str, email: str, user_doc: Optional[dict] = None) -> str:
+    now = datetime.now(timezone.utc)
     payload = {
         "user_id": user_id,
         "email": email,
-        "exp": datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
+        "iat": now,
+        "exp": now + timedelta(hours=JWT_EXPIRATION_HOURS)
     }
+    if user_doc and user_doc.get("name") and user_doc.get("created_at"):
+        claims = {field: user_doc.get(field) for field in TOKEN_CLAIMS}
+        claims["role"] = claims["role"] or "customer"
+        if isinstance(claims["created_at"], datetime):
+            claims["created_at"] = claims["created_at"].isoformat()
+        payload.update(claims)
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(request: Request) -> Optional[User]:
-    # Try cookie first
+def request_token(request: Request) -> Optional[str]:
+    """Session cookie first, then Authorization: Bearer"""
     token = request.cookies.get("session_token")
-    
-    # Fall back to Authorization header
     if not token:
         auth_header = request.headers.get("Authorization")
         if auth_header and auth_header.startswith("Bearer "):
             token = auth_header.split(" ")[1]
-    
-    if not token:
+    return token
+
+async def load_principal(token: str, user_id: str, expires_at: float) -> Optional[Principal]:
+    """Read the user from Mongo and cache it for this token"""
+    user_doc = await db.users.find_one({"user_id": user_id}, USER_PRINCIPAL_PROJECTION)
+    if not user_doc:
         return None
-    
-    # Check if it's a JWT token
+    if isinstance(user_doc.get('created_at'), str):
+        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
+    return principal_cache.put(token, user_id, User(**user_doc), verified=True, expires_at=expires_at)
+
+async def resolve_principal(token: str) -> Optional[Principal]:
+    """Principal for a token missing from the cache: JWT claims, else Mongo"""
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
-        if user_id:
-            user_doc = await db.users.find_one({"user_id": user_id}, {"_id": 0})
-            if user_doc:
-                if isinstance(user_doc.get('created_at'), str):
-                    user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
-                return User(**user_doc)
-    except jwt.ExpiredSignatureError:
-        pass
     except jwt.InvalidTokenError:
-        pass
+        payload = None
+    user_id = payload.get("user_id") if payload else None
+    if user_id:
+        if "role" in payload and principal_cache.claims_trusted(user_id, payload.get("iat", 0)):
+            user = User(user_id=user_id, email=payload["email"], **{field: payload.get(field) for field in TOKEN_CLAIMS})
+            return principal_cache.put(token, user_id, user, verified=False, expires_at=payload["exp"])
+        principal = await load_principal(token, user_id, payload["exp"])
+        if principal:
+            return principal
     
     # Check session token (for Google OAuth)
     session_doc = await db.user_sessions.find_one({"session_token": token}, {"_id": 0})
@@ -635,26 +782,71 @@ async def get_current_user(request: Request) -> Optional[User]:
         if expires_at.tzinfo is None:
             expires_at = expires_at.replace(tzinfo=timezone.utc)
         if expires_at > datetime.now(timezone.utc):
-            user_doc = await db.users.find_one({"user_id": session_doc["user_id"]}, {"_id": 0})
-            if user_doc:
-                if isinstance(user_doc.get('created_at'), str):
-                    user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
-                return User(**user_doc)
+            return await load_principal(token, session_doc["user_id"], expires_at.timestamp())
     
     return None
 
+async def get_current_user(request: Request) -> Optional[User]:
+    token = request_token(request)
+    if not token:
+        return None
+    principal = principal_cache.get(token) or await resolve_principal(token)
+    if principal is None:
+        return None
+    request.state.principal = principal
+    return principal.user
+
 async def require_auth(request: Request) -> User:
     user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Non authentifié")
     return user
 
+async def verified_user(request: Request) -> Optional[User]:
+    """
+    The current user as stored in Mongo, for role and ownership checks: token
+    claims may predate a demotion or a phone change made in the database
+    """
+    user = await get_current_user(request)
+    if user is None:
+        return None
+    principal = request.state.principal
+    if not principal.verified:
+        principal = await load_principal(request_token(request), user.user_id, principal.expires_at)
+        if principal is None:
+            return None
+        request.state.principal = principal
+    return principal.user
+
+async def require_verified_user(request: Request) -> User:
+    user = await verified_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Non authentifié")
+    return user
+
 async def require_admin(request: Request) -> User:
     user = await require_auth(request)
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    user = await verified_user(request)
+    if user is None or user.role != "admin":
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
     return user
 
+async def claims_changed(user_id: str):
+    """The user's token claims are stale: distrust older tokens, in every worker and across restarts"""
+    changed_at = int(time.time())  # whole seconds, like the JWT iat it is compared with
+    await db.users.update_one({"user_id": user_id}, {"$set": {"claims_valid_after": changed_at}})
+    await principal_cache.invalidate_user(user_id, changed_at)
+
+async def restore_claim_markers():
+    """Reload the claim changes still relevant to live tokens (the cache only keeps them in memory)"""
+    oldest_live = time.time() - JWT_EXPIRATION_HOURS * 3600
+    changed = await db.users.find(
+        {"claims_valid_after": {"$gt": oldest_live}}, {"_id": 0, "user_id": 1, "claims_valid_after": 1}
+    ).to_list(None)
+    principal_cache.restore_changes({doc["user_id"]: doc["claims_valid_after"] for doc in changed})
+
 # ============== MAILERLITE SERVICE ==============
 
 class MailerLiteService:
@@ -918,6 +1110,13 @@ async def detect_and_process_abandoned_carts():
         
         processed_count = 0
         
+        # Hydrate products for every cart in a single query
+        products = await hydrate_products(
+            db,
+            [item["product_id"] for cart in abandoned_carts for item in cart.get("items", [])],
+            SUMMARY_PROJECTION
+        )
+        
         for cart in abandoned_carts:
             user_id = cart.get("user_id")
             if not user_id:
@@ -946,17 +1145,14 @@ async def detect_and_process_abandoned_carts():
             cart_total = 0
             
             for item in cart.get("items", []):
-                product = await db.products.find_one(
-                    {"product_id": item["product_id"]},
-                    {"_id": 0, "name": 1, "price": 1, "images": 1}
-                )
+                product = products.get(item["product_id"])
                 if product:
                     item_data = {
                         "product_id": item["product_id"],
                         "name": product.get("name", "Produit"),
                         "quantity": item.get("quantity", 1),
                         "price": product.get("price", 0),
-                        "image": product.get("images", [""])[0] if product.get("images") else ""
+                        "image": first_image(product)
                     }
                     cart_items_with_details.append(item_data)
                     cart_total += item_data["price"] * item_data["quantity"]
@@ -1017,7 +1213,7 @@ async def register(user_data: UserCreate, response: Response):
         raise HTTPException(status_code=400, detail="Cet email est déjà utilisé")
     
     user_id = f"user_{uuid.uuid4().hex[:12]}"
-    hashed_password = hash_password(user_data.password) if user_data.password else None
+    hashed_password = await hash_password(user_data.password) if user_data.password else None
     
     user_doc = {
         "user_id": user_id,
@@ -1036,7 +1232,7 @@ async def register(user_data: UserCreate, response: Response):
     user_for_email = {k: v for k, v in user_doc.items() if k != "_id"}
     asyncio.create_task(send_welcome_email(user_for_email))
     
-    token = create_token(user_id, user_data.email)
+    token = create_token(user_id, user_data.email, user_doc)
     response.set_cookie(
         key="session_token",
         value=token,
@@ -1065,10 +1261,12 @@ async def login(credentials: UserLogin, response: Response):
     if not user_doc.get("password"):
         raise HTTPException(status_code=401, detail="Utilisez la connexion Google pour ce compte")
     
-    if not verify_password(credentials.password, user_doc["password"]):
+    if not await verify_password(credentials.password, user_doc["password"]):
         raise HTTPException(status_code=401, detail="Email ou mot de passe incorrect")
     
-    token = create_token(user_doc["user_id"], user_doc["email"])
+    asyncio.create_task(upgrade_password_hash(db.users, "user_id", user_doc, credentials.password))
+    
+    token = create_token(user_doc["user_id"], user_doc["email"], user_doc)
     response.set_cookie(
         key="session_token",
         value=token,
@@ -1152,6 +1350,8 @@ async def process_session(request: Request, response: Response):
         }},
         upsert=True
     )
+    # the previous session token is gone and name/picture may have changed
+    await claims_changed(user_id)
     
     response.set_cookie(
         key="session_token",
@@ -1166,7 +1366,7 @@ async def process_session(request: Request, response: Response):
     user_doc = await db.users.find_one({"user_id": user_id}, {"_id": 0})
     
     # Create JWT token for the user
-    jwt_token = create_token(user_id, user_doc["email"])
+    jwt_token = create_token(user_id, user_doc["email"], user_doc)
     
     return {
         "user_id": user_id,
@@ -1193,7 +1393,7 @@ class ProfileUpdate(BaseModel):
     phone: Optional[str] = None
 
 @api_router.put("/auth/profile")
-async def update_profile(profile_data: ProfileUpdate, user: User = Depends(require_auth)):
+async def update_profile(profile_data: ProfileUpdate, response: Response, user: User = Depends(require_auth)):
     """Update user profile (name, phone)"""
     update_fields = {}
     
@@ -1211,9 +1411,23 @@ async def update_profile(profile_data: ProfileUpdate, user: User = Depends(requi
         {"$set": update_fields}
     )
     
+    await claims_changed(user.user_id)
+    
     # Return updated user info
     updated_user = await db.users.find_one({"user_id": user.user_id}, {"_id": 0, "password": 0})
     
+    # older tokens carry the previous name/phone: replace the cookie as well
+    token = create_token(updated_user["user_id"], updated_user["email"], updated_user)
+    response.set_cookie(
+        key="session_token",
+        value=token,
+        httponly=True,
+        secure=True,
+        samesite="none",
+        max_age=JWT_EXPIRATION_HOURS * 3600,
+        path="/"
+    )
+    
     return {
         "message": "Profil mis à jour avec succès",
         "user": {
@@ -1223,14 +1437,16 @@ async def update_profile(profile_data: ProfileUpdate, user: User = Depends(requi
             "phone": updated_user.get("phone"),
             "role": updated_user.get("role", "customer"),
             "picture": updated_user.get("picture")
-        }
+        },
+        "token": token
     }
 
 @api_router.post("/auth/logout")
 async def logout(request: Request, response: Response):
-    token = request.cookies.get("session_token")
+    token = request_token(request)
     if token:
         await db.user_sessions.delete_one({"session_token": token})
+        await principal_cache.invalidate_token(token)
     
     response.delete_cookie(key="session_token", path="/")
     return {"message": "Déconnexion réussie"}
@@ -1240,40 +1456,53 @@ async def logout(request: Request, response: Response):
 # Create uploads directory
 UPLOADS_DIR = ROOT_DIR / "uploads"
 UPLOADS_DIR.mkdir(exist_ok=True)
+REVIEW_UPLOADS_DIR = UPLOADS_DIR / "reviews"
 
-# Image compression settings
-MAX_IMAGE_SIZE = 1920  # Max width/height in pixels
-JPEG_QUALITY = 85  # Quality for JPEG compression
+# Content-addressed (SHA-256) uploads on local disk or S3, with reference counts
+upload_store = UploadStore(db, create_storage_backend(UPLOADS_DIR))
 
-def compress_image(content: bytes, max_size: int = MAX_IMAGE_SIZE, quality: int = JPEG_QUALITY) -> tuple[bytes, str]:
-    """Compress and optimize image for web. Returns (compressed_content, extension)"""
-    try:
-        img = PILImage.open(io.BytesIO(content))
-        
-        # Convert RGBA to RGB for JPEG (remove transparency)
-        if img.mode in ('RGBA', 'P'):
-            background = PILImage.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Resize if too large
-        if img.width > max_size or img.height > max_size:
-            img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
-        
-        # Save as optimized JPEG
-        output = io.BytesIO()
-        img.save(output, format='JPEG', quality=quality, optimize=True)
-        output.seek(0)
-        
-        return output.getvalue(), 'jpg'
-    except Exception as e:
-        logging.error(f"Image compression error: {e}")
-        # Return original content if compression fails
-        return content, 'jpg'
+# Pillow work runs in a process pool; past its queue limit uploads get a 503
+image_processor = ImageProcessor()
+
+# Invoices, quotes and contracts: rendered in a process pool, cached per document version
+pdf_renderer = PDFRenderer(ROOT_DIR / "pdf_cache")
+
+def pdf_asset_source(url: str) -> Optional[str]:
+    """Local path (or bucket URL) behind a site-relative /api/uploads/ image URL"""
+    match = LEGACY_URL.search(url.split("?", 1)[0])
+    if not match:
+        return None
+    name = match.group(1)
+    legacy = UPLOADS_DIR / name
+    if legacy.is_file():
+        return str(legacy)
+    path = upload_store.backend.path(name)
+    return str(path) if path is not None else upload_store.backend.url(name)
+
+# Logo, product images and partner logos are fetched (async, with a timeout) before rendering
+pdf_assets = PDFAssetCache(ROOT_DIR / "pdf_cache" / "assets", resolve=pdf_asset_source)
+
+def image_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Serveur d'images occupé, réessayez dans quelques secondes",
+        headers={"Retry-After": str(IMAGE_RETRY_AFTER)}
+    )
+
+def upload_response(stored: dict, original_size: int, deduplicated: bool = False) -> dict:
+    main_size = stored["main_size"]
+    compression_ratio = round((1 - main_size / original_size) * 100, 1) if original_size > 0 else 0
+    return {
+        "success": True,
+        # Relative path - frontend will handle the full URL
+        "url": stored["url"],
+        "filename": stored["filename"],
+        "original_size": original_size,
+        "compressed_size": main_size,
+        "compression": f"{compression_ratio}%",
+        "deduplicated": deduplicated,
+        **{k: stored[k] for k in ("width", "height", "widths", "lqip") if k in stored}
+    }
 
 @api_router.post("/upload/image")
 async def upload_image(file: UploadFile = File(...), user: User = Depends(require_admin), request: Request = None):
@@ -1293,34 +1522,34 @@ async def upload_image(file: UploadFile = File(...), user: User = Depends(requir
         if original_size > 10 * 1024 * 1024:
             raise HTTPException(status_code=400, detail="Fichier trop volumineux (max 10MB)")
         
-        # Compress image (skip GIFs to preserve animation)
+        # Same bytes already stored: hand back the existing upload
+        digest = content_hash(content)
+        stored = await upload_store.find(digest)
+        if stored:
+            logging.info(f"Image upload deduplicated: {stored['filename']}")
+            return upload_response(stored, original_size, deduplicated=True)
+        
+        # Build the responsive variants in the process pool (skip GIFs to preserve animation)
+        meta = {}
         if file.content_type != "image/gif":
-            content, ext = compress_image(content)
+            filename = f"{digest}.jpg"
+            try:
+                result = await image_processor.variants(content, filename)
+            except ImagePoolBusy:
+                raise image_pool_busy()
+            except Exception as e:
+                logging.error(f"Image variant error: {e}")
+                raise HTTPException(status_code=400, detail="Image illisible ou corrompue")
+            files = result["files"]
+            meta = {k: result[k] for k in ("width", "height", "widths", "lqip")}
         else:
-            ext = "gif"
-        
-        compressed_size = len(content)
-        compression_ratio = round((1 - compressed_size / original_size) * 100, 1) if original_size > 0 else 0
-        
-        # Generate unique filename
-        filename = f"{uuid.uuid4().hex}.{ext}"
-        filepath = UPLOADS_DIR / filename
+            filename = f"{digest}.gif"
+            files = {filename: content}
         
-        with open(filepath, "wb") as f:
-            f.write(content)
+        stored = await upload_store.save(digest, filename, files, meta)
         
-        # Return relative path - frontend will handle the full URL
-        image_url = f"/api/uploads/{filename}"
-        
-        logging.info(f"Image uploaded: {filename} (compressed {compression_ratio}%: {original_size//1024}KB -> {compressed_size//1024}KB)")
-        return {
-            "success": True, 
-            "url": image_url, 
-            "filename": filename,
-            "original_size": original_size,
-            "compressed_size": compressed_size,
-            "compression": f"{compression_ratio}%"
-        }
+        logging.info(f"Image uploaded: {filename} ({original_size//1024}KB -> {stored['main_size']//1024}KB, {len(files)} files)")
+        return upload_response(stored, original_size)
     
     except HTTPException:
         raise
@@ -1328,37 +1557,57 @@ async def upload_image(file: UploadFile = File(...), user: User = Depends(requir
         logging.error(f"Error uploading image: {e}")
         raise HTTPException(status_code=500, detail="Erreur lors de l'upload")
 
+async def image_placeholders_for(images: List[str]) -> dict:
+    """{url: {lqip, width, height}} for the uploaded images of a product"""
+    urls = [url for url in images or [] if "/api/uploads/" in url]
+    if not urls:
+        return {}
+    # Stored URLs may be absolute (older products); uploads are recorded by relative URL
+    relative = {url[url.index("/api/uploads/"):]: url for url in urls}
+    placeholders = {}
+    async for upload in db[STORE_COLLECTION].find(
+        {"url": {"$in": list(relative)}}, {"_id": 0, "url": 1, "lqip": 1, "width": 1, "height": 1}
+    ):
+        if "lqip" in upload:
+            placeholders[relative[upload["url"]]] = {k: upload[k] for k in ("lqip", "width", "height")}
+    return placeholders
+
 @api_router.get("/uploads/{filename}")
-async def get_uploaded_image(filename: str, response: Response):
-    """Serve uploaded images with caching headers"""
-    filepath = UPLOADS_DIR / filename
-    
-    if not filepath.exists():
-        raise HTTPException(status_code=404, detail="Image non trouvée")
-    
-    # Determine content type
-    ext = filename.split(".")[-1].lower()
-    content_types = {
-        "jpg": "image/jpeg",
-        "jpeg": "image/jpeg",
-        "png": "image/png",
-        "webp": "image/webp",
-        "gif": "image/gif"
-    }
-    content_type = content_types.get(ext, "image/jpeg")
-    
-    with open(filepath, "rb") as f:
-        content = f.read()
+async def get_uploaded_image(
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096, description="Largeur d'affichage souhaitée en pixels")
+):
+    """Serve uploaded images with caching headers, picking the variant by w= and Accept"""
+    backend = upload_store.backend
+    names = await upload_store.file_names(filename)
+    if names is not None:
+        exists = names.__contains__
+    else:
+        # Files uploaded before content addressing live on local disk only
+        backend = None
+        if not (UPLOADS_DIR / filename).is_file():
+            raise HTTPException(status_code=404, detail="Image non trouvée")
+        exists = lambda name: (UPLOADS_DIR / name).exists()
+    
+    served = pick_variant(filename, w, request.headers.get("accept", ""), exists)
+    path = backend.path(served) if backend else UPLOADS_DIR / served
+    if path is None:
+        # Object storage: the client fetches the bytes from the bucket/CDN
+        return RedirectResponse(
+            backend.url(served), status_code=302,
+            headers={"Cache-Control": "public, max-age=600", "Vary": "Accept"}
+        )
     
-    # Add caching headers for better performance
-    return Response(
-        content=content, 
-        media_type=content_type,
-        headers={
-            "Cache-Control": "public, max-age=31536000",  # Cache for 1 year
-            "ETag": hashlib.md5(content).hexdigest()
-        }
+    # Streamed from disk (or by nginx via X-Accel-Redirect); 304 on revalidation
+    response = serve_file(
+        request, path, content_type_for(served),
+        headers={"Cache-Control": IMMUTABLE_CACHE, "Vary": "Accept"},
+        accel_path=served
     )
+    if response is None:
+        raise HTTPException(status_code=404, detail="Image non trouvée")
+    return response
 
 # ============== PRODUCTS ROUTES ==============
 
@@ -1379,8 +1628,8 @@ async def get_products(
     cache_key = None
     if not search and skip == 0 and limit <= 50:
         cache_key = f"products:{category}:{featured}:{is_new}:{is_promo}:{limit}"
-        cached = get_cached(cache_key)
-        if cached:
+        cached = await get_cached(cache_key)
+        if cached is not None:
             return cached
     
     query = {}
@@ -1393,11 +1642,6 @@ async def get_products(
         query["is_new"] = is_new
     if is_promo is not None:
         query["is_promo"] = is_promo
-    if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}}
-        ]
     
     # Use projection to limit data transfer and memory usage
     projection = {
@@ -1427,7 +1671,21 @@ async def get_products(
         "updated_at": 1
     }
     
-    products = await db.products.find(query, projection).skip(skip).limit(limit).to_list(limit)
+    if search and product_search.ready:
+        # Ranked ids from the in-memory index, then one $in for this page
+        page_ids, _ = product_search.search(search, query, limit=limit, skip=skip, db=db)
+        found = await db.products.find({"product_id": {"$in": page_ids}}, projection).to_list(len(page_ids))
+        by_id = {product["product_id"]: product for product in found}
+        products = [by_id[product_id] for product_id in page_ids if product_id in by_id]
+    elif search:
+        # Index still building: the Mongo text index, best matches first
+        query.update(text_search_query(search))
+        projection["score"] = {"$meta": "textScore"}
+        products = await db.products.find(query, projection).sort([("score", {"$meta": "textScore"})]).skip(skip).limit(limit).to_list(limit)
+        for product in products:
+            product.pop("score", None)
+    else:
+        products = await db.products.find(query, projection).skip(skip).limit(limit).to_list(limit)
     
     for product in products:
         for field in ['created_at', 'updated_at']:
@@ -1436,10 +1694,20 @@ async def get_products(
     
     # Cache the result
     if cache_key:
-        set_cached(cache_key, products, ttl=30)  # Cache for 30 seconds
+        await set_cached(cache_key, products, ttl=PRODUCTS_CACHE_TTL, tags=("products",))
     
     return products
 
+@api_router.get("/search/suggest")
+async def search_suggestions(
+    response: Response,
+    q: str = Query("", max_length=100),
+    limit: int = Query(8, ge=1, le=20)
+):
+    """Typeahead: products, brands, categories and professions, answered from memory"""
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return {"query": q, "suggestions": search_suggest.suggest(q, limit)}
+
 @api_router.get("/products/{product_id}", response_model=Product)
 async def get_product(product_id: str):
     product = await db.products.find_one({"product_id": product_id}, {"_id": 0})
@@ -1459,14 +1727,14 @@ async def create_product(product_data: ProductCreate, user: User = Depends(requi
     
     product_doc = product_data.model_dump()
     product_doc["product_id"] = product_id
+    product_doc["image_placeholders"] = await image_placeholders_for(product_doc["images"])
     product_doc["created_at"] = now.isoformat()
     product_doc["updated_at"] = now.isoformat()
     
     await db.products.insert_one(product_doc)
+    await upload_store.retain(product_doc["images"])
     
-    # Clear products cache
-    clear_cache("products")
-    clear_cache("flash_sales")
+    await catalog_bus.publish(PRODUCT_CREATED, [product_id])
     
     product_doc["created_at"] = now
     product_doc["updated_at"] = now
@@ -1480,16 +1748,16 @@ async def update_product(product_id: str, product_data: ProductCreate, user: Use
         raise HTTPException(status_code=404, detail="Produit non trouvé")
     
     update_doc = product_data.model_dump()
+    update_doc["image_placeholders"] = await image_placeholders_for(update_doc["images"])
     update_doc["updated_at"] = datetime.now(timezone.utc).isoformat()
     
     await db.products.update_one(
         {"product_id": product_id},
         {"$set": update_doc}
     )
+    await upload_store.replace(existing.get("images"), update_doc["images"])
     
-    # Clear products cache
-    clear_cache("products")
-    clear_cache("flash_sales")
+    await catalog_bus.publish(PRODUCT_UPDATED, [product_id], update_doc.keys())
     
     updated = await db.products.find_one({"product_id": product_id}, {"_id": 0})
     for field in ['created_at', 'updated_at']:
@@ -1502,13 +1770,12 @@ async def update_product(product_id: str, product_data: ProductCreate, user: Use
 @api_router.delete("/admin/products/{product_id}")
 async def delete_product(product_id: str, user: User = Depends(require_admin)):
     """Delete a product (accessible via both /products/ and /admin/products/)"""
-    result = await db.products.delete_one({"product_id": product_id})
-    if result.deleted_count == 0:
+    deleted = await db.products.find_one_and_delete({"product_id": product_id}, {"_id": 0, "images": 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
+    await upload_store.release(deleted.get("images"))
     
-    # Clear products cache
-    clear_cache("products")
-    clear_cache("flash_sales")
+    await catalog_bus.publish(PRODUCT_DELETED, [product_id])
     
     return {"message": "Produit supprimé"}
 
@@ -1518,8 +1785,8 @@ async def delete_product(product_id: str, user: User = Depends(require_admin)):
 async def get_flash_sales():
     """Get all active flash sale products with memory optimization and caching"""
     # Check cache first
-    cached = get_cached("flash_sales")
-    if cached:
+    cached = await get_cached("flash_sales")
+    if cached is not None:
         return cached
     
     now = datetime.now(timezone.utc).isoformat()
@@ -1563,8 +1830,18 @@ async def get_flash_sales():
         if isinstance(product.get('updated_at'), str):
             product['updated_at'] = datetime.fromisoformat(product['updated_at'])
     
-    # Cache for 30 seconds
-    set_cached("flash_sales", products, ttl=30)
+    # Cache until the next sale ends, at most FLASH_SALES_CACHE_TTL
+    ttl = FLASH_SALES_CACHE_TTL
+    if products:
+        try:
+            next_end = datetime.fromisoformat(products[0]["flash_sale_end"])
+            if next_end.tzinfo is None:
+                next_end = next_end.replace(tzinfo=timezone.utc)
+            seconds_left = (next_end - datetime.now(timezone.utc)).total_seconds()
+            ttl = max(1, min(ttl, int(seconds_left)))
+        except (KeyError, TypeError, ValueError):
+            pass
+    await set_cached("flash_sales", products, ttl=ttl, tags=("products", "flash_sales"))
     
     return products
 
@@ -1597,6 +1874,8 @@ async def create_flash_sale(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
     
+    await catalog_bus.publish(FLASH_SALE_CHANGED, [product_id])
+    
     return {"message": "Vente flash créée"}
 
 @api_router.delete("/admin/flash-sales/{product_id}")
@@ -1617,6 +1896,8 @@ async def remove_flash_sale(product_id: str, user: User = Depends(require_admin)
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
     
+    await catalog_bus.publish(FLASH_SALE_CHANGED, [product_id])
+    
     return {"message": "Vente flash supprimée"}
 
 # ============== SIMILAR PRODUCTS ROUTE ==============
@@ -1824,7 +2105,7 @@ async def mark_review_helpful(review_id: str, request: Request):
     return {"message": "Merci pour votre retour"}
 
 @api_router.delete("/reviews/{review_id}")
-async def delete_review(review_id: str, user: User = Depends(require_auth)):
+async def delete_review(review_id: str, user: User = Depends(require_verified_user)):
     """Delete a review (own review or admin)"""
     review = await db.reviews.find_one({"review_id": review_id}, {"_id": 0})
     if not review:
@@ -1834,6 +2115,7 @@ async def delete_review(review_id: str, user: User = Depends(require_auth)):
         raise HTTPException(status_code=403, detail="Non autorisé")
     
     await db.reviews.delete_one({"review_id": review_id})
+    await upload_store.release(referenced_urls("reviews", review))
     return {"message": "Avis supprimé"}
 
 # ============== STOCK NOTIFICATION ==============
@@ -3521,12 +3803,12 @@ async def reset_password(data: PasswordResetConfirm):
         raise HTTPException(status_code=400, detail="Le mot de passe doit contenir au moins 6 caractères")
     
     # Hash new password
-    hashed_password = bcrypt.hashpw(data.new_password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = await hash_password(data.new_password)
     
     # Update user password
     await db.users.update_one(
         {"user_id": reset_record["user_id"]},
-        {"$set": {"password": hashed_password.decode('utf-8')}}
+        {"$set": {"password": hashed_password}}
     )
     
     # Mark token as used
@@ -3550,8 +3832,7 @@ async def send_order_confirmation_email(order: dict):
     
     try:
         # Generate invoice PDF
-        pdf_buffer = generate_invoice_pdf(order)
-        pdf_content = pdf_buffer.getvalue()
+        pdf_content = await order_invoice_pdf(order)
         pdf_filename = f"facture_{order.get('order_id', 'commande')}.pdf"
         
         # Build email content
@@ -3832,6 +4113,10 @@ async def send_email_async(to: str, subject: str, html: str) -> dict:
     else:
         return {"success": False, "error": result.get("error")}
 
+# Persistent outbound queue: campaigns and marketing workflows are delivered by
+# background workers, through MailerSend bulk requests when available
+email_queue = EmailQueue(db, send_email_http, render=get_email_template, bulk=create_bulk_client())
+
 # ============== ADVANCED EMAIL MARKETING WORKFLOWS ==============
 
 async def process_post_purchase_reviews():
@@ -3890,16 +4175,24 @@ async def process_post_purchase_reviews():
             </div>
             """
             
-            result = await send_email_async(email, "⭐ Votre avis sur votre achat - YAMA+", html)
-            
-            if result.get("success"):
+            # Marked before queueing: the worker may settle the job right away
+            await db.orders.update_one(
+                {"order_id": order["order_id"]},
+                {"$set": {"review_email_sent": True, "review_email_sent_at": datetime.now(timezone.utc).isoformat()}}
+            )
+            try:
+                await email_queue.enqueue(
+                    email, "⭐ Votre avis sur votre achat - YAMA+", html, name,
+                    ref={"collection": "orders", "filter": {"order_id": order["order_id"]}, "field": "review_email_status"}
+                )
+            except Exception:
                 await db.orders.update_one(
-                    {"order_id": order["order_id"]},
-                    {"$set": {"review_email_sent": True, "review_email_sent_at": datetime.now(timezone.utc).isoformat()}}
+                    {"order_id": order["order_id"]}, {"$unset": {"review_email_sent": "", "review_email_sent_at": ""}}
                 )
-                sent_count += 1
+                raise
+            sent_count += 1
         
-        logger.info(f"Post-purchase review emails: sent {sent_count}")
+        logger.info(f"Post-purchase review emails: queued {sent_count}")
     except Exception as e:
         logger.error(f"Error in post-purchase review workflow: {e}")
 
@@ -3978,19 +4271,26 @@ async def process_vip_customer_rewards():
             </div>
             """
             
-            result = await send_email_async(user["email"], "👑 Récompense VIP exclusive - YAMA+", html)
-            
-            if result.get("success"):
-                await db.vip_emails.insert_one({
-                    "user_id": user_id,
-                    "month": this_month,
-                    "code": vip_code,
-                    "total_spent": vip["total_spent"],
-                    "sent_at": datetime.now(timezone.utc).isoformat()
-                })
-                sent_count += 1
+            # Tracked before queueing: the worker may settle the job right away
+            await db.vip_emails.insert_one({
+                "user_id": user_id,
+                "month": this_month,
+                "code": vip_code,
+                "total_spent": vip["total_spent"],
+                "status": "queued",
+                "sent_at": datetime.now(timezone.utc).isoformat()
+            })
+            try:
+                await email_queue.enqueue(
+                    user["email"], "👑 Récompense VIP exclusive - YAMA+", html, user.get("name", ""),
+                    ref={"collection": "vip_emails", "filter": {"user_id": user_id, "month": this_month}, "field": "status"}
+                )
+            except Exception:
+                await db.vip_emails.delete_one({"user_id": user_id, "month": this_month})
+                raise
+            sent_count += 1
         
-        logger.info(f"VIP customer emails: sent {sent_count}")
+        logger.info(f"VIP customer emails: queued {sent_count}")
     except Exception as e:
         logger.error(f"Error in VIP customer workflow: {e}")
 
@@ -4080,17 +4380,24 @@ async def process_winback_campaign():
             </div>
             """
             
-            result = await send_email_async(user["email"], "💔 Vous nous manquez - Cadeau inside !", html)
-            
-            if result.get("success"):
-                await db.winback_emails.insert_one({
-                    "user_id": user_id,
-                    "code": winback_code,
-                    "sent_at": datetime.now(timezone.utc).isoformat()
-                })
-                sent_count += 1
+            # Tracked before queueing: the worker may settle the job right away
+            await db.winback_emails.insert_one({
+                "user_id": user_id,
+                "code": winback_code,
+                "status": "queued",
+                "sent_at": datetime.now(timezone.utc).isoformat()
+            })
+            try:
+                await email_queue.enqueue(
+                    user["email"], "💔 Vous nous manquez - Cadeau inside !", html, user.get("name", ""),
+                    ref={"collection": "winback_emails", "filter": {"user_id": user_id, "code": winback_code}, "field": "status"}
+                )
+            except Exception:
+                await db.winback_emails.delete_one({"user_id": user_id, "code": winback_code})
+                raise
+            sent_count += 1
         
-        logger.info(f"Winback campaign emails: sent {sent_count}")
+        logger.info(f"Winback campaign emails: queued {sent_count}")
     except Exception as e:
         logger.error(f"Error in winback campaign: {e}")
 
@@ -4108,6 +4415,19 @@ async def process_wishlist_reminders():
             ]
         }, {"_id": 0}).to_list(50)
         
+        # Wishlist items are {"product_id", "added_at"} entries; max 3 shown per email
+        def reminder_product_ids(wishlist):
+            return [
+                item["product_id"] if isinstance(item, dict) else item
+                for item in wishlist.get("items", [])[:3]
+            ]
+        
+        products = await hydrate_products(
+            db,
+            [pid for wishlist in wishlists for pid in reminder_product_ids(wishlist)],
+            SUMMARY_PROJECTION
+        )
+        
         sent_count = 0
         for wishlist in wishlists:
             user_id = wishlist.get("user_id")
@@ -4120,12 +4440,12 @@ async def process_wishlist_reminders():
             
             # Get wishlist items details
             items_html = ""
-            for item_id in wishlist.get("items", [])[:3]:  # Max 3 items
-                product = await db.products.find_one({"product_id": item_id}, {"_id": 0})
+            for item_id in reminder_product_ids(wishlist):
+                product = products.get(item_id)
                 if product:
                     items_html += f"""
                     <div style="display: inline-block; width: 150px; margin: 10px; text-align: center; vertical-align: top;">
-                        <img src="{product.get('images', [''])[0]}" alt="{product.get('name')}" 
+                        <img src="{first_image(product)}" alt="{product.get('name')}" 
                              style="width: 120px; height: 120px; object-fit: cover; border-radius: 8px;" />
                         <p style="margin: 10px 0 5px 0; font-size: 14px; font-weight: 600; color: #333;">{product.get('name', '')[:30]}</p>
                         <p style="margin: 0; font-size: 16px; color: #00A651; font-weight: bold;">{product.get('price', 0):,} FCFA</p>
@@ -4161,16 +4481,29 @@ async def process_wishlist_reminders():
             </div>
             """
             
-            result = await send_email_async(user["email"], "❤️ Vos favoris vous attendent - YAMA+", html)
-            
-            if result.get("success"):
-                await db.wishlists.update_one(
-                    {"user_id": user_id},
-                    {"$set": {"reminder_sent_at": datetime.now(timezone.utc).isoformat()}}
+            # Tracked before queueing: the worker may settle the job right away
+            previous = await db.wishlists.find_one_and_update(
+                {"user_id": user_id},
+                {"$set": {"reminder_sent_at": datetime.now(timezone.utc).isoformat(), "reminder_status": "queued"}},
+                projection={"_id": 0, "reminder_sent_at": 1, "reminder_status": 1},
+                return_document=ReturnDocument.BEFORE
+            )
+            try:
+                await email_queue.enqueue(
+                    user["email"], "❤️ Vos favoris vous attendent - YAMA+", html, user.get("name", ""),
+                    ref={"collection": "wishlists", "filter": {"user_id": user_id}, "field": "reminder_status"}
                 )
-                sent_count += 1
+            except Exception:
+                previous = previous or {}
+                restore = {"$set": previous} if previous else {}
+                missing = {field: "" for field in ("reminder_sent_at", "reminder_status") if field not in previous}
+                if missing:
+                    restore["$unset"] = missing
+                await db.wishlists.update_one({"user_id": user_id}, restore)
+                raise
+            sent_count += 1
         
-        logger.info(f"Wishlist reminder emails: sent {sent_count}")
+        logger.info(f"Wishlist reminder emails: queued {sent_count}")
     except Exception as e:
         logger.error(f"Error in wishlist reminder workflow: {e}")
 
@@ -4228,16 +4561,24 @@ async def process_order_tracking_updates():
             </div>
             """
             
-            result = await send_email_async(email, f"🚚 Commande #{order.get('order_id')} en route !", html)
-            
-            if result.get("success"):
+            # Marked before queueing: the worker may settle the job right away
+            await db.orders.update_one(
+                {"order_id": order["order_id"]},
+                {"$set": {"tracking_email_sent": True, "tracking_email_sent_at": datetime.now(timezone.utc).isoformat()}}
+            )
+            try:
+                await email_queue.enqueue(
+                    email, f"🚚 Commande #{order.get('order_id')} en route !", html, name,
+                    ref={"collection": "orders", "filter": {"order_id": order["order_id"]}, "field": "tracking_email_status"}
+                )
+            except Exception:
                 await db.orders.update_one(
-                    {"order_id": order["order_id"]},
-                    {"$set": {"tracking_email_sent": True, "tracking_email_sent_at": datetime.now(timezone.utc).isoformat()}}
+                    {"order_id": order["order_id"]}, {"$unset": {"tracking_email_sent": "", "tracking_email_sent_at": ""}}
                 )
-                sent_count += 1
+                raise
+            sent_count += 1
         
-        logger.info(f"Order tracking emails: sent {sent_count}")
+        logger.info(f"Order tracking emails: queued {sent_count}")
     except Exception as e:
         logger.error(f"Error in order tracking workflow: {e}")
 
@@ -4445,9 +4786,26 @@ async def delete_campaign(campaign_id: str, user: User = Depends(require_admin))
         raise HTTPException(status_code=404, detail="Campagne non trouvée")
     return {"message": "Campagne supprimée"}
 
+async def campaign_recipients(target_audience: str):
+    """Walk campaign recipients by _id (duplicates are dropped by the queue's unique index)"""
+    projection = {"_id": 0, "email": 1, "name": 1}
+    if target_audience in ["newsletter", "all"]:
+        async for recipient in iterate_keyset(db.newsletter, {"active": True}, [("_id", 1)], projection):
+            yield recipient
+    if target_audience in ["customers", "all"]:
+        async for recipient in iterate_keyset(db.users, {}, [("_id", 1)], projection):
+            yield recipient
+
+async def keyset_page(collection, query: dict, sort: list, limit: int, cursor: Optional[str], projection: dict):
+    """paginate() with a 400 on cursors that do not belong to this listing"""
+    try:
+        return await paginate(collection, query, sort, limit, cursor, projection)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+
 @api_router.post("/admin/campaigns/{campaign_id}/send")
 async def send_campaign(campaign_id: str, user: User = Depends(require_admin)):
-    """Send a campaign to all subscribers in batches to prevent memory issues"""
+    """Queue a campaign for delivery; progress is available on /progress"""
     campaign = await db.campaigns.find_one({"campaign_id": campaign_id}, {"_id": 0})
     if not campaign:
         raise HTTPException(status_code=404, detail="Campagne non trouvée")
@@ -4455,125 +4813,70 @@ async def send_campaign(campaign_id: str, user: User = Depends(require_admin)):
     if campaign["status"] == "sent":
         raise HTTPException(status_code=400, detail="Cette campagne a déjà été envoyée")
     
-    # Count recipients first to avoid loading all into memory
-    if campaign["target_audience"] == "newsletter":
-        total_recipients = await db.newsletter.count_documents({"active": True})
-    elif campaign["target_audience"] == "customers":
-        total_recipients = await db.users.count_documents({})
-    else:  # all
-        newsletter_count = await db.newsletter.count_documents({"active": True})
-        users_count = await db.users.count_documents({})
-        # Estimate total (may have some overlap)
-        total_recipients = newsletter_count + users_count
-    
-    if total_recipients == 0:
-        raise HTTPException(status_code=400, detail="Aucun destinataire trouvé")
-    
-    # Update campaign status
-    await db.campaigns.update_one(
-        {"campaign_id": campaign_id},
+    try:
+        await email_queue.ensure_capacity()
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="File d'envoi saturée, réessayez plus tard")
+    
+    # Claim the campaign atomically so a double click cannot queue it twice
+    result = await db.campaigns.update_one(
+        {"campaign_id": campaign_id, "status": {"$nin": ["sending", "sent"]}},
         {"$set": {
             "status": "sending",
-            "total_recipients": total_recipients,
+            "enqueue_complete": False,
+            "total_recipients": 0,
+            "sent_count": 0,
+            "failed_count": 0,
             "sent_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=400, detail="Cette campagne est déjà en cours d'envoi")
     
-    # Send emails in batches to prevent memory issues
-    html_template = get_email_template(campaign["content"])
-    sent_count = 0
-    errors = []
-    batch_size = 50  # Process 50 emails at a time
-    
-    # Process newsletter subscribers
-    if campaign["target_audience"] in ["newsletter", "all"]:
-        skip = 0
-        while True:
-            batch = await db.newsletter.find(
-                {"active": True}, 
-                {"_id": 0, "email": 1, "name": 1}
-            ).skip(skip).limit(batch_size).to_list(batch_size)
-            
-            if not batch:
-                break
-                
-            for recipient in batch:
-                try:
-                    result = await send_email_async(recipient["email"], campaign["subject"], html_template)
-                    if result["success"]:
-                        sent_count += 1
-                    else:
-                        errors.append({"email": recipient["email"], "error": result["error"]})
-                except Exception as e:
-                    errors.append({"email": recipient["email"], "error": str(e)})
-                
-                # Small delay to avoid rate limiting
-                await asyncio.sleep(0.1)
-            
-            skip += batch_size
-            # Clear batch from memory
-            del batch
-            
-            # Break if we have too many errors
-            if len(errors) > 100:
-                break
-    
-    # Process registered users (if target is "customers" or "all")
-    if campaign["target_audience"] in ["customers", "all"]:
-        skip = 0
-        processed_emails = set()  # Track emails to avoid duplicates
-        
-        while True:
-            batch = await db.users.find(
-                {}, 
-                {"_id": 0, "email": 1, "name": 1}
-            ).skip(skip).limit(batch_size).to_list(batch_size)
-            
-            if not batch:
-                break
-                
-            for recipient in batch:
-                # Skip if already processed (for "all" target)
-                if recipient["email"] in processed_emails:
-                    continue
-                processed_emails.add(recipient["email"])
-                
-                try:
-                    result = await send_email_async(recipient["email"], campaign["subject"], html_template)
-                    if result["success"]:
-                        sent_count += 1
-                    else:
-                        errors.append({"email": recipient["email"], "error": result["error"]})
-                except Exception as e:
-                    errors.append({"email": recipient["email"], "error": str(e)})
-                
-                # Small delay to avoid rate limiting
-                await asyncio.sleep(0.1)
-            
-            skip += batch_size
-            # Clear batch from memory
-            del batch
-            
-            # Break if we have too many errors
-            if len(errors) > 100:
-                break
+    email_queue.start_campaign(campaign_id, campaign_recipients(campaign["target_audience"]))
     
-    # Update final status
-    await db.campaigns.update_one(
+    return {
+        "message": "Campagne mise en file d'envoi",
+        "campaign_id": campaign_id,
+        "status": "sending"
+    }
+
+@api_router.get("/admin/campaigns/{campaign_id}/progress")
+async def get_campaign_progress(campaign_id: str, user: User = Depends(require_admin)):
+    """Delivery progress of a queued campaign (polled by the admin UI)"""
+    campaign = await db.campaigns.find_one(
         {"campaign_id": campaign_id},
-        {"$set": {
-            "status": "sent",
-            "sent_count": sent_count
-        }}
+        {"_id": 0, "campaign_id": 1, "status": 1, "total_recipients": 1, "sent_count": 1,
+         "failed_count": 1, "enqueue_complete": 1, "sent_at": 1, "completed_at": 1}
     )
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campagne non trouvée")
     
+    queue = await email_queue.campaign_progress(campaign_id)
+    total = campaign.get("total_recipients") or 0
+    done = campaign.get("sent_count", 0) + campaign.get("failed_count", 0)
     return {
-        "message": f"Campagne envoyée à {sent_count} destinataires",
-        "sent_count": sent_count,
-        "total_recipients": total_recipients,
-        "errors": errors[:10] if errors else []  # Return first 10 errors
+        **campaign,
+        "queue": queue,
+        "progress": round(done / total * 100, 1) if total else 0
     }
 
+@api_router.get("/admin/email-queue/stats")
+async def get_email_queue_stats(user: User = Depends(require_admin)):
+    """Backlog size and this worker's delivery counters"""
+    return {"pending": await email_queue.pending_count(), **email_queue.stats()}
+
+@api_router.get("/admin/email-queue/dead-letters")
+async def get_email_dead_letters(campaign_id: Optional[str] = None, limit: int = 100, user: User = Depends(require_admin)):
+    """Emails that exhausted their retries"""
+    return await email_queue.dead_letters(min(limit, 500), campaign_id)
+
+@api_router.post("/admin/email-queue/dead-letters/retry")
+async def retry_email_dead_letters(campaign_id: Optional[str] = None, user: User = Depends(require_admin)):
+    """Put dead letters back in the queue"""
+    count = await email_queue.retry_dead(campaign_id)
+    return {"message": f"{count} emails remis en file d'envoi", "count": count}
+
 @api_router.post("/admin/campaigns/{campaign_id}/test")
 async def send_test_email(campaign_id: str, request: Request, user: User = Depends(require_admin)):
     """Send a test email to admin"""
@@ -5010,19 +5313,21 @@ async def get_cart(request: Request):
     if not cart:
         return {"items": [], "total": 0}
     
-    # Fetch product details for each item
+    # Fetch product details for all items in one query
+    items = cart.get("items", [])
+    products = await hydrate_products(db, [i["product_id"] for i in items], CART_PROJECTION)
     enriched_items = []
     total = 0
     
-    for item in cart.get("items", []):
-        product = await db.products.find_one({"product_id": item["product_id"]}, {"_id": 0})
+    for item in items:
+        product = products.get(item["product_id"])
         if product:
             enriched_items.append({
                 "product_id": item["product_id"],
                 "quantity": item["quantity"],
                 "name": product["name"],
                 "price": product["price"],
-                "image": product["images"][0] if product["images"] else "",
+                "image": first_image(product),
                 "stock": product["stock"]
             })
             total += product["price"] * item["quantity"]
@@ -5046,99 +5351,48 @@ async def add_to_cart(item: CartItem, request: Request, response: Response):
             path="/"
         )
     
-    # Check product exists and has stock
-    product = await db.products.find_one({"product_id": item.product_id}, {"_id": 0})
-    if not product:
-        raise HTTPException(status_code=404, detail="Produit non trouvé")
-    if product["stock"] < item.quantity:
+    # Check product exists and has stock (flash-sale SKUs: from the hot inventory counter)
+    left = hot_inventory.last_known(item.product_id)
+    if left is None:
+        product = await db.products.find_one({"product_id": item.product_id}, {"_id": 0, "stock": 1})
+        if not product:
+            raise HTTPException(status_code=404, detail="Produit non trouvé")
+        left = product["stock"]
+    if left < item.quantity:
         raise HTTPException(status_code=400, detail="Stock insuffisant")
     
-    query = {"user_id": user.user_id} if user else {"session_id": session_id}
-    cart = await db.carts.find_one(query, {"_id": 0})
-    
-    now = datetime.now(timezone.utc).isoformat()
+    owner = cart_owner(user.user_id if user else None, session_id)
+    cart = await add_cart_item(db.carts, owner, item.product_id, item.quantity)
     
-    if cart:
-        # Update existing cart
-        items = cart.get("items", [])
-        found = False
-        for i, existing_item in enumerate(items):
-            if existing_item["product_id"] == item.product_id:
-                items[i]["quantity"] += item.quantity
-                found = True
-                break
-        
-        if not found:
-            items.append({"product_id": item.product_id, "quantity": item.quantity})
-        
-        await db.carts.update_one(query, {"$set": {"items": items, "updated_at": now}})
-    else:
-        # Create new cart
-        cart_doc = {
-            "cart_id": f"cart_{uuid.uuid4().hex[:12]}",
-            "user_id": user.user_id if user else None,
-            "session_id": session_id if not user else None,
-            "items": [{"product_id": item.product_id, "quantity": item.quantity}],
-            "created_at": now,
-            "updated_at": now
-        }
-        await db.carts.insert_one(cart_doc)
-    
-    return {"message": "Produit ajouté au panier"}
+    return {"message": "Produit ajouté au panier", "items": cart["items"]}
 
 @api_router.put("/cart/update")
 async def update_cart_item(item: CartItem, request: Request):
     user = await get_current_user(request)
     session_id = request.cookies.get("cart_session") or request.headers.get("X-Cart-Session")
     
-    query = {}
-    if user:
-        query["user_id"] = user.user_id
-    elif session_id:
-        query["session_id"] = session_id
-    else:
+    if not user and not session_id:
         raise HTTPException(status_code=400, detail="Panier non trouvé")
     
-    cart = await db.carts.find_one(query, {"_id": 0})
+    owner = cart_owner(user.user_id if user else None, session_id)
+    cart = await set_cart_quantity(db.carts, owner, item.product_id, item.quantity)
     if not cart:
         raise HTTPException(status_code=404, detail="Panier non trouvé")
     
-    items = cart.get("items", [])
-    
-    if item.quantity <= 0:
-        items = [i for i in items if i["product_id"] != item.product_id]
-    else:
-        for i, existing_item in enumerate(items):
-            if existing_item["product_id"] == item.product_id:
-                items[i]["quantity"] = item.quantity
-                break
-    
-    await db.carts.update_one(
-        query,
-        {"$set": {"items": items, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
-    
-    return {"message": "Panier mis à jour"}
+    return {"message": "Panier mis à jour", "items": cart["items"]}
 
 @api_router.delete("/cart/remove/{product_id}")
 async def remove_from_cart(product_id: str, request: Request):
     user = await get_current_user(request)
     session_id = request.cookies.get("cart_session") or request.headers.get("X-Cart-Session")
     
-    query = {}
-    if user:
-        query["user_id"] = user.user_id
-    elif session_id:
-        query["session_id"] = session_id
-    else:
+    if not user and not session_id:
         raise HTTPException(status_code=400, detail="Panier non trouvé")
     
-    await db.carts.update_one(
-        query,
-        {"$pull": {"items": {"product_id": product_id}}}
-    )
+    owner = cart_owner(user.user_id if user else None, session_id)
+    cart = await remove_cart_item(db.carts, owner, product_id)
     
-    return {"message": "Produit retiré du panier"}
+    return {"message": "Produit retiré du panier", "items": cart["items"] if cart else []}
 
 @api_router.delete("/cart/clear")
 async def clear_cart(request: Request):
@@ -5164,17 +5418,19 @@ async def get_wishlist(user: User = Depends(require_auth)):
     if not wishlist:
         return {"items": []}
     
-    # Fetch product details
+    # Fetch product details for all items in one query
+    items = wishlist.get("items", [])
+    products = await hydrate_products(db, [i["product_id"] for i in items], CART_PROJECTION)
     enriched_items = []
-    for item in wishlist.get("items", []):
-        product = await db.products.find_one({"product_id": item["product_id"]}, {"_id": 0})
+    for item in items:
+        product = products.get(item["product_id"])
         if product:
             enriched_items.append({
                 "product_id": item["product_id"],
                 "added_at": item["added_at"],
                 "name": product["name"],
                 "price": product["price"],
-                "image": product["images"][0] if product["images"] else "",
+                "image": first_image(product),
                 "stock": product["stock"]
             })
     
@@ -5235,10 +5491,12 @@ async def get_shared_wishlist(share_id: str):
     if not wishlist:
         raise HTTPException(status_code=404, detail="Liste introuvable")
     
-    # Fetch product details
+    # Fetch product details for all items in one query
+    items = wishlist.get("items", [])
+    products = await hydrate_products(db, [i["product_id"] for i in items], WISHLIST_PROJECTION)
     enriched_items = []
-    for item in wishlist.get("items", []):
-        product = await db.products.find_one({"product_id": item["product_id"]}, {"_id": 0})
+    for item in items:
+        product = products.get(item["product_id"])
         if product:
             enriched_items.append({
                 "product_id": product["product_id"],
@@ -5416,29 +5674,35 @@ async def create_review_with_media(
     
     # Process media files
     media_urls = []
-    uploads_dir = Path("uploads/reviews")
-    uploads_dir.mkdir(parents=True, exist_ok=True)
     
     for file in media[:5]:  # Max 5 files
         if file.size > 10 * 1024 * 1024:  # 10MB limit
             continue
         
-        # Generate unique filename
         ext = Path(file.filename).suffix.lower()
         if ext not in ['.jpg', '.jpeg', '.png', '.gif', '.mp4', '.mov', '.webm']:
             continue
         
-        filename = f"review_{uuid.uuid4().hex[:12]}{ext}"
-        filepath = uploads_dir / filename
-        
         content = await file.read()
-        with open(filepath, "wb") as f:
-            f.write(content)
-        
         media_type = "video" if ext in ['.mp4', '.mov', '.webm'] else "image"
+        
+        # Stored by content hash: a file already uploaded is not processed again
+        digest = content_hash(content)
+        stored = await upload_store.find(digest)
+        if not stored:
+            # Photos are compressed like product images (GIFs keep their animation)
+            if ext in ['.jpg', '.jpeg', '.png']:
+                try:
+                    content, compressed_ext = await image_processor.compress(content)
+                except ImagePoolBusy:
+                    raise image_pool_busy()
+                ext = f".{compressed_ext}"
+            filename = f"{digest}{ext}"
+            stored = await upload_store.save(digest, filename, {filename: content})
+        
         media_urls.append({
             "type": media_type,
-            "url": f"/api/uploads/reviews/{filename}"
+            "url": stored["url"]
         })
     
     now = datetime.now(timezone.utc).isoformat()
@@ -5458,15 +5722,14 @@ async def create_review_with_media(
     }
     
     await db.reviews.insert_one(review_doc)
+    await upload_store.retain(referenced_urls("reviews", review_doc))
     
     return {"message": "Avis publié avec succès", "review_id": review_doc["review_id"]}
 
 @api_router.get("/uploads/reviews/{filename}")
-async def get_review_media(filename: str):
-    """Serve review media files"""
-    filepath = Path("uploads/reviews") / filename
-    if not filepath.exists():
-        raise HTTPException(status_code=404, detail="Fichier non trouvé")
+async def get_review_media(filename: str, request: Request):
+    """Serve review media files (byte ranges let videos seek)"""
+    filepath = REVIEW_UPLOADS_DIR / filename
     
     # Determine content type
     ext = filepath.suffix.lower()
@@ -5481,13 +5744,70 @@ async def get_review_media(filename: str):
     }
     content_type = content_types.get(ext, 'application/octet-stream')
     
-    return StreamingResponse(
-        open(filepath, "rb"),
-        media_type=content_type
+    response = serve_file(
+        request, filepath, content_type,
+        headers={"Cache-Control": IMMUTABLE_CACHE},
+        accel_path=f"reviews/{filename}"
     )
+    if response is None:
+        raise HTTPException(status_code=404, detail="Fichier non trouvé")
+    return response
 
 # ============== ORDERS ROUTES ==============
 
+# Flash-sale SKUs: stock counted in the shared store instead of on the product document.
+# The counters are state, not cache: they live under yama:hot, out of reach of app_cache.clear()
+hot_inventory = create_hot_inventory(db, app_cache.shared)
+
+# Stock is taken at checkout in one conditional bulk write; online payments hold it until paid
+stock_reservations = StockReservations(client, db, hot=hot_inventory)
+
+async def refresh_hot_inventory():
+    """Follow flash sales and write the units sold on hot SKUs back to products.stock"""
+    try:
+        flushed = await hot_inventory.refresh()
+    except Exception as e:
+        logger.error(f"Hot inventory reconcile failed: {e}")
+        return
+    if flushed:
+        await catalog_bus.publish(STOCK_CHANGED, list(flushed), ["stock"])
+
+@catalog_bus.on(FLASH_SALE_CHANGED)
+async def follow_flash_sales(event):
+    """Start or stop counting a SKU as soon as its flash sale changes"""
+    await refresh_hot_inventory()
+
+async def release_expired_reservations():
+    """Cancel online-payment orders left unpaid past their reservation and restock them"""
+    try:
+        expired = await stock_reservations.expire_due()
+    except Exception as e:
+        logger.error(f"Stock reservation expiry failed: {e}")
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    for reservation in expired:
+        order_id = reservation["order_id"]
+        changes = {"order_status": "cancelled", "payment_status": "expired", "cancelled_at": now}
+        before = await db.orders.find_one_and_update(
+            {"order_id": order_id, "payment_status": {"$ne": "paid"}},
+            {
+                "$set": changes,
+                "$push": {"status_history": {"status": "cancelled", "timestamp": now, "note": "Paiement non reçu"}}
+            },
+            projection={"_id": 0, "status_history": 0},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            continue
+        try:
+            await record_order_transition(db, before, changes)
+        except Exception as e:
+            logger.error(f"sales_daily update failed for {order_id}: {e}")
+    if expired:
+        product_ids = {item["product_id"] for reservation in expired for item in reservation["items"]}
+        await catalog_bus.publish(STOCK_CHANGED, list(product_ids), ["stock"])
+        logger.info(f"Released {len(expired)} expired stock reservation(s)")
+
 @api_router.post("/orders", response_model=Order)
 async def create_order(order_data: OrderCreate, request: Request):
     user = await get_current_user(request)
@@ -5502,14 +5822,46 @@ async def create_order(order_data: OrderCreate, request: Request):
     order_doc["order_status"] = "pending"
     order_doc["created_at"] = now.isoformat()
     
-    # Update stock for each product
-    for item in order_data.items:
-        await db.products.update_one(
-            {"product_id": item.product_id},
-            {"$inc": {"stock": -item.quantity}}
+    try:
+        quantities = order_quantities(order_data.items)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Quantité invalide")
+    
+    # Take the stock and insert the order, all or nothing; unpaid online
+    # payments only hold it until the payment is confirmed or expires.
+    # Flash-sale SKUs are taken from their hot inventory counters instead.
+    hot = {pid: qty for pid, qty in quantities.items() if hot_inventory.is_hot(pid)}
+    try:
+        if hot:
+            hot = await hot_inventory.admit(hot)
+        try:
+            await stock_reservations.place_order(
+                order_doc, hold=order_data.payment_method in ONLINE_PAYMENT_METHODS, skip=hot
+            )
+        except BaseException:
+            await hot_inventory.release(hot)
+            raise
+    except InsufficientStock as e:
+        names = [item.name for item in order_data.items if item.product_id in e.product_ids]
+        raise HTTPException(status_code=400, detail=f"Stock insuffisant: {', '.join(names)}")
+    except HotSkuBusy:
+        raise HTTPException(
+            status_code=429,
+            detail="Trop de commandes en cours sur ce produit, réessayez dans un instant",
+            headers={"Retry-After": str(HOT_RETRY_AFTER)}
         )
+    await hot_inventory.confirm(hot)
+    # order history and invoices keep showing the item images
+    await upload_store.retain(referenced_urls("orders", order_doc))
+    # hot SKUs are published when their units reach products.stock
+    cold_ids = [pid for pid in quantities if pid not in hot]
+    if cold_ids:
+        await catalog_bus.publish(STOCK_CHANGED, cold_ids, ["stock"])
     
-    await db.orders.insert_one(order_doc)
+    try:
+        await record_order(db, order_doc)
+    except Exception as e:
+        logger.error(f"sales_daily update failed for {order_id}: {e}")
     
     # Clear user's cart
     if user:
@@ -5546,7 +5898,7 @@ async def get_user_orders(user: User = Depends(require_auth)):
 @api_router.get("/orders/{order_id}")
 async def get_order(order_id: str, request: Request):
     """Get order details - public for basic tracking, full details for owner/admin"""
-    user = await get_current_user(request)
+    user = await verified_user(request)
     
     order = await db.orders.find_one({"order_id": order_id}, {"_id": 0})
     if not order:
@@ -5681,7 +6033,14 @@ class PaytechIPN(BaseModel):
 @api_router.post("/payments/paytech/initiate")
 async def initiate_paytech_payment(payment: PaymentRequest):
     """Initiate a PayTech payment (Wave, Orange Money, Free Money, Card)"""
-    
+    try:
+        return await _initiate_paytech_payment(payment)
+    except HTTPException:
+        # The checkout falls back to cash on delivery: keep the reserved stock for good
+        await stock_reservations.commit(payment.order_id)
+        raise
+
+async def _initiate_paytech_payment(payment: PaymentRequest):
     # Get PayTech credentials
     api_key = os.environ.get('PAYTECH_API_KEY', '')
     api_secret = os.environ.get('PAYTECH_API_SECRET', '')
@@ -5807,15 +6166,27 @@ async def paytech_ipn_webhook(request: Request):
             
             if order_id:
                 # Update order status
-                await db.orders.update_one(
+                changes = {
+                    "payment_status": "paid",
+                    "order_status": "processing",
+                    "payment_method_used": payment_method,
+                    "paid_at": datetime.now(timezone.utc).isoformat()
+                }
+                before = await db.orders.find_one_and_update(
                     {"order_id": order_id},
-                    {"$set": {
-                        "payment_status": "paid",
-                        "order_status": "processing",
-                        "payment_method_used": payment_method,
-                        "paid_at": datetime.now(timezone.utc).isoformat()
-                    }}
+                    {"$set": changes},
+                    projection={"_id": 0, "status_history": 0},
+                    return_document=ReturnDocument.BEFORE
                 )
+                try:
+                    await record_order_transition(db, before, changes)
+                except Exception as e:
+                    logger.error(f"sales_daily update failed for {order_id}: {e}")
+                
+                if not await stock_reservations.commit(order_id):
+                    # paid after its reservation expired and the stock went meanwhile
+                    logger.error(f"Order {order_id} paid but out of stock, flagged for the admin")
+                    await db.orders.update_one({"order_id": order_id}, {"$set": {"stock_shortage": True}})
                 
                 return JSONResponse(content={"status": "OK"})
         
@@ -5863,87 +6234,46 @@ async def get_analytics(
         period_start = now - timedelta(days=365)
     
     period_start_str = period_start.isoformat()
+    prev_period_start = period_start - (now - period_start)
     
-    # Get orders in period
-    orders_in_period = await db.orders.find({
-        "created_at": {"$gte": period_start_str}
-    }, {"_id": 0}).to_list(10000)
-    
-    # Calculate metrics
-    total_orders = len(orders_in_period)
-    total_revenue = sum(o.get("total", 0) for o in orders_in_period)
-    paid_orders = [o for o in orders_in_period if o.get("payment_status") == "paid"]
-    paid_revenue = sum(o.get("total", 0) for o in paid_orders)
-    
-    # Orders by status
-    status_counts = {}
-    for order in orders_in_period:
-        status = order.get("order_status", "unknown")
-        status_counts[status] = status_counts.get(status, 0) + 1
-    
-    # Orders by day (for chart)
-    daily_data = {}
-    for order in orders_in_period:
-        date_str = order.get("created_at", "")[:10]  # YYYY-MM-DD
-        if date_str:
-            if date_str not in daily_data:
-                daily_data[date_str] = {"orders": 0, "revenue": 0}
-            daily_data[date_str]["orders"] += 1
-            daily_data[date_str]["revenue"] += order.get("total", 0)
-    
-    # Sort daily data
-    daily_chart = [
-        {"date": date, "orders": data["orders"], "revenue": data["revenue"]}
-        for date, data in sorted(daily_data.items())
-    ]
-    
-    # Top products
-    product_sales = {}
-    for order in orders_in_period:
-        for item in order.get("items", []):
-            pid = item.get("product_id", item.get("name", "unknown"))
-            if pid not in product_sales:
-                product_sales[pid] = {
-                    "product_id": pid,
-                    "name": item.get("name", "Produit"),
-                    "quantity": 0,
-                    "revenue": 0
-                }
-            product_sales[pid]["quantity"] += item.get("quantity", 1)
-            product_sales[pid]["revenue"] += item.get("price", 0) * item.get("quantity", 1)
-    
-    top_products = sorted(product_sales.values(), key=lambda x: x["revenue"], reverse=True)[:10]
-    
-    # Payment methods breakdown
-    payment_methods = {}
-    for order in orders_in_period:
-        method = order.get("payment_method", "unknown")
-        payment_methods[method] = payment_methods.get(method, 0) + 1
+    # Order metrics come from the sales_daily rollup once backfilled (day
+    # granularity), otherwise from an aggregation over raw orders
+    if period != "day" and await rollup_ready(db):
+        order_analytics = compute_rollup_analytics(db, period_start_str, prev_period_start.isoformat())
+    else:
+        order_analytics = compute_order_analytics(db, period_start_str, prev_period_start.isoformat())
+    
+    (
+        order_stats,
+        total_customers,
+        newsletter_subs,
+        low_stock,
+        out_of_stock
+    ) = await asyncio.gather(
+        order_analytics,
+        db.users.count_documents({}),
+        db.newsletter.count_documents({"active": True}),
+        db.products.find(
+            {"stock": {"$lte": 5, "$gt": 0}},
+            {"_id": 0, "product_id": 1, "name": 1, "stock": 1}
+        ).to_list(20),
+        db.products.count_documents({"stock": {"$lte": 0}})
+    )
     
-    # Get comparison with previous period
-    prev_period_start = period_start - (now - period_start)
-    prev_orders = await db.orders.find({
-        "created_at": {"$gte": prev_period_start.isoformat(), "$lt": period_start_str}
-    }, {"_id": 0, "total": 1}).to_list(10000)
-    prev_revenue = sum(o.get("total", 0) for o in prev_orders)
-    prev_order_count = len(prev_orders)
+    total_orders = order_stats["total_orders"]
+    total_revenue = order_stats["total_revenue"]
+    paid_revenue = order_stats["paid_revenue"]
+    status_counts = order_stats["orders_by_status"]
+    payment_methods = order_stats["payment_methods"]
+    daily_chart = order_stats["daily_chart"]
+    top_products = order_stats["top_products"]
+    prev_revenue = order_stats["previous_revenue"]
+    prev_order_count = order_stats["previous_orders"]
     
     # Calculate growth
     revenue_growth = ((total_revenue - prev_revenue) / prev_revenue * 100) if prev_revenue > 0 else 0
     orders_growth = ((total_orders - prev_order_count) / prev_order_count * 100) if prev_order_count > 0 else 0
     
-    # Customer stats
-    total_customers = await db.users.count_documents({})
-    newsletter_subs = await db.newsletter.count_documents({"active": True})
-    
-    # Low stock products
-    low_stock = await db.products.find(
-        {"stock": {"$lte": 5, "$gt": 0}},
-        {"_id": 0, "product_id": 1, "name": 1, "stock": 1}
-    ).to_list(20)
-    
-    out_of_stock = await db.products.count_documents({"stock": {"$lte": 0}})
-    
     return {
         "period": period,
         "summary": {
@@ -5956,7 +6286,7 @@ async def get_analytics(
         },
         "orders_by_status": status_counts,
         "payment_methods": payment_methods,
-        "daily_chart": daily_chart[-30:],  # Last 30 days
+        "daily_chart": daily_chart,  # Last 30 days
         "top_products": top_products,
         "customers": {
             "total": total_customers,
@@ -5972,14 +6302,16 @@ async def get_analytics(
 async def get_all_orders(
     status: Optional[str] = None,
     limit: int = 50,
-    skip: int = 0,
+    cursor: Optional[str] = None,
     user: User = Depends(require_admin)
 ):
     query = {}
     if status:
         query["order_status"] = status
     
-    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    orders, next_cursor = await keyset_page(
+        db.orders, query, [("created_at", -1), ("order_id", -1)], limit, cursor, {"_id": 0}
+    )
     
     for order in orders:
         if isinstance(order.get('created_at'), str):
@@ -5987,7 +6319,7 @@ async def get_all_orders(
     
     total = await db.orders.count_documents(query)
     
-    return {"orders": orders, "total": total}
+    return {"orders": orders, "total": total, "next_cursor": next_cursor}
 
 @api_router.put("/admin/orders/{order_id}/status")
 async def update_order_status(
@@ -6016,16 +6348,23 @@ async def update_order_status(
         "note": note
     }
     
-    result = await db.orders.update_one(
+    before = await db.orders.find_one_and_update(
         {"order_id": order_id}, 
         {
             "$set": update_doc,
             "$push": {"status_history": history_entry}
-        }
+        },
+        projection={"_id": 0, "status_history": 0},
+        return_document=ReturnDocument.BEFORE
     )
-    if result.matched_count == 0:
+    if before is None:
         raise HTTPException(status_code=404, detail="Commande non trouvée")
     
+    try:
+        await record_order_transition(db, before, update_doc)
+    except Exception as e:
+        logger.error(f"sales_daily update failed for {order_id}: {e}")
+    
     # Send shipping notification email if status changed to shipped
     if order_status == "shipped":
         order = await db.orders.find_one({"order_id": order_id}, {"_id": 0})
@@ -6064,236 +6403,18 @@ async def update_order_status(
 
 # ============== INVOICE GENERATION ==============
 
-def generate_invoice_pdf(order: dict) -> io.BytesIO:
-    """Generate a professional PDF invoice for an order with logo and product images"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=1.5*cm, bottomMargin=2*cm)
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=28,
-        spaceAfter=5,
-        textColor=colors.HexColor('#0B0B0B'),
-        fontName='Helvetica-Bold'
-    )
-    
-    header_style = ParagraphStyle(
-        'CustomHeader',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#666666')
-    )
-    
-    # Add logo header
-    logo_path = ROOT_DIR / "logo_yama.png"
-    logging.info(f"Invoice logo path: {logo_path}, exists: {logo_path.exists()}")
-    
-    # Company legal info
-    company_info = """<b>GROUPE YAMA PLUS</b><br/>
-<font size='8' color='#666666'>Dakar – Sénégal<br/>
-Email : contact@groupeyamaplus.com<br/>
-Tel : 78 382 75 75 / 77 849 81 37<br/>
-NINEA : 012808210<br/>
-RCCM : SN DKR 2026 A 4814</font>"""
-    
-    if logo_path.exists():
-        try:
-            # Create header with YAMA+ logo
-            logo_img = Image(str(logo_path), width=3.5*cm, height=3.5*cm)
-            header_data = [[logo_img, Paragraph(company_info, styles['Normal'])]]
-            header_table = Table(header_data, colWidths=[4.5*cm, 12*cm])
-            header_table.setStyle(TableStyle([
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ]))
-            elements.append(header_table)
-            logging.info("Logo added to invoice successfully")
-        except Exception as e:
-            logging.error(f"Error adding logo to invoice: {e}")
-            elements.append(Paragraph("GROUPE YAMA PLUS", title_style))
-            elements.append(Paragraph(company_info, header_style))
-    else:
-        logging.warning(f"Logo file not found at {logo_path}")
-        elements.append(Paragraph("GROUPE YAMA PLUS", title_style))
-        elements.append(Paragraph(company_info, header_style))
-    elements.append(Spacer(1, 15))
-    
-    # Divider line
-    divider = Table([['']], colWidths=[17*cm])
-    divider.setStyle(TableStyle([
-        ('LINEBELOW', (0, 0), (-1, -1), 1, colors.HexColor('#0B0B0B')),
-    ]))
-    elements.append(divider)
-    elements.append(Spacer(1, 15))
-    
-    # Invoice Title
-    elements.append(Paragraph(f"<b>FACTURE N° {order['order_id'].upper()}</b>", ParagraphStyle(
-        'InvoiceTitle',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=15
-    )))
-    
-    # Order Date
-    order_date = order.get('created_at', datetime.now(timezone.utc))
-    if isinstance(order_date, str):
-        order_date = datetime.fromisoformat(order_date.replace('Z', '+00:00'))
-    
-    elements.append(Paragraph(f"<b>Date:</b> {order_date.strftime('%d/%m/%Y à %H:%M')}", styles['Normal']))
-    elements.append(Spacer(1, 15))
-    
-    # Customer Info
-    shipping = order.get('shipping', {})
-    elements.append(Paragraph("<b>FACTURER À:</b>", styles['Heading3']))
-    elements.append(Paragraph(f"{shipping.get('full_name', 'Client')}", styles['Normal']))
-    elements.append(Paragraph(f"{shipping.get('address', '')}", styles['Normal']))
-    elements.append(Paragraph(f"{shipping.get('city', '')}, {shipping.get('region', 'Dakar')}", styles['Normal']))
-    elements.append(Paragraph(f"Tél: {shipping.get('phone', '')}", styles['Normal']))
-    if shipping.get('email'):
-        elements.append(Paragraph(f"Email: {shipping.get('email')}", styles['Normal']))
-    elements.append(Spacer(1, 20))
-    
-    # Products with Images
-    elements.append(Paragraph("<b>ARTICLES COMMANDÉS:</b>", styles['Heading3']))
-    elements.append(Spacer(1, 10))
-    
-    # Products Table with Image column and description
-    table_data = [['', 'Produit', 'Qté', 'Prix Unit.', 'Total']]
-    
-    # Use 'items' key (the correct key used when storing orders)
-    items = order.get('items', []) or order.get('products', [])
-    
-    for item in items:
-        name = item.get('name', 'Produit')[:40]
-        # Get description from product database if not in order
-        description = item.get('description', '') or item.get('short_description', '')
-        if description:
-            description = description[:60]
-        qty = item.get('quantity', 1)
-        price = item.get('price', 0)
-        total_price = price * qty
-        
-        # Product name with description
-        product_text = f"<b>{name}</b>"
-        if description:
-            product_text += f"<br/><font size='7' color='#666666'>{description}...</font>"
-        
-        # Try to get product image
-        img_cell = ''
-        try:
-            img_url = item.get('image', '')
-            if img_url and img_url.startswith('http'):
-                import urllib.request
-                import tempfile
-                img_path = f"/tmp/prod_{item.get('product_id', 'temp')}.jpg"
-                urllib.request.urlretrieve(img_url, img_path)
-                img_cell = Image(img_path, width=1.2*cm, height=1.2*cm)
-        except:
-            img_cell = ''
-        
-        table_data.append([
-            img_cell,
-            Paragraph(product_text, ParagraphStyle('ProductCell', parent=styles['Normal'], fontSize=8, leading=10)),
-            str(qty),
-            f"{price:,.0f} FCFA".replace(',', ' '),
-            f"{total_price:,.0f} FCFA".replace(',', ' ')
-        ])
-    
-    # Create table with image column
-    table = Table(table_data, colWidths=[1.5*cm, 7*cm, 1.5*cm, 3.5*cm, 3.5*cm])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0B0B0B')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-        ('TOPPADDING', (0, 0), (-1, 0), 10),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F5F7')),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-        ('TOPPADDING', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E0E0E0')),
-    ]))
-    elements.append(table)
-    elements.append(Spacer(1, 20))
-    
-    # Totals
-    items = order.get('items', []) or order.get('products', [])
-    subtotal = order.get('subtotal', sum(p.get('price', 0) * p.get('quantity', 1) for p in items))
-    shipping_cost = order.get('shipping_cost', 2500)
-    discount = order.get('discount', 0)
-    total = order.get('total', subtotal + shipping_cost - discount)
-    
-    totals_data = [
-        ['Sous-total:', f"{subtotal:,.0f} FCFA".replace(',', ' ')],
-        ['Livraison:', f"{shipping_cost:,.0f} FCFA".replace(',', ' ')],
-    ]
-    
-    if discount > 0:
-        totals_data.append(['Réduction:', f"-{discount:,.0f} FCFA".replace(',', ' ')])
-    
-    totals_data.append(['TOTAL:', f"{total:,.0f} FCFA".replace(',', ' ')])
-    
-    totals_table = Table(totals_data, colWidths=[13.5*cm, 3.5*cm])
-    totals_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('FONTSIZE', (0, -1), (-1, -1), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.HexColor('#0B0B0B')),
-    ]))
-    elements.append(totals_table)
-    elements.append(Spacer(1, 30))
-    
-    # Payment Info
-    payment_method = order.get('payment_method', 'Non spécifié')
-    payment_labels = {
-        'wave': 'Wave',
-        'orange_money': 'Orange Money',
-        'card': 'Carte Bancaire',
-        'cash': 'Paiement à la livraison'
-    }
-    elements.append(Paragraph(f"<b>Mode de paiement:</b> {payment_labels.get(payment_method, payment_method)}", styles['Normal']))
-    
-    payment_status = order.get('payment_status', 'pending')
-    status_labels = {
-        'pending': '⏳ En attente',
-        'paid': '✅ Payé',
-        'failed': '❌ Échoué'
-    }
-    elements.append(Paragraph(f"<b>Statut du paiement:</b> {status_labels.get(payment_status, payment_status)}", styles['Normal']))
-    elements.append(Spacer(1, 40))
-    
-    # Footer
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.HexColor('#999999'),
-        alignment=1  # Center
-    )
-    elements.append(Paragraph("Merci pour votre achat chez GROUPE YAMA PLUS !", footer_style))
-    elements.append(Paragraph("Pour toute question, contactez-nous au 78 382 75 75 / 77 849 81 37", footer_style))
-    elements.append(Paragraph("NINEA : 012808210 | RCCM : SN DKR 2026 A 4814", footer_style))
-    elements.append(Paragraph("www.groupeyamaplus.com", footer_style))
-    
-    # Build PDF
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+async def order_invoice_pdf(order: dict) -> bytes:
+    """Invoice PDF for an order, re-rendered only when the order changes"""
+    items = order.get("items", []) or order.get("products", [])
+    assets = await pdf_assets.prefetch(item.get("image") for item in items)
+    return await pdf_renderer.render("order", order["order_id"], generate_order_invoice_pdf, order=order, assets=assets)
 
+def pdf_download(pdf: bytes, filename: str) -> Response:
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
 
 @api_router.get("/orders/{order_id}/invoice")
 async def get_order_invoice(order_id: str, request: Request):
@@ -6303,18 +6424,7 @@ async def get_order_invoice(order_id: str, request: Request):
     if not order:
         raise HTTPException(status_code=404, detail="Commande non trouvée")
     
-    # Generate PDF
-    pdf_buffer = generate_invoice_pdf(order)
-    
-    # Return as downloadable file
-    filename = f"facture_{order_id}.pdf"
-    return StreamingResponse(
-        pdf_buffer,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}"
-        }
-    )
+    return pdf_download(await order_invoice_pdf(order), f"facture_{order_id}.pdf")
 
 
 @api_router.get("/admin/orders/{order_id}/invoice")
@@ -6325,33 +6435,59 @@ async def get_admin_order_invoice(order_id: str, user: User = Depends(require_ad
     if not order:
         raise HTTPException(status_code=404, detail="Commande non trouvée")
     
-    # Generate PDF
-    pdf_buffer = generate_invoice_pdf(order)
+    return pdf_download(await order_invoice_pdf(order), f"facture_{order_id}.pdf")
+
+@api_router.post("/admin/orders/invoices/export")
+async def export_order_invoices(data: PDFExportRequest, user: User = Depends(require_admin)):
+    """ZIP of order invoices by ids or date range, streamed as they render; progress on /admin/exports/{export_id}"""
+    try:
+        query = export_query(data, "order_id")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Indiquez des identifiants ou une période (AAAA-MM-JJ)")
+    total = await db.orders.count_documents(query)
+    if not total:
+        raise HTTPException(status_code=404, detail="Aucune commande pour cette sélection")
+    if total > EXPORT_MAX_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"Sélection trop large ({total} commandes, maximum {EXPORT_MAX_DOCUMENTS})")
     
-    # Return as downloadable file
-    filename = f"facture_{order_id}.pdf"
-    return StreamingResponse(
-        pdf_buffer,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}"
-        }
-    )
+    progress = ExportProgress(db, "orders", total)
+    await progress.start()
+    
+    async def jobs():
+        async for order in db.orders.find(query, {"_id": 0}).sort("created_at", 1):
+            yield f"facture_{order['order_id']}.pdf", partial(order_invoice_pdf, order)
+    
+    return zip_response(stream_pdf_zip(jobs(), pdf_renderer.workers * 2, progress), "factures_commandes.zip", progress)
+
+@api_router.get("/admin/exports/{export_id}")
+async def get_pdf_export_progress(export_id: str, user: User = Depends(require_admin)):
+    """Progress of a bulk PDF export (X-Export-Id of the download)"""
+    progress = await get_export_progress(db, export_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Export non trouvé")
+    return progress
 
 @api_router.get("/admin/stats")
 async def get_admin_stats(user: User = Depends(require_admin)):
-    total_orders = await db.orders.count_documents({})
-    pending_orders = await db.orders.count_documents({"order_status": "pending"})
     total_products = await db.products.count_documents({})
     total_users = await db.users.count_documents({})
     
-    # Calculate revenue
-    pipeline = [
-        {"$match": {"payment_status": "paid"}},
-        {"$group": {"_id": None, "total": {"$sum": "$total"}}}
-    ]
-    revenue_result = await db.orders.aggregate(pipeline).to_list(1)
-    total_revenue = revenue_result[0]["total"] if revenue_result else 0
+    if await rollup_ready(db):
+        totals = await rollup_totals(db)
+        total_orders = totals["total_orders"]
+        pending_orders = totals["pending_orders"]
+        total_revenue = totals["total_revenue"]
+    else:
+        total_orders = await db.orders.count_documents({})
+        pending_orders = await db.orders.count_documents({"order_status": "pending"})
+        
+        # Calculate revenue
+        pipeline = [
+            {"$match": {"payment_status": "paid"}},
+            {"$group": {"_id": None, "total": {"$sum": "$total"}}}
+        ]
+        revenue_result = await db.orders.aggregate(pipeline).to_list(1)
+        total_revenue = revenue_result[0]["total"] if revenue_result else 0
     
     return {
         "total_orders": total_orders,
@@ -6361,83 +6497,46 @@ async def get_admin_stats(user: User = Depends(require_admin)):
         "total_revenue": total_revenue
     }
 
+@api_router.get("/admin/cache/stats")
+async def get_cache_stats(user: User = Depends(require_admin)):
+    """Cache hit/miss/eviction counters for this worker"""
+    return {**app_cache.stats(), "catalog_events": catalog_bus.stats(), "rate_limiter": rate_limiter.stats()}
+
+@api_router.post("/admin/cache/clear")
+async def admin_clear_cache(user: User = Depends(require_admin)):
+    """Flush the application cache in every worker"""
+    await invalidate_cache()
+    return {"message": "Cache vidé"}
+
 @api_router.get("/admin/users")
 async def get_all_users(
     limit: int = 50,
-    skip: int = 0,
+    cursor: Optional[str] = None,
     user: User = Depends(require_admin)
 ):
-    users = await db.users.find({}, {"_id": 0, "password": 0}).skip(skip).limit(limit).to_list(limit)
+    users, next_cursor = await keyset_page(
+        db.users, {}, [("created_at", -1), ("user_id", -1)], limit, cursor, {"_id": 0, "password": 0}
+    )
     total = await db.users.count_documents({})
-    return {"users": users, "total": total}
+    return {"users": users, "total": total, "next_cursor": next_cursor}
 
 @api_router.get("/admin/export/orders")
-async def export_orders_csv(user: User = Depends(require_admin)):
-    """Export all orders as CSV"""
-    orders = await db.orders.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    
-    if not orders:
-        return Response(content="Aucune commande", media_type="text/plain")
-    
-    # Create CSV content
-    import io
-    output = io.StringIO()
-    output.write("order_id,date,client,email,telephone,adresse,ville,total,statut,methode_paiement\n")
-    
-    for order in orders:
-        shipping = order.get("shipping", {})
-        date = order.get("created_at", "")[:10] if order.get("created_at") else ""
-        row = [
-            order.get("order_id", ""),
-            date,
-            shipping.get("full_name", "").replace(",", " "),
-            shipping.get("email", ""),
-            shipping.get("phone", ""),
-            shipping.get("address", "").replace(",", " "),
-            shipping.get("city", ""),
-            str(order.get("total", 0)),
-            order.get("order_status", ""),
-            order.get("payment_method", "")
-        ]
-        output.write(",".join(row) + "\n")
-    
-    return Response(
-        content=output.getvalue(),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=commandes_yama.csv"}
-    )
+async def export_orders_csv(gzip: bool = False, user: User = Depends(require_admin)):
+    """Export all orders as CSV (streamed, optionally gzip-compressed)"""
+    return csv_export_response(stream_csv(ORDERS_HEADER, order_rows(db), gzip), "commandes_yama.csv", gzip)
 
 @api_router.get("/admin/export/clients")
-async def export_clients_csv(user: User = Depends(require_admin)):
-    """Export all clients as CSV"""
-    users = await db.users.find({}, {"_id": 0, "password": 0}).sort("created_at", -1).to_list(1000)
-    
-    if not users:
-        return Response(content="Aucun client", media_type="text/plain")
-    
-    import io
-    output = io.StringIO()
-    output.write("user_id,nom,email,telephone,date_inscription,role,commandes\n")
-    
-    for u in users:
-        # Count orders for this user
-        order_count = await db.orders.count_documents({"user_id": u.get("user_id")})
-        date = u.get("created_at", "")[:10] if u.get("created_at") else ""
-        row = [
-            u.get("user_id", ""),
-            u.get("name", "").replace(",", " "),
-            u.get("email", ""),
-            u.get("phone", ""),
-            date,
-            u.get("role", "customer"),
-            str(order_count)
-        ]
-        output.write(",".join(row) + "\n")
-    
-    return Response(
-        content=output.getvalue(),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=clients_yama.csv"}
+async def export_clients_csv(gzip: bool = False, user: User = Depends(require_admin)):
+    """Export all clients with their order count as CSV (streamed, optionally gzip-compressed)"""
+    return csv_export_response(stream_csv(CLIENTS_HEADER, client_rows(db), gzip), "clients_yama.csv", gzip)
+
+def csv_export_response(chunks, filename: str, gzip: bool) -> StreamingResponse:
+    if gzip:
+        filename += ".gz"
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if gzip else "text/csv; charset=utf-8",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
 # ============== CONTACT ROUTES ==============
@@ -6473,7 +6572,12 @@ async def get_abandoned_carts(user: User = Depends(require_admin)):
         "updated_at": {"$lt": cutoff_iso}
     }, {"_id": 0}).sort("updated_at", -1).to_list(100)
     
-    # Enrich with user data and product details
+    # Enrich with user data and product details (one product query for all carts)
+    products = await hydrate_products(
+        db,
+        [item["product_id"] for cart in carts for item in cart.get("items", [])],
+        SUMMARY_PROJECTION
+    )
     result = []
     for cart in carts:
         user_doc = await db.users.find_one({"user_id": cart["user_id"]}, {"_id": 0, "email": 1, "name": 1})
@@ -6484,10 +6588,7 @@ async def get_abandoned_carts(user: User = Depends(require_admin)):
         items_with_details = []
         total = 0
         for item in cart.get("items", []):
-            product = await db.products.find_one(
-                {"product_id": item["product_id"]},
-                {"_id": 0, "name": 1, "price": 1, "images": 1}
-            )
+            product = products.get(item["product_id"])
             if product:
                 item_total = product.get("price", 0) * item.get("quantity", 1)
                 items_with_details.append({
@@ -6495,7 +6596,7 @@ async def get_abandoned_carts(user: User = Depends(require_admin)):
                     "name": product.get("name"),
                     "price": product.get("price"),
                     "quantity": item.get("quantity"),
-                    "image": product.get("images", [""])[0] if product.get("images") else "",
+                    "image": first_image(product),
                     "total": item_total
                 })
                 total += item_total
@@ -6575,20 +6676,19 @@ async def send_abandoned_cart_email_manually(cart_id: str, user: User = Depends(
         raise HTTPException(status_code=400, detail="Email utilisateur non trouvé")
     
     # Get cart items with details
+    items = cart.get("items", [])
+    products = await hydrate_products(db, [i["product_id"] for i in items], SUMMARY_PROJECTION)
     cart_items = []
     cart_total = 0
-    for item in cart.get("items", []):
-        product = await db.products.find_one(
-            {"product_id": item["product_id"]},
-            {"_id": 0, "name": 1, "price": 1, "images": 1}
-        )
+    for item in items:
+        product = products.get(item["product_id"])
         if product:
             item_data = {
                 "product_id": item["product_id"],
                 "name": product.get("name", "Produit"),
                 "quantity": item.get("quantity", 1),
                 "price": product.get("price", 0),
-                "image": product.get("images", [""])[0] if product.get("images") else ""
+                "image": first_image(product)
             }
             cart_items.append(item_data)
             cart_total += item_data["price"] * item_data["quantity"]
@@ -6625,8 +6725,12 @@ async def get_categories():
 
 @api_router.get("/sitemap.xml")
 async def get_sitemap():
-    """Generate dynamic sitemap.xml"""
-    base_url = "{SITE_URL}"
+    """Generate dynamic sitemap.xml (cached until the catalog changes)"""
+    cached = await get_cached("sitemap")
+    if cached is not None:
+        return Response(content=cached, media_type="application/xml")
+    
+    base_url = SITE_URL
     now = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
     # Static pages
@@ -6677,6 +6781,8 @@ async def get_sitemap():
     
     xml_content += '</urlset>'
     
+    await set_cached("sitemap", xml_content, ttl=SITEMAP_CACHE_TTL, tags=("sitemap",))
+    
     return Response(content=xml_content, media_type="application/xml")
 
 # ============== SEED DATA ==============
@@ -6704,7 +6810,7 @@ async def seed_database():
             "email": "admin@yama.sn",
             "name": "Admin YAMA+",
             "phone": "+221783827575",
-            "password": hash_password("admin123"),
+            "password": await hash_password("admin123"),
             "role": "admin",
             "picture": None,
             "created_at": now
@@ -7064,7 +7170,7 @@ async def seed_database():
             "email": "admin@lumina.sn",
             "name": "Admin Lumina",
             "phone": "+221 78 382 75 75",
-            "password": hash_password("admin123"),
+            "password": await hash_password("admin123"),
             "role": "admin",
             "picture": None,
             "created_at": now
@@ -7093,6 +7199,8 @@ async def seed_database():
             }
         )
     
+    await catalog_bus.publish(CATALOG_RESET)
+    
     return {"message": "Base de données initialisée", "products": total_products, "flash_sales": len(flash_sale_updates)}
 
 # ============== APPOINTMENT BOOKING SYSTEM ==============
@@ -7326,11 +7434,14 @@ L'équipe YAMA+"""
 
 # ============== PUSH NOTIFICATIONS ==============
 
-from pywebpush import webpush, WebPushException
+from services.push_dispatcher import PushDispatcher
 
 VAPID_PUBLIC_KEY = os.environ.get("VAPID_PUBLIC_KEY")
 VAPID_PRIVATE_KEY = os.environ.get("VAPID_PRIVATE_KEY")
 VAPID_CLAIMS_EMAIL = os.environ.get("VAPID_CLAIMS_EMAIL", "contact@groupeyamaplus.com")
+PUSH_ICON_URL = "https://customer-assets.emergentagent.com/job_premium-senegal/artifacts/xs5g0hsy_IMG_0613.png"
+
+push_dispatcher = PushDispatcher(db, VAPID_PRIVATE_KEY if VAPID_PUBLIC_KEY else None, VAPID_CLAIMS_EMAIL)
 
 class PushSubscription(BaseModel):
     endpoint: str
@@ -7375,69 +7486,23 @@ async def push_unsubscribe_v2(subscription: PushSubscription):
     )
     return {"message": "Désinscription réussie"}
 
-async def push_send_notification_v2(subscription: dict, title: str, body: str, url: str = None, icon: str = None):
-    """Send a push notification to a single subscriber"""
-    if not VAPID_PRIVATE_KEY or not VAPID_PUBLIC_KEY:
-        logger.warning("VAPID keys not configured")
-        return False
-    
-    try:
-        payload = {
-            "title": title,
-            "body": body,
-            "icon": icon or "https://customer-assets.emergentagent.com/job_premium-senegal/artifacts/xs5g0hsy_IMG_0613.png",
-            "badge": "https://customer-assets.emergentagent.com/job_premium-senegal/artifacts/xs5g0hsy_IMG_0613.png",
-            "url": url or SITE_URL,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-        
-        webpush(
-            subscription_info={
-                "endpoint": subscription["endpoint"],
-                "keys": subscription["keys"]
-            },
-            data=json.dumps(payload),
-            vapid_private_key=VAPID_PRIVATE_KEY,
-            vapid_claims={"sub": f"mailto:{VAPID_CLAIMS_EMAIL}"}
-        )
-        
-        logger.info(f"Push notification sent: {title}")
-        return True
-        
-    except WebPushException as e:
-        logger.error(f"Push notification failed: {str(e)}")
-        # If subscription is expired/invalid, mark it inactive
-        if e.response and e.response.status_code in [404, 410]:
-            await db.push_subscriptions.update_one(
-                {"endpoint": subscription["endpoint"]},
-                {"$set": {"is_active": False}}
-            )
-        return False
-    except Exception as e:
-        logger.error(f"Push notification error: {str(e)}")
-        return False
+def push_payload(title: str, body: str, url: str = None, icon: str = None) -> dict:
+    return {
+        "title": title,
+        "body": body,
+        "icon": icon or PUSH_ICON_URL,
+        "badge": PUSH_ICON_URL,
+        "url": url or SITE_URL,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
 
-async def send_push_to_all(title: str, body: str, url: str = None):
+async def send_push_to_all(title: str, body: str, url: str = None) -> dict:
     """Send push notification to all active subscribers"""
-    subscriptions = await db.push_subscriptions.find({"is_active": True}).to_list(1000)
-    
-    success_count = 0
-    for sub in subscriptions:
-        if await push_send_notification_v2(sub, title, body, url):
-            success_count += 1
-    
-    logger.info(f"Push notifications sent: {success_count}/{len(subscriptions)}")
-    return success_count
+    return await push_dispatcher.broadcast({"is_active": True}, push_payload(title, body, url), label=title)
 
-async def send_push_to_user(user_id: str, title: str, body: str, url: str = None):
+async def send_push_to_user(user_id: str, title: str, body: str, url: str = None) -> dict:
     """Send push notification to a specific user"""
-    subscriptions = await db.push_subscriptions.find({
-        "user_id": user_id,
-        "is_active": True
-    }).to_list(10)
-    
-    for sub in subscriptions:
-        await push_send_notification_v2(sub, title, body, url)
+    return await push_dispatcher.send_to_user(user_id, push_payload(title, body, url))
 
 @api_router.post("/admin/push/send")
 async def admin_send_push(
@@ -7447,8 +7512,8 @@ async def admin_send_push(
     user: User = Depends(require_admin)
 ):
     """Admin: Send push notification to all subscribers"""
-    count = await send_push_to_all(title, body, url)
-    return {"message": f"Notification envoyée à {count} abonnés"}
+    stats = await send_push_to_all(title, body, url)
+    return {"message": f"Notification envoyée à {stats['sent']} abonnés", "stats": stats}
 
 @api_router.get("/admin/push/stats")
 async def admin_push_stats(user: User = Depends(require_admin)):
@@ -7458,7 +7523,8 @@ async def admin_push_stats(user: User = Depends(require_admin)):
     
     return {
         "total_subscriptions": total,
-        "active_subscriptions": active
+        "active_subscriptions": active,
+        "dispatcher": push_dispatcher.stats()
     }
 
 # ============== BLOG ROUTES ==============
@@ -7951,7 +8017,7 @@ async def get_service_providers(
     search: Optional[str] = None,
     sort_by: str = "rating",  # rating, price, reviews
     limit: int = 20,
-    skip: int = 0
+    cursor: Optional[str] = None
 ):
     """Get service providers with filters"""
     query = {"is_active": True}
@@ -7984,16 +8050,18 @@ async def get_service_providers(
         "reviews": [("is_premium", -1), ("review_count", -1)],
         "newest": [("created_at", -1)]
     }
-    sort = sort_options.get(sort_by, sort_options["rating"])
+    sort = sort_options.get(sort_by, sort_options["rating"]) + [("provider_id", -1)]
     
-    providers = await db.service_providers.find(query, {"_id": 0, "password": 0}).sort(sort).skip(skip).limit(limit).to_list(limit)
+    providers, next_cursor = await keyset_page(
+        db.service_providers, query, sort, limit, cursor, {"_id": 0, "password": 0}
+    )
     total = await db.service_providers.count_documents(query)
     
     return {
         "providers": providers,
         "total": total,
         "limit": limit,
-        "skip": skip
+        "next_cursor": next_cursor
     }
 
 @api_router.get("/services/providers/{provider_id}")
@@ -8107,7 +8175,7 @@ async def get_provider_gallery(provider_id: str):
 async def add_gallery_photo(
     provider_id: str, 
     photo_data: GalleryPhotoUpload,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(verified_user)
 ):
     """Add a photo to provider's gallery (provider only)"""
     # Verify provider exists and user is the provider
@@ -8123,6 +8191,7 @@ async def add_gallery_photo(
         raise HTTPException(status_code=403, detail="Non autorisé à modifier cette galerie")
     
     # Get current gallery
+    previous_urls = referenced_urls("service_providers", provider)
     gallery = provider.get("gallery", [])
     
     # Add new photo
@@ -8143,6 +8212,7 @@ async def add_gallery_photo(
         {"provider_id": provider_id},
         {"$set": {"gallery": gallery, "photos": photos, "updated_at": datetime.now(timezone.utc).isoformat()}}
     )
+    await upload_store.replace(previous_urls, photos)
     
     return {"success": True, "photo": new_photo, "message": "Photo ajoutée à la galerie"}
 
@@ -8150,7 +8220,7 @@ async def add_gallery_photo(
 async def delete_gallery_photo(
     provider_id: str,
     photo_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(verified_user)
 ):
     """Delete a photo from provider's gallery"""
     provider = await db.service_providers.find_one({"provider_id": provider_id})
@@ -8178,6 +8248,7 @@ async def delete_gallery_photo(
         {"provider_id": provider_id},
         {"$set": {"gallery": gallery, "photos": photos, "updated_at": datetime.now(timezone.utc).isoformat()}}
     )
+    await upload_store.replace(referenced_urls("service_providers", provider), photos)
     
     return {"success": True, "message": "Photo supprimée de la galerie"}
 
@@ -8185,7 +8256,7 @@ async def delete_gallery_photo(
 async def reorder_gallery(
     provider_id: str,
     photo_ids: List[str],
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(verified_user)
 ):
     """Reorder gallery photos"""
     provider = await db.service_providers.find_one({"provider_id": provider_id})
@@ -8236,7 +8307,7 @@ class VerificationDocumentUpload(BaseModel):
 async def upload_verification_document(
     provider_id: str,
     doc_data: VerificationDocumentUpload,
-    current_user: User = Depends(require_auth)
+    current_user: User = Depends(require_verified_user)
 ):
     """Upload a verification document (CNI, photo) for provider validation"""
     provider = await db.service_providers.find_one({"provider_id": provider_id})
@@ -8295,7 +8366,7 @@ async def upload_verification_document(
 @api_router.get("/services/providers/{provider_id}/verification-documents")
 async def get_verification_documents(
     provider_id: str,
-    current_user: User = Depends(require_auth)
+    current_user: User = Depends(require_verified_user)
 ):
     """Get verification documents for a provider"""
     provider = await db.service_providers.find_one({"provider_id": provider_id})
@@ -8502,7 +8573,7 @@ async def register_provider(provider_data: ProviderCreate):
     provider_id = f"PRV-{secrets.token_hex(4).upper()}"
     
     # Hash password
-    hashed_password = hash_password(provider_data.password)
+    hashed_password = await hash_password(provider_data.password)
     
     provider = {
         "provider_id": provider_id,
@@ -8561,12 +8632,14 @@ async def login_provider(phone: str, password: str):
     """Login as a provider"""
     provider = await db.service_providers.find_one({"phone": phone})
     
-    if not provider or not verify_password(password, provider.get("password", "")):
+    if not provider or not await verify_password(password, provider.get("password", "")):
         raise HTTPException(status_code=401, detail="Numéro ou mot de passe incorrect")
     
     if not provider.get("is_active"):
         raise HTTPException(status_code=403, detail="Votre compte est en attente d'approbation")
     
+    asyncio.create_task(upgrade_password_hash(db.service_providers, "provider_id", provider, password))
+    
     # Create JWT token
     token_data = {
         "sub": provider["provider_id"],
@@ -8667,6 +8740,7 @@ async def update_my_provider_profile(update_data: dict, request: Request):
 async def admin_get_providers(
     status: Optional[str] = None,  # pending, active, inactive
     limit: int = 50,
+    cursor: Optional[str] = None,
     user: User = Depends(require_admin)
 ):
     """Admin: Get all providers"""
@@ -8676,7 +8750,9 @@ async def admin_get_providers(
     elif status == "active":
         query["is_active"] = True
     
-    providers = await db.service_providers.find(query, {"_id": 0, "password": 0}).sort("created_at", -1).limit(limit).to_list(limit)
+    providers, next_cursor = await keyset_page(
+        db.service_providers, query, [("created_at", -1), ("provider_id", -1)], limit, cursor, {"_id": 0, "password": 0}
+    )
     
     stats = {
         "total": await db.service_providers.count_documents({}),
@@ -8685,7 +8761,7 @@ async def admin_get_providers(
         "verified": await db.service_providers.count_documents({"is_verified": True})
     }
     
-    return {"providers": providers, "stats": stats}
+    return {"providers": providers, "stats": stats, "next_cursor": next_cursor}
 
 @api_router.put("/admin/service-providers/{provider_id}")
 async def admin_update_provider(
@@ -8710,6 +8786,8 @@ async def admin_update_provider(
             {"provider_id": provider_id},
             {"$set": update_fields}
         )
+        if "is_active" in update_fields:
+            await search_suggest.load_professions(db)
     
     # If activated, send notification to provider
     if body.get("is_active"):
@@ -8731,7 +8809,12 @@ async def admin_update_provider(
 @api_router.delete("/admin/service-providers/{provider_id}")
 async def admin_delete_provider(provider_id: str, user: User = Depends(require_admin)):
     """Admin: Delete a provider"""
-    await db.service_providers.delete_one({"provider_id": provider_id})
+    provider = await db.service_providers.find_one_and_delete(
+        {"provider_id": provider_id}, REFERENCE_PROJECTIONS["service_providers"]
+    )
+    if provider:
+        await upload_store.release(referenced_urls("service_providers", provider))
+        await search_suggest.load_professions(db)
     await db.provider_reviews.delete_many({"provider_id": provider_id})
     return {"message": "Prestataire supprimé"}
 
@@ -8799,8 +8882,9 @@ async def root():
 @api_router.post("/admin/reset-test-data")
 async def reset_test_data(user: User = Depends(require_admin)):
     """Reset all test data - DELETE ALL ORDERS AND STATS"""
-    # Delete all orders
+    # Delete all orders (and their rollup)
     orders_result = await db.orders.delete_many({})
+    await db[ROLLUP_COLLECTION].delete_many({})
     
     # Delete all notifications
     await db.notifications.delete_many({})
@@ -8815,9 +8899,8 @@ async def reset_test_data(user: User = Depends(require_admin)):
     await db.wishlist_items.delete_many({})
     
     # Clear all caches
-    clear_cache("products")
-    clear_cache("flash_sales")
-    clear_cache("orders")
+    await catalog_bus.publish(CATALOG_RESET)
+    await invalidate_cache("orders")
     
     return {
         "message": "Données de test réinitialisées",
@@ -9256,11 +9339,17 @@ class GiftBoxProductCreate(BaseModel):
 @api_router.get("/gift-box/products")
 async def get_giftbox_products():
     """Get all gift box products (public - for customers)"""
+    cached = await get_cached("giftbox:products")
+    if cached is not None:
+        return cached
+    
     products = await db.gift_box_products.find(
         {"is_active": True},
         {"_id": 0}
     ).sort("sort_order", 1).to_list(100)
-    return {"products": products}
+    result = {"products": products}
+    await set_cached("giftbox:products", result, ttl=GIFTBOX_CACHE_TTL, tags=("giftbox",))
+    return result
 
 @api_router.get("/admin/gift-box/products")
 async def get_admin_giftbox_products(user: User = Depends(require_admin)):
@@ -9288,6 +9377,9 @@ async def create_giftbox_product(product: GiftBoxProductCreate, user: User = Dep
     await db.gift_box_products.insert_one(new_product)
     if "_id" in new_product:
         del new_product["_id"]
+    await upload_store.retain(referenced_urls("gift_box_products", new_product))
+    
+    await catalog_bus.publish(GIFTBOX_CHANGED, [product_id])
     
     logger.info(f"Gift box product created: {product.name}")
     return {"message": "Produit coffret créé", "product": new_product}
@@ -9309,22 +9401,34 @@ async def update_giftbox_product(product_id: str, product: dict, user: User = De
     # Remove None values
     update_data = {k: v for k, v in update_data.items() if v is not None}
     
-    result = await db.gift_box_products.update_one(
+    existing = await db.gift_box_products.find_one_and_update(
         {"product_id": product_id},
-        {"$set": update_data}
+        {"$set": update_data},
+        projection={"_id": 0, "image": 1},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if existing is None:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
+    if "image" in update_data:
+        await upload_store.replace(
+            referenced_urls("gift_box_products", existing),
+            referenced_urls("gift_box_products", update_data)
+        )
+    
+    await catalog_bus.publish(GIFTBOX_CHANGED, [product_id], update_data.keys())
     
     return {"message": "Produit mis à jour"}
 
 @api_router.delete("/admin/gift-box/products/{product_id}")
 async def delete_giftbox_product(product_id: str, user: User = Depends(require_admin)):
     """Delete a gift box product"""
-    result = await db.gift_box_products.delete_one({"product_id": product_id})
-    if result.deleted_count == 0:
+    deleted = await db.gift_box_products.find_one_and_delete({"product_id": product_id}, {"_id": 0, "image": 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
+    await upload_store.release(referenced_urls("gift_box_products", deleted))
+    
+    await catalog_bus.publish(GIFTBOX_CHANGED, [product_id])
     return {"message": "Produit supprimé"}
 
 @api_router.post("/admin/gift-box/products/import-from-catalog")
@@ -9335,7 +9439,7 @@ async def import_products_to_giftbox(data: dict, user: User = Depends(require_ad
     if not product_ids:
         raise HTTPException(status_code=400, detail="Aucun produit sélectionné")
     
-    imported = 0
+    imported_ids = []
     for pid in product_ids:
         # Get product from main catalog
         product = await db.products.find_one({"product_id": pid}, {"_id": 0})
@@ -9362,7 +9466,12 @@ async def import_products_to_giftbox(data: dict, user: User = Depends(require_ad
         }
         
         await db.gift_box_products.insert_one(new_product)
-        imported += 1
+        await upload_store.retain(referenced_urls("gift_box_products", new_product))
+        imported_ids.append(new_product["product_id"])
+    
+    imported = len(imported_ids)
+    if imported_ids:
+        await catalog_bus.publish(GIFTBOX_CHANGED, imported_ids)
     
     return {"message": f"{imported} produit(s) importé(s)", "imported": imported}
 
@@ -9391,7 +9500,16 @@ async def health_check():
         "status": "healthy",
         "memory_mb": round(memory_mb, 2),
         "database": db_status,
-        "rate_limit_entries": len(rate_limit_storage)
+        "rate_limit_entries": rate_limiter.stats()["local_entries"],
+        "image_processing": image_processor.stats(),
+        "pdf_rendering": pdf_renderer.stats(),
+        "pdf_assets": pdf_assets.stats(),
+        "product_search": product_search.stats(),
+        "search_suggest": search_suggest.stats(),
+        "password_hashing": password_hasher.stats(),
+        "auth_principals": principal_cache.stats(),
+        "stock_reservations": stock_reservations.stats(),
+        "hot_inventory": hot_inventory.stats()
     }
 
 # ============ FIX IMAGE URLS - SOLUTION DÉFINITIVE ============
@@ -9410,6 +9528,7 @@ async def fix_all_image_urls(user: User = Depends(require_admin)):
     import re
     
     fixed_count = 0
+    fixed_product_ids = []
     products_checked = 0
     details = []
     errors = []
@@ -9493,6 +9612,7 @@ async def fix_all_image_urls(user: User = Depends(require_admin)):
                     }}
                 )
                 fixed_count += 1
+                fixed_product_ids.append(product_id)
             except Exception as e:
                 errors.append({
                     'product': product_name,
@@ -9501,6 +9621,9 @@ async def fix_all_image_urls(user: User = Depends(require_admin)):
     
     logger.info(f"Image URL fix completed: {fixed_count}/{products_checked} products fixed")
     
+    if fixed_product_ids:
+        await catalog_bus.publish(PRODUCT_UPDATED, fixed_product_ids, ["images"])
+    
     return {
         "success": True,
         "message": f"Correction terminée: {fixed_count} produit(s) corrigé(s) sur {products_checked}",
@@ -9576,7 +9699,7 @@ app.include_router(api_router)
 
 # Commercial routes
 from routes.commercial_routes import get_commercial_routes
-commercial_router = get_commercial_routes(db, require_admin)
+commercial_router = get_commercial_routes(db, require_admin, pdf_renderer, pdf_assets)
 app.include_router(commercial_router)
 
 # CORS - Allow multiple origins including production and preview
@@ -9594,6 +9717,8 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
+    # bulk PDF exports: the admin UI polls progress with this id while downloading
+    expose_headers=["X-Export-Id", "X-Export-Total"],
 )
 
 # Logging
@@ -9625,10 +9750,36 @@ async def startup_event():
         await db.orders.create_index("created_at")
         await db.orders.create_index("order_status")
         
+        # Analytics indexes
+        for collection, indexes in ANALYTICS_INDEXES.items():
+            for keys in indexes:
+                await db[collection].create_index(keys)
+        for keys, options in ROLLUP_INDEXES:
+            await db[ROLLUP_COLLECTION].create_index(keys, **options)
+        
+        # Outbound email queue indexes
+        for keys, options in QUEUE_INDEXES:
+            await db[QUEUE_COLLECTION].create_index(keys, **options)
+        await db[BULK_COLLECTION].create_index([("state", 1), ("submitted_at", 1)])
+        await db[BULK_COLLECTION].create_index("bulk_id", unique=True)
+        
         # Users indexes
         await db.users.create_index("user_id", unique=True)
         await db.users.create_index("email", unique=True)
         
+        # Keyset pagination indexes (sort key + unique tiebreaker)
+        await db.orders.create_index([("created_at", -1), ("order_id", -1)])
+        await db.orders.create_index([("order_status", 1), ("created_at", -1), ("order_id", -1)])
+        await db.users.create_index([("created_at", -1), ("user_id", -1)])
+        await db.service_providers.create_index("provider_id", unique=True)
+        await db.service_providers.create_index([("created_at", -1), ("provider_id", -1)])
+        await db.service_providers.create_index([("is_active", 1), ("is_premium", -1), ("rating", -1), ("provider_id", -1)])
+        
+        # Push subscriptions (broadcast scan and endpoint upserts)
+        await db.push_subscriptions.create_index([("is_active", 1), ("_id", 1)])
+        await db.push_subscriptions.create_index([("user_id", 1), ("is_active", 1)])
+        await db.push_subscriptions.create_index("endpoint")
+        
         # Reviews indexes
         await db.reviews.create_index("product_id")
         await db.reviews.create_index("user_id")
@@ -9639,9 +9790,15 @@ async def startup_event():
         await db.blog_posts.create_index("is_published")
         
         # Cart indexes
-        await db.carts.create_index("cart_id", unique=True)
-        await db.carts.create_index("user_id")
-        await db.carts.create_index("session_id")
+        for keys, options in STORE_INDEXES:
+            await db[STORE_COLLECTION].create_index(keys, **options)
+        for keys, options in EXPORT_INDEXES:
+            await db[EXPORT_COLLECTION].create_index(keys, **options)
+        await ensure_cart_indexes(db.carts)
+        
+        # Stock reservations of unpaid online payments
+        for keys, options in RESERVATION_INDEXES:
+            await db[RESERVATION_COLLECTION].create_index(keys, **options)
         
         # Sessions indexes
         await db.user_sessions.create_index("session_token")
@@ -9706,10 +9863,67 @@ async def startup_event():
         replace_existing=True
     )
     
+    # Rebuild search indexes (sales popularity, provider professions) every hour
+    scheduler.add_job(
+        refresh_search_indexes,
+        IntervalTrigger(hours=1),
+        id="search_index_refresh",
+        name="Search Index Refresh",
+        replace_existing=True
+    )
+    
+    # Flash-sale stock counters: follow flash sales, write units sold back to products
+    scheduler.add_job(
+        refresh_hot_inventory,
+        IntervalTrigger(seconds=HOT_RECONCILE_INTERVAL),
+        id="hot_inventory_reconcile",
+        name="Hot Inventory Reconcile",
+        replace_existing=True
+    )
+    
+    # Give back the stock of online payments never completed
+    scheduler.add_job(
+        release_expired_reservations,
+        IntervalTrigger(minutes=5),
+        id="stock_reservation_expiry",
+        name="Stock Reservation Expiry",
+        replace_existing=True
+    )
+    
     scheduler.start()
     logger.info("All email marketing schedulers started successfully")
+    
+    # Listen for cache invalidations and catalog events coming from other workers
+    await app_cache.start()
+    await catalog_bus.start()
+    await principal_cache.start()
+    await restore_claim_markers()
+    
+    # Start the outbound email workers and resume interrupted campaign expansions
+    await email_queue.start(campaign_recipients)
+    
+    # Multi-document transactions for orders when MongoDB runs as a replica set
+    await stock_reservations.detect_transactions()
+    await refresh_hot_inventory()
+    
+    # Logo and placeholder for PDFs, prepared once
+    await pdf_assets.preload()
+    
+    # Search indexes (built in the background; $text serves searches meanwhile)
+    rebuild_search_index()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     scheduler.shutdown()
+    await hot_inventory.close()
+    await email_queue.close()
+    await push_dispatcher.close()
+    image_processor.shutdown()
+    pdf_renderer.shutdown()
+    password_hasher.shutdown()
+    await pdf_assets.close()
+    await close_http_session()
+    await catalog_bus.close()
+    await principal_cache.close()
+    await app_cache.close()
     client.close()
@@ -0,0 +1,121 @@
+"""
+Analytics service for YAMA+ e-commerce platform
+Order metrics computed inside MongoDB with $facet aggregations, so memory
+use does not depend on how many orders fall in the period
+"""
+import asyncio
+from typing import Optional
+
+# Indexes the pipelines rely on, created at startup
+ANALYTICS_INDEXES = {
+    "orders": [
+        [("created_at", 1), ("total", 1)],  # covers the previous-period totals
+        [("user_id", 1), ("created_at", -1)],  # per-customer workflows (VIP, winback)
+    ],
+    "products": [
+        [("stock", 1)],
+    ],
+    "newsletter": [
+        [("active", 1)],
+    ],
+}
+
+TOP_PRODUCTS_LIMIT = 10
+DAILY_CHART_DAYS = 30
+
+
+def _period_match(start: str, end: Optional[str] = None) -> dict:
+    created_at = {"$gte": start}
+    if end:
+        created_at["$lt"] = end
+    return {"$match": {"created_at": created_at}}
+
+
+def order_analytics_pipeline(start: str, end: Optional[str] = None) -> list:
+    """Single $facet pipeline producing summary, breakdowns, daily series and top products"""
+    quantity = {"$ifNull": ["$items.quantity", 1]}
+    return [
+        _period_match(start, end),
+        {"$facet": {
+            "summary": [
+                {"$group": {
+                    "_id": None,
+                    "total_orders": {"$sum": 1},
+                    "total_revenue": {"$sum": {"$ifNull": ["$total", 0]}},
+                    "paid_revenue": {"$sum": {
+                        "$cond": [{"$eq": ["$payment_status", "paid"]}, {"$ifNull": ["$total", 0]}, 0]
+                    }}
+                }}
+            ],
+            "orders_by_status": [
+                {"$group": {"_id": {"$ifNull": ["$order_status", "unknown"]}, "count": {"$sum": 1}}}
+            ],
+            "payment_methods": [
+                {"$group": {"_id": {"$ifNull": ["$payment_method", "unknown"]}, "count": {"$sum": 1}}}
+            ],
+            "daily_chart": [
+                {"$match": {"created_at": {"$type": "string"}}},
+                {"$group": {
+                    "_id": {"$substrCP": ["$created_at", 0, 10]},
+                    "orders": {"$sum": 1},
+                    "revenue": {"$sum": {"$ifNull": ["$total", 0]}}
+                }},
+                {"$sort": {"_id": -1}},
+                {"$limit": DAILY_CHART_DAYS}
+            ],
+            "top_products": [
+                {"$project": {"items": 1}},
+                {"$unwind": "$items"},
+                {"$group": {
+                    "_id": {"$ifNull": ["$items.product_id", {"$ifNull": ["$items.name", "unknown"]}]},
+                    "name": {"$first": {"$ifNull": ["$items.name", "Produit"]}},
+                    "quantity": {"$sum": quantity},
+                    "revenue": {"$sum": {"$multiply": [{"$ifNull": ["$items.price", 0]}, quantity]}}
+                }},
+                {"$sort": {"revenue": -1}},
+                {"$limit": TOP_PRODUCTS_LIMIT}
+            ]
+        }}
+    ]
+
+
+def period_totals_pipeline(start: str, end: Optional[str] = None) -> list:
+    """Order count and revenue for a period (used for growth comparisons)"""
+    return [
+        _period_match(start, end),
+        {"$group": {"_id": None, "orders": {"$sum": 1}, "revenue": {"$sum": {"$ifNull": ["$total", 0]}}}}
+    ]
+
+
+def shape_order_analytics(facets: dict) -> dict:
+    """Turn the $facet output into the structure returned by /admin/analytics"""
+    summary = (facets.get("summary") or [{}])[0]
+    return {
+        "total_orders": summary.get("total_orders", 0),
+        "total_revenue": summary.get("total_revenue", 0),
+        "paid_revenue": summary.get("paid_revenue", 0),
+        "orders_by_status": {row["_id"]: row["count"] for row in facets.get("orders_by_status", [])},
+        "payment_methods": {row["_id"]: row["count"] for row in facets.get("payment_methods", [])},
+        "daily_chart": [
+            {"date": row["_id"], "orders": row["orders"], "revenue": row["revenue"]}
+            for row in reversed(facets.get("daily_chart", []))
+            if row["_id"]
+        ],
+        "top_products": [
+            {"product_id": row["_id"], "name": row["name"], "quantity": row["quantity"], "revenue": row["revenue"]}
+            for row in facets.get("top_products", [])
+        ]
+    }
+
+
+async def compute_order_analytics(db, start: str, previous_start: str) -> dict:
+    """Run the period facet and the previous-period totals in parallel"""
+    facets, previous = await asyncio.gather(
+        db.orders.aggregate(order_analytics_pipeline(start), allowDiskUse=True).to_list(1),
+        db.orders.aggregate(period_totals_pipeline(previous_start, start), allowDiskUse=True).to_list(1)
+    )
+    result = shape_order_analytics(facets[0] if facets else {})
+    previous = previous[0] if previous else {}
+    result["previous_orders"] = previous.get("orders", 0)
+    result["previous_revenue"] = previous.get("revenue", 0)
+    return result
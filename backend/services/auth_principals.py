@@ -0,0 +1,166 @@
+"""
+Auth principal service for YAMA+ e-commerce platform
+get_current_user runs on nearly every request. It used to decode the JWT and
+read the user from Mongo every time (plus a user_sessions lookup for Google
+sessions). Principals are now resolved once per token and kept in an
+in-process cache keyed by a hash of the token, for PRINCIPAL_CACHE_TTL
+seconds at most and never past the token's own expiry.
+
+Tokens from create_token also carry the profile claims (name, role...), so a
+cache miss on such a token needs no Mongo read either. Claims are trusted
+only for tokens issued after the user's last change: invalidate_user()
+(profile update, new Google session) drops the user's cached principals and
+sends older tokens back to Mongo; the server also persists the change time
+on the user so restore_changes() brings the markers back after a restart.
+Principals built from claims are not `verified`: role and ownership checks
+confirm them against Mongo (roles are changed directly in the database).
+When a shared store is attached (see services.cache), invalidations are
+relayed to the other uvicorn workers.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+from .cache import LocalLRUCache, _MISSING
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_TTL = int(os.environ.get("PRINCIPAL_CACHE_TTL", "60"))  # seconds, bounds staleness without a relay
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.environ.get("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+CHANGE_MARKERS_MAX = 10000  # past this, markers older than any live token are pruned
+
+
+def token_key(token: str) -> str:
+    """Cache key for a token: its SHA-256, so raw tokens are never kept"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class Principal(NamedTuple):
+    user: Any
+    verified: bool  # read from Mongo, not from token claims
+    expires_at: float  # epoch seconds, the token's expiry
+
+
+class PrincipalCache:
+    """Token hash -> Principal, with per-user invalidation"""
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES,
+                 token_lifetime: float = 7 * 24 * 3600, channel: str = "yama:principals"):
+        self.ttl = ttl
+        self.token_lifetime = token_lifetime
+        self.channel = channel
+        self.instance_id = uuid.uuid4().hex[:8]
+        self._cache = LocalLRUCache(max_entries)
+        self._changed_at: Dict[str, float] = {}  # user_id -> epoch of the last change
+        self._shared = None
+        self._listener = None
+        self._stats = {"from_claims": 0, "from_db": 0, "invalidations": 0, "received_from_other_workers": 0}
+
+    # ---------- lookups ----------
+
+    def get(self, token: str) -> Optional[Principal]:
+        principal = self._cache.get(token_key(token))
+        return None if principal is _MISSING else principal
+
+    def put(self, token: str, user_id: str, user, verified: bool, expires_at: float) -> Principal:
+        principal = Principal(user, verified, expires_at)
+        self._stats["from_db" if verified else "from_claims"] += 1
+        ttl = min(self.ttl, expires_at - time.time())
+        if ttl > 0:
+            key = token_key(token)
+            self._cache.set(key, principal, ttl, tags=(f"user:{user_id}", f"token:{key}"))
+        return principal
+
+    def claims_trusted(self, user_id: str, issued_at: float) -> bool:
+        """Whether claims of a token issued at `issued_at` postdate the user's last change
+
+        JWT iat is whole seconds: a token reissued in the second of the change is trusted.
+        """
+        return issued_at >= self._changed_at.get(user_id, 0)
+
+    # ---------- invalidation ----------
+
+    def _forget(self, user_ids: Iterable[str] = (), token_keys: Iterable[str] = (), changed_at: float = 0):
+        tags = [f"user:{user_id}" for user_id in user_ids] + [f"token:{key}" for key in token_keys]
+        self._cache.invalidate_tags(tags)
+        for user_id in user_ids:
+            self._changed_at[user_id] = max(changed_at, self._changed_at.get(user_id, 0))
+        if len(self._changed_at) > CHANGE_MARKERS_MAX:
+            oldest_live = time.time() - self.token_lifetime
+            self._changed_at = {uid: at for uid, at in self._changed_at.items() if at > oldest_live}
+
+    async def _relay(self, message: dict):
+        if self._shared is None:
+            return
+        try:
+            await self._shared.publish(self.channel, json.dumps({"origin": self.instance_id, **message}))
+        except Exception as e:
+            logger.warning(f"Principal invalidation relay failed: {e}")
+
+    async def invalidate_user(self, user_id: str, changed_at: Optional[float] = None):
+        """The user changed (profile, session): drop cached principals, distrust older claims"""
+        changed_at = changed_at or int(time.time())
+        self._stats["invalidations"] += 1
+        self._forget(user_ids=[user_id], changed_at=changed_at)
+        await self._relay({"users": [user_id], "at": changed_at})
+
+    def restore_changes(self, changed_at: Dict[str, float]):
+        """Reload persisted change times (user_id -> epoch), e.g. at startup"""
+        for user_id, at in changed_at.items():
+            self._changed_at[user_id] = max(at, self._changed_at.get(user_id, 0))
+
+    async def invalidate_token(self, token: str):
+        """Logout: drop the principal cached for this token"""
+        key = token_key(token)
+        self._stats["invalidations"] += 1
+        self._forget(token_keys=[key])
+        await self._relay({"tokens": [key]})
+
+    # ---------- relay between workers ----------
+
+    def attach_shared(self, store, channel: Optional[str] = None):
+        """Relay invalidations through a Redis-protocol store (RedisStore/FakeSharedStore)"""
+        self._shared = store
+        if channel:
+            self.channel = channel
+
+    async def start(self):
+        if self._shared is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                async for raw in self._shared.listen(self.channel):
+                    message = json.loads(raw)
+                    if message.get("origin") == self.instance_id:
+                        continue
+                    self._stats["received_from_other_workers"] += 1
+                    self._forget(message.get("users", ()), message.get("tokens", ()), message.get("at", 0))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Principal invalidation listener error, retrying: {e}")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def stats(self) -> dict:
+        return {
+            **self._cache.stats(),
+            **self._stats,
+            "ttl": self.ttl,
+            "relay": type(self._shared).__name__ if self._shared is not None else None
+        }
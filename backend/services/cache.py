@@ -0,0 +1,393 @@
+"""
+Cache service for YAMA+ e-commerce platform
+Two tiers behind one async API:
+- a bounded in-process LRU+TTL tier (always on)
+- an optional shared tier speaking the Redis protocol, so every uvicorn
+  worker sees the same catalog and invalidations reach all of them
+Entries are grouped by tags ("products", "flash_sales"...) and invalidated
+per tag instead of scanning key prefixes.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import fnmatch
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Iterable, Optional
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # Shared tier is optional
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL")
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "2000"))
+CACHE_NAMESPACE = os.environ.get("CACHE_NAMESPACE", "yama:cache")
+DEFAULT_TTL = 60  # seconds
+# When a shared tier exists, local copies are only kept briefly so a lost
+# invalidation message cannot keep a worker stale for long
+LOCAL_TTL_WITH_SHARED = 10  # seconds
+
+_MISSING = object()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class LocalLRUCache:
+    """Bounded in-process cache with per-entry TTL, LRU eviction and tag index"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return _MISSING
+        expires_at, value, _ = entry
+        if time.monotonic() >= expires_at:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = ()):
+        if key in self._entries:
+            self._remove(key)
+        tags = frozenset(tags)
+        self._entries[key] = (time.monotonic() + ttl, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._evict_one()
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        removed = 0
+        for tag in tags:
+            for key in self._tags.pop(tag, set()):
+                if key in self._entries:
+                    self._remove(key)
+                    removed += 1
+        return removed
+
+    def clear(self):
+        self._entries.clear()
+        self._tags.clear()
+
+    def _evict_one(self):
+        # Least recently used entry; counted as an expiration if it was already stale
+        now = time.monotonic()
+        oldest_key, (expires_at, _, _) = next(iter(self._entries.items()))
+        self._remove(oldest_key)
+        if expires_at <= now:
+            self.expirations += 1
+        else:
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class RedisStore:
+    """Shared store backed by a Redis-compatible server"""
+
+    def __init__(self, url: str):
+        if redis_asyncio is None:
+            raise RuntimeError("redis package is required for CACHE_REDIS_URL")
+        self.client = redis_asyncio.from_url(url, decode_responses=True)
+
+    async def get(self, key):
+        return await self.client.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        return bool(await self.client.set(key, value, ex=ex, nx=nx))
+
+    async def delete(self, *keys):
+        if keys:
+            await self.client.delete(*keys)
+
+    async def sadd(self, key, *members):
+        await self.client.sadd(key, *members)
+
+    async def smembers(self, key):
+        return await self.client.smembers(key)
+
+    async def expire(self, key, seconds):
+        await self.client.expire(key, seconds)
+
+    async def incrby(self, key, amount):
+        return await self.client.incrby(key, amount)
+
+    async def keys(self, pattern):
+        return [key async for key in self.client.scan_iter(match=pattern)]
+
+    async def publish(self, channel, message):
+        await self.client.publish(channel, message)
+
+    async def listen(self, channel):
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    yield message["data"]
+        finally:
+            await pubsub.unsubscribe(channel)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class FakeSharedStore:
+    """In-memory stand-in for RedisStore, shareable between cache instances in tests"""
+
+    def __init__(self):
+        self._data = {}  # key -> (expires_at or None, value)
+        self._subscribers = {}  # channel -> list of queues
+
+    def _alive(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key):
+        value = self._alive(key)
+        return value if isinstance(value, str) else None
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and self._alive(key) is not None:
+            return False
+        self._data[key] = (time.monotonic() + ex if ex else None, value)
+        return True
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def sadd(self, key, *members):
+        current = self._alive(key)
+        members_set = set(current) if isinstance(current, set) else set()
+        members_set.update(members)
+        expires_at = self._data[key][0] if key in self._data else None
+        self._data[key] = (expires_at, members_set)
+
+    async def smembers(self, key):
+        value = self._alive(key)
+        return set(value) if isinstance(value, set) else set()
+
+    async def expire(self, key, seconds):
+        if key in self._data:
+            self._data[key] = (time.monotonic() + seconds, self._data[key][1])
+
+    async def incrby(self, key, amount):
+        current = self._alive(key)
+        value = int(current or 0) + amount
+        expires_at = self._data[key][0] if key in self._data else None
+        self._data[key] = (expires_at, str(value))
+        return value
+
+    async def keys(self, pattern):
+        return [key for key in list(self._data) if fnmatch.fnmatchcase(key, pattern) and self._alive(key) is not None]
+
+    async def publish(self, channel, message):
+        for queue in self._subscribers.get(channel, []):
+            queue.put_nowait(message)
+
+    async def listen(self, channel):
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(channel, []).append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[channel].remove(queue)
+
+    async def close(self):
+        pass
+
+
+class TieredCache:
+    """Local LRU tier in front of an optional shared tier, with tag invalidation"""
+
+    def __init__(self, local: Optional[LocalLRUCache] = None, shared=None, namespace: str = CACHE_NAMESPACE):
+        self.local = local if local is not None else LocalLRUCache()
+        self.shared = shared
+        self.namespace = namespace
+        self.instance_id = uuid.uuid4().hex[:8]
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.shared_errors = 0
+        self._listener = None
+
+    def _key(self, key):
+        return f"{self.namespace}:v:{key}"
+
+    def _tag_key(self, tag):
+        return f"{self.namespace}:tag:{tag}"
+
+    @property
+    def _channel(self):
+        return f"{self.namespace}:invalidate"
+
+    async def get(self, key: str, default=None):
+        value = self.local.get(key)
+        if value is not _MISSING:
+            return value
+        if self.shared is None:
+            return default
+        try:
+            raw = await self.shared.get(self._key(key))
+        except Exception as e:
+            self.shared_errors += 1
+            logger.warning(f"Shared cache read failed for {key}: {e}")
+            return default
+        if raw is None:
+            self.shared_misses += 1
+            return default
+        self.shared_hits += 1
+        payload = json.loads(raw)
+        self.local.set(key, payload["value"], min(LOCAL_TTL_WITH_SHARED, payload["ttl"]), payload["tags"])
+        return payload["value"]
+
+    async def set(self, key: str, value: Any, ttl: float = DEFAULT_TTL, tags: Iterable[str] = ()):
+        tags = list(tags)
+        local_ttl = min(ttl, LOCAL_TTL_WITH_SHARED) if self.shared is not None else ttl
+        self.local.set(key, value, local_ttl, tags)
+        if self.shared is None:
+            return
+        try:
+            raw = json.dumps({"value": value, "ttl": ttl, "tags": tags}, default=_json_default)
+            await self.shared.set(self._key(key), raw, ex=int(ttl) or 1)
+            for tag in tags:
+                await self.shared.sadd(self._tag_key(tag), key)
+                await self.shared.expire(self._tag_key(tag), int(ttl) + 60)
+        except Exception as e:
+            self.shared_errors += 1
+            logger.warning(f"Shared cache write failed for {key}: {e}")
+
+    async def invalidate_tags(self, *tags: str) -> int:
+        """Drop every entry carrying one of the tags, in all workers"""
+        removed = self.local.invalidate_tags(tags)
+        if self.shared is None:
+            return removed
+        try:
+            for tag in tags:
+                keys = await self.shared.smembers(self._tag_key(tag))
+                await self.shared.delete(*[self._key(k) for k in keys], self._tag_key(tag))
+            await self.shared.publish(self._channel, json.dumps({"origin": self.instance_id, "tags": list(tags)}))
+        except Exception as e:
+            self.shared_errors += 1
+            logger.warning(f"Shared cache invalidation failed for {tags}: {e}")
+        return removed
+
+    async def clear(self):
+        self.local.clear()
+        if self.shared is None:
+            return
+        try:
+            keys = await self.shared.keys(f"{self.namespace}:*")
+            await self.shared.delete(*keys)
+            await self.shared.publish(self._channel, json.dumps({"origin": self.instance_id, "tags": None}))
+        except Exception as e:
+            self.shared_errors += 1
+            logger.warning(f"Shared cache clear failed: {e}")
+
+    async def start(self):
+        """Subscribe to invalidations published by other workers"""
+        if self.shared is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                async for raw in self.shared.listen(self._channel):
+                    message = json.loads(raw)
+                    if message.get("origin") == self.instance_id:
+                        continue
+                    if message.get("tags") is None:
+                        self.local.clear()
+                    else:
+                        self.local.invalidate_tags(message["tags"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener error, retrying: {e}")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self.shared is not None:
+            await self.shared.close()
+
+    def stats(self) -> dict:
+        stats = {"local": self.local.stats(), "shared": None}
+        if self.shared is not None:
+            stats["shared"] = {
+                "backend": type(self.shared).__name__,
+                "hits": self.shared_hits,
+                "misses": self.shared_misses,
+                "errors": self.shared_errors
+            }
+        return stats
+
+
+def create_cache(redis_url: Optional[str] = CACHE_REDIS_URL, max_entries: int = CACHE_MAX_ENTRIES) -> TieredCache:
+    """Build the application cache from configuration"""
+    shared = None
+    if redis_url:
+        try:
+            shared = RedisStore(redis_url)
+        except RuntimeError as e:
+            logger.warning(f"Shared cache disabled: {e}")
+    return TieredCache(LocalLRUCache(max_entries), shared)
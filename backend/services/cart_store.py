@@ -0,0 +1,144 @@
+"""
+Cart store service for YAMA+ e-commerce platform
+Cart mutations are single atomic updates on the cart document instead of
+read / modify in Python / $set the whole items array, which took two round
+trips and lost one of two concurrent adds (two tabs, double clicks):
+- adding a product already in the cart is one $inc on its line (arrayFilters)
+- otherwise the $inc matches nothing and one $push adds the line, upserting
+  the cart when there is none
+- quantity changes and removals are one $set on the line / one $pull
+Each returns the cart as updated (find_one_and_update).
+
+There is one cart per user and per guest session, enforced by unique
+partial indexes: two first adds racing to create the same cart cannot both
+insert, the loser retries as an add to the cart the winner created.
+"""
+import uuid
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+CART_PROJECTION = {"_id": 0, "cart_id": 1, "items": 1, "updated_at": 1}
+CART_INDEXES = [
+    ("cart_id", {"unique": True}),
+    ("user_id", {"name": "cart_owner_user", "unique": True,
+                 "partialFilterExpression": {"user_id": {"$type": "string"}}}),
+    ("session_id", {"name": "cart_owner_session", "unique": True,
+                    "partialFilterExpression": {"session_id": {"$type": "string"}}}),
+]
+LEGACY_CART_INDEXES = ("user_id_1", "session_id_1")  # non-unique, replaced by the owner indexes
+ADD_ATTEMPTS = 3
+
+
+def cart_owner(user_id: Optional[str], session_id: Optional[str]) -> dict:
+    """Filter selecting the cart of a user, else of a guest session"""
+    return {"user_id": user_id} if user_id else {"session_id": session_id}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+async def add_cart_item(carts, owner: dict, product_id: str, quantity: int) -> dict:
+    """Add quantity of a product, creating the line or the cart if needed; returns the cart"""
+    for _ in range(ADD_ATTEMPTS):
+        # Already in the cart: bump its line
+        cart = await carts.find_one_and_update(
+            {**owner, "items.product_id": product_id},
+            {"$inc": {"items.$[line].quantity": quantity}, "$set": {"updated_at": _now()}},
+            array_filters=[{"line.product_id": product_id}],
+            projection=CART_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if cart is not None:
+            return cart
+        # New line, in the existing cart or in a new one
+        now = _now()
+        try:
+            return await carts.find_one_and_update(
+                {**owner, "items.product_id": {"$ne": product_id}},
+                {
+                    "$push": {"items": {"product_id": product_id, "quantity": quantity}},
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {
+                        "cart_id": f"cart_{uuid.uuid4().hex[:12]}",
+                        "user_id": owner.get("user_id"),
+                        "session_id": owner.get("session_id"),
+                        "created_at": now
+                    }
+                },
+                upsert=True,
+                projection=CART_PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another request added this product (or created the cart) since the $inc: go again
+            continue
+    raise RuntimeError(f"Cart add kept conflicting for {owner}")
+
+
+async def set_cart_quantity(carts, owner: dict, product_id: str, quantity: int) -> Optional[dict]:
+    """Set a line's quantity (0 or less removes it); None when there is no cart"""
+    if quantity <= 0:
+        return await remove_cart_item(carts, owner, product_id)
+    return await carts.find_one_and_update(
+        owner,
+        {"$set": {"items.$[line].quantity": quantity, "updated_at": _now()}},
+        array_filters=[{"line.product_id": product_id}],
+        projection=CART_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def remove_cart_item(carts, owner: dict, product_id: str) -> Optional[dict]:
+    return await carts.find_one_and_update(
+        owner,
+        {"$pull": {"items": {"product_id": product_id}}, "$set": {"updated_at": _now()}},
+        projection=CART_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def merge_duplicate_carts(carts) -> int:
+    """Fold carts sharing an owner into the most recently updated one; returns carts removed"""
+    removed = 0
+    for field in ("user_id", "session_id"):
+        duplicates = await carts.aggregate([
+            {"$match": {field: {"$type": "string"}}},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}
+        ]).to_list(None)
+        for row in duplicates:
+            owned = await carts.find({field: row["_id"]}).sort("updated_at", -1).to_list(None)
+            keeper, others = owned[0], owned[1:]
+            quantities = {}
+            for cart in owned:
+                for item in cart.get("items", []):
+                    quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
+            await carts.update_one(
+                {"_id": keeper["_id"]},
+                {"$set": {"items": [{"product_id": pid, "quantity": qty} for pid, qty in quantities.items()]}}
+            )
+            await carts.delete_many({"_id": {"$in": [cart["_id"] for cart in others]}})
+            removed += len(others)
+    if removed:
+        logger.info(f"Merged duplicate carts: {removed} removed")
+    return removed
+
+
+async def ensure_cart_indexes(carts):
+    """Create the cart indexes, replacing the former non-unique owner indexes once"""
+    existing = await carts.index_information()
+    legacy = [name for name in LEGACY_CART_INDEXES if name in existing]
+    if legacy:
+        # concurrent first adds could create several carts per owner: merge them before enforcing one
+        await merge_duplicate_carts(carts)
+        for name in legacy:
+            await carts.drop_index(name)
+    for keys, options in CART_INDEXES:
+        await carts.create_index(keys, **options)
@@ -0,0 +1,151 @@
+"""
+Catalog change bus for YAMA+ e-commerce platform
+Every product mutation publishes a CatalogEvent; caches, the sitemap and
+derived indexes subscribe instead of being cleared by hand at each call site.
+When a shared store is attached (see services.cache), events are relayed to
+the other uvicorn workers as well.
+"""
+import json
+import uuid
+import asyncio
+import logging
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+PRODUCT_CREATED = "product.created"
+PRODUCT_UPDATED = "product.updated"
+PRODUCT_DELETED = "product.deleted"
+STOCK_CHANGED = "product.stock_changed"
+FLASH_SALE_CHANGED = "product.flash_sale_changed"
+GIFTBOX_CHANGED = "giftbox.changed"
+CATALOG_RESET = "catalog.reset"
+
+ALL_KINDS = (
+    PRODUCT_CREATED, PRODUCT_UPDATED, PRODUCT_DELETED, STOCK_CHANGED,
+    FLASH_SALE_CHANGED, GIFTBOX_CHANGED, CATALOG_RESET
+)
+
+
+class CatalogEvent:
+    """A change to one or more products; empty product_ids means "any product" """
+
+    __slots__ = ("kind", "product_ids", "fields", "origin", "local")
+
+    def __init__(self, kind: str, product_ids: Iterable[str] = (), fields: Iterable[str] = (),
+                 origin: str = "", local: bool = True):
+        self.kind = kind
+        self.product_ids = list(product_ids)
+        self.fields = list(fields)
+        self.origin = origin
+        self.local = local
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "kind": self.kind,
+            "product_ids": self.product_ids,
+            "fields": self.fields,
+            "origin": self.origin
+        })
+
+    @classmethod
+    def from_json(cls, raw: str) -> "CatalogEvent":
+        data = json.loads(raw)
+        return cls(data["kind"], data.get("product_ids", []), data.get("fields", []),
+                   data.get("origin", ""), local=False)
+
+    def __repr__(self):
+        return f"CatalogEvent({self.kind}, {self.product_ids}, local={self.local})"
+
+
+Handler = Callable[[CatalogEvent], Awaitable[None]]
+
+
+class CatalogEventBus:
+    """In-process publish/subscribe, optionally relayed through a shared store"""
+
+    def __init__(self, channel: str = "yama:catalog"):
+        self.channel = channel
+        self.instance_id = uuid.uuid4().hex[:8]
+        self._subscribers: List[tuple] = []  # (kinds or None, handler)
+        self._shared = None
+        self._listener = None
+        self.published = 0
+        self.received = 0
+        self.handler_errors = 0
+
+    def subscribe(self, handler: Handler, kinds: Optional[Iterable[str]] = None) -> Handler:
+        """Register an async handler for some (or all) event kinds"""
+        self._subscribers.append((frozenset(kinds) if kinds else None, handler))
+        return handler
+
+    def on(self, *kinds: str):
+        """Decorator form of subscribe()"""
+        def decorator(handler: Handler) -> Handler:
+            return self.subscribe(handler, kinds or None)
+        return decorator
+
+    async def publish(self, kind: str, product_ids: Iterable[str] = (), fields: Iterable[str] = ()):
+        """Dispatch an event to local subscribers, then relay it to other workers"""
+        event = CatalogEvent(kind, product_ids, fields, origin=self.instance_id)
+        self.published += 1
+        await self._dispatch(event)
+        if self._shared is not None:
+            try:
+                await self._shared.publish(self.channel, event.to_json())
+            except Exception as e:
+                logger.warning(f"Catalog event relay failed for {event}: {e}")
+
+    async def _dispatch(self, event: CatalogEvent):
+        for kinds, handler in self._subscribers:
+            if kinds is not None and event.kind not in kinds:
+                continue
+            try:
+                await handler(event)
+            except Exception as e:
+                self.handler_errors += 1
+                logger.error(f"Catalog event handler {getattr(handler, '__name__', handler)} failed for {event}: {e}")
+
+    def attach_shared(self, store, channel: Optional[str] = None):
+        """Relay events through a Redis-protocol store (RedisStore/FakeSharedStore)"""
+        self._shared = store
+        if channel:
+            self.channel = channel
+
+    async def start(self):
+        if self._shared is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                async for raw in self._shared.listen(self.channel):
+                    event = CatalogEvent.from_json(raw)
+                    if event.origin == self.instance_id:
+                        continue
+                    self.received += 1
+                    await self._dispatch(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Catalog event listener error, retrying: {e}")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "received_from_other_workers": self.received,
+            "handler_errors": self.handler_errors,
+            "relay": type(self._shared).__name__ if self._shared is not None else None
+        }
@@ -0,0 +1,110 @@
+"""
+CSV export service for YAMA+ e-commerce platform
+Streams admin exports straight from Mongo cursors: rows are encoded with the
+csv module in small chunks (optionally gzip-compressed), so memory stays
+constant whatever the size of the collection
+"""
+import io
+import csv
+import zlib
+from typing import AsyncIterator, Iterable, List
+
+EXPORT_BATCH_SIZE = 500  # cursor batch size and rows per emitted chunk
+
+ORDERS_HEADER = ["order_id", "date", "client", "email", "telephone", "adresse", "ville", "total", "statut", "methode_paiement"]
+ORDERS_PROJECTION = {
+    "_id": 0, "order_id": 1, "created_at": 1, "shipping": 1,
+    "total": 1, "order_status": 1, "payment_method": 1
+}
+
+CLIENTS_HEADER = ["user_id", "nom", "email", "telephone", "date_inscription", "role", "commandes"]
+CLIENTS_PROJECTION = {"_id": 0, "user_id": 1, "name": 1, "email": 1, "phone": 1, "created_at": 1, "role": 1}
+
+
+def _date(value) -> str:
+    return str(value)[:10] if value else ""
+
+
+async def stream_csv(header: List[str], rows: AsyncIterator[Iterable], gzip_output: bool = False,
+                     chunk_rows: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Encode rows as CSV and yield byte chunks of about chunk_rows rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    compressor = zlib.compressobj(wbits=31) if gzip_output else None  # wbits=31 -> gzip container
+
+    def drain() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow(header)
+    pending = 0
+    async for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            chunk = drain()
+            pending = 0
+            if chunk:
+                yield chunk
+    chunk = drain()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+async def order_rows(db) -> AsyncIterator[list]:
+    cursor = db.orders.find({}, ORDERS_PROJECTION).sort("created_at", -1).batch_size(EXPORT_BATCH_SIZE)
+    async for order in cursor:
+        shipping = order.get("shipping") or {}
+        yield [
+            order.get("order_id", ""),
+            _date(order.get("created_at")),
+            shipping.get("full_name", ""),
+            shipping.get("email", ""),
+            shipping.get("phone", ""),
+            shipping.get("address", ""),
+            shipping.get("city", ""),
+            order.get("total", 0),
+            order.get("order_status", ""),
+            order.get("payment_method", "")
+        ]
+
+
+async def client_rows(db) -> AsyncIterator[list]:
+    """Users ordered by user_id, merge-joined with per-user order counts
+
+    Both sides stream in user_id order (users via the unique index, counts
+    via one $group + $sort), so only the current row of each is in memory.
+    """
+    users = db.users.find({}, CLIENTS_PROJECTION).sort("user_id", 1).batch_size(EXPORT_BATCH_SIZE)
+    counts = db.orders.aggregate([
+        {"$match": {"user_id": {"$type": "string"}}},
+        {"$group": {"_id": "$user_id", "orders": {"$sum": 1}}},
+        {"$sort": {"_id": 1}}
+    ], allowDiskUse=True, batchSize=EXPORT_BATCH_SIZE)
+
+    current = await _next(counts)
+    async for u in users:
+        user_id = u.get("user_id") or ""
+        while current is not None and current["_id"] < user_id:
+            current = await _next(counts)
+        order_count = current["orders"] if current is not None and current["_id"] == user_id else 0
+        yield [
+            user_id,
+            u.get("name", ""),
+            u.get("email", ""),
+            u.get("phone", ""),
+            _date(u.get("created_at")),
+            u.get("role", "customer"),
+            order_count
+        ]
+
+
+async def _next(cursor):
+    try:
+        return await cursor.__anext__()
+    except StopAsyncIteration:
+        return None
@@ -0,0 +1,563 @@
+"""
+Outbound email queue for YAMA+ e-commerce platform
+Messages are persisted in the email_queue collection and delivered by a pool
+of asyncio workers:
+- jobs are claimed atomically (find_one_and_update), so several uvicorn
+  workers can share the queue; jobs stuck in "sending" are reclaimed
+- a token bucket keeps the send rate under the MailerSend quota
+- failures are retried with exponential backoff, then moved to "dead"
+  (the dead-letter list) once EMAIL_MAX_ATTEMPTS is reached
+- campaigns are expanded into one job per recipient in the background and
+  report progress through sent_count / failed_count on the campaign; an
+  expansion cut short by a restart or an error is resumed on start()
+- with a bulk client, workers claim jobs in batches and submit each batch as
+  one MailerSend bulk request; a reconciler polls the bulk reports and
+  settles every job (and the document it belongs to) from them
+"""
+import os
+import time
+import uuid
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from .mailersend_bulk import BulkSendError, BULK_DONE_STATES, bulk_outcomes
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+EMAIL_QUEUE_CONCURRENCY = int(os.environ.get("EMAIL_QUEUE_CONCURRENCY", "4"))
+EMAIL_RATE_PER_SECOND = float(os.environ.get("EMAIL_RATE_PER_SECOND", "2"))  # API requests per process, keep under the MailerSend quota
+EMAIL_RATE_BURST = int(os.environ.get("EMAIL_RATE_BURST", "10"))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_BASE_SECONDS = int(os.environ.get("EMAIL_RETRY_BASE_SECONDS", "30"))
+EMAIL_RETRY_MAX_SECONDS = 3600
+EMAIL_LOCK_SECONDS = 300  # a "sending" job older than this belongs to a dead worker
+EMAIL_MAX_PENDING = int(os.environ.get("EMAIL_MAX_PENDING", "100000"))  # campaign expansion pauses above this
+EMAIL_POLL_INTERVAL = 2.0
+ENQUEUE_BATCH_SIZE = 500
+BULK_RECONCILE_INTERVAL = 30.0
+BULK_RECONCILE_LIMIT = 20  # bulk reports fetched per reconcile pass
+
+QUEUE_COLLECTION = "email_queue"
+BULK_COLLECTION = "email_bulk_batches"
+
+PENDING = "pending"
+SENDING = "sending"
+SUBMITTED = "submitted"  # accepted in a bulk request, waiting for its report
+SENT = "sent"
+DEAD = "dead"
+
+QUEUE_INDEXES = [
+    ([("job_id", 1)], {"unique": True}),
+    ([("lock", 1)], {"sparse": True}),
+    ([("status", 1), ("next_attempt_at", 1)], {}),
+    ([("campaign_id", 1), ("status", 1)], {}),
+    # one job per recipient and campaign, so "all" audiences are deduplicated
+    ([("campaign_id", 1), ("to", 1)], {"unique": True, "partialFilterExpression": {"campaign_id": {"$type": "string"}}}),
+]
+
+DUPLICATE_KEY = 11000
+
+
+class QueueFullError(Exception):
+    """Raised when the backlog is too large to accept a new campaign"""
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, at most `burst` saved up"""
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # The lock makes waiters queue up in order instead of racing for each token
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with 10% jitter: 30s, 60s, 120s... capped at one hour"""
+    delay = min(EMAIL_RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1), EMAIL_RETRY_MAX_SECONDS)
+    return delay * (1 + random.random() * 0.1)
+
+
+def is_retryable(result: dict) -> bool:
+    """Network errors, throttling and provider outages are worth retrying; other 4xx are not"""
+    status = result.get("status")
+    return status is None or status == 429 or status >= 500
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class EmailQueue:
+    """Mongo-backed outbound queue with a worker pool
+
+    `sender(to_email, to_name, subject, html)` returns the same dict as
+    email_service.send_email_mailersend ({"success", "error", "status"}).
+    `render(content)` turns campaign content into the email HTML.
+    `bulk` is an optional MailerSendBulkClient; when set, jobs are sent in
+    bulk requests of bulk.batch_size messages.
+
+    A job may carry a `ref` ({"collection", "filter", "field"}) naming the
+    document that tracks it (vip_emails, winback_emails, orders...); its
+    `field` is set to "sent" or "failed" once the outcome is final.
+    """
+
+    def __init__(self, db, sender: Callable[..., Awaitable[dict]], render: Callable[[str], str] = None,
+                 concurrency: int = EMAIL_QUEUE_CONCURRENCY, rate: float = EMAIL_RATE_PER_SECOND,
+                 burst: int = EMAIL_RATE_BURST, max_attempts: int = EMAIL_MAX_ATTEMPTS,
+                 max_pending: int = EMAIL_MAX_PENDING, poll_interval: float = EMAIL_POLL_INTERVAL,
+                 bulk=None, reconcile_interval: float = BULK_RECONCILE_INTERVAL):
+        self.db = db
+        self.sender = sender
+        self.render = render or (lambda content: content)
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.bulk = bulk
+        self.reconcile_interval = reconcile_interval
+        self._workers = []
+        self._background = set()
+        self._wakeup = asyncio.Event()
+        self._campaign_content = {}
+        self._stats = {"sent": 0, "retried": 0, "dead": 0, "bulk_requests": 0}
+
+    @property
+    def collection(self):
+        return self.db[QUEUE_COLLECTION]
+
+    # ---- producers ----
+
+    def _job(self, to: str, subject: Optional[str], html: Optional[str], name: str = "",
+             campaign_id: Optional[str] = None, ref: Optional[dict] = None) -> dict:
+        now = _now()
+        job = {
+            "job_id": f"MAIL-{uuid.uuid4().hex[:12].upper()}",
+            "to": to,
+            "name": name or "",
+            "subject": subject,
+            "html": html,
+            "campaign_id": campaign_id,
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now
+        }
+        if ref:
+            job["ref"] = ref
+        return job
+
+    async def enqueue(self, to: str, subject: str, html: str, name: str = "", ref: Optional[dict] = None) -> str:
+        """Queue a single message and return its job_id"""
+        job = self._job(to, subject, html, name, ref=ref)
+        await self.collection.insert_one(job)
+        self._wakeup.set()
+        return job["job_id"]
+
+    async def pending_count(self) -> int:
+        return await self.collection.count_documents({"status": PENDING})
+
+    async def ensure_capacity(self):
+        """Reject new campaigns while the backlog is above max_pending"""
+        if await self.pending_count() >= self.max_pending:
+            raise QueueFullError(f"{QUEUE_COLLECTION} backlog above {self.max_pending}")
+
+    async def _insert_batch(self, jobs: list) -> int:
+        try:
+            result = await self.collection.insert_many(jobs, ordered=False)
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Duplicates are recipients already queued for this campaign
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != DUPLICATE_KEY for err in errors):
+                raise
+            return e.details.get("nInserted", len(jobs) - len(errors))
+
+    async def enqueue_campaign(self, campaign_id: str, recipients: AsyncIterator[dict]) -> int:
+        """Create one job per recipient, waiting while the backlog is full
+
+        Subject and HTML are resolved from the campaign when the job is sent,
+        so they are not copied into every job.
+        """
+        queued = 0
+        batch = []
+        try:
+            async for recipient in recipients:
+                email = (recipient.get("email") or "").strip()
+                if not email:
+                    continue
+                batch.append(self._job(email, None, None, recipient.get("name", ""), campaign_id))
+                if len(batch) >= ENQUEUE_BATCH_SIZE:
+                    while await self.pending_count() >= self.max_pending:
+                        await asyncio.sleep(self.poll_interval)
+                    queued += await self._insert_batch(batch)
+                    batch = []
+                    self._wakeup.set()
+            if batch:
+                queued += await self._insert_batch(batch)
+                self._wakeup.set()
+        except Exception as e:
+            # enqueue_complete stays False: the expansion is resumed at the next start()
+            logger.error(f"Campaign {campaign_id} enqueue failed after {queued} recipients: {e}")
+            await self.db.campaigns.update_one(
+                {"campaign_id": campaign_id},
+                {"$set": {"enqueue_error": str(e)}}
+            )
+            return queued
+        # Count what is actually in the queue (a resumed expansion skips duplicates)
+        total = await self.collection.count_documents({"campaign_id": campaign_id})
+        await self.db.campaigns.update_one(
+            {"campaign_id": campaign_id},
+            {"$set": {"total_recipients": total, "enqueue_complete": True}, "$unset": {"enqueue_error": ""}}
+        )
+        await self._maybe_complete_campaign(campaign_id)
+        logger.info(f"Campaign {campaign_id}: {total} emails queued")
+        return total
+
+    def start_campaign(self, campaign_id: str, recipients: AsyncIterator[dict]) -> asyncio.Task:
+        """Run enqueue_campaign in the background (the admin request returns immediately)"""
+        task = asyncio.create_task(self.enqueue_campaign(campaign_id, recipients))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def resume_campaigns(self, audience: Callable[[str], AsyncIterator[dict]]) -> int:
+        """Restart expansions cut short by a restart or an error
+
+        Recipients already queued are skipped by the unique index, so the
+        audience is simply walked again from the start.
+        """
+        campaigns = await self.db.campaigns.find(
+            {"status": "sending", "enqueue_complete": False}, {"_id": 0, "campaign_id": 1, "target_audience": 1}
+        ).to_list(None)
+        for campaign in campaigns:
+            logger.info(f"Resuming enqueue of campaign {campaign['campaign_id']}")
+            self.start_campaign(campaign["campaign_id"], audience(campaign.get("target_audience", "all")))
+        return len(campaigns)
+
+    # ---- workers ----
+
+    async def claim(self) -> Optional[dict]:
+        now = _now()
+        return await self.collection.find_one_and_update(
+            {"status": PENDING, "next_attempt_at": {"$lte": now}},
+            {"$set": {"status": SENDING, "locked_at": now}, "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def claim_batch(self, limit: int) -> list:
+        """Claim up to `limit` due jobs: pick candidates, flip them with a lock
+        token, then read back only the ones this worker actually won"""
+        now = _now()
+        candidates = await self.collection.find(
+            {"status": PENDING, "next_attempt_at": {"$lte": now}}, {"_id": 0, "job_id": 1}
+        ).sort("next_attempt_at", 1).limit(limit).to_list(limit)
+        if not candidates:
+            return []
+        lock = uuid.uuid4().hex
+        await self.collection.update_many(
+            {"job_id": {"$in": [c["job_id"] for c in candidates]}, "status": PENDING},
+            {"$set": {"status": SENDING, "locked_at": now, "lock": lock}, "$inc": {"attempts": 1}}
+        )
+        return await self.collection.find({"lock": lock, "status": SENDING}, {"_id": 0}).to_list(limit)
+
+    async def reclaim_stale(self) -> int:
+        """Put jobs left in "sending" by a crashed worker back in the queue"""
+        cutoff = _now() - timedelta(seconds=EMAIL_LOCK_SECONDS)
+        result = await self.collection.update_many(
+            {"status": SENDING, "locked_at": {"$lt": cutoff}},
+            {"$set": {"status": PENDING}}
+        )
+        return result.modified_count
+
+    async def _content(self, job: dict):
+        if not job.get("campaign_id"):
+            return job["subject"], job["html"]
+        campaign_id = job["campaign_id"]
+        if campaign_id not in self._campaign_content:
+            campaign = await self.db.campaigns.find_one(
+                {"campaign_id": campaign_id}, {"_id": 0, "subject": 1, "content": 1}
+            )
+            if not campaign:
+                return None, None
+            if len(self._campaign_content) >= 32:
+                self._campaign_content.clear()
+            self._campaign_content[campaign_id] = (campaign["subject"], self.render(campaign["content"]))
+        return self._campaign_content[campaign_id]
+
+    async def process(self, job: dict):
+        subject, html = await self._content(job)
+        if html is None:
+            result = {"success": False, "error": "Campaign not found", "status": 404}
+        else:
+            await self.bucket.acquire()
+            try:
+                result = await self.sender(job["to"], job.get("name", ""), subject, html)
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+        await self.settle([job], [result])
+
+    async def process_batch(self, jobs: list):
+        """Submit claimed jobs as one bulk request"""
+        messages, ready = [], []
+        for job in jobs:
+            subject, html = await self._content(job)
+            if html is None:
+                await self.settle([job], [{"success": False, "error": "Campaign not found", "status": 404}])
+                continue
+            messages.append(self.bulk.message(job["to"], job.get("name", ""), subject, html))
+            ready.append(job)
+        if not ready:
+            return
+
+        await self.bucket.acquire()
+        self._stats["bulk_requests"] += 1
+        try:
+            bulk_id = await self.bulk.submit(messages)
+        except BulkSendError as e:
+            result = {"success": False, "error": str(e), "status": e.status}
+            await self.settle(ready, [result] * len(ready))
+            return
+
+        job_ids = [job["job_id"] for job in ready]
+        await self.db[BULK_COLLECTION].insert_one({
+            "bulk_id": bulk_id,
+            "job_ids": job_ids,
+            "state": SUBMITTED,
+            "submitted_at": _now()
+        })
+        await self.collection.update_many(
+            {"job_id": {"$in": job_ids}},
+            {"$set": {"status": SUBMITTED, "bulk_id": bulk_id}}
+        )
+
+    async def reconcile(self) -> int:
+        """Settle jobs of bulk requests whose MailerSend report is final"""
+        batches = await self.db[BULK_COLLECTION].find(
+            {"state": SUBMITTED}, {"_id": 0}
+        ).sort("submitted_at", 1).limit(BULK_RECONCILE_LIMIT).to_list(BULK_RECONCILE_LIMIT)
+        settled = 0
+        for batch in batches:
+            try:
+                report = await self.bulk.status(batch["bulk_id"])
+            except BulkSendError as e:
+                logger.warning(f"Bulk report {batch['bulk_id']} unavailable: {e}")
+                continue
+            if report.get("state") not in BULK_DONE_STATES:
+                continue
+            jobs = await self.collection.find(
+                {"job_id": {"$in": batch["job_ids"]}, "status": SUBMITTED}, {"_id": 0}
+            ).to_list(None)
+            by_id = {job["job_id"]: job for job in jobs}
+            recipients = [by_id[job_id]["to"] if job_id in by_id else "" for job_id in batch["job_ids"]]
+            outcomes = bulk_outcomes(report, recipients)
+            ordered = [(by_id[job_id], outcome) for job_id, outcome in zip(batch["job_ids"], outcomes) if job_id in by_id]
+            await self.settle([job for job, _ in ordered], [outcome for _, outcome in ordered])
+            await self.db[BULK_COLLECTION].update_one(
+                {"bulk_id": batch["bulk_id"]},
+                {"$set": {
+                    "state": report.get("state"),
+                    "failed": sum(1 for outcome in outcomes if not outcome.get("success")),
+                    "reconciled_at": _now()
+                }}
+            )
+            settled += len(ordered)
+        return settled
+
+    async def settle(self, jobs: list, results: list):
+        """Apply send results: sent, retry later, or dead letter"""
+        sent, dead = [], []
+        for job, result in zip(jobs, results):
+            if result.get("success"):
+                sent.append(job)
+            elif is_retryable(result) and job["attempts"] < self.max_attempts:
+                await self.collection.update_one(
+                    {"job_id": job["job_id"]},
+                    {"$set": {
+                        "status": PENDING,
+                        "last_error": result.get("error"),
+                        "next_attempt_at": _now() + timedelta(seconds=retry_delay(job["attempts"]))
+                    }, "$unset": {"lock": "", "bulk_id": ""}}
+                )
+                self._stats["retried"] += 1
+            else:
+                await self.collection.update_one(
+                    {"job_id": job["job_id"]},
+                    {"$set": {"status": DEAD, "last_error": result.get("error"), "failed_at": _now()}}
+                )
+                logger.warning(f"Email to {job['to']} moved to dead letters: {result.get('error')}")
+                dead.append(job)
+
+        if sent:
+            await self.collection.update_many(
+                {"job_id": {"$in": [job["job_id"] for job in sent]}},
+                {"$set": {"status": SENT, "sent_at": _now()}, "$unset": {"html": ""}}
+            )
+        self._stats["sent"] += len(sent)
+        self._stats["dead"] += len(dead)
+
+        for jobs_done, outcome, counter in ((sent, "sent", "sent_count"), (dead, "failed", "failed_count")):
+            per_campaign = {}
+            for job in jobs_done:
+                ref = job.get("ref")
+                if ref:
+                    await self.db[ref["collection"]].update_one(
+                        ref["filter"], {"$set": {ref.get("field", "email_status"): outcome}}
+                    )
+                if job.get("campaign_id"):
+                    per_campaign[job["campaign_id"]] = per_campaign.get(job["campaign_id"], 0) + 1
+            for campaign_id, count in per_campaign.items():
+                await self.db.campaigns.update_one({"campaign_id": campaign_id}, {"$inc": {counter: count}})
+                await self._maybe_complete_campaign(campaign_id)
+
+    async def _maybe_complete_campaign(self, campaign_id: str):
+        """Mark the campaign sent once every queued job reached a final state"""
+        campaign = await self.db.campaigns.find_one(
+            {"campaign_id": campaign_id, "status": "sending", "enqueue_complete": True},
+            {"_id": 0, "total_recipients": 1, "sent_count": 1, "failed_count": 1}
+        )
+        if not campaign:
+            return
+        done = campaign.get("sent_count", 0) + campaign.get("failed_count", 0)
+        if done >= campaign.get("total_recipients", 0):
+            await self.db.campaigns.update_one(
+                {"campaign_id": campaign_id, "status": "sending"},
+                {"$set": {"status": "sent", "completed_at": _now().isoformat()}}
+            )
+            self._campaign_content.pop(campaign_id, None)
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                jobs = await self.claim_batch(self.bulk.batch_size) if self.bulk else [await self.claim()]
+                if not jobs or jobs[0] is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.bulk:
+                    await self.process_batch(jobs)
+                else:
+                    await self.process(jobs[0])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Email worker {index} error: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _reconciler(self):
+        while True:
+            try:
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Bulk reconcile error: {e}")
+            await asyncio.sleep(self.reconcile_interval)
+
+    async def start(self, audience: Optional[Callable[[str], AsyncIterator[dict]]] = None):
+        """Start the workers; with `audience` (target_audience -> recipients),
+        campaigns whose expansion did not finish are resumed"""
+        if self._workers:
+            return
+        reclaimed = await self.reclaim_stale()
+        if reclaimed:
+            logger.info(f"Requeued {reclaimed} interrupted emails")
+        if audience is not None:
+            await self.resume_campaigns(audience)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        if self.bulk:
+            self._workers.append(asyncio.create_task(self._reconciler()))
+        mode = f"bulk x{self.bulk.batch_size}" if self.bulk else "single"
+        logger.info(f"Email queue started with {self.concurrency} workers ({mode}) at {self.bucket.rate} requests/s")
+
+    async def close(self):
+        tasks = self._workers + list(self._background)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+
+    # ---- reporting ----
+
+    async def campaign_progress(self, campaign_id: str) -> dict:
+        """Job counts per status for one campaign"""
+        rows = await self.collection.aggregate([
+            {"$match": {"campaign_id": campaign_id}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        counts = {PENDING: 0, SENDING: 0, SUBMITTED: 0, SENT: 0, DEAD: 0}
+        counts.update({row["_id"]: row["count"] for row in rows})
+        return counts
+
+    async def dead_letters(self, limit: int = 100, campaign_id: Optional[str] = None) -> list:
+        query = {"status": DEAD}
+        if campaign_id:
+            query["campaign_id"] = campaign_id
+        return await self.collection.find(
+            query, {"_id": 0, "html": 0}
+        ).sort("failed_at", -1).to_list(limit)
+
+    async def retry_dead(self, campaign_id: Optional[str] = None) -> int:
+        """Give dead letters a fresh set of attempts
+
+        Retried campaign jobs leave failed_count and put their campaign back
+        in "sending", one campaign at a time so each gets its own count.
+        """
+        if campaign_id:
+            campaign_ids = [campaign_id]
+        else:
+            # None covers single messages, whatever distinct reports for them
+            campaign_ids = set(await self.collection.distinct("campaign_id", {"status": DEAD})) | {None}
+        retried = 0
+        for cid in campaign_ids:
+            result = await self.collection.update_many(
+                {"status": DEAD, "campaign_id": cid},
+                {"$set": {"status": PENDING, "attempts": 0, "next_attempt_at": _now()}}
+            )
+            if cid and result.modified_count:
+                await self.db.campaigns.update_one(
+                    {"campaign_id": cid},
+                    {"$inc": {"failed_count": -result.modified_count}, "$set": {"status": "sending"}}
+                )
+            retried += result.modified_count
+        self._wakeup.set()
+        return retried
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.concurrency if self._workers else 0,
+            "bulk": bool(self.bulk),
+            "rate_per_second": self.bucket.rate,
+            "background_tasks": len(self._background),
+            **self._stats
+        }
@@ -28,6 +28,28 @@ MAILERSEND_FROM_NAME = os.environ.get("MAILERSEND_FROM_NAME", "GROUPE YAMA+")
 MAILERLITE_API_KEY = os.environ.get("MAILERLITE_API_KEY")
 MAILERLITE_API_URL = os.environ.get("MAILERLITE_API_URL", "https://connect.mailerlite.com/api")
 
+# Pooled HTTP session shared by all outgoing API calls (created lazily on the running loop)
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the shared aiohttp session, keeping connections to MailerSend alive"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=30),
+            connector=aiohttp.TCPConnector(limit=50, keepalive_timeout=60)
+        )
+    return _http_session
+
+
+async def close_http_session():
+    """Close the shared session (application shutdown)"""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
 # Site Configuration
 SITE_URL = os.environ.get("SITE_URL", "https://groupeyamaplus.com")
 STORE_NAME = os.environ.get("STORE_NAME", "GROUPE YAMA+")
@@ -112,15 +134,14 @@ async def send_email_mailersend(to_email: str, to_name: str, subject: str, html_
                 "disposition": "attachment"
             } for att in attachments]
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                if response.status in [200, 201, 202]:
-                    logger.info(f"Email sent to {to_email}: {subject}")
-                    return {"success": True, "response": await response.text()}
-                else:
-                    error_text = await response.text()
-                    logger.error(f"MailerSend error: {response.status} - {error_text}")
-                    return {"success": False, "error": f"HTTP {response.status}: {error_text}"}
+        async with get_http_session().post(url, json=payload, headers=headers) as response:
+            if response.status in [200, 201, 202]:
+                logger.info(f"Email sent to {to_email}: {subject}")
+                return {"success": True, "response": await response.text()}
+            else:
+                error_text = await response.text()
+                logger.error(f"MailerSend error: {response.status} - {error_text}")
+                return {"success": False, "error": f"HTTP {response.status}: {error_text}", "status": response.status}
         
     except Exception as e:
         logger.error(f"MailerSend error: {str(e)}")
@@ -164,21 +185,20 @@ class MailerLiteService:
         url = f"{self.base_url}/{endpoint}"
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.request(
-                    method, url, json=data, headers=self.headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    response_text = await response.text()
-                    
-                    if response.status in [200, 201, 204]:
-                        return {"success": True, "data": json.loads(response_text) if response_text else {}}
-                    elif response.status == 429:
-                        logger.warning("MailerLite rate limit reached")
-                        return {"success": False, "error": "Rate limit exceeded", "status": 429}
-                    else:
-                        logger.error(f"MailerLite API error: {response.status} - {response_text}")
-                        return {"success": False, "error": response_text, "status": response.status}
+            async with get_http_session().request(
+                method, url, json=data, headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
+                response_text = await response.text()
+                
+                if response.status in [200, 201, 204]:
+                    return {"success": True, "data": json.loads(response_text) if response_text else {}}
+                elif response.status == 429:
+                    logger.warning("MailerLite rate limit reached")
+                    return {"success": False, "error": "Rate limit exceeded", "status": 429}
+                else:
+                    logger.error(f"MailerLite API error: {response.status} - {response_text}")
+                    return {"success": False, "error": response_text, "status": response.status}
         except asyncio.TimeoutError:
             logger.error("MailerLite API timeout")
             return {"success": False, "error": "Request timeout"}
@@ -0,0 +1,264 @@
+"""
+Hot inventory service for YAMA+ e-commerce platform
+During a flash sale every checkout decrements the same product document and
+Mongo serialises those writes. Products on a running flash sale are "hot":
+their stock moves into a counter in the shared store (Redis protocol, see
+services.cache; an in-process FakeSharedStore when there is none, which is
+only correct with a single worker) and checkouts are admitted against it:
+
+- INCRBY -qty on the counter; a negative result is undone and rejected
+- each SKU has an in-process admission gate: at most HOT_ADMISSION_CONCURRENCY
+  counter calls in flight, at most HOT_ADMISSION_QUEUE_LIMIT waiting (past
+  that HotSkuBusy, answered 429), and once the counter hits zero the waiting
+  and later requests are rejected locally without a round trip
+- units sold are added to a pending counter once the order is stored
+
+reconcile() runs every HOT_RECONCILE_INTERVAL seconds, under a per-SKU lock
+so a single worker does it: it moves the pending units into products.stock
+with one $inc, and adds to the counter any change made to products.stock
+meanwhile by someone else (admin edit, expired reservation put back). When
+the flash sale ends the SKU is reconciled one last time and its counters
+dropped; products.stock is authoritative again.
+"""
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+
+from .cache import FakeSharedStore
+from .stock_reservation import InsufficientStock
+
+logger = logging.getLogger(__name__)
+
+HOT_RECONCILE_INTERVAL = int(os.environ.get("HOT_INVENTORY_RECONCILE_SECONDS", "5"))
+HOT_ADMISSION_CONCURRENCY = int(os.environ.get("HOT_ADMISSION_CONCURRENCY", "32"))  # counter calls in flight per SKU
+HOT_ADMISSION_QUEUE_LIMIT = int(os.environ.get("HOT_ADMISSION_QUEUE_LIMIT", "2000"))  # waiting per SKU before shedding
+HOT_RETRY_AFTER = 1  # seconds, Retry-After when shedding
+HOT_LOCK_TTL = 30  # seconds, a reconcile lock left by a dead worker expires
+HOT_MAX_SKUS = 100
+
+
+class HotSkuBusy(Exception):
+    """Too many checkouts already waiting on this SKU"""
+
+
+class _HotSku:
+    def __init__(self, concurrency: int):
+        self.gate = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+        self.left: Optional[int] = None  # counter value last seen by this worker
+        self.sold_out = False
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+
+
+class HotInventory:
+    def __init__(self, store, db, namespace: str = "yama:hot",
+                 concurrency: int = HOT_ADMISSION_CONCURRENCY, queue_limit: int = HOT_ADMISSION_QUEUE_LIMIT):
+        self.store = store
+        self.db = db
+        self.namespace = namespace
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.instance_id = uuid.uuid4().hex[:8]
+        self._skus: Dict[str, _HotSku] = {}
+        self._stats = {"flushed_units": 0, "drift_units": 0, "reconciles": 0}
+
+    def _key(self, product_id: str, name: str) -> str:
+        return f"{self.namespace}:{product_id}:{name}"
+
+    def is_hot(self, product_id: str) -> bool:
+        return product_id in self._skus
+
+    def last_known(self, product_id: str) -> Optional[int]:
+        """Units left as last seen by this worker, None when the SKU is not hot"""
+        sku = self._skus.get(product_id)
+        return None if sku is None else sku.left
+
+    # ---------- admission ----------
+
+    async def _admit_one(self, product_id: str, quantity: int) -> bool:
+        """Take quantity from the counter; False when the SKU stopped being hot elsewhere"""
+        sku = self._skus[product_id]
+        if sku.sold_out:
+            sku.rejected += 1
+            raise InsufficientStock([product_id])
+        if sku.waiting >= self.queue_limit:
+            sku.shed += 1
+            raise HotSkuBusy(product_id)
+        sku.waiting += 1
+        try:
+            async with sku.gate:
+                if sku.sold_out:  # sold out while this request waited
+                    sku.rejected += 1
+                    raise InsufficientStock([product_id])
+                key = self._key(product_id, "available")
+                left = await self.store.incrby(key, -quantity)
+                if left >= 0:
+                    sku.left = left
+                    sku.sold_out = left == 0
+                    sku.admitted += quantity
+                    return True
+                await self.store.incrby(key, quantity)
+                if await self.store.get(self._key(product_id, "base")) is None:
+                    # retired by another worker: its stock is back in products.stock
+                    await self.store.delete(key)
+                    self._skus.pop(product_id, None)
+                    return False
+                sku.left = left + quantity
+                sku.sold_out = sku.left <= 0
+                sku.rejected += 1
+                raise InsufficientStock([product_id])
+        finally:
+            sku.waiting -= 1
+
+    async def admit(self, quantities: Dict[str, int]) -> Dict[str, int]:
+        """
+        Take hot SKU quantities from their counters, all or nothing.
+        Returns the quantities taken; SKUs no longer hot are left out, for the
+        caller to take from products.stock. Raises InsufficientStock or HotSkuBusy.
+        """
+        taken: Dict[str, int] = {}
+        try:
+            for product_id, quantity in quantities.items():
+                if product_id in self._skus and await self._admit_one(product_id, quantity):
+                    taken[product_id] = quantity
+        except BaseException:
+            await self.release(taken)
+            raise
+        return taken
+
+    async def release(self, quantities: Dict[str, int]):
+        """Give back admitted quantities whose order was not stored"""
+        for product_id, quantity in quantities.items():
+            sku = self._skus.get(product_id)
+            if sku is None:
+                continue
+            sku.left = await self.store.incrby(self._key(product_id, "available"), quantity)
+            sku.sold_out = sku.left <= 0
+            sku.admitted -= quantity
+
+    async def confirm(self, quantities: Dict[str, int]):
+        """The order is stored: its units go to products.stock at the next reconcile"""
+        for product_id, quantity in quantities.items():
+            if product_id in self._skus:
+                await self.store.incrby(self._key(product_id, "pending"), quantity)
+            else:
+                # retired since admission: products.stock is authoritative again
+                await self.db.products.update_one({"product_id": product_id}, {"$inc": {"stock": -quantity}})
+
+    # ---------- reconciliation ----------
+
+    async def _locked(self, product_id: str) -> bool:
+        return await self.store.set(self._key(product_id, "lock"), self.instance_id, ex=HOT_LOCK_TTL, nx=True)
+
+    async def _unlock(self, product_id: str):
+        await self.store.delete(self._key(product_id, "lock"))
+
+    async def _activate(self, product_id: str):
+        product = await self.db.products.find_one({"product_id": product_id}, {"_id": 0, "stock": 1})
+        if product is None:
+            return
+        stock = product.get("stock") or 0
+        if await self.store.set(self._key(product_id, "base"), str(stock), nx=True):
+            # first worker to see this flash sale: the counter starts at the stock
+            await self.store.set(self._key(product_id, "available"), str(stock))
+            logger.info(f"Hot inventory on for {product_id}: {stock} units")
+        self._skus[product_id] = _HotSku(self.concurrency)
+
+    async def _flush(self, product_id: str) -> int:
+        """Move pending units into products.stock and pick up outside changes; lock held"""
+        pending = int(await self.store.get(self._key(product_id, "pending")) or 0)
+        base = await self.store.get(self._key(product_id, "base"))
+        if pending:
+            product = await self.db.products.find_one_and_update(
+                {"product_id": product_id},
+                {"$inc": {"stock": -pending}},
+                projection={"_id": 0, "stock": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            # after the $inc: a crash in between flushes twice (undersells) rather than never (oversells)
+            await self.store.incrby(self._key(product_id, "pending"), -pending)
+        else:
+            product = await self.db.products.find_one({"product_id": product_id}, {"_id": 0, "stock": 1})
+        if product is None or base is None:  # deleted product, or units confirmed after the SKU was retired
+            return pending
+        stock = product.get("stock") or 0
+        drift = stock - (int(base) - pending)
+        if drift:
+            await self.store.incrby(self._key(product_id, "available"), drift)
+            self._stats["drift_units"] += drift
+        await self.store.set(self._key(product_id, "base"), str(stock))
+        self._stats["flushed_units"] += pending
+        return pending
+
+    async def reconcile(self, product_id: str) -> int:
+        """Flush one hot SKU if no other worker is doing it; returns units written to products.stock"""
+        flushed = 0
+        if await self._locked(product_id):
+            try:
+                flushed = await self._flush(product_id)
+                self._stats["reconciles"] += 1
+            finally:
+                await self._unlock(product_id)
+        sku = self._skus.get(product_id)
+        if sku is not None:
+            available = await self.store.get(self._key(product_id, "available"))
+            sku.left = int(available or 0)
+            sku.sold_out = sku.left <= 0
+        return flushed
+
+    async def _retire(self, product_id: str) -> int:
+        """Flash sale over: final flush, then products.stock is authoritative again"""
+        if not await self._locked(product_id):
+            return 0  # another worker is reconciling: retire at the next refresh
+        self._skus.pop(product_id, None)
+        try:
+            flushed = await self._flush(product_id)
+            await self.store.delete(*(self._key(product_id, name) for name in ("base", "available", "pending")))
+        finally:
+            await self._unlock(product_id)
+        logger.info(f"Hot inventory off for {product_id}")
+        return flushed
+
+    async def refresh(self) -> Dict[str, int]:
+        """Follow running flash sales and reconcile; returns units flushed per product"""
+        now = datetime.now(timezone.utc).isoformat()
+        running = await self.db.products.find(
+            {"is_flash_sale": True, "flash_sale_end": {"$gt": now}}, {"_id": 0, "product_id": 1}
+        ).to_list(HOT_MAX_SKUS)
+        hot_ids = {doc["product_id"] for doc in running}
+        flushed = {}
+        for product_id in set(self._skus) - hot_ids:
+            flushed[product_id] = await self._retire(product_id)
+        for product_id in hot_ids - set(self._skus):
+            await self._activate(product_id)
+        for product_id in list(self._skus):
+            flushed[product_id] = await self.reconcile(product_id)
+        return {product_id: units for product_id, units in flushed.items() if units}
+
+    async def close(self):
+        """Flush before exiting: in-process counters die with the worker"""
+        for product_id in list(self._skus):
+            await self.reconcile(product_id)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "store": type(self.store).__name__,
+            "skus": {
+                product_id: {"left": sku.left, "sold_out": sku.sold_out, "waiting": sku.waiting,
+                             "admitted": sku.admitted, "rejected": sku.rejected, "shed": sku.shed}
+                for product_id, sku in self._skus.items()
+            }
+        }
+
+
+def create_hot_inventory(db, shared_store=None, namespace: str = "yama:hot") -> HotInventory:
+    """Use the shared store when the app has one, otherwise in-process counters"""
+    return HotInventory(shared_store if shared_store is not None else FakeSharedStore(), db, namespace)
@@ -0,0 +1,210 @@
+"""
+Image processing service for YAMA+ e-commerce platform
+Pillow decode/resize/encode is CPU-bound and holds the GIL, so it runs in a
+process pool sized to the cores instead of inside the async handlers.
+The number of images in flight is bounded: past the queue limit callers get
+ImagePoolBusy (turned into a 503 with Retry-After by the API).
+
+Uploads are stored as a set of derivatives next to the full-size JPEG
+({stem}.jpg): a full-size WebP ({stem}.webp) and, for every width in
+VARIANT_WIDTHS smaller than the image, {stem}_w{width}.webp plus a JPEG
+fallback {stem}_w{width}.jpg. A tiny LQIP data URI is returned for
+placeholders. pick_variant maps a request (w=, Accept) to one of those files.
+"""
+import io
+import os
+import time
+import base64
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Optional
+
+from PIL import Image as PILImage
+
+logger = logging.getLogger(__name__)
+
+# Image compression settings
+MAX_IMAGE_SIZE = 1920  # Max width/height in pixels
+JPEG_QUALITY = 85  # Quality for JPEG compression
+WEBP_QUALITY = 80
+VARIANT_WIDTHS = (200, 400, 800, 1600)
+LQIP_SIZE = 16  # Longest side of the blurred placeholder, in pixels
+
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", str(os.cpu_count() or 1)))
+IMAGE_QUEUE_LIMIT = int(os.environ.get("IMAGE_QUEUE_LIMIT", str(IMAGE_WORKERS * 4)))  # waiting beyond the running ones
+IMAGE_RETRY_AFTER = 2  # seconds suggested to rejected clients
+
+
+class ImagePoolBusy(Exception):
+    """Too many images are already being processed"""
+
+
+def _flatten(img):
+    """RGB copy of img with transparency composited onto white"""
+    if img.mode in ('RGBA', 'P'):
+        background = PILImage.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def _encode(img, fmt: str, quality: int) -> bytes:
+    output = io.BytesIO()
+    if fmt == 'WEBP':
+        img.save(output, format='WEBP', quality=quality, method=4)
+    else:
+        img.save(output, format='JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def compress_image(content: bytes, max_size: int = MAX_IMAGE_SIZE, quality: int = JPEG_QUALITY) -> tuple:
+    """Compress and optimize image for web. Returns (compressed_content, extension)"""
+    try:
+        img = _flatten(PILImage.open(io.BytesIO(content)))
+
+        # Resize if too large
+        if img.width > max_size or img.height > max_size:
+            img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
+
+        return _encode(img, 'JPEG', quality), 'jpg'
+    except Exception as e:
+        logger.error(f"Image compression error: {e}")
+        # Return original content if compression fails
+        return content, 'jpg'
+
+
+def variant_name(filename: str, width: Optional[int], ext: str) -> str:
+    stem = Path(filename).stem
+    return f"{stem}_w{width}.{ext}" if width else f"{stem}.{ext}"
+
+
+def build_variants(content: bytes, filename: str, widths: tuple = VARIANT_WIDTHS,
+                   max_size: int = MAX_IMAGE_SIZE) -> dict:
+    """
+    Full-size JPEG + WebP, per-width WebP/JPEG thumbnails and an LQIP for an
+    upload stored as `filename`. Returns {"files": {name: bytes}, "widths",
+    "width", "height", "lqip"}; files[filename] is the full-size JPEG.
+    Raises on undecodable input, unlike compress_image.
+    """
+    img = _flatten(PILImage.open(io.BytesIO(content)))
+    if img.width > max_size or img.height > max_size:
+        img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
+
+    files = {
+        variant_name(filename, None, "jpg"): _encode(img, 'JPEG', JPEG_QUALITY),
+        variant_name(filename, None, "webp"): _encode(img, 'WEBP', WEBP_QUALITY)
+    }
+    made = []
+    # Largest first so each step downsamples the previous one (cheaper than from full size)
+    source = img
+    for width in sorted(widths, reverse=True):
+        if width >= img.width:
+            continue
+        height = max(1, round(img.height * width / img.width))
+        source = source.resize((width, height), PILImage.Resampling.LANCZOS)
+        files[variant_name(filename, width, "webp")] = _encode(source, 'WEBP', WEBP_QUALITY)
+        files[variant_name(filename, width, "jpg")] = _encode(source, 'JPEG', JPEG_QUALITY)
+        made.append(width)
+
+    tiny = source.copy()
+    tiny.thumbnail((LQIP_SIZE, LQIP_SIZE), PILImage.Resampling.BILINEAR)
+    lqip = "data:image/webp;base64," + base64.b64encode(_encode(tiny, 'WEBP', 30)).decode("ascii")
+
+    return {
+        "files": files,
+        "widths": sorted(made),
+        "width": img.width,
+        "height": img.height,
+        "lqip": lqip
+    }
+
+
+def pick_variant(filename: str, width: Optional[int], accept: str, exists: Callable[[str], bool]) -> str:
+    """
+    File to serve for a request of `filename` at `width` px with an Accept header:
+    the smallest stored variant at least that wide (the full-size file when
+    none is), WebP when the client accepts it. Falls back to `filename` itself for
+    uploads that have no derivatives (GIFs, files stored before variants).
+    """
+    if not filename.endswith(".jpg"):
+        return filename
+    ext = "webp" if "image/webp" in (accept or "") else "jpg"
+    if width:
+        for candidate in sorted(VARIANT_WIDTHS):
+            if candidate >= width:
+                name = variant_name(filename, candidate, ext)
+                if exists(name):
+                    return name
+    if ext == "webp" and exists(variant_name(filename, None, "webp")):
+        return variant_name(filename, None, "webp")
+    return filename
+
+
+class ImageProcessor:
+    """Bounded front-end to a lazily started process pool"""
+
+    def __init__(self, workers: int = IMAGE_WORKERS, queue_limit: int = IMAGE_QUEUE_LIMIT):
+        self.workers = max(1, workers)
+        self.queue_limit = queue_limit
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self._stats = {"completed": 0, "rejected": 0, "failed": 0, "total_ms": 0.0}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: never fork a process that has an event loop and Mongo threads running
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool, or raise ImagePoolBusy when the queue is full"""
+        if self._in_flight >= self.workers + self.queue_limit:
+            self._stats["rejected"] += 1
+            raise ImagePoolBusy(f"{self._in_flight} images in flight")
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a decompression bomb); start a fresh pool next time
+            self._stats["failed"] += 1
+            self._pool = None
+            raise
+        finally:
+            self._in_flight -= 1
+        self._stats["completed"] += 1
+        self._stats["total_ms"] += (time.perf_counter() - started) * 1000
+        return result
+
+    async def compress(self, content: bytes, max_size: int = MAX_IMAGE_SIZE, quality: int = JPEG_QUALITY) -> tuple:
+        return await self.run(compress_image, content, max_size, quality)
+
+    async def variants(self, content: bytes, filename: str, widths: tuple = VARIANT_WIDTHS) -> dict:
+        return await self.run(build_variants, content, filename, widths)
+
+    def stats(self) -> dict:
+        completed = self._stats["completed"]
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": self._in_flight,
+            "completed": completed,
+            "rejected": self._stats["rejected"],
+            "failed": self._stats["failed"],
+            "avg_ms": round(self._stats["total_ms"] / completed, 1) if completed else 0
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,140 @@
+"""
+MailerSend bulk-email client for YAMA+ e-commerce platform
+Packs personalized messages into POST /bulk-email requests (one HTTP call
+for a few hundred recipients) and turns the bulk status report into a
+per-message outcome once MailerSend has processed the batch
+"""
+import os
+import logging
+from typing import Callable, Dict, List
+
+from .email_service import (
+    MAILERSEND_API_KEY,
+    MAILERSEND_FROM_EMAIL,
+    MAILERSEND_FROM_NAME,
+    get_http_session
+)
+
+logger = logging.getLogger(__name__)
+
+MAILERSEND_API_URL = os.environ.get("MAILERSEND_API_URL", "https://api.mailersend.com/v1")
+MAILERSEND_BULK_ENABLED = os.environ.get("MAILERSEND_BULK_ENABLED", "true").lower() == "true"
+BULK_BATCH_SIZE = int(os.environ.get("MAILERSEND_BULK_BATCH_SIZE", "200"))  # MailerSend accepts up to 500
+
+# Bulk states after which the report no longer changes
+BULK_DONE_STATES = {"completed", "failed"}
+
+
+class BulkSendError(Exception):
+    """The bulk request itself was rejected (status None for network errors)"""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+def _suppressed_emails(node) -> set:
+    """Collect every "email" found in the suppressed_recipients structure"""
+    emails = set()
+    if isinstance(node, dict):
+        if isinstance(node.get("email"), str):
+            emails.add(node["email"].lower())
+        for value in node.values():
+            emails |= _suppressed_emails(value)
+    elif isinstance(node, list):
+        for value in node:
+            emails |= _suppressed_emails(value)
+    return emails
+
+
+def bulk_outcomes(report: dict, recipients: List[str]) -> List[dict]:
+    """Per-message results, in submission order, for a finished bulk report
+
+    Validation errors are keyed "message.<index>.<field>"; suppressed
+    recipients (bounces, unsubscribes) are matched by address. Both are
+    permanent, so they come back with status 422. A failed batch is
+    reported with no status, which the queue treats as retryable.
+    """
+    if report.get("state") == "failed":
+        return [{"success": False, "error": "Bulk batch failed"} for _ in recipients]
+
+    errors: Dict[int, str] = {}
+    for key, messages in (report.get("validation_errors") or {}).items():
+        parts = key.split(".")
+        if len(parts) > 1 and parts[0] == "message" and parts[1].isdigit():
+            index = int(parts[1])
+            text = "; ".join(messages) if isinstance(messages, list) else str(messages)
+            errors[index] = f"{errors[index]}; {text}" if index in errors else text
+
+    suppressed = _suppressed_emails(report.get("suppressed_recipients") or {})
+    outcomes = []
+    for index, email in enumerate(recipients):
+        if index in errors:
+            outcomes.append({"success": False, "error": errors[index], "status": 422})
+        elif email.lower() in suppressed:
+            outcomes.append({"success": False, "error": "Recipient suppressed", "status": 422})
+        else:
+            outcomes.append({"success": True})
+    return outcomes
+
+
+class MailerSendBulkClient:
+    """Thin wrapper around the bulk-email endpoints, sharing the pooled session"""
+
+    def __init__(self, api_key: str = MAILERSEND_API_KEY, base_url: str = MAILERSEND_API_URL,
+                 session_factory: Callable = get_http_session, batch_size: int = BULK_BATCH_SIZE):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def message(self, to_email: str, to_name: str, subject: str, html: str) -> dict:
+        return {
+            "from": {"email": MAILERSEND_FROM_EMAIL, "name": MAILERSEND_FROM_NAME},
+            "to": [{"email": to_email, "name": to_name or to_email.split("@")[0]}],
+            "subject": subject,
+            "html": html
+        }
+
+    async def submit(self, messages: List[dict]) -> str:
+        """Send one bulk request and return its bulk_email_id"""
+        try:
+            async with self.session_factory().post(
+                f"{self.base_url}/bulk-email", json=messages, headers=self.headers
+            ) as response:
+                text = await response.text()
+                if response.status in [200, 201, 202]:
+                    data = await response.json(content_type=None)
+                    logger.info(f"MailerSend bulk accepted: {len(messages)} messages ({data.get('bulk_email_id')})")
+                    return data["bulk_email_id"]
+                raise BulkSendError(f"HTTP {response.status}: {text}", response.status)
+        except BulkSendError:
+            raise
+        except Exception as e:
+            raise BulkSendError(str(e))
+
+    async def status(self, bulk_email_id: str) -> dict:
+        """Bulk report: state, validation_errors, suppressed_recipients..."""
+        try:
+            async with self.session_factory().get(
+                f"{self.base_url}/bulk-email/{bulk_email_id}", headers=self.headers
+            ) as response:
+                if response.status != 200:
+                    raise BulkSendError(f"HTTP {response.status}: {await response.text()}", response.status)
+                data = await response.json(content_type=None)
+                return data.get("data", data)
+        except BulkSendError:
+            raise
+        except Exception as e:
+            raise BulkSendError(str(e))
+
+
+def create_bulk_client():
+    """Bulk client when MailerSend is configured and bulk sending is enabled"""
+    if MAILERSEND_BULK_ENABLED and MAILERSEND_API_KEY:
+        return MailerSendBulkClient()
+    return None
@@ -0,0 +1,130 @@
+"""
+Keyset pagination for YAMA+ e-commerce platform
+Pages are selected with a range condition on the sort key plus a unique
+tiebreaker instead of skip(), so page N costs the same index seek as page 1.
+The cursor handed to clients is an opaque URL-safe token holding the sort
+values of the last document returned.
+"""
+import base64
+from typing import AsyncIterator, List, Optional, Tuple
+
+from bson import json_util
+
+Sort = List[Tuple[str, int]]
+
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """The cursor could not be decoded or does not match the sort"""
+
+
+def encode_cursor(values: list) -> str:
+    raw = json_util.dumps(values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Cursor does not match this listing")
+    return values
+
+
+def _after(field: str, direction: int, value) -> Optional[dict]:
+    """Condition selecting values strictly after `value` in sort order
+
+    MongoDB sorts null/missing before every other value, but range
+    operators never match across types, so nulls need explicit handling.
+    """
+    if value is None:
+        return None if direction < 0 else {field: {"$ne": None}}
+    if direction < 0:
+        return {"$or": [{field: {"$lt": value}}, {field: None}]}
+    return {field: {"$gt": value}}
+
+
+def keyset_filter(sort: Sort, values: list) -> dict:
+    """(k0 after v0) OR (k0 == v0 AND k1 after v1) OR ..."""
+    branches = []
+    for index, (field, direction) in enumerate(sort):
+        after = _after(field, direction, values[index])
+        if after is None:
+            continue
+        equal = {sort[i][0]: values[i] for i in range(index)}
+        branches.append({**equal, **after})
+    return {"$or": branches} if branches else {"_id": {"$exists": False}}
+
+
+def _prepare_projection(projection: Optional[dict], sort: Sort):
+    """Make sure sort keys are returned; report the ones the caller did not ask for"""
+    if projection is None:
+        return None, set()
+    projection = dict(projection)
+    inclusion = any(value for key, value in projection.items() if key != "_id")
+    hidden = set()
+    for field, _ in sort:
+        if projection.get(field) == 0:
+            del projection[field]
+            hidden.add(field)
+        elif inclusion and field not in projection and field != "_id":
+            projection[field] = 1
+            hidden.add(field)
+    return projection, hidden
+
+
+def _sort_value(doc: dict, field: str):
+    value = doc
+    for part in field.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+async def _page(collection, query: dict, sort: Sort, limit: int, after: Optional[list],
+                projection: Optional[dict]) -> Tuple[list, Optional[list]]:
+    if after is not None:
+        condition = keyset_filter(sort, after)
+        query = {"$and": [query, condition]} if query else condition
+    fields, hidden = _prepare_projection(projection, sort)
+    docs = await collection.find(query, fields).sort(sort).limit(limit + 1).to_list(limit + 1)
+
+    last = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = [_sort_value(docs[-1], field) for field, _ in sort]
+    for doc in docs:
+        for field in hidden:
+            doc.pop(field, None)
+    return docs, last
+
+
+async def paginate(collection, query: dict, sort: Sort, limit: int, cursor: Optional[str] = None,
+                   projection: Optional[dict] = None) -> Tuple[list, Optional[str]]:
+    """One page of documents and the cursor of the next page (None on the last page)
+
+    The last entry of `sort` must be a unique field (the tiebreaker).
+    """
+    after = decode_cursor(cursor, len(sort)) if cursor else None
+    docs, last = await _page(collection, query, sort, max(1, min(limit, MAX_PAGE_SIZE)), after, projection)
+    return docs, encode_cursor(last) if last is not None else None
+
+
+async def iterate_keyset(collection, query: dict, sort: Sort, projection: Optional[dict] = None,
+                         batch_size: int = 500) -> AsyncIterator[dict]:
+    """Walk a whole collection page by page
+
+    Unlike one long-lived cursor, each page is a fresh query, so a slow
+    consumer (e.g. campaign expansion waiting on a full queue) never hits
+    the server-side cursor timeout.
+    """
+    after = None
+    while True:
+        docs, after = await _page(collection, query, sort, batch_size, after, projection)
+        for doc in docs:
+            yield doc
+        if after is None:
+            return
@@ -0,0 +1,124 @@
+"""
+Password hashing service for YAMA+ e-commerce platform
+bcrypt costs a few hundred milliseconds of CPU per hash or check. Run inline
+in an async handler it stops the event loop, so a burst of logins froze every
+other request of the worker. Hashes and checks run in a dedicated thread
+pool instead (bcrypt releases the GIL while it works), sized to the cores.
+The number of operations in flight is bounded: past the queue limit callers
+get HashPoolBusy (turned into a 429 with Retry-After by the API) rather than
+an ever-growing backlog.
+
+The work factor is BCRYPT_ROUNDS. Hashes made with another cost are
+upgraded (or lowered) on the next successful login, see needs_rehash.
+"""
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+AUTH_HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", str(os.cpu_count() or 1)))
+AUTH_HASH_QUEUE_LIMIT = int(os.environ.get("AUTH_HASH_QUEUE_LIMIT", str(AUTH_HASH_WORKERS * 8)))  # waiting beyond the running ones
+AUTH_RETRY_AFTER = 2  # seconds suggested to rejected clients
+
+
+class HashPoolBusy(Exception):
+    """Too many password hashes are already queued"""
+
+
+def hash_cost(hashed: str) -> Optional[int]:
+    """Work factor of a bcrypt hash ("$2b$12$..." -> 12), None if it is not one"""
+    parts = (hashed or "").split("$")
+    if len(parts) != 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def _check(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode(), hashed.encode())
+    except ValueError:
+        # not a bcrypt hash (e.g. empty for Google-only accounts)
+        return False
+
+
+class PasswordHasher:
+    """Bounded front-end to a lazily started thread pool"""
+
+    def __init__(self, workers: int = AUTH_HASH_WORKERS, queue_limit: int = AUTH_HASH_QUEUE_LIMIT,
+                 rounds: int = BCRYPT_ROUNDS):
+        self.workers = max(1, workers)
+        self.queue_limit = queue_limit
+        self.rounds = rounds
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._in_flight = 0
+        self._stats = {"completed": 0, "rejected": 0, "rehashed": 0, "total_ms": 0.0}
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="auth-hash")
+        return self._pool
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool, or raise HashPoolBusy when the queue is full"""
+        if self._in_flight >= self.workers + self.queue_limit:
+            self._stats["rejected"] += 1
+            raise HashPoolBusy(f"{self._in_flight} password hashes in flight")
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+        finally:
+            self._in_flight -= 1
+        self._stats["completed"] += 1
+        self._stats["total_ms"] += (time.perf_counter() - started) * 1000
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self.run(_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        if not hashed:
+            return False
+        return await self.run(_check, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        cost = hash_cost(hashed)
+        return cost is not None and cost != self.rounds
+
+    async def rehash(self, password: str) -> Optional[str]:
+        """New hash at the current cost, or None when the pool is busy (retried on a later login)"""
+        try:
+            hashed = await self.hash(password)
+        except HashPoolBusy:
+            return None
+        self._stats["rehashed"] += 1
+        return hashed
+
+    def stats(self) -> dict:
+        completed = self._stats["completed"]
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "rounds": self.rounds,
+            "in_flight": self._in_flight,
+            "completed": completed,
+            "rejected": self._stats["rejected"],
+            "rehashed": self._stats["rehashed"],
+            "avg_ms": round(self._stats["total_ms"] / completed, 1) if completed else 0
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
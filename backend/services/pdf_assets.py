@@ -0,0 +1,177 @@
+"""
+PDF asset cache for YAMA+ e-commerce platform
+Everything a PDF embeds is fetched before rendering, never during it:
+- the company logo and a placeholder thumbnail are prepared once at startup
+- product images / partner logos are fetched concurrently over aiohttp with
+  a timeout and a size cap, downscaled and stored on disk keyed by URL hash
+Renderers receive a {url: local path} mapping (plus "logo" and
+"placeholder") and only read local files, so render time no longer depends
+on remote image hosts. Unreachable images are remembered for a while and
+replaced by the placeholder.
+"""
+import io
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import aiohttp
+from PIL import Image as PILImage
+
+logger = logging.getLogger(__name__)
+
+COMPANY_LOGO = Path(__file__).resolve().parent.parent / "logo_yama.png"
+
+ASSET_FETCH_TIMEOUT = float(os.environ.get("PDF_ASSET_TIMEOUT", "4"))  # seconds, per image
+ASSET_CONCURRENCY = 8
+ASSET_MAX_BYTES = 5 * 1024 * 1024
+THUMBNAIL_SIZE = 256  # px, longest side; invoices print images at ~1.2cm
+LOGO_SIZE = 600
+FAILURE_TTL = 600  # seconds before retrying an unreachable URL
+
+
+def asset_name(url: str) -> str:
+    return f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]}.jpg"
+
+
+def make_thumbnail(data: bytes, size: int = THUMBNAIL_SIZE) -> bytes:
+    """Downscaled JPEG of an image (CPU work, run in a thread)"""
+    img = PILImage.open(io.BytesIO(data))
+    img.thumbnail((size, size), PILImage.Resampling.LANCZOS)
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = PILImage.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=85)
+    return output.getvalue()
+
+
+class PDFAssetCache:
+    def __init__(self, asset_dir: Path, resolve: Optional[Callable[[str], Optional[str]]] = None,
+                 timeout: float = ASSET_FETCH_TIMEOUT, concurrency: int = ASSET_CONCURRENCY):
+        """
+        `resolve` maps site-relative URLs (/api/uploads/...) to a local file
+        path or an absolute URL; other relative URLs are skipped
+        """
+        self.asset_dir = Path(asset_dir)
+        self.resolve = resolve
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._failures = {}  # url -> monotonic time of the failure
+        self._inflight = {}  # url -> Task
+        self.logo: Optional[str] = None
+        self.placeholder: Optional[str] = None
+        self._stats = {"hits": 0, "fetched": 0, "failed": 0}
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": "YAMA+ invoice renderer"}
+            )
+        return self._session
+
+    def _prepare_static(self):
+        self.asset_dir.mkdir(parents=True, exist_ok=True)
+        placeholder = self.asset_dir / "placeholder.jpg"
+        if not placeholder.exists():
+            output = io.BytesIO()
+            PILImage.new("RGB", (64, 64), (236, 240, 241)).save(output, format="JPEG")
+            placeholder.write_bytes(output.getvalue())
+        self.placeholder = str(placeholder)
+        if COMPANY_LOGO.exists():
+            logo = self.asset_dir / "logo.png"
+            if not logo.exists() or logo.stat().st_mtime < COMPANY_LOGO.stat().st_mtime:
+                img = PILImage.open(COMPANY_LOGO)
+                img.thumbnail((LOGO_SIZE, LOGO_SIZE), PILImage.Resampling.LANCZOS)
+                img.save(logo, format="PNG", optimize=True)
+            self.logo = str(logo)
+        else:
+            logger.warning(f"Company logo not found at {COMPANY_LOGO}")
+
+    async def preload(self):
+        """Prepare the logo and placeholder once (at startup)"""
+        await asyncio.to_thread(self._prepare_static)
+
+    def _store(self, path: Path, data: bytes):
+        thumbnail = make_thumbnail(data)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(thumbnail)
+        os.replace(tmp, path)
+
+    async def _download(self, url: str) -> bytes:
+        async with self._semaphore:
+            async with self.session().get(url) as response:
+                if response.status != 200:
+                    raise ValueError(f"HTTP {response.status}")
+                data = await response.content.read(ASSET_MAX_BYTES + 1)
+                if len(data) > ASSET_MAX_BYTES:
+                    raise ValueError("image too large")
+                return data
+
+    async def _fetch(self, url: str, path: Path) -> Optional[str]:
+        source = url
+        if not url.startswith(("http://", "https://")):
+            source = self.resolve(url) if self.resolve else None
+            if not source:
+                return None
+        try:
+            if source.startswith(("http://", "https://")):
+                data = await self._download(source)
+            else:
+                data = await asyncio.to_thread(Path(source).read_bytes)
+            await asyncio.to_thread(self._store, path, data)
+        except Exception as e:
+            self._failures[url] = time.monotonic()
+            self._stats["failed"] += 1
+            logger.warning(f"PDF asset unavailable, using placeholder: {url[:80]} ({e})")
+            return None
+        self._stats["fetched"] += 1
+        return str(path)
+
+    async def get(self, url: str) -> Optional[str]:
+        """Local thumbnail path for `url`, fetching it if needed; None when unavailable"""
+        if not url:
+            return None
+        path = self.asset_dir / asset_name(url)
+        if path.exists():
+            self._stats["hits"] += 1
+            return str(path)
+        failed_at = self._failures.get(url)
+        if failed_at is not None and time.monotonic() - failed_at < FAILURE_TTL:
+            return None
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(url, path))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def prefetch(self, urls: Iterable[str]) -> dict:
+        """
+        Assets for one render: {"logo", "placeholder", url: path...}.
+        URLs that could not be fetched are left out.
+        """
+        if self.placeholder is None:
+            await self.preload()
+        unique = list(dict.fromkeys(url for url in urls if url))
+        paths = await asyncio.gather(*(self.get(url) for url in unique))
+        assets = {url: path for url, path in zip(unique, paths) if path}
+        assets["logo"] = self.logo
+        assets["placeholder"] = self.placeholder
+        return assets
+
+    def stats(self) -> dict:
+        return {**self._stats, "failing_urls": len(self._failures)}
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
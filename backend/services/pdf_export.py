@@ -0,0 +1,210 @@
+"""
+Bulk PDF export service for YAMA+ e-commerce platform
+Invoices, quotes or order invoices selected by ids or by date range are
+rendered through PDFRenderer (process pool + rendered-PDF cache) a few at a
+time and streamed back as a ZIP:
+- each PDF is added to the archive as soon as it is rendered, in completion
+  order, so the download starts with the first document
+- memory holds at most `concurrency` documents, whatever the batch size
+- documents that fail to render are listed in erreurs.txt inside the archive
+- progress (done / failed / total) is kept in the pdf_exports collection so
+  the admin UI can poll it from any worker
+"""
+import io
+import time
+import uuid
+import asyncio
+import zipfile
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+from starlette.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLLECTION = "pdf_exports"
+EXPORT_INDEXES = [
+    ([("export_id", 1)], {"unique": True}),
+    # progress documents are only useful while the admin is waiting
+    ([("created_at_dt", 1)], {"expireAfterSeconds": 24 * 3600}),
+]
+EXPORT_MAX_DOCUMENTS = 5000
+PROGRESS_INTERVAL = 1.0  # seconds between progress writes
+
+# (file name inside the archive, coroutine factory returning the PDF bytes)
+ExportJob = Tuple[str, Callable[[], Awaitable[bytes]]]
+
+
+class PDFExportRequest(BaseModel):
+    """Either explicit ids or a date range (YYYY-MM-DD, both inclusive)"""
+    ids: Optional[List[str]] = Field(None, max_length=EXPORT_MAX_DOCUMENTS)
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+
+
+def export_query(request: PDFExportRequest, id_field: str) -> dict:
+    """Mongo filter for the selection; ValueError when it is empty or malformed"""
+    if request.ids:
+        return {id_field: {"$in": list(dict.fromkeys(request.ids))}}
+    if not request.date_from and not request.date_to:
+        raise ValueError("ids or date range required")
+    created_at = {}
+    # created_at is an ISO string: lexicographic bounds on the day prefix
+    if request.date_from:
+        created_at["$gte"] = datetime.strptime(request.date_from, "%Y-%m-%d").date().isoformat()
+    if request.date_to:
+        day_after = datetime.strptime(request.date_to, "%Y-%m-%d").date() + timedelta(days=1)
+        created_at["$lt"] = day_after.isoformat()
+    return {"created_at": created_at}
+
+
+class ExportProgress:
+    """Progress document of one export, written at most once per PROGRESS_INTERVAL"""
+
+    def __init__(self, db, kind: str, total: int, export_id: Optional[str] = None):
+        self.collection = db[EXPORT_COLLECTION]
+        self.export_id = export_id or f"exp_{uuid.uuid4().hex[:12]}"
+        self.kind = kind
+        self.total = total
+        self._written_at = 0.0
+
+    async def start(self):
+        now = datetime.now(timezone.utc)
+        await self.collection.insert_one({
+            "export_id": self.export_id,
+            "kind": self.kind,
+            "status": "running",
+            "total": self.total,
+            "done": 0,
+            "failed": 0,
+            "created_at": now.isoformat(),
+            "created_at_dt": now
+        })
+
+    async def update(self, done: int, failed: int, force: bool = False):
+        if not force and time.monotonic() - self._written_at < PROGRESS_INTERVAL:
+            return
+        self._written_at = time.monotonic()
+        await self.collection.update_one(
+            {"export_id": self.export_id}, {"$set": {"done": done, "failed": failed}}
+        )
+
+    async def finish(self, done: int, failed: int, status: str = "completed"):
+        await self.collection.update_one(
+            {"export_id": self.export_id},
+            {"$set": {
+                "done": done,
+                "failed": failed,
+                "status": status,
+                "completed_at": datetime.now(timezone.utc).isoformat()
+            }}
+        )
+
+
+async def get_export_progress(db, export_id: str) -> Optional[dict]:
+    progress = await db[EXPORT_COLLECTION].find_one({"export_id": export_id}, {"_id": 0, "created_at_dt": 0})
+    if progress:
+        total = progress.get("total") or 0
+        finished = progress.get("done", 0) + progress.get("failed", 0)
+        progress["progress"] = round(finished / total * 100, 1) if total else 100.0
+    return progress
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, unseekable buffer: zipfile then streams entries with data descriptors"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+async def stream_pdf_zip(jobs: AsyncIterator[ExportJob], concurrency: int,
+                         progress: Optional[ExportProgress] = None) -> AsyncIterator[bytes]:
+    """Render jobs with at most `concurrency` in flight and yield the ZIP as they complete"""
+    sink = _ZipSink()
+    # PDFs are already compressed; storing them keeps the CPU for rendering
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED)
+    pending = {}  # Task -> file name
+    names = set()
+    errors = []
+    done = failed = 0
+    exhausted = False
+    status = "cancelled"
+    jobs = jobs.__aiter__()
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    name, render = await jobs.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                pending[asyncio.ensure_future(render())] = name
+            if not pending:
+                break
+
+            finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                name = pending.pop(task)
+                try:
+                    pdf = task.result()
+                except Exception as e:
+                    failed += 1
+                    errors.append(f"{name}: {e}")
+                    logger.warning(f"Bulk export: {name} failed to render: {e}")
+                    continue
+                # Two documents may share a number; never overwrite inside the archive
+                if name in names:
+                    name = name.replace(".pdf", f"_{done}.pdf")
+                names.add(name)
+                archive.writestr(name, pdf)
+                done += 1
+            if progress:
+                await progress.update(done, failed)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+
+        if errors:
+            archive.writestr("erreurs.txt", "\n".join(errors))
+        archive.close()
+        status = "completed"
+        yield sink.drain()
+    except Exception:
+        status = "failed"
+        raise
+    finally:
+        # Client went away (or a query failed): stop the renders still queued
+        for task in pending:
+            task.cancel()
+        if progress:
+            try:
+                await progress.finish(done, failed, status)
+            except Exception as e:
+                logger.warning(f"Bulk export progress not saved: {e}")
+
+
+def zip_response(chunks: AsyncIterator[bytes], filename: str, progress: ExportProgress) -> StreamingResponse:
+    """The archive as a download; X-Export-Id is the handle for polling progress"""
+    return StreamingResponse(
+        chunks,
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "X-Export-Id": progress.export_id,
+            "X-Export-Total": str(progress.total)
+        }
+    )
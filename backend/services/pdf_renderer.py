@@ -0,0 +1,179 @@
+"""
+PDF rendering service for YAMA+ e-commerce platform
+ReportLab is pure-Python and CPU-bound, so documents are rendered in a
+process pool instead of inside the async handlers.
+
+Rendered bytes are cached by (kind, document id, version), the version
+being a hash of every input handed to the render function (the order, the
+quote and its partner...). Any change to a document therefore yields a new
+key; stale renders are never served and are removed from disk by
+invalidate() or when the next version is written.
+- memory: LRU bounded in bytes, per worker process
+- disk: PDF_CACHE_DIR/{kind}/{id}/{version}.pdf, shared by the uvicorn workers
+Concurrent requests for the same version share a single render.
+"""
+import os
+import re
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "2"))
+PDF_CACHE_MEMORY_MB = int(os.environ.get("PDF_CACHE_MEMORY_MB", "32"))
+# Bump when a template changes so cached documents are re-rendered
+TEMPLATE_VERSION = "1"
+
+_SAFE_ID = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def document_version(fn: Callable, kwargs: dict) -> str:
+    """Hash of the renderer and its inputs"""
+    payload = json.dumps([TEMPLATE_VERSION, fn.__module__, fn.__name__, kwargs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:20]
+
+
+def render_bytes(fn: Callable, kwargs: dict) -> bytes:
+    """Worker entry point: render functions return a BytesIO"""
+    return fn(**kwargs).getvalue()
+
+
+class PDFRenderer:
+    def __init__(self, cache_dir: Path, workers: int = PDF_WORKERS, memory_bytes: int = PDF_CACHE_MEMORY_MB * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.workers = max(1, workers)
+        self.memory_bytes = memory_bytes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._memory = OrderedDict()  # (kind, id, version) -> bytes
+        self._memory_size = 0
+        self._inflight = {}  # (kind, id, version) -> Future
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "renders": 0, "shared": 0, "render_ms": 0.0}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: never fork a process that has an event loop and Mongo threads running
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def run(self, fn: Callable, **kwargs) -> bytes:
+        """Render in the pool without caching (previews, one-off documents)"""
+        started = time.perf_counter()
+        try:
+            pdf = await asyncio.get_running_loop().run_in_executor(self._executor(), render_bytes, fn, kwargs)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool next time
+            self._pool = None
+            raise
+        self._stats["renders"] += 1
+        self._stats["render_ms"] += (time.perf_counter() - started) * 1000
+        return pdf
+
+    def _doc_dir(self, kind: str, doc_id: str) -> Path:
+        return self.cache_dir / kind / _SAFE_ID.sub("_", doc_id)
+
+    def _remember(self, key: tuple, pdf: bytes):
+        if len(pdf) > self.memory_bytes:
+            return
+        self._forget(key)
+        self._memory[key] = pdf
+        self._memory_size += len(pdf)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _forget(self, key: tuple):
+        pdf = self._memory.pop(key, None)
+        if pdf is not None:
+            self._memory_size -= len(pdf)
+
+    def _write(self, path: Path, pdf: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(pdf)
+        os.replace(tmp, path)
+        # Older versions of this document are dead weight
+        for other in path.parent.glob("*.pdf"):
+            if other != path:
+                other.unlink(missing_ok=True)
+
+    def _read(self, path: Path) -> Optional[bytes]:
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    async def render(self, kind: str, doc_id: str, fn: Callable, **kwargs) -> bytes:
+        """PDF bytes for fn(**kwargs), from memory, disk or a fresh render"""
+        version = document_version(fn, kwargs)
+        key = (kind, doc_id, version)
+
+        pdf = self._memory.get(key)
+        if pdf is not None:
+            self._memory.move_to_end(key)
+            self._stats["memory_hits"] += 1
+            return pdf
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._stats["shared"] += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            path = self._doc_dir(kind, doc_id) / f"{version}.pdf"
+            pdf = await asyncio.to_thread(self._read, path)
+            if pdf is not None:
+                self._stats["disk_hits"] += 1
+            else:
+                pdf = await self.run(fn, **kwargs)
+                try:
+                    await asyncio.to_thread(self._write, path, pdf)
+                except OSError as e:
+                    logger.warning(f"PDF cache write failed for {kind}/{doc_id}: {e}")
+            self._remember(key, pdf)
+            future.set_result(pdf)
+            return pdf
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't warn about an unretrieved exception
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def invalidate(self, kind: str, doc_id: str):
+        """Drop every cached version of a document"""
+        for key in [k for k in self._memory if k[0] == kind and k[1] == doc_id]:
+            self._forget(key)
+        await asyncio.to_thread(shutil.rmtree, self._doc_dir(kind, doc_id), True)
+
+    def stats(self) -> dict:
+        renders = self._stats["renders"]
+        return {
+            "workers": self.workers,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "memory_hits": self._stats["memory_hits"],
+            "disk_hits": self._stats["disk_hits"],
+            "renders": renders,
+            "shared": self._stats["shared"],
+            "avg_render_ms": round(self._stats["render_ms"] / renders, 1) if renders else 0
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -4,7 +4,9 @@ Professional design with GROUPE YAMA PLUS branding
 """
 import io
 import os
-from datetime import datetime
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -13,9 +15,11 @@ from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, HRFlowable
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-import requests
+from reportlab.lib.utils import ImageReader
 from typing import Optional, List, Dict, Any
 
+logger = logging.getLogger(__name__)
+
 # Company colors
 YAMA_BLUE = colors.HexColor("#4A7BA7")
 YAMA_DARK = colors.HexColor("#2C3E50")
@@ -34,15 +38,23 @@ COMPANY_INFO = {
     "logo_url": "/assets/images/logo_yama_pdf.png"
 }
 
-def download_image(url: str) -> Optional[io.BytesIO]:
-    """Download image from URL and return as BytesIO"""
+ORDER_INVOICE_LOGO = Path(__file__).resolve().parent.parent / "logo_yama.png"
+
+def asset_image(path: Optional[str], width: float, height: float) -> Optional[Image]:
+    """
+    Image flowable fitted inside width x height, keeping its aspect ratio.
+    `path` is a local file prepared by PDFAssetCache; nothing is downloaded
+    while rendering.
+    """
+    if not path:
+        return None
     try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            return io.BytesIO(response.content)
+        img_width, img_height = ImageReader(path).getSize()
     except Exception as e:
-        print(f"Error downloading image: {e}")
-    return None
+        logger.warning(f"Unreadable PDF asset {path}: {e}")
+        return None
+    scale = min(width / img_width, height / img_height)
+    return Image(path, width=img_width * scale, height=img_height * scale)
 
 def format_price(amount: float) -> str:
     """Format price in FCFA"""
@@ -174,19 +186,14 @@ def get_styles():
     return styles
 
 
-def create_header(styles, doc_type: str = ""):
+def create_header(styles, doc_type: str = "", logo_path: Optional[str] = None):
     """Create document header with logo and company info"""
     elements = []
     
-    # Try to load logo
-    logo_data = download_image(COMPANY_INFO["logo_url"])
-    
-    header_data = []
+    img = asset_image(logo_path, 35*mm, 35*mm)
     
     # Left side: Logo with tagline or Company name
-    if logo_data:
-        # Use proportional sizing to avoid stretching - square logo
-        img = Image(logo_data, width=35*mm, height=35*mm)
+    if img:
         # Create logo with tagline below
         logo_table = Table([
             [img],
@@ -232,7 +239,7 @@ def create_header(styles, doc_type: str = ""):
     return elements
 
 
-def create_partner_section(partner: Dict, styles, partner_logo_url: Optional[str] = None):
+def create_partner_section(partner: Dict, styles, partner_logo_path: Optional[str] = None):
     """Create partner information section"""
     elements = []
     
@@ -266,11 +273,11 @@ def create_partner_section(partner: Dict, styles, partner_logo_url: Optional[str
     partner_text = "<br/>".join(partner_info_parts)
     
     # Add partner logo if available
-    if partner_logo_url:
-        logo_data = download_image(partner_logo_url)
-        if logo_data:
+    if partner_logo_path:
+        logo = asset_image(partner_logo_path, 30*mm, 15*mm)
+        if logo:
             partner_table_data = [
-                [Image(logo_data, width=30*mm, height=15*mm), Paragraph(partner_text, styles['PartnerInfo'])]
+                [logo, Paragraph(partner_text, styles['PartnerInfo'])]
             ]
             partner_table = Table(partner_table_data, colWidths=[35*mm, 120*mm])
             partner_table.setStyle(TableStyle([
@@ -445,9 +452,11 @@ def generate_quote_pdf(
     notes: Optional[str] = None,
     validity_days: int = 30,
     payment_terms: Optional[str] = None,
-    date: Optional[str] = None
+    date: Optional[str] = None,
+    assets: Optional[Dict[str, str]] = None
 ) -> io.BytesIO:
     """Generate a professional quote PDF"""
+    assets = assets or {}
     
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(
@@ -463,7 +472,7 @@ def generate_quote_pdf(
     elements = []
     
     # Header
-    elements.extend(create_header(styles, "DEVIS"))
+    elements.extend(create_header(styles, "DEVIS", assets.get("logo")))
     
     # Document title
     elements.append(Paragraph("DEVIS", styles['DocTitle']))
@@ -476,7 +485,7 @@ def generate_quote_pdf(
     elements.append(Spacer(1, 10*mm))
     
     # Partner section
-    elements.extend(create_partner_section(partner, styles, partner.get('logo_url')))
+    elements.extend(create_partner_section(partner, styles, assets.get(partner.get('logo_url'))))
     
     # Object/Title
     if title:
@@ -527,9 +536,11 @@ def generate_invoice_pdf(
     payment_terms: Optional[str] = None,
     date: Optional[str] = None,
     status: str = "unpaid",
-    amount_paid: float = 0
+    amount_paid: float = 0,
+    assets: Optional[Dict[str, str]] = None
 ) -> io.BytesIO:
     """Generate a professional invoice PDF"""
+    assets = assets or {}
     
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(
@@ -545,7 +556,7 @@ def generate_invoice_pdf(
     elements = []
     
     # Header
-    elements.extend(create_header(styles, "FACTURE"))
+    elements.extend(create_header(styles, "FACTURE", assets.get("logo")))
     
     # Document title
     doc_title = "FACTURE PRO FORMA" if invoice_type == "proforma" else "FACTURE"
@@ -574,7 +585,7 @@ def generate_invoice_pdf(
     elements.append(Spacer(1, 10*mm))
     
     # Partner section
-    elements.extend(create_partner_section(partner, styles, partner.get('logo_url')))
+    elements.extend(create_partner_section(partner, styles, assets.get(partner.get('logo_url'))))
     
     # Object/Title
     if title:
@@ -624,9 +635,11 @@ def generate_contract_pdf(
     end_date: Optional[str] = None,
     value: Optional[float] = None,
     notes: Optional[str] = None,
-    date: Optional[str] = None
+    date: Optional[str] = None,
+    assets: Optional[Dict[str, str]] = None
 ) -> io.BytesIO:
     """Generate a professional contract PDF"""
+    assets = assets or {}
     
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(
@@ -642,7 +655,7 @@ def generate_contract_pdf(
     elements = []
     
     # Header
-    elements.extend(create_header(styles, "CONTRAT"))
+    elements.extend(create_header(styles, "CONTRAT", assets.get("logo")))
     
     # Document title
     elements.append(Paragraph("CONTRAT", styles['DocTitle']))
@@ -768,7 +781,8 @@ def generate_partnership_contract_pdf(
     delivery_responsibility: str = "GROUPE YAMA PLUS",
     delivery_fees: str = "inclus dans le prix",
     contract_duration: str = "12 mois",
-    date: Optional[str] = None
+    date: Optional[str] = None,
+    assets: Optional[Dict[str, str]] = None
 ) -> io.BytesIO:
     """
     Generate a professional Partnership Contract PDF matching the exact format
@@ -837,18 +851,13 @@ def generate_partnership_contract_pdf(
     ))
     
     # ========== HEADER WITH LOGO ==========
-    try:
-        logo_image = download_image(COMPANY_INFO['logo_url'])
-        if logo_image:
-            # Use proportional sizing to avoid stretching - square logo
-            logo = Image(logo_image, width=35*mm, height=35*mm)
-            logo.hAlign = 'CENTER'
-            elements.append(logo)
-            # Add tagline below logo
-            elements.append(Paragraph("<i>Votre partenaire de croissance</i>", ParagraphStyle('Tagline', fontSize=9, textColor=YAMA_GRAY, fontName='Helvetica-Oblique', alignment=TA_CENTER)))
-            elements.append(Spacer(1, 5*mm))
-    except:
-        pass
+    logo = asset_image((assets or {}).get("logo"), 35*mm, 35*mm)
+    if logo:
+        logo.hAlign = 'CENTER'
+        elements.append(logo)
+        # Add tagline below logo
+        elements.append(Paragraph("<i>Votre partenaire de croissance</i>", ParagraphStyle('Tagline', fontSize=9, textColor=YAMA_GRAY, fontName='Helvetica-Oblique', alignment=TA_CENTER)))
+        elements.append(Spacer(1, 5*mm))
     
     # ========== TITLE ==========
     elements.append(Paragraph("CONTRAT DE PARTENARIAT COMMERCIAL", styles['ContractTitle']))
@@ -1031,3 +1040,222 @@ def generate_partnership_contract_pdf(
     buffer.seek(0)
     
     return buffer
+
+
+# ============== ORDER INVOICE (customer orders) ==============
+
+def generate_order_invoice_pdf(order: dict, assets: Optional[Dict[str, str]] = None) -> io.BytesIO:
+    """
+    Generate a professional PDF invoice for an order with logo and product images.
+    `assets` maps image URLs to local thumbnails (see PDFAssetCache.prefetch);
+    images missing from it are drawn as the placeholder.
+    """
+    assets = assets or {}
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=1.5*cm, bottomMargin=2*cm)
+    
+    elements = []
+    styles = getSampleStyleSheet()
+    
+    # Custom styles
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=28,
+        spaceAfter=5,
+        textColor=colors.HexColor('#0B0B0B'),
+        fontName='Helvetica-Bold'
+    )
+    
+    header_style = ParagraphStyle(
+        'CustomHeader',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#666666')
+    )
+    
+    # Add logo header
+    logo_img = asset_image(assets.get("logo") or str(ORDER_INVOICE_LOGO), 3.5*cm, 3.5*cm)
+    
+    # Company legal info
+    company_info = """<b>GROUPE YAMA PLUS</b><br/>
+<font size='8' color='#666666'>Dakar – Sénégal<br/>
+Email : contact@groupeyamaplus.com<br/>
+Tel : 78 382 75 75 / 77 849 81 37<br/>
+NINEA : 012808210<br/>
+RCCM : SN DKR 2026 A 4814</font>"""
+    
+    if logo_img:
+        # Create header with YAMA+ logo
+        header_data = [[logo_img, Paragraph(company_info, styles['Normal'])]]
+        header_table = Table(header_data, colWidths=[4.5*cm, 12*cm])
+        header_table.setStyle(TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+        ]))
+        elements.append(header_table)
+    else:
+        elements.append(Paragraph("GROUPE YAMA PLUS", title_style))
+        elements.append(Paragraph(company_info, header_style))
+    elements.append(Spacer(1, 15))
+    
+    # Divider line
+    divider = Table([['']], colWidths=[17*cm])
+    divider.setStyle(TableStyle([
+        ('LINEBELOW', (0, 0), (-1, -1), 1, colors.HexColor('#0B0B0B')),
+    ]))
+    elements.append(divider)
+    elements.append(Spacer(1, 15))
+    
+    # Invoice Title
+    elements.append(Paragraph(f"<b>FACTURE N° {order['order_id'].upper()}</b>", ParagraphStyle(
+        'InvoiceTitle',
+        parent=styles['Heading2'],
+        fontSize=16,
+        spaceAfter=15
+    )))
+    
+    # Order Date
+    order_date = order.get('created_at', datetime.now(timezone.utc))
+    if isinstance(order_date, str):
+        order_date = datetime.fromisoformat(order_date.replace('Z', '+00:00'))
+    
+    elements.append(Paragraph(f"<b>Date:</b> {order_date.strftime('%d/%m/%Y à %H:%M')}", styles['Normal']))
+    elements.append(Spacer(1, 15))
+    
+    # Customer Info
+    shipping = order.get('shipping', {})
+    elements.append(Paragraph("<b>FACTURER À:</b>", styles['Heading3']))
+    elements.append(Paragraph(f"{shipping.get('full_name', 'Client')}", styles['Normal']))
+    elements.append(Paragraph(f"{shipping.get('address', '')}", styles['Normal']))
+    elements.append(Paragraph(f"{shipping.get('city', '')}, {shipping.get('region', 'Dakar')}", styles['Normal']))
+    elements.append(Paragraph(f"Tél: {shipping.get('phone', '')}", styles['Normal']))
+    if shipping.get('email'):
+        elements.append(Paragraph(f"Email: {shipping.get('email')}", styles['Normal']))
+    elements.append(Spacer(1, 20))
+    
+    # Products with Images
+    elements.append(Paragraph("<b>ARTICLES COMMANDÉS:</b>", styles['Heading3']))
+    elements.append(Spacer(1, 10))
+    
+    # Products Table with Image column and description
+    table_data = [['', 'Produit', 'Qté', 'Prix Unit.', 'Total']]
+    
+    # Use 'items' key (the correct key used when storing orders)
+    items = order.get('items', []) or order.get('products', [])
+    
+    for item in items:
+        name = item.get('name', 'Produit')[:40]
+        # Get description from product database if not in order
+        description = item.get('description', '') or item.get('short_description', '')
+        if description:
+            description = description[:60]
+        qty = item.get('quantity', 1)
+        price = item.get('price', 0)
+        total_price = price * qty
+        
+        # Product name with description
+        product_text = f"<b>{name}</b>"
+        if description:
+            product_text += f"<br/><font size='7' color='#666666'>{description}...</font>"
+        
+        # Product thumbnail, prefetched before rendering
+        img_cell = asset_image(assets.get(item.get('image')) or assets.get("placeholder"), 1.2*cm, 1.2*cm) or ''
+        
+        table_data.append([
+            img_cell,
+            Paragraph(product_text, ParagraphStyle('ProductCell', parent=styles['Normal'], fontSize=8, leading=10)),
+            str(qty),
+            f"{price:,.0f} FCFA".replace(',', ' '),
+            f"{total_price:,.0f} FCFA".replace(',', ' ')
+        ])
+    
+    # Create table with image column
+    table = Table(table_data, colWidths=[1.5*cm, 7*cm, 1.5*cm, 3.5*cm, 3.5*cm])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0B0B0B')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+        ('TOPPADDING', (0, 0), (-1, 0), 10),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F5F7')),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+        ('TOPPADDING', (0, 1), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E0E0E0')),
+    ]))
+    elements.append(table)
+    elements.append(Spacer(1, 20))
+    
+    # Totals
+    items = order.get('items', []) or order.get('products', [])
+    subtotal = order.get('subtotal', sum(p.get('price', 0) * p.get('quantity', 1) for p in items))
+    shipping_cost = order.get('shipping_cost', 2500)
+    discount = order.get('discount', 0)
+    total = order.get('total', subtotal + shipping_cost - discount)
+    
+    totals_data = [
+        ['Sous-total:', f"{subtotal:,.0f} FCFA".replace(',', ' ')],
+        ['Livraison:', f"{shipping_cost:,.0f} FCFA".replace(',', ' ')],
+    ]
+    
+    if discount > 0:
+        totals_data.append(['Réduction:', f"-{discount:,.0f} FCFA".replace(',', ' ')])
+    
+    totals_data.append(['TOTAL:', f"{total:,.0f} FCFA".replace(',', ' ')])
+    
+    totals_table = Table(totals_data, colWidths=[13.5*cm, 3.5*cm])
+    totals_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('FONTSIZE', (0, -1), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.HexColor('#0B0B0B')),
+    ]))
+    elements.append(totals_table)
+    elements.append(Spacer(1, 30))
+    
+    # Payment Info
+    payment_method = order.get('payment_method', 'Non spécifié')
+    payment_labels = {
+        'wave': 'Wave',
+        'orange_money': 'Orange Money',
+        'card': 'Carte Bancaire',
+        'cash': 'Paiement à la livraison'
+    }
+    elements.append(Paragraph(f"<b>Mode de paiement:</b> {payment_labels.get(payment_method, payment_method)}", styles['Normal']))
+    
+    payment_status = order.get('payment_status', 'pending')
+    status_labels = {
+        'pending': '⏳ En attente',
+        'paid': '✅ Payé',
+        'failed': '❌ Échoué'
+    }
+    elements.append(Paragraph(f"<b>Statut du paiement:</b> {status_labels.get(payment_status, payment_status)}", styles['Normal']))
+    elements.append(Spacer(1, 40))
+    
+    # Footer
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=styles['Normal'],
+        fontSize=9,
+        textColor=colors.HexColor('#999999'),
+        alignment=1  # Center
+    )
+    elements.append(Paragraph("Merci pour votre achat chez GROUPE YAMA PLUS !", footer_style))
+    elements.append(Paragraph("Pour toute question, contactez-nous au 78 382 75 75 / 77 849 81 37", footer_style))
+    elements.append(Paragraph("NINEA : 012808210 | RCCM : SN DKR 2026 A 4814", footer_style))
+    elements.append(Paragraph("www.groupeyamaplus.com", footer_style))
+    
+    # Build PDF
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,111 @@
+"""
+Product hydration service for YAMA+ e-commerce platform
+Resolves lists of product_ids (cart lines, wishlist entries...) into product
+documents with a single $in query instead of one find_one per item
+"""
+import time
+import logging
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Short-lived in-process cache: long enough to absorb bursts of cart/wishlist
+# page views, short enough that price and stock never drift noticeably
+PRODUCT_CACHE_TTL = 5  # seconds
+PRODUCT_CACHE_MAX_ENTRIES = 5000
+
+# Projections used by the call sites in server.py
+CART_PROJECTION = {"_id": 0, "product_id": 1, "name": 1, "price": 1, "images": 1, "stock": 1}
+WISHLIST_PROJECTION = {"_id": 0, "product_id": 1, "name": 1, "price": 1, "original_price": 1, "images": 1, "stock": 1}
+SUMMARY_PROJECTION = {"_id": 0, "product_id": 1, "name": 1, "price": 1, "images": 1}
+
+
+class ProductCache:
+    """Per-process product cache keyed by (product_id, projection)"""
+
+    def __init__(self, ttl: float = PRODUCT_CACHE_TTL, max_entries: int = PRODUCT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+
+    def get(self, product_id: str, projection_key: tuple) -> Optional[dict]:
+        entry = self._entries.get((product_id, projection_key))
+        if entry is None:
+            return None
+        expires_at, doc = entry
+        if time.monotonic() >= expires_at:
+            self._entries.pop((product_id, projection_key), None)
+            return None
+        return doc
+
+    def set(self, product_id: str, projection_key: tuple, doc: dict):
+        if len(self._entries) >= self.max_entries:
+            # Dicts keep insertion order: drop the oldest tenth in one go
+            for key in list(self._entries)[: max(1, self.max_entries // 10)]:
+                self._entries.pop(key, None)
+        self._entries[(product_id, projection_key)] = (time.monotonic() + self.ttl, doc)
+
+    def invalidate(self, product_ids: Optional[Iterable[str]] = None):
+        """Drop cached entries for the given products, or everything"""
+        if product_ids is None:
+            self._entries.clear()
+            return
+        ids = set(product_ids)
+        for key in [k for k in self._entries if k[0] in ids]:
+            self._entries.pop(key, None)
+
+
+product_cache = ProductCache()
+
+
+def _projection_key(projection: Optional[dict]) -> tuple:
+    return tuple(sorted((projection or {}).items()))
+
+
+async def hydrate_products(
+    db,
+    product_ids: Iterable[str],
+    projection: Optional[dict] = None,
+    use_cache: bool = True
+) -> Dict[str, dict]:
+    """Fetch products for the given ids in one round-trip, returns {product_id: doc}"""
+    ids = list(dict.fromkeys(pid for pid in product_ids if pid))
+    if not ids:
+        return {}
+
+    if projection is None:
+        projection = {"_id": 0}
+    elif projection.get("product_id") is None and any(v for k, v in projection.items() if k != "_id"):
+        # Inclusion projections must keep product_id so results can be keyed
+        projection = {**projection, "product_id": 1}
+    projection_key = _projection_key(projection)
+
+    found = {}
+    missing = ids
+    if use_cache:
+        missing = []
+        for pid in ids:
+            doc = product_cache.get(pid, projection_key)
+            if doc is not None:
+                found[pid] = doc
+            else:
+                missing.append(pid)
+
+    if missing:
+        docs = await db.products.find(
+            {"product_id": {"$in": missing}},
+            projection
+        ).to_list(len(missing))
+        for doc in docs:
+            pid = doc.get("product_id")
+            found[pid] = doc
+            if use_cache:
+                product_cache.set(pid, projection_key, doc)
+
+    return found
+
+
+def first_image(product: dict) -> str:
+    """Return the first image URL of a product, or an empty string"""
+    images = product.get("images") or []
+    return images[0] if images else ""
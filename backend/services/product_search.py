@@ -0,0 +1,298 @@
+"""
+Product search service for YAMA+ e-commerce platform
+An in-process inverted index over the catalog, kept current by catalog
+change events (each uvicorn worker holds its own copy):
+- accent and case folding ("electromenager" finds "Électroménager"),
+  French stopwords and plural folding
+- weighted fields: name > brand > category > short description > description
+- prefix matching for typeahead: the last word, and any word of 4+ letters,
+  may be the start of a term ("refri" -> "réfrigérateur")
+- every word must match; when nothing does, any word may
+- score = BM25-like relevance x (1 + popularity), popularity being the
+  quantity sold over POPULARITY_DAYS from the sales_daily rollup
+Until the first build completes callers fall back to Mongo's $text index.
+"""
+import re
+import math
+import time
+import asyncio
+import logging
+import unicodedata
+import heapq
+from bisect import bisect_left
+from functools import lru_cache
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FIELD_WEIGHTS = {
+    "name": 10.0,
+    "brand": 6.0,
+    "category": 4.0,
+    "subcategory": 4.0,
+    "short_description": 2.0,
+    "description": 1.0,
+}
+INDEXED_FIELDS = tuple(FIELD_WEIGHTS)
+FILTER_FIELDS = ("category", "featured", "is_new", "is_promo", "stock", "is_on_order")
+SEARCH_PROJECTION = {"_id": 0, "product_id": 1, **{field: 1 for field in INDEXED_FIELDS + FILTER_FIELDS}}
+
+PREFIX_WEIGHT = 0.6  # a prefix hit counts for less than the whole word
+PREFIX_MAX_TERMS = 200  # cap on terms expanded from one short prefix
+POPULARITY_WEIGHT = 0.5
+POPULARITY_DAYS = 90
+POPULARITY_TTL = 900  # seconds between refreshes of the sales counts
+OUT_OF_STOCK_FACTOR = 0.8
+
+STOPWORDS = frozenset("""
+a au aux avec ce ces d de des du en et la le les l pour par sur un une ou the and of for with
+""".split())
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def fold(text: str) -> str:
+    """Lowercase, strip accents and ligatures, keep letters and digits"""
+    text = unicodedata.normalize("NFKD", text.lower().replace("œ", "oe").replace("æ", "ae"))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(" ", text)
+
+
+def stem(word: str) -> str:
+    """French plural folding: robes -> robe, chapeaux -> chapeau"""
+    if len(word) > 3 and word[-1] in "sx" and not word[-2].isdigit():
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def _word_terms(word: str) -> Tuple[str, ...]:
+    """Terms of one whitespace-separated word ("l'été" -> ("ete",)); catalogs reuse few words"""
+    return tuple(stem(part) for part in fold(word).split() if part not in STOPWORDS)
+
+
+def tokenize(text) -> List[str]:
+    if not text:
+        return []
+    if isinstance(text, (list, tuple)):
+        text = " ".join(str(part) for part in text)
+    return [term for word in str(text).split() for term in _word_terms(word)]
+
+
+class ProductSearchIndex:
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = {}  # term -> {product_id: weighted tf}
+        self._terms: List[str] = []  # sorted, for prefix lookups
+        self._terms_dirty = False
+        self._docs: Dict[str, dict] = {}  # product_id -> {"terms": [...], filter fields}
+        self._popularity: Dict[str, float] = {}  # product_id -> 0..1
+        self._popularity_at = 0.0
+        self._popularity_task: Optional[asyncio.Task] = None
+        self.ready = False
+        self._building = False
+        self._changed_during_build = set()
+        self.built_at: Optional[str] = None
+        self.build_ms = 0.0
+        self.searches = 0
+
+    # ---------- indexing ----------
+
+    @staticmethod
+    def _weighted_terms(doc: dict) -> Dict[str, float]:
+        weights: Dict[str, float] = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            value = doc.get(field)
+            if not value:
+                continue
+            # dampen repetition: ten "promo" in a description is not ten times better
+            for term, count in Counter(tokenize(value)).items():
+                weights[term] = weights.get(term, 0.0) + (weight if count == 1 else weight * (1 + math.log(count)))
+        return weights
+
+    def add(self, doc: dict):
+        product_id = doc["product_id"]
+        self.remove(product_id)
+        terms = self._weighted_terms(doc)
+        for term, weight in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                self._terms_dirty = True
+            postings[product_id] = weight
+        self._docs[product_id] = {
+            "terms": list(terms),
+            **{field: doc.get(field) for field in FILTER_FIELDS}
+        }
+
+    def remove(self, product_id: str):
+        entry = self._docs.pop(product_id, None)
+        if entry is None:
+            return
+        for term in entry["terms"]:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                self._terms_dirty = True
+
+    def _build_from(self, docs: List[dict]):
+        fresh = ProductSearchIndex()
+        for doc in docs:
+            fresh.add(doc)
+        fresh._sorted_terms()
+        return fresh
+
+    async def build(self, db):
+        """Index the whole catalog; the swap happens only once the new index is complete"""
+        started = time.perf_counter()
+        self._building = True
+        self._changed_during_build = set()
+        try:
+            docs = await db.products.find({}, SEARCH_PROJECTION).to_list(None)
+            # Tokenizing tens of thousands of products takes a moment: keep it off the loop
+            fresh = await asyncio.to_thread(self._build_from, docs)
+        finally:
+            self._building = False
+        self._postings, self._terms, self._docs = fresh._postings, fresh._terms, fresh._docs
+        self._terms_dirty = False
+        self.ready = True
+        if self._changed_during_build:
+            # changes published while the catalog was being read may be missing from it
+            await self.refresh(db, self._changed_during_build)
+        self.built_at = datetime.now(timezone.utc).isoformat()
+        self.build_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Product search index built: {len(self._docs)} products, {len(self._postings)} terms in {self.build_ms:.0f} ms")
+        await self.load_popularity(db)
+
+    async def refresh(self, db, product_ids: Iterable[str]):
+        """Re-read changed products (missing ones are removed)"""
+        product_ids = list(product_ids)
+        if self._building:
+            self._changed_during_build.update(product_ids)
+        found = await db.products.find({"product_id": {"$in": product_ids}}, SEARCH_PROJECTION).to_list(None)
+        for doc in found:
+            self.add(doc)
+        for product_id in set(product_ids) - {doc["product_id"] for doc in found}:
+            self.remove(product_id)
+
+    async def load_popularity(self, db):
+        """Quantity sold per product over the last POPULARITY_DAYS, log-scaled to 0..1"""
+        since = (datetime.now(timezone.utc) - timedelta(days=POPULARITY_DAYS)).strftime("%Y-%m-%d")
+        rows = await db.sales_daily.aggregate([
+            {"$match": {"product_id": {"$ne": ""}, "day": {"$gte": since}, "order_status": {"$ne": "cancelled"}}},
+            {"$group": {"_id": "$product_id", "quantity": {"$sum": "$quantity"}}}
+        ]).to_list(None)
+        top = max((row["quantity"] for row in rows), default=0)
+        self._popularity = {
+            row["_id"]: math.log1p(row["quantity"]) / math.log1p(top)
+            for row in rows if row["quantity"] > 0
+        }
+        self._popularity_at = time.monotonic()
+
+    @property
+    def popularity(self) -> Dict[str, float]:
+        """product_id -> 0..1 share of recent sales (log scale)"""
+        return self._popularity
+
+    def _refresh_popularity_later(self, db):
+        stale = time.monotonic() - self._popularity_at > POPULARITY_TTL
+        if db is not None and stale and (self._popularity_task is None or self._popularity_task.done()):
+            self._popularity_at = time.monotonic()  # one refresh at a time, even if it fails
+            self._popularity_task = asyncio.ensure_future(self.load_popularity(db))
+
+    # ---------- querying ----------
+
+    def _sorted_terms(self) -> List[str]:
+        if self._terms_dirty or len(self._terms) != len(self._postings):
+            self._terms = sorted(self._postings)
+            self._terms_dirty = False
+        return self._terms
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        terms = self._sorted_terms()
+        start = bisect_left(terms, prefix)
+        matched = []
+        for term in terms[start:start + PREFIX_MAX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            matched.append(term)
+        return matched
+
+    def _token_scores(self, token: str, prefix: bool) -> Dict[str, float]:
+        """product_id -> score for one query word (whole word, plus prefixes when asked)"""
+        total = len(self._docs) or 1
+        scores: Dict[str, float] = {}
+        candidates = [(token, 1.0)]
+        if prefix:
+            candidates += [(term, PREFIX_WEIGHT) for term in self._prefix_terms(token) if term != token]
+        for term, factor in candidates:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for product_id, weight in postings.items():
+                score = weight * idf * factor
+                if score > scores.get(product_id, 0):
+                    scores[product_id] = score
+        return scores
+
+    def _matches_filters(self, entry: dict, filters: dict) -> bool:
+        return all(entry.get(field) == value for field, value in filters.items())
+
+    def search(self, query: str, filters: Optional[dict] = None, limit: int = 50, skip: int = 0,
+               prefix: bool = True, db=None) -> Tuple[List[str], int]:
+        """
+        (product ids of the requested page, total matches), best first.
+        `filters` are equality filters on FILTER_FIELDS; `prefix` lets the
+        last word match as a prefix (typeahead). Pass `db` to keep the
+        popularity counts fresh.
+        """
+        self.searches += 1
+        self._refresh_popularity_later(db)
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return [], 0
+        per_token = [
+            self._token_scores(token, prefix=prefix and (index == len(tokens) - 1 or len(token) >= 4))
+            for index, token in enumerate(tokens)
+        ]
+        filters = {field: value for field, value in (filters or {}).items() if value is not None}
+
+        # every word must match; if no product has them all, rank those having any
+        ordered = sorted(per_token, key=len)
+        matched = set(ordered[0]).intersection(*ordered[1:]) if ordered[0] else set()
+        if not matched:
+            matched = set().union(*per_token)
+
+        ranked = []
+        for product_id in matched:
+            entry = self._docs.get(product_id)
+            if entry is None or (filters and not self._matches_filters(entry, filters)):
+                continue
+            relevance = sum(scores.get(product_id, 0.0) for scores in per_token)
+            score = relevance * (1 + POPULARITY_WEIGHT * self._popularity.get(product_id, 0.0))
+            if (entry.get("stock") or 0) <= 0 and not entry.get("is_on_order"):
+                score *= OUT_OF_STOCK_FACTOR
+            ranked.append((score, product_id))
+        best = heapq.nsmallest(skip + limit, ranked, key=lambda item: (-item[0], item[1]))
+        return [product_id for _, product_id in best[skip:]], len(ranked)
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "products": len(self._docs),
+            "terms": len(self._postings),
+            "popular_products": len(self._popularity),
+            "built_at": self.built_at,
+            "build_ms": round(self.build_ms, 1),
+            "searches": self.searches
+        }
+
+
+def text_search_query(search: str) -> dict:
+    """Fallback before the index is ready: the existing $text index (accent-insensitive, no prefixes)"""
+    return {"$text": {"$search": search}}
@@ -0,0 +1,219 @@
+"""
+Web push dispatcher for YAMA+ e-commerce platform
+Broadcasts stream subscriptions page by page and fan out over a pooled
+aiohttp session with bounded concurrency:
+- payload encryption (aes128gcm) runs in a small thread pool, off the loop
+- VAPID Authorization headers are signed once per push-service origin and
+  reused until shortly before they expire
+- endpoints answering 404/410 are deactivated with one bulk_write at the end
+Each broadcast returns throughput stats; the last ones are kept for /admin.
+Notifications for a single user (order updates...) go through send_to_user:
+the user's few devices are pushed directly, without the worker pool and
+without a history entry.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import urlparse
+
+import aiohttp
+from pymongo import UpdateOne
+from py_vapid import Vapid
+from pywebpush import WebPusher
+
+from .pagination import iterate_keyset
+
+logger = logging.getLogger(__name__)
+
+PUSH_CONCURRENCY = int(os.environ.get("PUSH_CONCURRENCY", "32"))
+PUSH_CRYPTO_THREADS = int(os.environ.get("PUSH_CRYPTO_THREADS", "4"))
+PUSH_TTL = int(os.environ.get("PUSH_TTL", "0"))  # seconds the push service keeps an undelivered message
+PUSH_TIMEOUT = 10
+VAPID_TOKEN_LIFETIME = 12 * 3600
+VAPID_REFRESH_MARGIN = 3600
+
+EXPIRED_STATUSES = {404, 410}
+DEACTIVATE_BATCH = 1000
+HISTORY_SIZE = 20
+USER_SUBSCRIPTION_LIMIT = 20  # devices pushed per user notification
+
+
+class VapidSigner:
+    """VAPID headers cached per push-service origin (FCM, Mozilla, Apple...)"""
+
+    def __init__(self, private_key: str, claims_email: str):
+        self.vapid = Vapid.from_string(private_key)
+        self.subject = f"mailto:{claims_email}"
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def headers(self, endpoint: str) -> dict:
+        url = urlparse(endpoint)
+        audience = f"{url.scheme}://{url.netloc}"
+        now = int(time.time())
+        with self._lock:
+            cached = self._cache.get(audience)
+            if cached and cached[1] - now > VAPID_REFRESH_MARGIN:
+                return cached[0]
+            expires = now + VAPID_TOKEN_LIFETIME
+            headers = self.vapid.sign({"sub": self.subject, "aud": audience, "exp": expires})
+            self._cache[audience] = (headers, expires)
+            return headers
+
+
+def encrypt_push(subscription: dict, data: str, vapid_headers: dict, ttl: int):
+    """Encrypted body and request headers for one subscription (CPU-bound)"""
+    encoded = WebPusher({"endpoint": subscription["endpoint"], "keys": subscription["keys"]}).encode(
+        data.encode("utf-8"), "aes128gcm"
+    )
+    headers = {**vapid_headers, "Content-Encoding": "aes128gcm", "TTL": str(ttl)}
+    return encoded["body"], headers
+
+
+class PushDispatcher:
+    def __init__(self, db, private_key: Optional[str], claims_email: str,
+                 concurrency: int = PUSH_CONCURRENCY, ttl: int = PUSH_TTL):
+        self.db = db
+        self.signer = VapidSigner(private_key, claims_email) if private_key else None
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=PUSH_CRYPTO_THREADS, thread_name_prefix="webpush")
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._direct = {"sent": 0, "failed": 0, "expired": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.signer is not None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=PUSH_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+            )
+        return self._session
+
+    def _prepare(self, subscription: dict, data: str):
+        return encrypt_push(subscription, data, self.signer.headers(subscription["endpoint"]), self.ttl)
+
+    async def _send_one(self, subscription: dict, data: str) -> Optional[int]:
+        """HTTP status from the push service, None when the request could not be made"""
+        loop = asyncio.get_running_loop()
+        try:
+            body, headers = await loop.run_in_executor(self._executor, self._prepare, subscription, data)
+        except Exception as e:
+            logger.warning(f"Push encryption failed for {subscription['endpoint'][:50]}: {e}")
+            return None
+        try:
+            async with self.session().post(subscription["endpoint"], data=body, headers=headers) as response:
+                await response.read()
+                return response.status
+        except Exception as e:
+            logger.warning(f"Push request failed for {subscription['endpoint'][:50]}: {e}")
+            return None
+
+    async def broadcast(self, query: dict, payload: dict, label: str = "") -> dict:
+        """Send `payload` to every subscription matching `query`"""
+        stats = {"label": label, "total": 0, "sent": 0, "failed": 0, "expired": 0,
+                 "started_at": datetime.now(timezone.utc).isoformat()}
+        if not self.enabled:
+            logger.warning("VAPID keys not configured")
+            return stats
+
+        data = json.dumps(payload)
+        expired = []
+        started = time.monotonic()
+        pending = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker():
+            while True:
+                subscription = await pending.get()
+                if subscription is None:
+                    return
+                status = await self._send_one(subscription, data)
+                if status is not None and 200 <= status < 300:
+                    stats["sent"] += 1
+                elif status in EXPIRED_STATUSES:
+                    expired.append(subscription["endpoint"])
+                else:
+                    stats["failed"] += 1
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            async for subscription in iterate_keyset(
+                self.db.push_subscriptions, query, [("_id", 1)], {"_id": 0, "endpoint": 1, "keys": 1}
+            ):
+                stats["total"] += 1
+                await pending.put(subscription)
+        finally:
+            for _ in workers:
+                await pending.put(None)
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        stats["expired"] = len(expired)
+        await self._deactivate(expired)
+
+        elapsed = time.monotonic() - started
+        stats["duration_ms"] = round(elapsed * 1000)
+        stats["per_second"] = round(stats["total"] / elapsed, 1) if elapsed > 0 else 0
+        self._history.append(stats)
+        logger.info(
+            f"Push broadcast {label or ''}: {stats['sent']}/{stats['total']} sent, "
+            f"{stats['expired']} expired, {stats['failed']} failed in {stats['duration_ms']}ms"
+        )
+        return stats
+
+    async def send_to_user(self, user_id: str, payload: dict) -> dict:
+        """Send `payload` to one user's active subscriptions"""
+        stats = {"total": 0, "sent": 0, "failed": 0, "expired": 0}
+        if not self.enabled:
+            logger.warning("VAPID keys not configured")
+            return stats
+
+        subscriptions = await self.db.push_subscriptions.find(
+            {"user_id": user_id, "is_active": True}, {"_id": 0, "endpoint": 1, "keys": 1}
+        ).to_list(USER_SUBSCRIPTION_LIMIT)
+        data = json.dumps(payload)
+        statuses = await asyncio.gather(*(self._send_one(subscription, data) for subscription in subscriptions))
+        expired = []
+        for subscription, status in zip(subscriptions, statuses):
+            if status is not None and 200 <= status < 300:
+                stats["sent"] += 1
+            elif status in EXPIRED_STATUSES:
+                expired.append(subscription["endpoint"])
+            else:
+                stats["failed"] += 1
+        stats["total"] = len(subscriptions)
+        stats["expired"] = len(expired)
+        await self._deactivate(expired)
+        for key in self._direct:
+            self._direct[key] += stats[key]
+        return stats
+
+    async def _deactivate(self, endpoints: list):
+        for i in range(0, len(endpoints), DEACTIVATE_BATCH):
+            operations = [
+                UpdateOne({"endpoint": endpoint}, {"$set": {"is_active": False}})
+                for endpoint in endpoints[i:i + DEACTIVATE_BATCH]
+            ]
+            await self.db.push_subscriptions.bulk_write(operations, ordered=False)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "broadcasts": list(self._history),
+            "direct": dict(self._direct)
+        }
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._executor.shutdown(wait=False)
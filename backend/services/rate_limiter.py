@@ -0,0 +1,177 @@
+"""
+Rate limiter for YAMA+ e-commerce platform
+Sliding-window counters (current + previous fixed window, weighted by the
+elapsed fraction) with per-route cost weights. Two backends:
+- LocalRateLimitBackend: in-process, bounded, O(1) LRU eviction
+- SharedRateLimitBackend: Redis-protocol store (RedisStore/FakeSharedStore)
+  so limits hold across uvicorn workers; falls back to local on errors
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+RATE_LIMIT_REQUESTS = int(os.environ.get("RATE_LIMIT_REQUESTS", "100"))  # cost units per window
+RATE_LIMIT_WINDOW = int(os.environ.get("RATE_LIMIT_WINDOW", "60"))  # seconds
+MAX_RATE_LIMIT_ENTRIES = int(os.environ.get("MAX_RATE_LIMIT_ENTRIES", "10000"))
+
+# Heavier routes consume more of the budget (default cost is 1)
+ROUTE_COSTS: Dict[str, int] = {
+    "/api/auth/login": 10,
+    "/api/auth/register": 10,
+    "/api/auth/forgot-password": 10,
+    "/api/auth/reset-password": 10,
+    "/api/provider/login": 10,
+    "/api/provider/register": 10,
+    "/api/game/spin": 10,
+    "/api/payments/paytech/initiate": 5,
+    "/api/upload/image": 5,
+    "/api/admin/analyze-product-image": 5,
+}
+
+
+class RateLimitResult:
+    __slots__ = ("allowed", "limit", "remaining", "retry_after")
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, retry_after: int = 0):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.retry_after = retry_after
+
+
+def _sliding_estimate(previous: int, current: int, now: float, window: int) -> float:
+    """Requests seen in the last `window` seconds, assuming the previous window was uniform"""
+    elapsed = now % window
+    return previous * (window - elapsed) / window + current
+
+
+def _retry_after(previous: int, current: int, cost: int, limit: int, now: float, window: int) -> int:
+    """Seconds until enough of the previous window has slid out to admit `cost`"""
+    if current + cost > limit or previous == 0:
+        return int(window - now % window) + 1
+    # previous * (window - elapsed') / window + current + cost <= limit
+    needed_elapsed = window - (limit - current - cost) * window / previous
+    return max(1, int(needed_elapsed - now % window) + 1)
+
+
+class LocalRateLimitBackend:
+    """Per-process counters; the least recently seen client is evicted in O(1)"""
+
+    def __init__(self, max_entries: int = MAX_RATE_LIMIT_ENTRIES):
+        self.max_entries = max_entries
+        self._clients = OrderedDict()  # key -> [window_start, previous_count, current_count]
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._clients)
+
+    def hit(self, key: str, cost: int, limit: int, window: int, now: float) -> RateLimitResult:
+        window_start = int(now // window) * window
+        entry = self._clients.get(key)
+        if entry is None:
+            entry = [window_start, 0, 0]
+            self._clients[key] = entry
+            if len(self._clients) > self.max_entries:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._clients.move_to_end(key)
+            if entry[0] != window_start:
+                # Roll the window; anything older than one window counts as zero
+                entry[1] = entry[2] if window_start - entry[0] == window else 0
+                entry[2] = 0
+                entry[0] = window_start
+
+        estimate = _sliding_estimate(entry[1], entry[2], now, window)
+        if estimate + cost > limit:
+            return RateLimitResult(False, limit, 0, _retry_after(entry[1], entry[2], cost, limit, now, window))
+        entry[2] += cost
+        return RateLimitResult(True, limit, max(0, int(limit - estimate - cost)))
+
+
+class SharedRateLimitBackend:
+    """Counters in a Redis-protocol store, one key per client and fixed window"""
+
+    def __init__(self, store, namespace: str = "yama:ratelimit", fallback: Optional[LocalRateLimitBackend] = None):
+        self.store = store
+        self.namespace = namespace
+        self.fallback = fallback if fallback is not None else LocalRateLimitBackend()
+        self.errors = 0
+
+    async def hit(self, key: str, cost: int, limit: int, window: int, now: float) -> RateLimitResult:
+        window_start = int(now // window) * window
+        current_key = f"{self.namespace}:{key}:{window_start}"
+        previous_key = f"{self.namespace}:{key}:{window_start - window}"
+        try:
+            previous_raw, current = await asyncio.gather(
+                self.store.get(previous_key),
+                self.store.incrby(current_key, cost)
+            )
+            if current == cost:
+                await self.store.expire(current_key, window * 2)
+            previous = int(previous_raw or 0)
+            estimate = _sliding_estimate(previous, current - cost, now, window)
+            if estimate + cost > limit:
+                # Refund so rejected requests do not extend the block
+                await self.store.incrby(current_key, -cost)
+                return RateLimitResult(False, limit, 0, _retry_after(previous, current - cost, cost, limit, now, window))
+            return RateLimitResult(True, limit, max(0, int(limit - estimate - cost)))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Shared rate limiter unavailable, using local counters: {e}")
+            return self.fallback.hit(key, cost, limit, window, now)
+
+
+class RateLimiter:
+    """Front object used by the middleware"""
+
+    def __init__(self, backend=None, limit: int = RATE_LIMIT_REQUESTS, window: int = RATE_LIMIT_WINDOW,
+                 route_costs: Optional[Dict[str, int]] = None):
+        self.backend = backend if backend is not None else LocalRateLimitBackend()
+        self.limit = limit
+        self.window = window
+        self.route_costs = ROUTE_COSTS if route_costs is None else route_costs
+        self.allowed = 0
+        self.rejected = 0
+
+    def cost_for(self, path: str) -> int:
+        return self.route_costs.get(path.rstrip("/") or "/", 1)
+
+    async def check(self, client_key: str, path: str, now: Optional[float] = None) -> RateLimitResult:
+        now = time.time() if now is None else now
+        cost = self.cost_for(path)
+        result = self.backend.hit(client_key, cost, self.limit, self.window, now)
+        if asyncio.iscoroutine(result):
+            result = await result
+        if result.allowed:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        return result
+
+    def stats(self) -> dict:
+        local = self.backend if isinstance(self.backend, LocalRateLimitBackend) else self.backend.fallback
+        stats = {
+            "backend": type(self.backend).__name__,
+            "limit": self.limit,
+            "window_seconds": self.window,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "local_entries": len(local),
+            "local_evictions": local.evictions
+        }
+        if isinstance(self.backend, SharedRateLimitBackend):
+            stats["shared_errors"] = self.backend.errors
+        return stats
+
+
+def create_rate_limiter(shared_store=None) -> RateLimiter:
+    """Use the shared store when the app has one, otherwise per-process counters"""
+    backend = SharedRateLimitBackend(shared_store) if shared_store is not None else LocalRateLimitBackend()
+    return RateLimiter(backend)
@@ -0,0 +1,250 @@
+"""
+Daily sales rollup for YAMA+ e-commerce platform
+The sales_daily collection holds pre-aggregated counters keyed by
+day x order_status x payment_status x payment_method x product_id:
+- order rows (product_id == "") count orders and sum order totals
+- item rows count order lines, quantities and line revenue per product
+Order writes keep it current with $inc upserts; rebuild_sales_daily()
+recomputes it from history (see backfill_sales_daily.py).
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from .analytics import TOP_PRODUCTS_LIMIT, DAILY_CHART_DAYS, shape_order_analytics
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "sales_daily"
+ROLLUP_STATE_COLLECTION = "sales_daily_state"
+ORDER_ROW = ""  # product_id of order-level rows
+
+ROLLUP_KEY_FIELDS = ("day", "order_status", "payment_status", "payment_method", "product_id")
+
+ROLLUP_INDEXES = [
+    ([(field, 1) for field in ROLLUP_KEY_FIELDS], {"unique": True}),
+    ([("product_id", 1), ("day", 1)], {}),
+]
+
+
+def _order_dims(order: dict) -> dict:
+    created_at = order.get("created_at")
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    return {
+        "day": (created_at or "")[:10],
+        "order_status": order.get("order_status") or "unknown",
+        "payment_status": order.get("payment_status") or "unknown",
+        "payment_method": order.get("payment_method") or "unknown",
+    }
+
+
+def _item_product_id(item: dict) -> str:
+    return item.get("product_id") or item.get("name") or "unknown"
+
+
+def rollup_operations(order: dict, sign: int = 1) -> list:
+    """$inc upserts adding (sign=1) or removing (sign=-1) an order from the rollup"""
+    dims = _order_dims(order)
+    if not dims["day"]:
+        return []
+    operations = [
+        UpdateOne(
+            {**dims, "product_id": ORDER_ROW},
+            {"$inc": {"orders": sign, "revenue": sign * (order.get("total") or 0)}},
+            upsert=True
+        )
+    ]
+    for item in order.get("items", []):
+        quantity = item.get("quantity") or 1
+        update = {"$inc": {
+            "orders": sign,
+            "quantity": sign * quantity,
+            "revenue": sign * (item.get("price") or 0) * quantity
+        }}
+        if sign > 0:
+            update["$set"] = {"name": item.get("name") or "Produit"}
+        operations.append(UpdateOne({**dims, "product_id": _item_product_id(item)}, update, upsert=True))
+    return operations
+
+
+async def record_order(db, order: dict):
+    """Add a newly created order to the rollup"""
+    operations = rollup_operations(order, 1)
+    if operations:
+        await db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+
+async def record_order_transition(db, before: Optional[dict], changes: dict):
+    """Move an order between rollup keys after a status/payment change
+
+    `before` is the order as it was prior to the update (e.g. from
+    find_one_and_update with ReturnDocument.BEFORE); nothing is written when
+    the dimensions did not change, so replayed webhooks are harmless.
+    """
+    if not before:
+        return
+    after = {**before, **changes}
+    if _order_dims(before) == _order_dims(after):
+        return
+    operations = rollup_operations(before, -1) + rollup_operations(after, 1)
+    if operations:
+        await db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+
+def _backfill_pipelines() -> list:
+    dims = {
+        "day": {"$substrCP": ["$created_at", 0, 10]},
+        "order_status": {"$ifNull": ["$order_status", "unknown"]},
+        "payment_status": {"$ifNull": ["$payment_status", "unknown"]},
+        "payment_method": {"$ifNull": ["$payment_method", "unknown"]},
+    }
+    key_projection = {field: f"$_id.{field}" for field in dims}
+    merge = {"$merge": {
+        "into": ROLLUP_COLLECTION,
+        "on": list(ROLLUP_KEY_FIELDS),
+        "whenMatched": "replace",
+        "whenNotMatched": "insert"
+    }}
+    only_dated = {"$match": {"created_at": {"$type": "string"}}}
+    quantity = {"$ifNull": ["$items.quantity", 1]}
+    orders_pipeline = [
+        only_dated,
+        {"$group": {
+            "_id": dims,
+            "orders": {"$sum": 1},
+            "revenue": {"$sum": {"$ifNull": ["$total", 0]}}
+        }},
+        {"$project": {"_id": 0, **key_projection, "product_id": {"$literal": ORDER_ROW},
+                      "orders": 1, "revenue": 1}},
+        merge
+    ]
+    items_pipeline = [
+        only_dated,
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {**dims, "product_id": {"$ifNull": ["$items.product_id", {"$ifNull": ["$items.name", "unknown"]}]}},
+            "orders": {"$sum": 1},
+            "quantity": {"$sum": quantity},
+            "revenue": {"$sum": {"$multiply": [{"$ifNull": ["$items.price", 0]}, quantity]}},
+            "name": {"$last": {"$ifNull": ["$items.name", "Produit"]}}
+        }},
+        {"$project": {"_id": 0, **key_projection, "product_id": "$_id.product_id",
+                      "orders": 1, "quantity": 1, "revenue": 1, "name": 1}},
+        merge
+    ]
+    return [orders_pipeline, items_pipeline]
+
+
+async def rebuild_sales_daily(db) -> dict:
+    """Recompute the whole rollup from the orders collection
+
+    Orders written while the rebuild runs may be counted twice or missed;
+    run it during a quiet period (the backfill script does this once).
+    """
+    for keys, options in ROLLUP_INDEXES:
+        await db[ROLLUP_COLLECTION].create_index(keys, **options)
+    await db[ROLLUP_COLLECTION].delete_many({})
+    for pipeline in _backfill_pipelines():
+        await db.orders.aggregate(pipeline, allowDiskUse=True).to_list(None)
+    rows = await db[ROLLUP_COLLECTION].count_documents({})
+    state = {"backfilled_at": datetime.now(timezone.utc).isoformat(), "rows": rows}
+    await db[ROLLUP_STATE_COLLECTION].update_one({"_id": "state"}, {"$set": state}, upsert=True)
+    logger.info(f"sales_daily rebuilt: {rows} rows")
+    return state
+
+
+async def rollup_ready(db) -> bool:
+    """The rollup is only trusted once a backfill has completed"""
+    state = await db[ROLLUP_STATE_COLLECTION].find_one({"_id": "state"})
+    return bool(state and state.get("backfilled_at"))
+
+
+def rollup_analytics_pipeline(start_day: str) -> list:
+    """Same facets as analytics.order_analytics_pipeline, read from sales_daily"""
+    order_rows = {"$match": {"product_id": ORDER_ROW}}
+    return [
+        {"$match": {"day": {"$gte": start_day}}},
+        {"$facet": {
+            "summary": [
+                order_rows,
+                {"$group": {
+                    "_id": None,
+                    "total_orders": {"$sum": "$orders"},
+                    "total_revenue": {"$sum": "$revenue"},
+                    "paid_revenue": {"$sum": {"$cond": [{"$eq": ["$payment_status", "paid"]}, "$revenue", 0]}}
+                }}
+            ],
+            "orders_by_status": [
+                order_rows,
+                {"$group": {"_id": "$order_status", "count": {"$sum": "$orders"}}},
+                {"$match": {"count": {"$gt": 0}}}
+            ],
+            "payment_methods": [
+                order_rows,
+                {"$group": {"_id": "$payment_method", "count": {"$sum": "$orders"}}},
+                {"$match": {"count": {"$gt": 0}}}
+            ],
+            "daily_chart": [
+                order_rows,
+                {"$group": {"_id": "$day", "orders": {"$sum": "$orders"}, "revenue": {"$sum": "$revenue"}}},
+                {"$match": {"orders": {"$gt": 0}}},
+                {"$sort": {"_id": -1}},
+                {"$limit": DAILY_CHART_DAYS}
+            ],
+            "top_products": [
+                {"$match": {"product_id": {"$ne": ORDER_ROW}}},
+                {"$group": {
+                    "_id": "$product_id",
+                    "name": {"$last": "$name"},
+                    "quantity": {"$sum": "$quantity"},
+                    "revenue": {"$sum": "$revenue"}
+                }},
+                {"$match": {"quantity": {"$gt": 0}}},
+                {"$sort": {"revenue": -1}},
+                {"$limit": TOP_PRODUCTS_LIMIT}
+            ]
+        }}
+    ]
+
+
+def rollup_totals_pipeline(match: dict) -> list:
+    return [
+        {"$match": {**match, "product_id": ORDER_ROW}},
+        {"$group": {
+            "_id": None,
+            "orders": {"$sum": "$orders"},
+            "revenue": {"$sum": "$revenue"},
+            "paid_revenue": {"$sum": {"$cond": [{"$eq": ["$payment_status", "paid"]}, "$revenue", 0]}},
+            "pending_orders": {"$sum": {"$cond": [{"$eq": ["$order_status", "pending"]}, "$orders", 0]}}
+        }}
+    ]
+
+
+async def compute_rollup_analytics(db, start: str, previous_start: str) -> dict:
+    """Day-granular equivalent of analytics.compute_order_analytics"""
+    start_day, previous_day = start[:10], previous_start[:10]
+    collection = db[ROLLUP_COLLECTION]
+    facets, previous = await asyncio.gather(
+        collection.aggregate(rollup_analytics_pipeline(start_day)).to_list(1),
+        collection.aggregate(rollup_totals_pipeline({"day": {"$gte": previous_day, "$lt": start_day}})).to_list(1)
+    )
+    result = shape_order_analytics(facets[0] if facets else {})
+    previous = previous[0] if previous else {}
+    result["previous_orders"] = previous.get("orders", 0)
+    result["previous_revenue"] = previous.get("revenue", 0)
+    return result
+
+
+async def rollup_totals(db) -> dict:
+    """All-time order count, pending count and paid revenue"""
+    rows = await db[ROLLUP_COLLECTION].aggregate(rollup_totals_pipeline({})).to_list(1)
+    row = rows[0] if rows else {}
+    return {
+        "total_orders": row.get("orders", 0),
+        "pending_orders": row.get("pending_orders", 0),
+        "total_revenue": row.get("paid_revenue", 0)
+    }
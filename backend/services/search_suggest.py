@@ -0,0 +1,273 @@
+"""
+Search suggestions service for YAMA+ e-commerce platform
+Typeahead for the storefront search box, answered from memory (no Mongo
+round trip per keystroke). Suggestions are product names, brands,
+categories and service-provider professions; every word of a suggestion is
+inserted in a character trie, so "sams" or "gal sams" find
+"Samsung Galaxy A15".
+
+Each trie node caches the best TOP_CACHE suggestions of its subtree. A
+node's list is derived from its own entries and its children's lists, so
+after a change only the nodes on the changed words' paths are recomputed,
+lazily, on the next lookup through them. A single-word lookup is then a
+walk down the prefix plus a slice.
+
+Scores: products 1 + popularity (sales) + featured bonus; brands and
+categories the sum of their products' scores; professions the number of
+active providers. Products follow catalog events; professions are
+refreshed by the admin provider endpoints and the periodic rebuild.
+"""
+import time
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from .product_search import fold, STOPWORDS, POPULARITY_WEIGHT
+
+logger = logging.getLogger(__name__)
+
+TOP_CACHE = 32  # suggestions kept per trie node
+SUGGEST_LIMIT = 8
+FEATURED_BONUS = 0.5
+SUGGEST_PROJECTION = {"_id": 0, "product_id": 1, "name": 1, "brand": 1, "category": 1, "featured": 1}
+SUGGEST_FIELDS = frozenset(SUGGEST_PROJECTION) - {"_id"}
+
+
+def suggest_words(text: str) -> List[str]:
+    """Folded words, no stemming: typeahead prefixes are matched as typed"""
+    return [word for word in fold(text or "").split() if word not in STOPWORDS]
+
+
+class _Node:
+    __slots__ = ("children", "keys", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.keys = set()  # entries having a word that ends here
+        self.top: Optional[List[str]] = None  # best keys of the subtree, None when stale
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._root = _Node()
+        self._entries: Dict[str, dict] = {}  # key -> {"text", "type", "value", "score", "words"}
+        self._products: Dict[str, tuple] = {}  # product_id -> (brand key, category key, score)
+        self._groups: Dict[str, list] = {}  # brand/category key -> [text, score, product count]
+        self.ready = False
+        self._building = False
+        self._changed_during_build = set()
+        self._professions_changed_during_build = False
+        self.built_at = None
+        self.lookups = 0
+
+    # ---------- trie ----------
+
+    def _insert(self, key: str, words: List[str]):
+        for word in set(words):
+            node = self._root
+            node.top = None
+            for char in word:
+                node = node.children.setdefault(char, _Node())
+                node.top = None
+            node.keys.add(key)
+
+    def _delete(self, key: str, words: List[str]):
+        for word in set(words):
+            path = [self._root]
+            for char in word:
+                node = path[-1].children.get(char)
+                if node is None:
+                    break
+                path.append(node)
+            else:
+                path[-1].keys.discard(key)
+            for node in path:
+                node.top = None
+            # prune branches left empty
+            for depth in range(len(path) - 1, 0, -1):
+                node = path[depth]
+                if node.keys or node.children:
+                    break
+                del path[depth - 1].children[word[depth - 1]]
+
+    def _rank(self, key: str):
+        entry = self._entries[key]
+        return -entry["score"], entry["text"]
+
+    def _top(self, node: _Node) -> List[str]:
+        if node.top is None:
+            candidates = set(node.keys)
+            for child in node.children.values():
+                candidates.update(self._top(child))
+            node.top = sorted(candidates, key=self._rank)[:TOP_CACHE]
+        return node.top
+
+    def _subtree_keys(self, node: _Node) -> set:
+        keys = set(node.keys)
+        stack = list(node.children.values())
+        while stack:
+            current = stack.pop()
+            keys.update(current.keys)
+            stack.extend(current.children.values())
+        return keys
+
+    def _find(self, prefix: str) -> Optional[_Node]:
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    # ---------- entries ----------
+
+    def _put(self, key: str, text: str, kind: str, value: str, score: float):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry["text"] == text:
+                if entry["score"] != score:
+                    entry["score"] = score
+                    self._insert(key, entry["words"])  # same words: only invalidates the cached tops
+                return
+            self._drop(key)
+        words = suggest_words(text)
+        if not words:
+            return
+        self._entries[key] = {"text": text, "type": kind, "value": value, "score": score, "words": words}
+        self._insert(key, words)
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._delete(key, entry["words"])
+
+    def _adjust_group(self, key: Optional[str], kind: str, text: str, score: float, count: int):
+        if key is None:
+            return
+        group = self._groups.setdefault(key, [text, 0.0, 0])
+        group[1] += score
+        group[2] += count
+        if group[2] <= 0:
+            del self._groups[key]
+            self._drop(key)
+        else:
+            self._put(key, group[0], kind, group[0], round(group[1], 6))
+
+    def add_product(self, doc: dict, popularity: float = 0.0):
+        product_id = doc["product_id"]
+        self.remove_product(product_id)
+        score = 1 + POPULARITY_WEIGHT * popularity + (FEATURED_BONUS if doc.get("featured") else 0)
+        brand = (doc.get("brand") or "").strip()
+        category = (doc.get("category") or "").strip()
+        brand_key = f"brand:{fold(brand).strip()}" if suggest_words(brand) else None
+        category_key = f"category:{category}" if category else None
+        self._products[product_id] = (brand_key, category_key, score)
+        self._put(f"product:{product_id}", doc.get("name") or "", "product", product_id, score)
+        self._adjust_group(brand_key, "brand", brand, score, 1)
+        self._adjust_group(category_key, "category", category, score, 1)
+
+    def remove_product(self, product_id: str):
+        previous = self._products.pop(product_id, None)
+        if previous is None:
+            return
+        brand_key, category_key, score = previous
+        self._drop(f"product:{product_id}")
+        self._adjust_group(brand_key, "brand", "", -score, -1)
+        self._adjust_group(category_key, "category", "", -score, -1)
+
+    def set_professions(self, counts: Dict[str, int]):
+        """Replace the profession suggestions ({profession: active providers})"""
+        wanted = {f"profession:{fold(name).strip()}": (name, count) for name, count in counts.items() if suggest_words(name)}
+        for key in [key for key in self._entries if key.startswith("profession:") and key not in wanted]:
+            self._drop(key)
+        for key, (name, count) in wanted.items():
+            self._put(key, name, "profession", name, float(count))
+
+    # ---------- loading ----------
+
+    async def load_professions(self, db):
+        if self._building:
+            self._professions_changed_during_build = True
+        rows = await db.service_providers.aggregate([
+            {"$match": {"is_active": True, "profession": {"$type": "string", "$ne": ""}}},
+            {"$group": {"_id": "$profession", "providers": {"$sum": 1}}}
+        ]).to_list(None)
+        counts: Dict[str, int] = {}
+        for row in rows:
+            # "Plombier" and "plombier " are one suggestion
+            name = row["_id"].strip()
+            counts[name] = counts.get(name, 0) + row["providers"]
+        self.set_professions(counts)
+
+    async def build(self, db, popularity: Optional[Dict[str, float]] = None):
+        """Rebuild from the catalog and providers, then swap in the new trie"""
+        started = time.perf_counter()
+        popularity = popularity or {}
+        self._building = True
+        self._changed_during_build = set()
+        self._professions_changed_during_build = False
+        try:
+            fresh = SuggestIndex()
+            async for doc in db.products.find({}, SUGGEST_PROJECTION):
+                fresh.add_product(doc, popularity.get(doc["product_id"], 0.0))
+            await fresh.load_professions(db)
+        finally:
+            self._building = False
+        self._root, self._entries = fresh._root, fresh._entries
+        self._products, self._groups = fresh._products, fresh._groups
+        self.ready = True
+        # changes published while the catalog was being read may be missing from it
+        if self._changed_during_build:
+            await self.refresh(db, self._changed_during_build, popularity)
+        if self._professions_changed_during_build:
+            await self.load_professions(db)
+        self.built_at = time.time()
+        logger.info(f"Search suggestions built: {len(self._entries)} entries in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    async def refresh(self, db, product_ids: Iterable[str], popularity: Optional[Dict[str, float]] = None):
+        """Re-read changed products (missing ones are removed)"""
+        popularity = popularity or {}
+        product_ids = list(product_ids)
+        if self._building:
+            self._changed_during_build.update(product_ids)
+        found = await db.products.find({"product_id": {"$in": product_ids}}, SUGGEST_PROJECTION).to_list(None)
+        for doc in found:
+            self.add_product(doc, popularity.get(doc["product_id"], 0.0))
+        for product_id in set(product_ids) - {doc["product_id"] for doc in found}:
+            self.remove_product(product_id)
+
+    # ---------- querying ----------
+
+    def suggest(self, query: str, limit: int = SUGGEST_LIMIT) -> List[dict]:
+        """Best suggestions whose words start with every word typed"""
+        self.lookups += 1
+        words = list(dict.fromkeys(suggest_words(query)))
+        if not words:
+            return []
+        # the longest word has the smallest subtree
+        words.sort(key=len, reverse=True)
+        node = self._find(words[0])
+        if node is None:
+            return []
+        candidates = self._top(node)
+        if len(words) > 1:
+            others = words[1:]
+
+            def matches(key: str) -> bool:
+                entry_words = self._entries[key]["words"]
+                return all(any(word.startswith(prefix) for word in entry_words) for prefix in others)
+
+            filtered = [key for key in candidates if matches(key)]
+            if len(filtered) < limit and len(candidates) >= TOP_CACHE:
+                # the cached best of the subtree were not enough: look at all of it
+                filtered = sorted((key for key in self._subtree_keys(node) if matches(key)), key=self._rank)
+            candidates = filtered
+        return [
+            {"text": entry["text"], "type": entry["type"], "value": entry["value"]}
+            for entry in (self._entries[key] for key in candidates[:limit])
+        ]
+
+    def stats(self) -> dict:
+        kinds: Dict[str, int] = {}
+        for entry in self._entries.values():
+            kinds[entry["type"]] = kinds.get(entry["type"], 0) + 1
+        return {"ready": self.ready, "entries": kinds, "lookups": self.lookups}
@@ -0,0 +1,168 @@
+"""
+Static file serving for YAMA+ e-commerce platform
+Uploaded files are served from disk without being read into memory:
+- ETag from mtime + size (no hashing of the content), Last-Modified
+- 304 Not Modified for If-None-Match / If-Modified-Since revalidations
+- single byte ranges (206 / 416) honouring If-Range
+- FileResponse / chunked streaming for the body, or, when
+  UPLOADS_ACCEL_PREFIX is set, an X-Accel-Redirect so nginx sends the
+  bytes itself (sendfile) from an `internal` location
+"""
+import os
+import stat
+import logging
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response, FileResponse
+
+logger = logging.getLogger(__name__)
+
+# e.g. "/_uploads/" -> nginx `location /_uploads/ { internal; alias .../uploads/; }`
+UPLOADS_ACCEL_PREFIX = os.environ.get("UPLOADS_ACCEL_PREFIX", "")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def file_etag(st: os.stat_result) -> str:
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match list against our ETag"""
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: str, size: int) -> Optional[tuple]:
+    """
+    (start, end) inclusive for a single `bytes=` range, None to serve the
+    whole file (no/unknown unit or several ranges), RangeNotSatisfiable when
+    the range lies outside the file
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable(header)
+            start, end = max(0, size - length), size - 1
+    except ValueError:
+        return None
+    if start < 0 or start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(Response):
+    """206 Partial Content streaming bytes start..end (inclusive) of a file"""
+
+    def __init__(self, path: Path, start: int, end: int, size: int, headers: dict, media_type: str):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.status_code = 206
+        self.media_type = media_type
+        self.background = None
+        self.init_headers({
+            **headers,
+            "content-range": f"bytes {start}-{end}/{size}",
+            "content-length": str(end - start + 1)
+        })
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # file shrank under us; close the stream
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def serve_file(request: Request, path: Path, media_type: str, headers: Optional[dict] = None,
+               accel_path: Optional[str] = None) -> Optional[Response]:
+    """
+    Response for `path`, or None when it is not a regular file.
+    `accel_path` (path relative to the uploads root) enables X-Accel-Redirect
+    when UPLOADS_ACCEL_PREFIX is configured.
+    """
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+
+    etag = file_etag(st)
+    base_headers = {
+        **(headers or {}),
+        "etag": etag,
+        "last-modified": formatdate(st.st_mtime, usegmt=True),
+        "accept-ranges": "bytes"
+    }
+
+    if not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=base_headers)
+
+    if UPLOADS_ACCEL_PREFIX and accel_path:
+        # nginx serves the body (and handles Range) from its internal location
+        return Response(
+            media_type=media_type,
+            headers={**base_headers, "x-accel-redirect": UPLOADS_ACCEL_PREFIX.rstrip("/") + "/" + accel_path}
+        )
+
+    range_header = request.headers.get("range")
+    if range_header:
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range.strip() == etag:
+            try:
+                byte_range = parse_range(range_header, st.st_size)
+            except RangeNotSatisfiable:
+                return Response(status_code=416, headers={**base_headers, "content-range": f"bytes */{st.st_size}"})
+            if byte_range:
+                return FileRangeResponse(path, *byte_range, st.st_size, base_headers, media_type)
+
+    return FileResponse(path, headers=base_headers, media_type=media_type, stat_result=st)
@@ -0,0 +1,254 @@
+"""
+Stock reservation service for YAMA+ e-commerce platform
+create_order decremented stock with one unconditional $inc per item: N round
+trips, stock could go negative (flash-sale oversell) and nothing was given
+back when the order insert failed. Orders now take their stock all or nothing:
+
+- one bulk_write of conditional decrements ({stock: {$gte: qty}})
+- with a replica set, the decrements and the order insert run in one
+  multi-document transaction; a missing unit aborts everything
+- on a standalone server, each decrement also pushes the order id in the
+  product's stock_holds, so when some products were short exactly the
+  decrements that happened are given back (then the markers are pulled);
+  a failed order insert gives everything back the same way
+
+Orders paid online (PayTech) keep a reservation document while unpaid.
+Past RESERVATION_TTL it expires: the stock returns to the shelf and the
+server cancels the order. A payment confirmed after that takes the stock
+again if there still is some.
+"""
+import os
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, List
+
+from pymongo import UpdateOne, ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_COLLECTION = "stock_reservations"
+RESERVATION_INDEXES = [
+    ("order_id", {"unique": True}),
+    ([("status", 1), ("expires_at", 1)], {}),
+]
+RESERVATION_TTL = int(os.environ.get("STOCK_RESERVATION_TTL", "1800"))  # seconds an unpaid online payment holds stock
+ONLINE_PAYMENT_METHODS = ("mobile_money", "card")  # paid through PayTech
+HOLD_FIELD = "stock_holds"  # transient per-order markers, standalone servers only
+EXPIRE_BATCH = 200
+
+
+class InsufficientStock(Exception):
+    """Some products do not have the quantity ordered"""
+
+    def __init__(self, product_ids: Iterable[str]):
+        self.product_ids = list(product_ids)
+        super().__init__(f"Insufficient stock for {', '.join(self.product_ids)}")
+
+
+def order_quantities(items: Iterable) -> Dict[str, int]:
+    """product_id -> quantity, merging repeated lines; raises ValueError on a quantity below 1"""
+    quantities: Dict[str, int] = {}
+    for item in items:
+        product_id = item["product_id"] if isinstance(item, dict) else item.product_id
+        quantity = item["quantity"] if isinstance(item, dict) else item.quantity
+        if not isinstance(quantity, int) or quantity < 1:
+            raise ValueError(f"Invalid quantity {quantity!r} for {product_id}")
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+class StockReservations:
+    """
+    `hot` is the optional HotInventory: products it counts are re-acquired
+    from its counters, never from products.stock, which lags behind them.
+    """
+
+    def __init__(self, client, db, ttl: int = RESERVATION_TTL, hot=None):
+        self.client = client
+        self.db = db
+        self.ttl = ttl
+        self.hot = hot
+        self.transactions = False
+        self._stats = {"orders": 0, "rejected": 0, "compensated": 0, "committed": 0, "expired": 0, "reacquired": 0}
+
+    @property
+    def reservations(self):
+        return self.db[RESERVATION_COLLECTION]
+
+    async def detect_transactions(self):
+        """Transactions need a replica set (or mongos); standalone servers use compensation"""
+        try:
+            hello = await self.client.admin.command("hello")
+        except Exception as e:
+            logger.warning(f"Could not detect the MongoDB topology, using compensation: {e}")
+            hello = {}
+        self.transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        logger.info(f"Stock reservations: {'transactions' if self.transactions else 'conditional updates with compensation'}")
+
+    # ---------- stock moves ----------
+
+    async def _short_products(self, quantities: Dict[str, int], session=None) -> List[str]:
+        found = await self.db.products.find(
+            {"product_id": {"$in": list(quantities)}}, {"_id": 0, "product_id": 1, "stock": 1}, session=session
+        ).to_list(None)
+        stock = {doc["product_id"]: doc.get("stock") or 0 for doc in found}
+        return [pid for pid, quantity in quantities.items() if stock.get(pid, 0) < quantity]
+
+    async def _take_in_transaction(self, quantities: Dict[str, int], session):
+        result = await self.db.products.bulk_write([
+            UpdateOne({"product_id": pid, "stock": {"$gte": quantity}}, {"$inc": {"stock": -quantity}})
+            for pid, quantity in quantities.items()
+        ], ordered=False, session=session)
+        if result.matched_count < len(quantities):
+            # raising aborts the transaction: no decrement is kept
+            raise InsufficientStock(await self._short_products(quantities, session=session) or list(quantities))
+
+    async def _take(self, ref: str, quantities: Dict[str, int]):
+        """Standalone server: decrement all or give back what was taken"""
+        result = await self.db.products.bulk_write([
+            UpdateOne(
+                {"product_id": pid, "stock": {"$gte": quantity}},
+                {"$inc": {"stock": -quantity}, "$push": {HOLD_FIELD: ref}}
+            )
+            for pid, quantity in quantities.items()
+        ], ordered=False)
+        if result.matched_count < len(quantities):
+            await self._give_back(ref, quantities)
+            self._stats["compensated"] += 1
+            raise InsufficientStock(await self._short_products(quantities) or list(quantities))
+        await self.db.products.update_many({"product_id": {"$in": list(quantities)}}, {"$pull": {HOLD_FIELD: ref}})
+
+    async def _give_back(self, ref: str, quantities: Dict[str, int]):
+        """Undo _take for the products still carrying this order's marker (idempotent)"""
+        await self.db.products.bulk_write([
+            UpdateOne(
+                {"product_id": pid, HOLD_FIELD: ref},
+                {"$inc": {"stock": quantity}, "$pull": {HOLD_FIELD: ref}}
+            )
+            for pid, quantity in quantities.items()
+        ], ordered=False)
+
+    async def _put_back(self, quantities: Dict[str, int]):
+        await self.db.products.bulk_write([
+            UpdateOne({"product_id": pid}, {"$inc": {"stock": quantity}})
+            for pid, quantity in quantities.items()
+        ], ordered=False)
+
+    # ---------- orders ----------
+
+    def _reservation(self, order_id: str, quantities: Dict[str, int]) -> dict:
+        now = datetime.now(timezone.utc)
+        return {
+            "order_id": order_id,
+            "items": [{"product_id": pid, "quantity": quantity} for pid, quantity in quantities.items()],
+            "status": "held",
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl)
+        }
+
+    async def place_order(self, order_doc: dict, hold: bool = False, skip: Iterable[str] = ()):
+        """
+        Take the order's stock and insert the order, all or nothing.
+        With `hold` (unpaid online payment) the stock is only reserved until
+        commit() or expiry. Products in `skip` had their stock taken elsewhere
+        (hot inventory counters). Raises InsufficientStock or ValueError.
+        """
+        order_id = order_doc["order_id"]
+        quantities = order_quantities(order_doc["items"])
+        reservation = self._reservation(order_id, quantities) if hold else None
+        skip = set(skip)
+        quantities = {pid: quantity for pid, quantity in quantities.items() if pid not in skip}
+        try:
+            if self.transactions:
+                async def run(session):
+                    if quantities:
+                        await self._take_in_transaction(quantities, session)
+                    await self.db.orders.insert_one(order_doc, session=session)
+                    if reservation:
+                        await self.reservations.insert_one(reservation, session=session)
+
+                async with await self.client.start_session() as session:
+                    await session.with_transaction(run)
+            else:
+                if quantities:
+                    await self._take(order_id, quantities)
+                try:
+                    await self.db.orders.insert_one(order_doc)
+                    if reservation:
+                        await self.reservations.insert_one(reservation)
+                except Exception:
+                    if quantities:
+                        await self._put_back(quantities)
+                    await self.db.orders.delete_one({"order_id": order_id})
+                    self._stats["compensated"] += 1
+                    raise
+        except InsufficientStock:
+            self._stats["rejected"] += 1
+            raise
+        self._stats["orders"] += 1
+
+    async def commit(self, order_id: str) -> bool:
+        """Payment confirmed: the reservation becomes a sale. False when the stock could not be secured"""
+        now = datetime.now(timezone.utc)
+        reservation = await self.reservations.find_one_and_update(
+            {"order_id": order_id, "status": "held"},
+            {"$set": {"status": "committed", "committed_at": now}}
+        )
+        if reservation is not None:
+            self._stats["committed"] += 1
+            return True
+        expired = await self.reservations.find_one_and_update(
+            {"order_id": order_id, "status": "expired"},
+            {"$set": {"status": "reacquiring"}},
+            return_document=ReturnDocument.AFTER
+        )
+        if expired is None:
+            return True  # no reservation: the stock was taken for good at checkout
+        quantities = {item["product_id"]: item["quantity"] for item in expired["items"]}
+        hot = {pid: quantity for pid, quantity in quantities.items() if self.hot is not None and self.hot.is_hot(pid)}
+        taken = {}
+        try:
+            if hot:
+                taken = await self.hot.admit(hot)
+            cold = {pid: quantity for pid, quantity in quantities.items() if pid not in taken}
+            if cold:
+                await self._take(order_id, cold)
+        except InsufficientStock as e:
+            if taken:
+                await self.hot.release(taken)
+            logger.error(f"Order {order_id} paid after its reservation expired, out of stock: {e.product_ids}")
+            await self.reservations.update_one({"order_id": order_id}, {"$set": {"status": "short", "committed_at": now}})
+            return False
+        except BaseException:
+            # busy hot SKU or database error: leave it expired for the next payment notification
+            if taken:
+                await self.hot.release(taken)
+            await self.reservations.update_one({"order_id": order_id}, {"$set": {"status": "expired"}})
+            raise
+        if taken:
+            await self.hot.confirm(taken)
+        await self.reservations.update_one({"order_id": order_id}, {"$set": {"status": "committed", "committed_at": now}})
+        self._stats["reacquired"] += 1
+        return True
+
+    async def expire_due(self) -> List[dict]:
+        """Release reservations past their deadline; returns them (the caller cancels the orders)"""
+        expired = []
+        now = datetime.now(timezone.utc)
+        while len(expired) < EXPIRE_BATCH:
+            # one at a time and atomically, so two workers never release the same reservation
+            reservation = await self.reservations.find_one_and_update(
+                {"status": "held", "expires_at": {"$lte": now}},
+                {"$set": {"status": "expired", "released_at": now}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            if reservation is None:
+                break
+            await self._put_back({item["product_id"]: item["quantity"] for item in reservation["items"]})
+            expired.append(reservation)
+        self._stats["expired"] += len(expired)
+        return expired
+
+    def stats(self) -> dict:
+        return {"transactions": self.transactions, "ttl": self.ttl, **self._stats}
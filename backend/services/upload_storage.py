@@ -0,0 +1,452 @@
+"""
+Upload storage service for YAMA+ e-commerce platform
+Uploads are content-addressed: the stored name is the SHA-256 of the
+uploaded bytes ({digest}.jpg, plus its variants {digest}_w400.webp...), so
+the same photo uploaded twice is processed and stored once. Public URLs keep
+the /api/uploads/{name} shape.
+
+Bytes live in a pluggable backend:
+- LocalBackend: a directory on disk (served with serve_file / X-Accel-Redirect)
+- S3Backend: any S3-compatible object store (AWS, MinIO, R2...), served by
+  redirecting to a public or presigned URL
+
+The stored_files collection records every blob with its file names, image
+metadata and `refs`, the number of products/reviews/providers/gift box
+products pointing at it. recount_refs rebuilds the counts from those
+collections and prune, after a recount, deletes blobs nobody has referenced
+for a grace period.
+"""
+import os
+import re
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Iterable, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from .static_files import IMMUTABLE_CACHE
+from .image_processing import build_variants
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # Object storage is optional
+    boto3 = None
+    ClientError = Exception
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+UPLOAD_STORAGE = os.environ.get("UPLOAD_STORAGE", "local")  # local | s3
+S3_BUCKET = os.environ.get("S3_BUCKET", "")
+S3_PREFIX = os.environ.get("S3_PREFIX", "uploads/")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")  # e.g. http://localhost:9000 for MinIO
+S3_REGION = os.environ.get("S3_REGION")
+S3_PUBLIC_URL = os.environ.get("S3_PUBLIC_URL")  # CDN / public bucket URL; presigned URLs otherwise
+S3_PRESIGN_EXPIRES = 3600
+
+STORE_COLLECTION = "stored_files"
+STORE_INDEXES = [
+    ([("digest", 1)], {"unique": True}),
+    ([("url", 1)], {"unique": True}),
+    ([("refs", 1), ("updated_at", 1)], {}),
+]
+PRUNE_GRACE = timedelta(days=7)
+NAMES_CACHE_SIZE = 4096
+
+CONTENT_TYPES = {
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "gif": "image/gif",
+    "mp4": "video/mp4",
+    "mov": "video/quicktime",
+    "webm": "video/webm"
+}
+
+# /api/uploads/{digest}.{ext}, absolute or relative
+STORED_URL = re.compile(r"/api/uploads/([0-9a-f]{64})\.[a-z0-9]+$")
+# /api/uploads/{uuid}.jpg and /api/uploads/reviews/{name} from before content addressing
+LEGACY_URL = re.compile(r"/api/uploads/((?:reviews/)?[^/?#\s]+)$")
+VARIANT_SOURCES = {"jpg", "jpeg", "png", "webp"}
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def content_type_for(name: str) -> str:
+    return CONTENT_TYPES.get(name.rsplit(".", 1)[-1].lower(), "application/octet-stream")
+
+
+def stored_url(url: str) -> Optional[str]:
+    """Relative /api/uploads/... URL when `url` points at a content-addressed upload"""
+    match = STORED_URL.search(url or "")
+    return match.group(0) if match else None
+
+
+class LocalBackend:
+    """Files in a directory on this machine"""
+
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, name: str) -> Optional[Path]:
+        return self.root / name
+
+    def url(self, name: str) -> Optional[str]:
+        return None
+
+    def _put(self, name: str, data: bytes):
+        target = self.root / name
+        # Write-then-rename so readers never see a partial file
+        tmp = target.with_name(f".{target.name}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, target)
+
+    async def put(self, name: str, data: bytes, content_type: str):
+        await asyncio.to_thread(self._put, name, data)
+
+    async def read(self, name: str) -> bytes:
+        return await asyncio.to_thread((self.root / name).read_bytes)
+
+    async def exists(self, name: str) -> bool:
+        return await asyncio.to_thread((self.root / name).is_file)
+
+    async def delete(self, name: str):
+        await asyncio.to_thread((self.root / name).unlink, True)
+
+
+class S3Backend:
+    """Objects in an S3-compatible bucket; boto3 calls run in threads"""
+
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = S3_PREFIX, client=None,
+                 public_url: Optional[str] = S3_PUBLIC_URL):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("boto3 is not installed")
+            client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_url = public_url.rstrip("/") if public_url else None
+
+    def key(self, name: str) -> str:
+        return f"{self.prefix}{name}"
+
+    def path(self, name: str) -> Optional[Path]:
+        return None
+
+    def url(self, name: str) -> Optional[str]:
+        if self.public_url:
+            return f"{self.public_url}/{self.key(name)}"
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.key(name)}, ExpiresIn=S3_PRESIGN_EXPIRES
+        )
+
+    async def put(self, name: str, data: bytes, content_type: str):
+        await asyncio.to_thread(
+            self.client.put_object, Bucket=self.bucket, Key=self.key(name), Body=data,
+            ContentType=content_type, CacheControl=IMMUTABLE_CACHE
+        )
+
+    async def read(self, name: str) -> bytes:
+        def get():
+            return self.client.get_object(Bucket=self.bucket, Key=self.key(name))["Body"].read()
+        return await asyncio.to_thread(get)
+
+    async def exists(self, name: str) -> bool:
+        try:
+            await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self.key(name))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    async def delete(self, name: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self.key(name))
+
+
+def create_storage_backend(local_root: Path, storage: str = UPLOAD_STORAGE):
+    """Backend from configuration; falls back to local disk when S3 is unusable"""
+    if storage == "s3":
+        try:
+            if not S3_BUCKET:
+                raise RuntimeError("S3_BUCKET is not set")
+            return S3Backend(S3_BUCKET)
+        except RuntimeError as e:
+            logger.warning(f"S3 upload storage disabled: {e}")
+    return LocalBackend(local_root)
+
+
+class UploadStore:
+    """Content-addressed blobs with reference counts"""
+
+    def __init__(self, db, backend):
+        self.db = db
+        self.backend = backend
+        self.collection = db[STORE_COLLECTION]
+        self._names = OrderedDict()  # filename -> set of stored names (blobs are immutable)
+
+    async def find(self, digest: str) -> Optional[dict]:
+        return await self.collection.find_one({"digest": digest}, {"_id": 0})
+
+    async def save(self, digest: str, filename: str, files: dict, meta: Optional[dict] = None) -> dict:
+        """
+        Store `files` ({name: bytes}, files[filename] being the main one) and
+        record the blob. Concurrent uploads of the same bytes both write the
+        same objects; the first record wins.
+        """
+        for name, data in files.items():
+            await self.backend.put(name, data, content_type_for(name))
+        now = datetime.now(timezone.utc).isoformat()
+        doc = {
+            "digest": digest,
+            "filename": filename,
+            "url": f"/api/uploads/{filename}",
+            "files": sorted(files),
+            "main_size": len(files[filename]),
+            "size": sum(len(data) for data in files.values()),
+            "backend": self.backend.name,
+            "refs": 0,
+            **(meta or {}),
+            "created_at": now,
+            "updated_at": now
+        }
+        try:
+            await self.collection.insert_one(dict(doc))
+        except DuplicateKeyError:
+            return await self.find(digest)
+        return doc
+
+    async def file_names(self, filename: str) -> Optional[set]:
+        """Names stored for an upload (main file and variants), None when unknown"""
+        names = self._names.get(filename)
+        if names is not None:
+            self._names.move_to_end(filename)
+            return names
+        doc = await self.collection.find_one({"filename": filename}, {"_id": 0, "files": 1})
+        if not doc:
+            return None
+        names = set(doc["files"])
+        self._names[filename] = names
+        if len(self._names) > NAMES_CACHE_SIZE:
+            self._names.popitem(last=False)
+        return names
+
+    async def _add_refs(self, urls: Iterable[str], delta: int):
+        # One reference per document, however many times it lists the URL
+        relatives = {stored_url(url) for url in urls or []} - {None}
+        now = datetime.now(timezone.utc).isoformat()
+        for relative in relatives:
+            await self.collection.update_one(
+                {"url": relative}, {"$inc": {"refs": delta}, "$set": {"updated_at": now}}
+            )
+
+    async def retain(self, urls: Iterable[str]):
+        await self._add_refs(urls, 1)
+
+    async def release(self, urls: Iterable[str]):
+        await self._add_refs(urls, -1)
+
+    async def replace(self, old_urls: Iterable[str], new_urls: Iterable[str]):
+        """Move references from old_urls to new_urls (a document's images changed)"""
+        old, new = list(old_urls or []), list(new_urls or [])
+        await self.release([url for url in old if url not in new])
+        await self.retain([url for url in new if url not in old])
+
+    async def prune(self, grace: timedelta = PRUNE_GRACE, dry_run: bool = False) -> dict:
+        """Delete blobs without references whose last change is older than `grace`"""
+        if not dry_run:
+            # counts maintained by the handlers can drift: only trust what the documents say
+            await recount_refs(self.db)
+        cutoff = (datetime.now(timezone.utc) - grace).isoformat()
+        stats = {"blobs": 0, "files": 0, "bytes": 0}
+        async for doc in self.collection.find({"refs": {"$lte": 0}, "updated_at": {"$lt": cutoff}}, {"_id": 0}):
+            if not dry_run:
+                # Drop the record first: if it gained a reference meanwhile, keep the files
+                result = await self.collection.delete_one({"digest": doc["digest"], "refs": {"$lte": 0}})
+                if not result.deleted_count:
+                    continue
+                self._names.pop(doc["filename"], None)
+                for name in doc["files"]:
+                    await self.backend.delete(name)
+            stats["blobs"] += 1
+            stats["files"] += len(doc["files"])
+            stats["bytes"] += doc.get("size", 0)
+        return stats
+
+
+# Collections holding one upload URL in a top-level field
+SINGLE_URL_FIELDS = {
+    "gift_box_products": "image",
+    "gift_box_sizes": "image",
+    "gift_box_wrappings": "image",
+    "gift_box_config": "banner_image",
+    "gift_box_templates": "banner_image",
+    "blog_posts": "image",
+    "campaigns": "banner_image",
+    "partners": "logo_url",
+}
+
+
+def referenced_urls(collection: str, doc: dict) -> list:
+    """Upload URLs a document of one of the REFERENCING_COLLECTIONS points at"""
+    if collection == "products":
+        return list(doc.get("images") or [])
+    if collection == "orders":
+        # the image shown in order history and on invoices, copied at checkout
+        return [item.get("image") for item in doc.get("items") or [] if isinstance(item, dict) and item.get("image")]
+    if collection == "reviews":
+        return [m.get("url") for m in doc.get("media") or [] if isinstance(m, dict) and m.get("url")]
+    if collection == "service_providers":
+        urls = list(doc.get("photos") or [])
+        urls += [p.get("image_url") for p in doc.get("gallery") or [] if isinstance(p, dict) and p.get("image_url")]
+        return urls
+    field = SINGLE_URL_FIELDS.get(collection)
+    if field:
+        return [doc[field]] if doc.get(field) else []
+    return []
+
+
+# Every document type that can hold an /api/upload/image URL: a blob is only
+# pruned when none of them references it, so new consumers must be added here
+REFERENCING_COLLECTIONS = ("products", "orders", "reviews", "service_providers", *SINGLE_URL_FIELDS)
+REFERENCE_PROJECTIONS = {
+    "products": {"_id": 1, "images": 1},
+    "orders": {"_id": 1, "items.image": 1},
+    "reviews": {"_id": 1, "media": 1},
+    "service_providers": {"_id": 1, "photos": 1, "gallery": 1},
+    **{collection: {"_id": 1, field: 1} for collection, field in SINGLE_URL_FIELDS.items()},
+}
+
+
+async def recount_refs(db) -> dict:
+    """Rebuild every blob's `refs` from the documents that reference it"""
+    counts = {}
+    for collection in REFERENCING_COLLECTIONS:
+        async for doc in db[collection].find({}, REFERENCE_PROJECTIONS[collection]):
+            # A provider lists the same photo in `photos` and `gallery`: one reference
+            for relative in {stored_url(url) for url in referenced_urls(collection, doc)} - {None}:
+                counts[relative] = counts.get(relative, 0) + 1
+    now = datetime.now(timezone.utc).isoformat()
+    updated = 0
+    async for doc in db[STORE_COLLECTION].find({}, {"_id": 0, "url": 1, "refs": 1}):
+        refs = counts.get(doc["url"], 0)
+        if doc.get("refs") != refs:
+            await db[STORE_COLLECTION].update_one({"url": doc["url"]}, {"$set": {"refs": refs, "updated_at": now}})
+            updated += 1
+    return {"referenced": len(counts), "updated": updated}
+
+
+def _rewrite_urls(collection: str, doc: dict, mapping: dict) -> dict:
+    """$set for a document whose upload URLs appear in `mapping` (old -> new)"""
+    def new(url):
+        return mapping.get(url, url)
+
+    if collection == "products":
+        return {"images": [new(url) for url in doc.get("images") or []]}
+    if collection == "reviews":
+        return {"media": [
+            {**m, "url": new(m.get("url"))} if isinstance(m, dict) and m.get("url") else m
+            for m in doc.get("media") or []
+        ]}
+    if collection == "orders":
+        # per line: the projection only read items.image, the rest of each line stays as it is
+        return {
+            f"items.{index}.image": new(item["image"])
+            for index, item in enumerate(doc.get("items") or [])
+            if isinstance(item, dict) and item.get("image") in mapping
+        }
+    if collection in SINGLE_URL_FIELDS:
+        field = SINGLE_URL_FIELDS[collection]
+        return {field: new(doc.get(field))}
+    update = {"photos": [new(url) for url in doc.get("photos") or []]}
+    if doc.get("gallery"):
+        update["gallery"] = [
+            {**p, "image_url": new(p.get("image_url"))} if isinstance(p, dict) and p.get("image_url") else p
+            for p in doc["gallery"]
+        ]
+    return update
+
+
+async def migrate_legacy_uploads(db, store: UploadStore, legacy_root: Path, dry_run: bool = False) -> dict:
+    """
+    Move files referenced by legacy /api/uploads/... URLs into the
+    content-addressed store and rewrite the references in every
+    REFERENCING_COLLECTIONS document, then recount refs. Legacy files are left on disk.
+    """
+    stats = {"documents": 0, "files": 0, "deduplicated": 0, "missing": [], "stored": 0}
+    migrated = {}  # legacy relative path -> stored doc (None when the file is missing)
+
+    async def migrate_file(relative_path: str) -> Optional[dict]:
+        if relative_path in migrated:
+            return migrated[relative_path]
+        path = legacy_root / relative_path
+        if not path.is_file():
+            stats["missing"].append(relative_path)
+            migrated[relative_path] = None
+            return None
+        data = await asyncio.to_thread(path.read_bytes)
+        digest = content_hash(data)
+        stats["files"] += 1
+        doc = await store.find(digest)
+        if doc:
+            stats["deduplicated"] += 1
+        elif dry_run:
+            doc = {"url": f"/api/uploads/{digest}.{path.suffix.lstrip('.').lower()}"}
+        else:
+            ext = path.suffix.lstrip(".").lower()
+            if ext in VARIANT_SOURCES and not relative_path.startswith("reviews/"):
+                filename = f"{digest}.jpg"
+                result = await asyncio.to_thread(build_variants, data, filename)
+                doc = await store.save(digest, filename, result["files"],
+                                       {k: result[k] for k in ("width", "height", "widths", "lqip")})
+            else:
+                filename = f"{digest}.{ext}"
+                doc = await store.save(digest, filename, {filename: data})
+            stats["stored"] += 1
+        migrated[relative_path] = doc
+        return doc
+
+    for collection in REFERENCING_COLLECTIONS:
+        async for doc in db[collection].find({}, REFERENCE_PROJECTIONS[collection]):
+            mapping = {}
+            for url in referenced_urls(collection, doc):
+                if stored_url(url):
+                    continue
+                match = LEGACY_URL.search(url)
+                if not match:
+                    continue
+                stored = await migrate_file(match.group(1))
+                if stored:
+                    mapping[url] = stored["url"]
+            if not mapping:
+                continue
+            stats["documents"] += 1
+            if dry_run:
+                continue
+            update = _rewrite_urls(collection, doc, mapping)
+            if collection == "products":
+                placeholders = {}
+                for url in update["images"]:
+                    stored = await store.collection.find_one({"url": url}, {"_id": 0, "lqip": 1, "width": 1, "height": 1})
+                    if stored and "lqip" in stored:
+                        placeholders[url] = stored
+                update["image_placeholders"] = placeholders
+            await db[collection].update_one({"_id": doc["_id"]}, {"$set": update})
+
+    if not dry_run:
+        stats["refs"] = await recount_refs(db)
+    return stats
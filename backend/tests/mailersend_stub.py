@@ -0,0 +1,78 @@
+"""
+Local MailerSend stub for tests and manual runs
+Implements POST /v1/email, POST /v1/bulk-email and GET /v1/bulk-email/{id}
+Addresses containing "invalid" come back as validation errors and
+addresses containing "bounced" as suppressed recipients.
+
+Standalone: python tests/mailersend_stub.py --port 8025
+then start the backend with MAILERSEND_API_URL=http://localhost:8025/v1
+"""
+import uuid
+import argparse
+
+from aiohttp import web
+
+
+class MailerSendStub:
+    def __init__(self, throttle_first: int = 0):
+        self.single_requests = 0
+        self.bulk_requests = 0
+        self.status_requests = 0
+        self.throttle_first = throttle_first  # answer 429 to the first N bulk requests
+        self.batches = {}
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/v1/email", self.send_email)
+        app.router.add_post("/v1/bulk-email", self.send_bulk)
+        app.router.add_get("/v1/bulk-email/{bulk_id}", self.bulk_status)
+        return app
+
+    async def send_email(self, request):
+        self.single_requests += 1
+        await request.json()
+        return web.Response(status=202)
+
+    async def send_bulk(self, request):
+        self.bulk_requests += 1
+        if self.throttle_first > 0:
+            self.throttle_first -= 1
+            return web.json_response({"message": "Too Many Attempts."}, status=429)
+        messages = await request.json()
+        bulk_id = uuid.uuid4().hex[:24]
+        self.batches[bulk_id] = messages
+        return web.json_response(
+            {"message": "The bulk email is being processed.", "bulk_email_id": bulk_id}, status=202
+        )
+
+    async def bulk_status(self, request):
+        self.status_requests += 1
+        bulk_id = request.match_info["bulk_id"]
+        messages = self.batches.get(bulk_id)
+        if messages is None:
+            return web.json_response({"message": "Not found"}, status=404)
+        validation_errors = {}
+        suppressed = {}
+        for index, message in enumerate(messages):
+            email = message["to"][0]["email"]
+            if "invalid" in email:
+                validation_errors[f"message.{index}.to.0.email"] = ["The email must be a valid email address."]
+            elif "bounced" in email:
+                suppressed[uuid.uuid4().hex[:24]] = {"to": [{"email": email, "reasons": ["hard_bounced"]}]}
+        return web.json_response({"data": {
+            "id": bulk_id,
+            "state": "completed",
+            "total_recipients_count": len(messages),
+            "suppressed_recipients_count": len(suppressed),
+            "suppressed_recipients": suppressed or None,
+            "validation_errors_count": len(validation_errors),
+            "validation_errors": validation_errors or None,
+            "messages_id": [uuid.uuid4().hex[:24] for _ in messages]
+        }})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local MailerSend stub")
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+    web.run_app(MailerSendStub().app(), port=args.port)
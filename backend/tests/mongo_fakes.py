@@ -0,0 +1,465 @@
+"""
+In-memory MongoDB stand-ins for the service tests
+FakeDB / FakeCollection / FakeCursor cover the part of the Motor API the
+services use, with MongoDB's matching rules where the tests depend on them:
+- filters: equality (against array elements and dotted paths too), $and,
+  $or, $gt/$gte/$lt/$lte (never across types), $ne, $in, $nin, $exists
+- updates: $set, $unset, $inc, $push, $pull, $setOnInsert (upserts)
+- cursors: sort (nulls first), skip, limit, projections, async iteration
+- unique keys: duplicates raise DuplicateKeyError / BulkWriteError (11000)
+
+Every call is a round trip: it is counted in `calls` and yields to the event
+loop once (bulk writes once per operation), so concurrent coroutines
+interleave the way they do against a server. aggregate() does not run the
+pipeline; it returns the `rows` the collection was created with.
+"""
+import copy
+import asyncio
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Iterable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+DUPLICATE_KEY = 11000
+WRITE_METHODS = (
+    "insert_one", "insert_many", "update_one", "update_many", "find_one_and_update",
+    "find_one_and_delete", "delete_one", "delete_many", "bulk_write"
+)
+# BSON comparison order of the types the tests use
+TYPE_ORDER = {"null": 0, "number": 1, "string": 2, "object": 3, "array": 4, "bool": 5, "date": 6}
+
+
+def _bracket(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, datetime):
+        return "date"
+    return type(value).__name__
+
+
+def _candidates(doc: dict, path: str) -> list:
+    """Values a filter on `path` is tested against: arrays match on any element"""
+    values = [doc]
+    for part in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict) and part in value:
+                found.append(value[part])
+            elif isinstance(value, list):
+                found.extend(item[part] for item in value if isinstance(item, dict) and part in item)
+        values = found
+    expanded = []
+    for value in values:
+        expanded.append(value)
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+def _compare(op: str, value, arg) -> bool:
+    if value is None or arg is None or _bracket(value) != _bracket(arg):
+        return False
+    if op == "$gt":
+        return value > arg
+    if op == "$gte":
+        return value >= arg
+    if op == "$lt":
+        return value < arg
+    return value <= arg
+
+
+def _match_values(values: list, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        return all(_operator(values, op, arg) for op, arg in condition.items())
+    if condition is None and not values:
+        return True
+    return any(value == condition for value in values)
+
+
+def _operator(values: list, op: str, arg) -> bool:
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        return any(_compare(op, value, arg) for value in values)
+    if op == "$ne":
+        return not _match_values(values, arg)
+    if op == "$in":
+        return any(_match_values(values, option) for option in arg)
+    if op == "$nin":
+        return not any(_match_values(values, option) for option in arg)
+    if op == "$exists":
+        return bool(values) == bool(arg)
+    raise NotImplementedError(f"mongo_fakes does not support {op}")
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif not _match_values(_candidates(doc, key), condition):
+            return False
+    return True
+
+
+def _parent(doc: dict, path: str, create: bool = True):
+    """Container holding the last part of a dotted path ("items.0.image" indexes arrays)"""
+    *parents, last = path.split(".")
+    for part in parents:
+        if isinstance(doc, list):
+            doc = doc[int(part)] if part.isdigit() and int(part) < len(doc) else None
+        else:
+            if part not in doc and create:
+                doc[part] = {}
+            doc = doc.get(part)
+        if not isinstance(doc, (dict, list)):
+            return None, last
+    if isinstance(doc, list):
+        if not last.isdigit() or int(last) >= len(doc):
+            return None, last
+        return doc, int(last)
+    return doc, last
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False):
+    """Apply an update document in place"""
+    if not any(key.startswith("$") for key in update):
+        preserved = {"_id": doc["_id"]} if "_id" in doc else {}
+        doc.clear()
+        doc.update(preserved, **copy.deepcopy(update))
+        return
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            parent, field = _parent(doc, path, create=op != "$unset")
+            if parent is None:
+                continue
+            if op in ("$set", "$setOnInsert"):
+                parent[field] = copy.deepcopy(value)
+            elif op == "$unset":
+                if isinstance(parent, list):
+                    parent[field] = None  # array elements are nulled, not removed
+                else:
+                    parent.pop(field, None)
+            elif op == "$inc":
+                parent[field] = parent.get(field, 0) + value
+            elif op == "$push":
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                parent.setdefault(field, []).extend(copy.deepcopy(items))
+            elif op == "$pull":
+                parent[field] = [
+                    item for item in parent.get(field, [])
+                    if not (matches(item, value) if isinstance(value, dict) and isinstance(item, dict) else item == value)
+                ]
+            else:
+                raise NotImplementedError(f"mongo_fakes does not support {op}")
+
+
+def _include(value, paths: list):
+    """Inclusion projection of dotted paths, applied to every element of arrays on the way"""
+    if isinstance(value, list):
+        return [_include(item, paths) for item in value if isinstance(item, (dict, list))]
+    projected = {}
+    for head in dict.fromkeys(path[0] for path in paths):
+        if head not in value:
+            continue
+        rest = [path[1:] for path in paths if path[0] == head]
+        if any(not path for path in rest) or not isinstance(value[head], (dict, list)):
+            projected[head] = value[head]
+        else:
+            projected[head] = _include(value[head], rest)
+    return projected
+
+
+def project(doc: dict, projection: Optional[dict]) -> dict:
+    """Copy of doc restricted by an inclusion or exclusion projection"""
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    included = [key for key, value in projection.items() if value and key != "_id"]
+    if included:
+        projected = _include(doc, [path.split(".") for path in included])
+        if projection.get("_id", 1) and "_id" in doc:
+            projected["_id"] = doc["_id"]
+        return projected
+    for path in (key for key, value in projection.items() if not value):
+        parent, field = _parent(doc, path, create=False)
+        if parent is not None:
+            parent.pop(field, None)
+    return doc
+
+
+def sort_key(doc: dict, field: str):
+    values = _candidates(doc, field)
+    value = values[0] if values else None
+    return TYPE_ORDER.get(_bracket(value), 99), value if value is not None else 0
+
+
+def sort_docs(docs: list, sort) -> list:
+    for field, direction in reversed(sort):
+        docs.sort(key=lambda doc: sort_key(doc, field), reverse=direction < 0)
+    return docs
+
+
+class FakeCursor:
+    def __init__(self, docs: list, projection: Optional[dict] = None):
+        self.docs = docs
+        self.projection = projection
+        self._skip = 0
+        self._limit = 0
+        self._iter = None
+
+    def sort(self, key_or_list, direction: int = 1):
+        sort_docs(self.docs, key_or_list if isinstance(key_or_list, list) else [(key_or_list, direction)])
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _results(self) -> list:
+        docs = self.docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [project(doc, self.projection) for doc in docs]
+
+    async def to_list(self, length: Optional[int]):
+        await asyncio.sleep(0)
+        docs = self._results()
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        self._iter = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    """
+    `unique` names the fields of a unique index; documents missing one of
+    them are left out of it, like a partial index.
+    """
+
+    def __init__(self, docs: Iterable[dict] = (), unique=None, rows: Iterable[dict] = ()):
+        self.docs = [copy.deepcopy(doc) for doc in docs]
+        self.unique = (unique,) if isinstance(unique, str) else unique
+        self.rows = list(rows)
+        self.calls = Counter()
+        self._next_id = len(self.docs) + 1
+
+    @property
+    def round_trips(self) -> int:
+        return sum(self.calls.values())
+
+    @property
+    def writes(self) -> int:
+        return sum(self.calls[method] for method in WRITE_METHODS)
+
+    async def _call(self, method: str):
+        self.calls[method] += 1
+        await asyncio.sleep(0)
+
+    def get(self, query: dict) -> Optional[dict]:
+        """The stored document itself (not a copy), for tests to inspect or edit"""
+        return next((doc for doc in self.docs if matches(doc, query)), None)
+
+    def _key(self, doc: dict):
+        if not self.unique or any(doc.get(field) is None for field in self.unique):
+            return None
+        return tuple(doc.get(field) for field in self.unique)
+
+    def _store(self, doc: dict) -> dict:
+        doc = copy.deepcopy(doc)
+        key = self._key(doc)
+        if key is not None and any(self._key(other) == key for other in self.docs):
+            raise DuplicateKeyError(f"E11000 duplicate key error, {dict(zip(self.unique, key))}", DUPLICATE_KEY)
+        if "_id" not in doc:
+            doc["_id"] = self._next_id
+            self._next_id += 1
+        self.docs.append(doc)
+        return doc
+
+    def _matching(self, query: dict, sort=None) -> list:
+        docs = [doc for doc in self.docs if matches(doc, query)]
+        return sort_docs(docs, sort) if sort else docs
+
+    # ---------- reads ----------
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None, session=None) -> FakeCursor:
+        self.calls["find"] += 1
+        return FakeCursor(self._matching(query or {}), projection)
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None, session=None):
+        await self._call("find_one")
+        doc = self.get(query or {})
+        return project(doc, projection) if doc is not None else None
+
+    async def count_documents(self, query: dict, session=None) -> int:
+        await self._call("count_documents")
+        return len(self._matching(query))
+
+    async def distinct(self, field: str, query: Optional[dict] = None, session=None) -> list:
+        await self._call("distinct")
+        values = []
+        for doc in self._matching(query or {}):
+            for value in _candidates(doc, field) or [None]:
+                if not isinstance(value, list) and value not in values:
+                    values.append(value)
+        return values
+
+    def aggregate(self, pipeline: list, **kwargs) -> FakeCursor:
+        self.calls["aggregate"] += 1
+        return FakeCursor(copy.deepcopy(self.rows))
+
+    # ---------- writes ----------
+
+    async def insert_one(self, doc: dict, session=None):
+        await self._call("insert_one")
+        return SimpleNamespace(inserted_id=self._store(doc)["_id"])
+
+    async def insert_many(self, docs: Iterable[dict], ordered: bool = True, session=None):
+        await self._call("insert_many")
+        inserted, errors = [], []
+        for index, doc in enumerate(docs):
+            try:
+                inserted.append(self._store(doc)["_id"])
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": DUPLICATE_KEY, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted)
+
+    def _upsert(self, query: dict, update: dict) -> dict:
+        doc = {key: copy.deepcopy(value) for key, value in query.items()
+               if not key.startswith("$") and not isinstance(value, dict)}
+        apply_update(doc, update, inserting=True)
+        return self._store(doc)
+
+    def _update(self, query: dict, update: dict, many: bool = False, upsert: bool = False):
+        docs = self._matching(query)
+        if not many:
+            docs = docs[:1]
+        for doc in docs:
+            apply_update(doc, update)
+        upserted_id = None
+        if not docs and upsert:
+            upserted_id = self._upsert(query, update)["_id"]
+        return SimpleNamespace(matched_count=len(docs), modified_count=len(docs), upserted_id=upserted_id)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False, session=None):
+        await self._call("update_one")
+        return self._update(query, update, upsert=upsert)
+
+    async def update_many(self, query: dict, update: dict, upsert: bool = False, session=None):
+        await self._call("update_many")
+        return self._update(query, update, many=True, upsert=upsert)
+
+    async def find_one_and_update(self, query: dict, update: dict, projection: Optional[dict] = None,
+                                  sort=None, upsert: bool = False,
+                                  return_document=ReturnDocument.BEFORE, session=None):
+        await self._call("find_one_and_update")
+        docs = self._matching(query, sort)
+        if not docs:
+            if not upsert:
+                return None
+            doc = self._upsert(query, update)
+            return project(doc, projection) if return_document == ReturnDocument.AFTER else None
+        before = copy.deepcopy(docs[0])
+        apply_update(docs[0], update)
+        return project(docs[0] if return_document == ReturnDocument.AFTER else before, projection)
+
+    async def find_one_and_delete(self, query: dict, projection: Optional[dict] = None, sort=None, session=None):
+        await self._call("find_one_and_delete")
+        docs = self._matching(query, sort)
+        if not docs:
+            return None
+        self.docs.remove(docs[0])
+        return project(docs[0], projection)
+
+    async def delete_one(self, query: dict, session=None):
+        await self._call("delete_one")
+        doc = self.get(query)
+        if doc is not None:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def delete_many(self, query: dict, session=None):
+        await self._call("delete_many")
+        kept = [doc for doc in self.docs if not matches(doc, query)]
+        deleted = len(self.docs) - len(kept)
+        self.docs = kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    async def bulk_write(self, requests: list, ordered: bool = True, session=None):
+        """UpdateOne / UpdateMany / InsertOne / DeleteOne, yielding between operations"""
+        self.calls["bulk_write"] += 1
+        counts = Counter()
+        for request in requests:
+            await asyncio.sleep(0)
+            kind = type(request).__name__
+            if kind == "InsertOne":
+                self._store(request._doc)
+                counts["inserted_count"] += 1
+            elif kind in ("UpdateOne", "UpdateMany"):
+                result = self._update(request._filter, request._doc, many=kind == "UpdateMany",
+                                      upsert=bool(request._upsert))
+                counts["matched_count"] += result.matched_count
+                counts["modified_count"] += result.modified_count
+                counts["upserted_count"] += int(result.upserted_id is not None)
+            elif kind == "DeleteOne":
+                doc = self.get(request._filter)
+                if doc is not None:
+                    self.docs.remove(doc)
+                    counts["deleted_count"] += 1
+            else:
+                raise NotImplementedError(f"mongo_fakes does not support {kind}")
+        return SimpleNamespace(**{key: counts[key] for key in (
+            "inserted_count", "matched_count", "modified_count", "upserted_count", "deleted_count"
+        )})
+
+
+class FakeDB:
+    """Collections by attribute or key, created on first use like Motor's"""
+
+    def __init__(self, **collections):
+        self.collections = {
+            name: value if isinstance(value, FakeCollection) else FakeCollection(value)
+            for name, value in collections.items()
+        }
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        return self.collections.setdefault(name, FakeCollection())
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_") or name == "collections":
+            raise AttributeError(name)
+        return self[name]
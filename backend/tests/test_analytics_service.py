@@ -0,0 +1,85 @@
+"""
+Tests for the analytics aggregation service
+Pipeline structure and shaping of the $facet output into the
+/admin/analytics response
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.analytics import (
+    order_analytics_pipeline,
+    period_totals_pipeline,
+    shape_order_analytics,
+    compute_order_analytics
+)
+
+
+def test_pipeline_is_a_single_facet_with_unwind_for_top_products():
+    pipeline = order_analytics_pipeline("2026-01-01T00:00:00+00:00")
+    assert pipeline[0] == {"$match": {"created_at": {"$gte": "2026-01-01T00:00:00+00:00"}}}
+    facet = pipeline[1]["$facet"]
+    assert set(facet) == {"summary", "orders_by_status", "payment_methods", "daily_chart", "top_products"}
+    assert {"$unwind": "$items"} in facet["top_products"]
+    # Output is bounded whatever the order volume
+    assert {"$limit": 10} in facet["top_products"]
+    assert {"$limit": 30} in facet["daily_chart"]
+
+
+def test_previous_period_is_half_open():
+    pipeline = period_totals_pipeline("2026-01-01", "2026-02-01")
+    assert pipeline[0]["$match"]["created_at"] == {"$gte": "2026-01-01", "$lt": "2026-02-01"}
+
+
+def test_shape_facet_output():
+    facets = {
+        "summary": [{"_id": None, "total_orders": 3, "total_revenue": 45000, "paid_revenue": 30000}],
+        "orders_by_status": [{"_id": "pending", "count": 2}, {"_id": "delivered", "count": 1}],
+        "payment_methods": [{"_id": "wave", "count": 3}],
+        "daily_chart": [
+            {"_id": "2026-03-02", "orders": 1, "revenue": 15000},
+            {"_id": "2026-03-01", "orders": 2, "revenue": 30000}
+        ],
+        "top_products": [{"_id": "prod_1", "name": "Tapis", "quantity": 4, "revenue": 40000}]
+    }
+    shaped = shape_order_analytics(facets)
+    assert shaped["total_orders"] == 3
+    assert shaped["orders_by_status"] == {"pending": 2, "delivered": 1}
+    assert [d["date"] for d in shaped["daily_chart"]] == ["2026-03-01", "2026-03-02"]
+    assert shaped["top_products"][0] == {"product_id": "prod_1", "name": "Tapis", "quantity": 4, "revenue": 40000}
+
+
+def test_empty_period():
+    shaped = shape_order_analytics({"summary": [], "orders_by_status": [], "payment_methods": [],
+                                    "daily_chart": [], "top_products": []})
+    assert shaped["total_orders"] == 0
+    assert shaped["daily_chart"] == []
+
+
+def test_compute_runs_both_aggregations():
+    class Cursor:
+        def __init__(self, rows):
+            self.rows = rows
+
+        async def to_list(self, length):
+            return self.rows
+
+    class Orders:
+        def __init__(self):
+            self.pipelines = []
+
+        def aggregate(self, pipeline, **kwargs):
+            self.pipelines.append(pipeline)
+            if "$facet" in pipeline[1]:
+                return Cursor([{"summary": [{"total_orders": 2, "total_revenue": 10, "paid_revenue": 5}]}])
+            return Cursor([{"orders": 1, "revenue": 4}])
+
+    class DB:
+        orders = Orders()
+
+    result = asyncio.run(compute_order_analytics(DB(), "2026-02-01", "2026-01-01"))
+    assert result["total_orders"] == 2
+    assert (result["previous_orders"], result["previous_revenue"]) == (1, 4)
+    assert len(DB.orders.pipelines) == 2
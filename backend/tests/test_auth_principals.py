@@ -0,0 +1,121 @@
+"""
+Tests for the auth principal cache
+Lookups by token hash, expiry bounded by the token, per-user and per-token
+invalidation, distrust of claims older than a change and relay between workers
+"""
+import sys
+import time
+import asyncio
+from datetime import datetime, timezone
+from pathlib import Path
+
+import jwt
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.cache import FakeSharedStore
+from services.auth_principals import PrincipalCache, token_key
+
+LATER = time.time() + 3600
+
+
+def test_cached_by_token_hash():
+    cache = PrincipalCache(ttl=60)
+    principal = cache.put("tok-1", "u1", {"name": "Awa"}, verified=False, expires_at=LATER)
+    assert cache.get("tok-1") is principal and not principal.verified
+    assert cache.get("tok-2") is None
+    assert token_key("tok-1") != "tok-1" and len(token_key("tok-1")) == 64
+    stats = cache.stats()
+    assert stats["from_claims"] == 1 and stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_never_cached_past_the_token_expiry():
+    cache = PrincipalCache(ttl=60)
+    cache.put("expired", "u1", {}, verified=True, expires_at=time.time() - 1)
+    cache.put("soon", "u1", {}, verified=True, expires_at=time.time() + 0.05)
+    assert cache.get("expired") is None and cache.get("soon") is not None
+    time.sleep(0.06)
+    assert cache.get("soon") is None
+
+
+def test_invalidations():
+    async def scenario():
+        cache = PrincipalCache()
+        issued_at = int(time.time()) - 1
+        for token in ("phone", "laptop"):
+            cache.put(token, "u1", {}, verified=False, expires_at=LATER)
+        cache.put("other", "u2", {}, verified=True, expires_at=LATER)
+        assert cache.claims_trusted("u1", issued_at)
+
+        await cache.invalidate_token("phone")
+        assert cache.get("phone") is None and cache.get("laptop") is not None
+
+        await cache.invalidate_user("u1")
+        assert cache.get("laptop") is None and cache.get("other") is not None
+        # tokens issued before the change must be re-read from Mongo
+        assert not cache.claims_trusted("u1", issued_at)
+        assert cache.claims_trusted("u1", time.time() + 1)
+        assert cache.claims_trusted("u2", issued_at)
+
+    asyncio.run(scenario())
+
+
+def test_invalidations_relayed_to_other_workers():
+    async def scenario():
+        store = FakeSharedStore()
+        worker_a, worker_b = PrincipalCache(), PrincipalCache()
+        for cache in (worker_a, worker_b):
+            cache.attach_shared(store)
+            await cache.start()
+        await asyncio.sleep(0)
+        for cache in (worker_a, worker_b):
+            cache.put("session", "u1", {}, verified=True, expires_at=LATER)
+            cache.put("jwt", "u2", {}, verified=False, expires_at=LATER)
+
+        await worker_a.invalidate_token("session")
+        await worker_a.invalidate_user("u2")
+        await asyncio.sleep(0.01)
+
+        assert worker_b.get("session") is None and worker_b.get("jwt") is None
+        assert not worker_b.claims_trusted("u2", time.time() - 5)
+        assert worker_b.stats()["received_from_other_workers"] == 2
+
+        await worker_a.close()
+        await worker_b.close()
+
+    asyncio.run(scenario())
+
+
+def test_token_reissued_right_after_a_change_is_trusted():
+    async def scenario():
+        cache = PrincipalCache()
+        await cache.invalidate_user("u1")
+        # update_profile replaces the cookie in the same request; iat is whole seconds
+        token = jwt.encode({"user_id": "u1", "iat": datetime.now(timezone.utc)}, "secret", algorithm="HS256")
+        issued_at = jwt.decode(token, "secret", algorithms=["HS256"])["iat"]
+        assert cache.claims_trusted("u1", issued_at)
+
+        # same after a restart, from the marker persisted on the user
+        after_restart = PrincipalCache()
+        after_restart.restore_changes({"u1": issued_at})
+        assert after_restart.claims_trusted("u1", issued_at)
+        assert not after_restart.claims_trusted("u1", issued_at - 1)
+
+    asyncio.run(scenario())
+
+
+def test_persisted_changes_survive_a_restart():
+    async def scenario():
+        before_restart = PrincipalCache()
+        changed_at = time.time()
+        await before_restart.invalidate_user("u1", changed_at)
+        assert not before_restart.claims_trusted("u1", changed_at - 1)
+
+        # a fresh worker only knows what was persisted on the user
+        after_restart = PrincipalCache()
+        assert after_restart.claims_trusted("u1", changed_at - 1)
+        after_restart.restore_changes({"u1": changed_at})
+        assert not after_restart.claims_trusted("u1", changed_at - 1)
+        assert after_restart.claims_trusted("u1", changed_at + 1)
+
+    asyncio.run(scenario())
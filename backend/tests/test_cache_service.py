@@ -0,0 +1,114 @@
+"""
+Tests for the tiered cache service
+Local LRU+TTL tier, tag invalidation, counters, and two workers sharing a
+fake Redis-protocol store
+"""
+import sys
+import time
+import asyncio
+from pathlib import Path
+from datetime import datetime, timezone
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.cache import LocalLRUCache, TieredCache, FakeSharedStore, _MISSING
+
+
+class TestLocalLRUCache:
+
+    def test_lru_eviction_is_bounded(self):
+        cache = LocalLRUCache(max_entries=3)
+        for key in ("a", "b", "c"):
+            cache.set(key, key.upper(), ttl=60)
+        cache.get("a")  # "b" becomes least recently used
+        cache.set("d", "D", ttl=60)
+
+        assert len(cache) == 3
+        assert cache.get("b") is _MISSING
+        assert cache.get("a") == "A"
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiry(self):
+        cache = LocalLRUCache()
+        cache.set("k", 1, ttl=0.01)
+        time.sleep(0.02)
+        assert cache.get("k") is _MISSING
+        assert cache.stats()["expirations"] == 1
+
+    def test_tag_invalidation_only_touches_tagged_keys(self):
+        cache = LocalLRUCache()
+        cache.set("products:all", [1], ttl=60, tags=["products"])
+        cache.set("flash_sales", [2], ttl=60, tags=["products", "flash_sales"])
+        cache.set("categories", [3], ttl=60, tags=["categories"])
+
+        assert cache.invalidate_tags(["products"]) == 2
+        assert cache.get("flash_sales") is _MISSING
+        assert cache.get("categories") == [3]
+
+    def test_hit_miss_counters(self):
+        cache = LocalLRUCache()
+        cache.set("k", "v", ttl=60)
+        cache.get("k")
+        cache.get("missing")
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+        assert stats["hit_rate"] == 0.5
+
+
+class TestTieredCache:
+
+    def test_local_only(self):
+        async def scenario():
+            cache = TieredCache(LocalLRUCache())
+            await cache.set("k", {"a": 1}, ttl=60, tags=["products"])
+            assert await cache.get("k") == {"a": 1}
+            await cache.invalidate_tags("products")
+            assert await cache.get("k") is None
+            assert cache.stats()["shared"] is None
+
+        asyncio.run(scenario())
+
+    def test_workers_share_values_and_invalidations(self):
+        async def scenario():
+            store = FakeSharedStore()
+            worker_a = TieredCache(LocalLRUCache(), store)
+            worker_b = TieredCache(LocalLRUCache(), store)
+            await worker_a.start()
+            await worker_b.start()
+            await asyncio.sleep(0)
+
+            now = datetime.now(timezone.utc)
+            await worker_a.set("flash_sales", [{"product_id": "p1", "created_at": now}], ttl=300, tags=["flash_sales"])
+
+            # Worker B reads through the shared tier (datetimes come back as ISO strings)
+            value = await worker_b.get("flash_sales")
+            assert value == [{"product_id": "p1", "created_at": now.isoformat()}]
+            assert worker_b.stats()["shared"]["hits"] == 1
+
+            # Invalidation from A clears the shared tier and B's local copy
+            await worker_a.invalidate_tags("flash_sales")
+            await asyncio.sleep(0.01)
+            assert worker_b.local.get("flash_sales") is _MISSING
+            assert await worker_b.get("flash_sales") is None
+
+            await worker_a.close()
+            await worker_b.close()
+
+        asyncio.run(scenario())
+
+    def test_clear_reaches_other_workers(self):
+        async def scenario():
+            store = FakeSharedStore()
+            worker_a = TieredCache(LocalLRUCache(), store)
+            worker_b = TieredCache(LocalLRUCache(), store)
+            await worker_b.start()
+            await asyncio.sleep(0)
+
+            await worker_b.set("products:x", [1], ttl=60, tags=["products"])
+            await worker_a.clear()
+            await asyncio.sleep(0.01)
+            assert len(worker_b.local) == 0
+            assert await worker_b.get("products:x") is None
+            await worker_b.close()
+
+        asyncio.run(scenario())
@@ -0,0 +1,191 @@
+"""
+Tests for atomic cart mutations
+Runs the cart store against an in-memory carts collection that applies each
+update atomically but yields to the event loop before it, the way a network
+round trip does, so concurrent requests interleave as they would against
+Mongo. Also covers the one-time merge of duplicate carts.
+"""
+import sys
+import copy
+import asyncio
+from pathlib import Path
+
+from pymongo.errors import DuplicateKeyError
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.cart_store import (
+    cart_owner, add_cart_item, set_cart_quantity, remove_cart_item, merge_duplicate_carts, ensure_cart_indexes
+)
+
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        if field == "items.product_id":
+            ids = [item["product_id"] for item in doc.get("items", [])]
+            if isinstance(condition, dict):
+                if condition["$ne"] in ids:
+                    return False
+            elif condition not in ids:
+                return False
+        elif field == "_id" and isinstance(condition, dict):
+            if doc["_id"] not in condition["$in"]:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs.sort(key=lambda doc: doc.get(field) or "", reverse=direction < 0)
+        return self
+
+    async def to_list(self, length):
+        return self.docs
+
+
+class FakeCarts:
+    """Atomic per operation, unique per owner (like the partial unique indexes)"""
+
+    def __init__(self, docs=(), unique_owner=True):
+        self.docs = [dict(doc) for doc in docs]
+        self.unique_owner = unique_owner
+        self.round_trips = 0
+        self.indexes = {"_id_": {}, "user_id_1": {}, "session_id_1": {}}
+
+    def _apply(self, doc, update, array_filters):
+        line_id = array_filters[0]["line.product_id"] if array_filters else None
+        for field, value in update.get("$set", {}).items():
+            if field == "items.$[line].quantity":
+                for item in doc["items"]:
+                    if item["product_id"] == line_id:
+                        item["quantity"] = value
+            else:
+                doc[field] = value
+        for field, value in update.get("$inc", {}).items():
+            for item in doc["items"]:
+                if item["product_id"] == line_id:
+                    item["quantity"] += value
+        for field, value in update.get("$push", {}).items():
+            doc.setdefault(field, []).append(dict(value))
+        for field, value in update.get("$pull", {}).items():
+            doc[field] = [item for item in doc.get(field, []) if item["product_id"] != value["product_id"]]
+
+    async def find_one_and_update(self, query, update, array_filters=None, upsert=False,
+                                  projection=None, return_document=None):
+        self.round_trips += 1
+        await asyncio.sleep(0)  # the request travels; other coroutines run meanwhile
+        for doc in self.docs:
+            if _matches(doc, query):
+                self._apply(doc, update, array_filters)
+                return copy.deepcopy(doc)
+        if not upsert:
+            return None
+        doc = {field: value for field, value in query.items() if not isinstance(value, dict) and "." not in field}
+        doc.update(update.get("$setOnInsert", {}))
+        owner = [(field, doc.get(field)) for field in ("user_id", "session_id") if doc.get(field)]
+        if self.unique_owner and any(other.get(f) == v for other in self.docs for f, v in owner):
+            raise DuplicateKeyError("E11000 duplicate key error collection: carts")
+        self._apply(doc, update, array_filters)
+        doc["_id"] = len(self.docs) + 1
+        self.docs.append(doc)
+        return copy.deepcopy(doc)
+
+    def aggregate(self, pipeline):
+        field = pipeline[1]["$group"]["_id"].lstrip("$")
+        counts = {}
+        for doc in self.docs:
+            if isinstance(doc.get(field), str):
+                counts[doc[field]] = counts.get(doc[field], 0) + 1
+        return FakeCursor([{"_id": key, "count": n} for key, n in counts.items() if n > 1])
+
+    def find(self, query):
+        return FakeCursor([copy.deepcopy(doc) for doc in self.docs if _matches(doc, query)])
+
+    async def update_one(self, query, update):
+        for doc in self.docs:
+            if _matches(doc, query):
+                self._apply(doc, update, None)
+                return
+
+    async def delete_many(self, query):
+        self.docs = [doc for doc in self.docs if not _matches(doc, query)]
+
+    async def index_information(self):
+        return dict(self.indexes)
+
+    async def drop_index(self, name):
+        del self.indexes[name]
+
+    async def create_index(self, keys, **options):
+        self.indexes[options.get("name", f"{keys}_1")] = options
+
+
+def quantities(cart):
+    return {item["product_id"]: item["quantity"] for item in cart["items"]}
+
+
+def test_add_update_remove():
+    carts = FakeCarts()
+    owner = cart_owner(None, "sess-1")
+
+    async def scenario():
+        cart = await add_cart_item(carts, owner, "p1", 2)
+        assert quantities(cart) == {"p1": 2} and cart["cart_id"].startswith("cart_")
+        assert quantities(await add_cart_item(carts, owner, "p1", 1)) == {"p1": 3}
+        assert quantities(await add_cart_item(carts, owner, "p2", 1)) == {"p1": 3, "p2": 1}
+        assert quantities(await set_cart_quantity(carts, owner, "p2", 5)) == {"p1": 3, "p2": 5}
+        assert quantities(await set_cart_quantity(carts, owner, "p1", 0)) == {"p2": 5}
+        assert quantities(await remove_cart_item(carts, owner, "p2")) == {}
+        assert await set_cart_quantity(carts, cart_owner(None, "other"), "p1", 1) is None
+
+    asyncio.run(scenario())
+    assert len(carts.docs) == 1
+    assert carts.docs[0]["session_id"] == "sess-1" and carts.docs[0]["user_id"] is None
+
+
+def test_adding_an_existing_line_is_one_round_trip():
+    carts = FakeCarts([{"cart_id": "c1", "user_id": "u1", "items": [{"product_id": "p1", "quantity": 1}]}])
+
+    async def scenario():
+        await add_cart_item(carts, cart_owner("u1", "sess"), "p1", 1)
+
+    asyncio.run(scenario())
+    assert carts.round_trips == 1 and quantities(carts.docs[0]) == {"p1": 2}
+
+
+def test_concurrent_adds_lose_nothing():
+    carts = FakeCarts()
+    owner = cart_owner("u1", None)
+
+    async def scenario():
+        # two tabs hammering the same new cart: same product and different products
+        await asyncio.gather(*(
+            add_cart_item(carts, owner, f"p{n % 3}", 1) for n in range(30)
+        ))
+
+    asyncio.run(scenario())
+    assert len(carts.docs) == 1
+    assert quantities(carts.docs[0]) == {"p0": 10, "p1": 10, "p2": 10}
+
+
+def test_duplicate_carts_are_merged_before_enforcing_one_per_owner():
+    carts = FakeCarts([
+        {"_id": 1, "cart_id": "a", "user_id": "u1", "updated_at": "2024-01-01", "items": [{"product_id": "p1", "quantity": 1}]},
+        {"_id": 2, "cart_id": "b", "user_id": "u1", "updated_at": "2024-02-01",
+         "items": [{"product_id": "p1", "quantity": 2}, {"product_id": "p2", "quantity": 1}]},
+        {"_id": 3, "cart_id": "c", "session_id": "s1", "user_id": None, "updated_at": "2024-01-01", "items": []},
+    ])
+
+    async def scenario():
+        await ensure_cart_indexes(carts)
+        assert await merge_duplicate_carts(carts) == 0
+
+    asyncio.run(scenario())
+    assert [doc["cart_id"] for doc in carts.docs] == ["b", "c"]
+    assert quantities(carts.docs[0]) == {"p1": 3, "p2": 1}
+    assert "user_id_1" not in carts.indexes and carts.indexes["cart_owner_user"]["unique"]
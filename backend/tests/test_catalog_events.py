@@ -0,0 +1,105 @@
+"""
+Tests for the catalog change bus
+Subscriptions by kind, handler isolation and relay between workers
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.cache import FakeSharedStore, LocalLRUCache, TieredCache
+from services.catalog_events import (
+    CatalogEventBus,
+    PRODUCT_UPDATED,
+    STOCK_CHANGED,
+    GIFTBOX_CHANGED
+)
+
+
+def test_handlers_filtered_by_kind():
+    async def scenario():
+        bus = CatalogEventBus()
+        seen_all, seen_stock = [], []
+
+        @bus.on()
+        async def on_any(event):
+            seen_all.append(event.kind)
+
+        @bus.on(STOCK_CHANGED)
+        async def on_stock(event):
+            seen_stock.append(event.product_ids)
+
+        await bus.publish(PRODUCT_UPDATED, ["p1"], ["price"])
+        await bus.publish(STOCK_CHANGED, ["p1", "p2"], ["stock"])
+
+        assert seen_all == [PRODUCT_UPDATED, STOCK_CHANGED]
+        assert seen_stock == [["p1", "p2"]]
+
+    asyncio.run(scenario())
+
+
+def test_failing_handler_does_not_block_others():
+    async def scenario():
+        bus = CatalogEventBus()
+        calls = []
+
+        @bus.on()
+        async def broken(event):
+            raise RuntimeError("boom")
+
+        @bus.on()
+        async def healthy(event):
+            calls.append(event.kind)
+
+        await bus.publish(GIFTBOX_CHANGED, ["gbp_1"])
+        assert calls == [GIFTBOX_CHANGED]
+        assert bus.stats()["handler_errors"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_events_relayed_to_other_workers():
+    async def scenario():
+        store = FakeSharedStore()
+        worker_a, worker_b = CatalogEventBus(), CatalogEventBus()
+        for bus in (worker_a, worker_b):
+            bus.attach_shared(store)
+            await bus.start()
+        await asyncio.sleep(0)
+
+        received_a, received_b = [], []
+        worker_a.subscribe(lambda e: _append(received_a, e))
+        worker_b.subscribe(lambda e: _append(received_b, e))
+
+        await worker_a.publish(PRODUCT_UPDATED, ["p1"], ["images"])
+        await asyncio.sleep(0.01)
+
+        # Publisher handles it locally once, the other worker gets a remote copy
+        assert [(e.kind, e.local) for e in received_a] == [(PRODUCT_UPDATED, True)]
+        assert [(e.kind, e.product_ids, e.local) for e in received_b] == [(PRODUCT_UPDATED, ["p1"], False)]
+
+        await worker_a.close()
+        await worker_b.close()
+
+    asyncio.run(scenario())
+
+
+def test_stock_event_invalidates_tagged_cache():
+    async def scenario():
+        cache = TieredCache(LocalLRUCache())
+        bus = CatalogEventBus()
+
+        @bus.on(STOCK_CHANGED)
+        async def drop_products(event):
+            await cache.invalidate_tags("products")
+
+        await cache.set("products:None:True:None:None:8", [{"stock": 3}], ttl=300, tags=["products"])
+        await bus.publish(STOCK_CHANGED, ["p1"], ["stock"])
+        assert await cache.get("products:None:True:None:None:8") is None
+
+    asyncio.run(scenario())
+
+
+async def _append(target, event):
+    target.append(event)
@@ -0,0 +1,122 @@
+"""
+Tests for the streaming CSV exports
+Quoting, gzip output, no row cap, and the merge join of users with
+per-user order counts
+"""
+import sys
+import csv
+import gzip
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.csv_export import stream_csv, order_rows, client_rows, ORDERS_HEADER, CLIENTS_HEADER
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = list(docs)
+        self.index = 0
+
+    def sort(self, key, direction):
+        self.docs.sort(key=lambda d: d.get(key) or "", reverse=direction < 0)
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.index >= len(self.docs):
+            raise StopAsyncIteration
+        doc = self.docs[self.index]
+        self.index += 1
+        return doc
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return FakeCursor(self.docs)
+
+    def aggregate(self, pipeline, **kwargs):
+        counts = {}
+        for doc in self.docs:
+            if isinstance(doc.get("user_id"), str):
+                counts[doc["user_id"]] = counts.get(doc["user_id"], 0) + 1
+        return FakeCursor(sorted(({"_id": k, "orders": v} for k, v in counts.items()), key=lambda r: r["_id"]))
+
+
+class FakeDB:
+    def __init__(self, users, orders):
+        self.users = FakeCollection(users)
+        self.orders = FakeCollection(orders)
+
+
+def collect(chunks):
+    async def scenario():
+        return b"".join([chunk async for chunk in chunks])
+    return asyncio.run(scenario())
+
+
+def make_orders(count):
+    return [{
+        "order_id": f"ORD-{i:06d}",
+        "created_at": f"2026-01-{(i % 28) + 1:02d}T10:00:00+00:00",
+        "user_id": f"user_{i % 7}" if i % 3 else None,
+        "shipping": {"full_name": "Diop, Awa", "email": "awa@example.sn", "phone": "+221770000000",
+                     "address": 'Rue 10 "Villa 4", Mermoz', "city": "Dakar"},
+        "total": 15000,
+        "order_status": "pending",
+        "payment_method": "wave"
+    } for i in range(count)]
+
+
+def test_orders_export_has_no_row_cap_and_quotes_fields():
+    db = FakeDB([], make_orders(2500))
+    data = collect(stream_csv(ORDERS_HEADER, order_rows(db)))
+    rows = list(csv.reader(data.decode("utf-8").splitlines()))
+    assert rows[0] == ORDERS_HEADER
+    assert len(rows) == 2501
+    assert rows[1][2] == "Diop, Awa"
+    assert rows[1][5] == 'Rue 10 "Villa 4", Mermoz'
+
+
+def test_gzip_output_round_trips():
+    db = FakeDB([], make_orders(1200))
+    plain = collect(stream_csv(ORDERS_HEADER, order_rows(FakeDB([], make_orders(1200)))))
+    compressed = collect(stream_csv(ORDERS_HEADER, order_rows(db), gzip_output=True))
+    assert gzip.decompress(compressed) == plain
+    assert len(compressed) < len(plain)
+
+
+def test_chunks_are_bounded():
+    db = FakeDB([], make_orders(2000))
+
+    async def scenario():
+        return [chunk async for chunk in stream_csv(ORDERS_HEADER, order_rows(db), chunk_rows=100)]
+
+    chunks = asyncio.run(scenario())
+    assert len(chunks) == 20
+    assert max(len(c) for c in chunks) < 20_000
+
+
+def test_clients_export_joins_order_counts():
+    users = [{"user_id": f"user_{i}", "name": f"Client {i}", "email": f"c{i}@example.sn",
+              "created_at": "2025-12-01T00:00:00+00:00", "role": "customer"} for i in range(10)]
+    orders = make_orders(70)
+    expected = {}
+    for order in orders:
+        if order["user_id"]:
+            expected[order["user_id"]] = expected.get(order["user_id"], 0) + 1
+
+    data = collect(stream_csv(CLIENTS_HEADER, client_rows(FakeDB(users, orders))))
+    rows = list(csv.reader(data.decode("utf-8").splitlines()))[1:]
+    assert len(rows) == 10
+    for row in rows:
+        assert int(row[6]) == expected.get(row[0], 0)
@@ -0,0 +1,230 @@
+"""
+Tests for the outbound email queue
+Token bucket pacing, retry/dead-letter handling and campaign progress,
+run against an in-memory collection
+"""
+import sys
+import asyncio
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mongo_fakes import FakeDB, FakeCollection
+from services.email_queue import (
+    EmailQueue,
+    TokenBucket,
+    QueueFullError,
+    QUEUE_COLLECTION,
+    PENDING,
+    SENT,
+    DEAD,
+    retry_delay,
+    is_retryable
+)
+
+
+def queue_db():
+    return FakeDB(**{QUEUE_COLLECTION: FakeCollection(unique=("campaign_id", "to"))})
+
+
+async def recipients(emails):
+    for email in emails:
+        yield {"email": email, "name": ""}
+
+
+class FakeSender:
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.sent = []
+
+    async def __call__(self, to, name, subject, html):
+        if self.failures.get(to):
+            self.failures[to] -= 1
+            return {"success": False, "error": "HTTP 503", "status": 503}
+        if to.startswith("bad"):
+            return {"success": False, "error": "HTTP 422", "status": 422}
+        self.sent.append((to, subject, html))
+        return {"success": True}
+
+
+async def drain(queue):
+    while True:
+        job = await queue.claim()
+        if job is None:
+            return
+        await queue.process(job)
+
+
+def make_queue(db, sender, **kwargs):
+    return EmailQueue(db, sender, render=lambda content: f"<p>{content}</p>", rate=1000, burst=1000, **kwargs)
+
+
+def test_token_bucket_paces_sends():
+    clock = [0.0]
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    async def scenario():
+        original = asyncio.sleep
+        asyncio.sleep = fake_sleep
+        try:
+            bucket = TokenBucket(rate=2, burst=3, clock=lambda: clock[0])
+            for _ in range(7):
+                await bucket.acquire()
+        finally:
+            asyncio.sleep = original
+
+    asyncio.run(scenario())
+    # 3 from the burst, then one token every 0.5s
+    assert abs(clock[0] - 2.0) < 1e-9
+    assert len(sleeps) == 4
+
+
+def test_retry_policy():
+    assert is_retryable({"status": 503})
+    assert is_retryable({"status": 429})
+    assert is_retryable({"error": "timeout"})
+    assert not is_retryable({"status": 422})
+    assert 30 <= retry_delay(1) <= 33
+    assert 120 <= retry_delay(3) <= 132
+    assert retry_delay(20) <= 3600 * 1.1
+
+
+def test_campaign_is_deduplicated_and_completes():
+    async def scenario():
+        db = queue_db()
+        await db.campaigns.insert_one({"campaign_id": "CAMP-1", "subject": "Soldes", "content": "Promo",
+                                       "status": "sending", "sent_count": 0, "failed_count": 0})
+        sender = FakeSender()
+        queue = make_queue(db, sender)
+        emails = ["a@x.sn", "b@x.sn", "a@x.sn", "bad@x.sn"]
+        total = await queue.enqueue_campaign("CAMP-1", recipients(emails))
+        assert total == 3
+
+        await drain(queue)
+        campaign = await db.campaigns.find_one({"campaign_id": "CAMP-1"})
+        assert campaign["sent_count"] == 2
+        assert campaign["failed_count"] == 1
+        assert campaign["status"] == "sent"
+        assert sender.sent[0][1:] == ("Soldes", "<p>Promo</p>")
+
+    asyncio.run(scenario())
+
+
+def test_transient_failures_back_off_then_dead_letter():
+    async def scenario():
+        db = queue_db()
+        sender = FakeSender(failures={"flaky@x.sn": 1, "down@x.sn": 99})
+        queue = make_queue(db, sender, max_attempts=3)
+        await queue.enqueue("flaky@x.sn", "Hi", "<p>1</p>")
+        await queue.enqueue("down@x.sn", "Hi", "<p>2</p>")
+        jobs = db[QUEUE_COLLECTION].docs
+
+        for _ in range(3):
+            await drain(queue)
+            # Retries are scheduled in the future; make them due now
+            for job in jobs:
+                if job["status"] == PENDING:
+                    assert job["next_attempt_at"] > job["created_at"]
+                    job["next_attempt_at"] -= timedelta(hours=2)
+
+        by_to = {job["to"]: job for job in jobs}
+        assert by_to["flaky@x.sn"]["status"] == SENT
+        assert by_to["flaky@x.sn"]["attempts"] == 2
+        assert by_to["down@x.sn"]["status"] == DEAD
+        assert by_to["down@x.sn"]["attempts"] == 3
+
+        assert await queue.retry_dead() == 1
+        assert by_to["down@x.sn"]["status"] == PENDING
+
+    asyncio.run(scenario())
+
+
+def test_workers_deliver_and_backlog_limit():
+    async def scenario():
+        db = queue_db()
+        sender = FakeSender()
+        queue = make_queue(db, sender, concurrency=3, max_pending=5, poll_interval=0.01)
+        for i in range(5):
+            await queue.enqueue(f"user{i}@x.sn", "Hi", "<p>x</p>")
+        try:
+            await queue.ensure_capacity()
+            raise AssertionError("expected QueueFullError")
+        except QueueFullError:
+            pass
+
+        await queue.start()
+        for _ in range(100):
+            if len(sender.sent) == 5:
+                break
+            await asyncio.sleep(0.01)
+        await queue.close()
+        assert len(sender.sent) == 5
+        await queue.ensure_capacity()
+
+    asyncio.run(scenario())
+
+
+async def failing_recipients(emails):
+    for email in emails:
+        yield {"email": email, "name": ""}
+    raise ConnectionError("cursor lost")
+
+
+def test_interrupted_expansion_is_resumed_on_start():
+    async def scenario():
+        db = queue_db()
+        await db.campaigns.insert_one({"campaign_id": "CAMP-1", "subject": "Soldes", "content": "Promo",
+                                       "target_audience": "newsletter", "status": "sending",
+                                       "enqueue_complete": False, "sent_count": 0, "failed_count": 0})
+        queue = make_queue(db, FakeSender(), concurrency=0)
+        await queue.enqueue_campaign("CAMP-1", failing_recipients(["a@x.sn"]))
+        campaign = await db.campaigns.find_one({"campaign_id": "CAMP-1"})
+        assert campaign["enqueue_complete"] is False and campaign["enqueue_error"] == "cursor lost"
+
+        audiences = []
+
+        def audience(target):
+            audiences.append(target)
+            return recipients(["a@x.sn", "b@x.sn"])
+
+        restarted = make_queue(db, FakeSender(), concurrency=0)
+        await restarted.start(audience)
+        await asyncio.gather(*restarted._background)
+        await restarted.close()
+        assert audiences == ["newsletter"]
+        campaign = await db.campaigns.find_one({"campaign_id": "CAMP-1"})
+        assert campaign["enqueue_complete"] is True and "enqueue_error" not in campaign
+        assert campaign["total_recipients"] == 2
+        assert sorted(job["to"] for job in db[QUEUE_COLLECTION].docs) == ["a@x.sn", "b@x.sn"]
+
+    asyncio.run(scenario())
+
+
+def test_retry_all_dead_letters_reopens_each_campaign():
+    async def scenario():
+        db = queue_db()
+        for campaign_id in ("CAMP-1", "CAMP-2"):
+            await db.campaigns.insert_one({"campaign_id": campaign_id, "subject": "S", "content": "C",
+                                           "status": "sending", "sent_count": 0, "failed_count": 0})
+        queue = make_queue(db, FakeSender())
+        await queue.enqueue_campaign("CAMP-1", recipients(["bad1@x.sn", "bad2@x.sn", "ok@x.sn"]))
+        await queue.enqueue_campaign("CAMP-2", recipients(["bad3@x.sn"]))
+        await queue.enqueue("bad4@x.sn", "Hi", "<p>x</p>")
+        await drain(queue)
+        for campaign_id, failed in (("CAMP-1", 2), ("CAMP-2", 1)):
+            campaign = await db.campaigns.find_one({"campaign_id": campaign_id})
+            assert campaign["status"] == "sent" and campaign["failed_count"] == failed
+
+        assert await queue.retry_dead() == 4
+        for campaign_id in ("CAMP-1", "CAMP-2"):
+            campaign = await db.campaigns.find_one({"campaign_id": campaign_id})
+            assert campaign["status"] == "sending" and campaign["failed_count"] == 0
+        assert all(job["status"] != DEAD for job in db[QUEUE_COLLECTION].docs)
+
+    asyncio.run(scenario())
@@ -0,0 +1,192 @@
+"""
+Tests for flash-sale hot inventory counters
+Admission against the counter under heavy concurrency, local sold-out
+rejection, load shedding, all-or-nothing multi-SKU admission and the
+reconciliation with products.stock (units sold, outside changes, end of sale).
+"""
+import sys
+import asyncio
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mongo_fakes import FakeDB
+from services.cache import FakeSharedStore, TieredCache
+from services.hot_inventory import HotInventory, HotSkuBusy, create_hot_inventory
+from services.stock_reservation import StockReservations, InsufficientStock, RESERVATION_COLLECTION
+
+SALE_END = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+
+
+class CountingStore(FakeSharedStore):
+    """FakeSharedStore that yields on each call like a network round trip"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def incrby(self, key, amount):
+        self.calls += 1
+        await asyncio.sleep(0)
+        return await super().incrby(key, amount)
+
+
+def flash(product_id, stock):
+    return {"product_id": product_id, "stock": stock, "is_flash_sale": True, "flash_sale_end": SALE_END}
+
+
+def test_thousands_of_checkouts_on_one_sku():
+    db = FakeDB(products=[flash("hot", 100)])
+    store = CountingStore()
+    inventory = HotInventory(store, db, concurrency=16, queue_limit=5000)
+
+    async def checkout():
+        try:
+            taken = await inventory.admit({"hot": 1})
+        except InsufficientStock:
+            return False
+        await inventory.confirm(taken)
+        return True
+
+    async def scenario():
+        await inventory.refresh()
+        assert inventory.is_hot("hot") and inventory.last_known("hot") == 100
+        results = await asyncio.gather(*(checkout() for _ in range(3000)))
+        assert sum(results) == 100
+        assert db.products.docs[0]["stock"] == 100 and db.products.writes == 0
+        assert await inventory.refresh() == {"hot": 100}
+
+    asyncio.run(scenario())
+    assert db.products.docs[0]["stock"] == 0 and db.products.writes == 1
+    sku = inventory.stats()["skus"]["hot"]
+    assert sku["sold_out"] and sku["admitted"] == 100 and sku["rejected"] == 2900
+    # once sold out, waiting requests were turned away without touching the counter
+    assert store.calls < 3000
+
+
+def test_queue_limit_sheds_load():
+    db = FakeDB(products=[flash("hot", 10)])
+    inventory = HotInventory(CountingStore(), db, concurrency=1, queue_limit=5)
+
+    async def scenario():
+        await inventory.refresh()
+        return await asyncio.gather(*(inventory.admit({"hot": 1}) for _ in range(8)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert sum(isinstance(result, HotSkuBusy) for result in results) == 3
+    assert inventory.stats()["skus"]["hot"]["shed"] == 3
+
+
+def test_multi_sku_admission_is_all_or_nothing():
+    db = FakeDB(products=[flash("a", 5), flash("b", 1), {"product_id": "cold", "stock": 9}])
+    inventory = HotInventory(FakeSharedStore(), db)
+
+    async def scenario():
+        await inventory.refresh()
+        assert not inventory.is_hot("cold")
+        with pytest.raises(InsufficientStock) as error:
+            await inventory.admit({"a": 2, "b": 2})
+        assert error.value.product_ids == ["b"]
+        assert await inventory.admit({"a": 2, "b": 1}) == {"a": 2, "b": 1}
+        await inventory.release({"a": 2, "b": 1})  # order insert failed
+        await inventory.reconcile("a")
+        await inventory.reconcile("b")
+
+    asyncio.run(scenario())
+    assert inventory.last_known("a") == 5 and inventory.last_known("b") == 1
+    assert [doc["stock"] for doc in db.products.docs] == [5, 1, 9]
+
+
+def test_reconcile_picks_up_outside_changes_and_retires_ended_sales():
+    db = FakeDB(products=[flash("hot", 10)])
+    inventory = HotInventory(FakeSharedStore(), db)
+
+    async def scenario():
+        await inventory.refresh()
+        await inventory.confirm(await inventory.admit({"hot": 4}))
+        db.products.docs[0]["stock"] += 20  # admin restock during the sale
+        await inventory.refresh()
+        assert db.products.docs[0]["stock"] == 26 and inventory.last_known("hot") == 26
+
+        await inventory.confirm(await inventory.admit({"hot": 6}))
+        db.products.docs[0]["is_flash_sale"] = False
+        assert await inventory.refresh() == {"hot": 6}
+        assert not inventory.is_hot("hot") and await inventory.store.keys(f"{inventory.namespace}:*") == []
+
+    asyncio.run(scenario())
+    assert db.products.docs[0]["stock"] == 20
+
+
+def test_sale_retired_by_another_worker_falls_back_to_products():
+    db = FakeDB(products=[flash("hot", 10)])
+    store = FakeSharedStore()
+    worker_a, worker_b = HotInventory(store, db), HotInventory(store, db)
+
+    async def scenario():
+        await worker_a.refresh()
+        await worker_b.refresh()
+        db.products.docs[0]["is_flash_sale"] = False
+        await worker_a.refresh()
+        # worker_b has not refreshed yet: the order goes to products.stock
+        assert await worker_b.admit({"hot": 1}) == {}
+        assert not worker_b.is_hot("hot")
+
+    asyncio.run(scenario())
+    assert db.products.docs[0]["stock"] == 10
+
+
+def test_late_payment_takes_hot_units_from_the_counter():
+    db = FakeDB(products=[flash("hot", 10)])
+    inventory = HotInventory(FakeSharedStore(), db)
+    reservations = StockReservations(None, db, ttl=60, hot=inventory)
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+
+    async def late_order(order_id):
+        await reservations.place_order(
+            {"order_id": order_id, "items": [{"product_id": "hot", "quantity": 1}]},
+            hold=True, skip=await inventory.admit({"hot": 1})
+        )
+        await inventory.confirm({"hot": 1})
+        db[RESERVATION_COLLECTION].get({"order_id": order_id})["expires_at"] = past
+        await reservations.expire_due()  # one unit back on products.stock
+
+    async def scenario():
+        await inventory.refresh()
+        await late_order("late")
+        await inventory.refresh()  # the unit put back reaches the counter
+        assert inventory.last_known("hot") == 10
+        assert await reservations.commit("late")
+        assert inventory.last_known("hot") == 9 and db.products.get({})["stock"] == 10
+
+        await late_order("short")
+        await inventory.confirm(await inventory.admit({"hot": 8}))  # sold out, not flushed yet
+        # products.stock still shows the unflushed units: the counter has the last word
+        assert db.products.get({})["stock"] == 11
+        assert not await reservations.commit("short")
+        await inventory.refresh()
+
+    asyncio.run(scenario())
+    # 9 units sold; the unit of the order paid too late is back on the shelf
+    assert db.products.get({})["stock"] == 1
+    assert db[RESERVATION_COLLECTION].get({"order_id": "short"})["status"] == "short"
+
+
+def test_clearing_the_cache_keeps_the_counters():
+    store = FakeSharedStore()
+    db = FakeDB(products=[flash("hot", 10)])
+    cache = TieredCache(shared=store)
+    inventory = create_hot_inventory(db, store)
+
+    async def scenario():
+        await cache.set("products:list", [1, 2], ttl=60)
+        await inventory.refresh()
+        await inventory.confirm(await inventory.admit({"hot": 4}))
+        await cache.clear()
+        assert await inventory.refresh() == {"hot": 4}
+
+    asyncio.run(scenario())
+    assert db.products.get({})["stock"] == 6 and inventory.last_known("hot") == 6
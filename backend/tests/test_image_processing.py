@@ -0,0 +1,134 @@
+"""
+Tests for the image processing pool
+Compression output, responsive variants and their selection, 503
+backpressure past the queue limit, and a benchmark:
+event-loop latency (what every other API request waits on) while several
+large uploads are compressed, inline vs in the process pool
+"""
+import io
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+import pytest
+from PIL import Image as PILImage
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.image_processing import ImageProcessor, ImagePoolBusy, compress_image, build_variants, pick_variant
+
+
+def make_png(width=3000, height=2000) -> bytes:
+    image = PILImage.effect_noise((width, height), 64).convert("RGBA")
+    output = io.BytesIO()
+    image.save(output, format="PNG", compress_level=1)
+    return output.getvalue()
+
+
+@pytest.fixture(scope="module")
+def large_png():
+    return make_png()
+
+
+def test_compress_image_outputs_bounded_jpeg(large_png):
+    content, ext = compress_image(large_png)
+    assert ext == "jpg"
+    image = PILImage.open(io.BytesIO(content))
+    assert image.format == "JPEG"
+    assert max(image.size) == 1920
+
+
+def test_queue_limit_rejects_with_busy(large_png):
+    async def scenario():
+        processor = ImageProcessor(workers=1, queue_limit=1)
+        try:
+            tasks = [asyncio.create_task(processor.compress(large_png)) for _ in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(ImagePoolBusy):
+                await processor.compress(large_png)
+            results = await asyncio.gather(*tasks)
+            assert all(ext == "jpg" for _, ext in results)
+            stats = processor.stats()
+            assert stats["rejected"] == 1 and stats["completed"] == 2 and stats["in_flight"] == 0
+        finally:
+            processor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def loop_latency_p99(compress, uploads: int, content: bytes) -> float:
+    """p99 delay of a 5ms ticker (a stand-in for API requests) during concurrent uploads"""
+    async def scenario():
+        delays = []
+        done = asyncio.Event()
+
+        async def ticker():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                delays.append(time.perf_counter() - start - 0.005)
+
+        tick = asyncio.create_task(ticker())
+        await asyncio.gather(*(compress(content) for _ in range(uploads)))
+        done.set()
+        await tick
+        delays.sort()
+        return delays[int(len(delays) * 0.99) - 1] * 1000 if delays else 0.0
+
+    return asyncio.run(scenario())
+
+
+def test_benchmark_loop_latency_stays_flat_with_pool(large_png):
+    async def inline(content):
+        await asyncio.sleep(0)
+        return compress_image(content)
+
+    processor = ImageProcessor(workers=2, queue_limit=8)
+    try:
+        # Warm the pool so process start-up is not measured
+        asyncio.run(processor.compress(large_png))
+        pooled_p99 = loop_latency_p99(processor.compress, 4, large_png)
+    finally:
+        processor.shutdown()
+    inline_p99 = loop_latency_p99(inline, 4, large_png)
+
+    print(f"\nloop p99 latency during 4 uploads: inline {inline_p99:.1f}ms, pool {pooled_p99:.1f}ms")
+    assert pooled_p99 < inline_p99 / 3
+
+
+def test_variants_cover_each_width_in_webp_and_jpeg(large_png):
+    result = build_variants(large_png, "abc.jpg")
+    assert result["widths"] == [200, 400, 800, 1600]
+    assert (result["width"], result["height"]) == (1920, 1280)
+    for width in result["widths"]:
+        webp = PILImage.open(io.BytesIO(result["files"][f"abc_w{width}.webp"]))
+        jpeg = PILImage.open(io.BytesIO(result["files"][f"abc_w{width}.jpg"]))
+        assert (webp.format, jpeg.format) == ("WEBP", "JPEG")
+        assert webp.size[0] == jpeg.size[0] == width
+    assert PILImage.open(io.BytesIO(result["files"]["abc.jpg"])).size == (1920, 1280)
+    assert PILImage.open(io.BytesIO(result["files"]["abc.webp"])).format == "WEBP"
+    assert result["lqip"].startswith("data:image/webp;base64,") and len(result["lqip"]) < 1000
+    # Listing thumbnails are a fraction of the full-size JPEG
+    assert len(result["files"]["abc_w400.webp"]) * 5 < len(result["files"]["abc.jpg"])
+
+
+def test_small_images_skip_wider_variants():
+    result = build_variants(make_png(500, 300), "small.jpg")
+    assert result["widths"] == [200, 400]
+    assert "small_w800.jpg" not in result["files"]
+
+
+def test_pick_variant_by_width_and_accept():
+    stored = {"a.jpg", "a.webp", "a_w200.jpg", "a_w200.webp", "a_w400.jpg", "a_w400.webp"}
+    exists = stored.__contains__
+    webp = "image/avif,image/webp,*/*"
+    assert pick_variant("a.jpg", 300, webp, exists) == "a_w400.webp"
+    assert pick_variant("a.jpg", 300, "image/jpeg", exists) == "a_w400.jpg"
+    assert pick_variant("a.jpg", 150, "", exists) == "a_w200.jpg"
+    # wider than every stored variant: the full-size file
+    assert pick_variant("a.jpg", 700, webp, exists) == "a.webp"
+    assert pick_variant("a.jpg", None, "", exists) == "a.jpg"
+    # uploads without derivatives are served as stored
+    assert pick_variant("b.gif", 200, webp, exists) == "b.gif"
+    assert pick_variant("old.jpg", 200, webp, exists) == "old.jpg"
@@ -0,0 +1,114 @@
+"""
+Tests for the MailerSend bulk path
+Bulk report parsing, and a campaign plus a workflow email delivered through
+the queue against the local MailerSend stub
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+import aiohttp
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mailersend_stub import MailerSendStub
+from test_email_queue import queue_db, recipients
+from services.mailersend_bulk import MailerSendBulkClient, bulk_outcomes
+from services.email_queue import EmailQueue, QUEUE_COLLECTION, BULK_COLLECTION, SENT, DEAD, PENDING
+
+
+def test_bulk_outcomes_maps_errors_to_messages():
+    report = {
+        "state": "completed",
+        "validation_errors": {"message.1.to.0.email": ["The email must be a valid email address."]},
+        "suppressed_recipients": {"abc": {"to": [{"email": "Gone@x.sn", "reasons": ["hard_bounced"]}]}}
+    }
+    outcomes = bulk_outcomes(report, ["a@x.sn", "oops", "gone@x.sn"])
+    assert outcomes[0] == {"success": True}
+    assert outcomes[1]["status"] == 422 and "valid email" in outcomes[1]["error"]
+    assert outcomes[2]["status"] == 422
+    assert all("status" not in o for o in bulk_outcomes({"state": "failed"}, ["a", "b"]))
+
+
+async def with_stub(stub, scenario):
+    server = TestServer(stub.app())
+    await server.start_server()
+    session = aiohttp.ClientSession()
+    try:
+        client = MailerSendBulkClient(
+            api_key="test", base_url=str(server.make_url("/v1")),
+            session_factory=lambda: session, batch_size=100
+        )
+        return await scenario(client)
+    finally:
+        await session.close()
+        await server.close()
+
+
+async def run_queue(queue):
+    while True:
+        jobs = await queue.claim_batch(queue.bulk.batch_size)
+        if not jobs:
+            break
+        await queue.process_batch(jobs)
+    await queue.reconcile()
+
+
+def test_campaign_goes_out_in_bulk_requests():
+    stub = MailerSendStub()
+
+    async def scenario(client):
+        db = queue_db()
+        await db.campaigns.insert_one({"campaign_id": "CAMP-B", "subject": "Nouveautés", "content": "Hello",
+                                       "status": "sending", "sent_count": 0, "failed_count": 0})
+        await db.vip_emails.insert_one({"user_id": "u1", "month": "2026-10", "status": "queued"})
+
+        async def single_sender(*args):
+            raise AssertionError("bulk mode must not use the single-send path")
+
+        queue = EmailQueue(db, single_sender, bulk=client, rate=1000, burst=1000)
+        emails = [f"client{i}@x.sn" for i in range(450)] + ["invalid-address", "bounced@x.sn"]
+        await queue.enqueue_campaign("CAMP-B", recipients(emails))
+        await queue.enqueue("vip@x.sn", "VIP", "<p>VIP</p>",
+                            ref={"collection": "vip_emails", "filter": {"user_id": "u1", "month": "2026-10"}, "field": "status"})
+        await run_queue(queue)
+        return db
+
+    db = asyncio.run(with_stub(stub, scenario))
+    # 453 messages in batches of 100 instead of 453 requests
+    assert stub.bulk_requests == 5
+    assert stub.single_requests == 0
+
+    campaign = db.campaigns.docs[0]
+    assert campaign["sent_count"] == 450
+    assert campaign["failed_count"] == 2
+    assert campaign["status"] == "sent"
+    assert db.vip_emails.docs[0]["status"] == "sent"
+
+    jobs = db[QUEUE_COLLECTION].docs
+    assert sum(1 for j in jobs if j["status"] == SENT) == 451
+    assert {j["to"] for j in jobs if j["status"] == DEAD} == {"invalid-address", "bounced@x.sn"}
+    assert all(b["state"] == "completed" for b in db[BULK_COLLECTION].docs)
+
+
+def test_throttled_bulk_request_is_retried():
+    stub = MailerSendStub(throttle_first=1)
+
+    async def scenario(client):
+        db = queue_db()
+        queue = EmailQueue(db, None, bulk=client, rate=1000, burst=1000)
+        for i in range(3):
+            await queue.enqueue(f"user{i}@x.sn", "Hi", "<p>x</p>")
+        await run_queue(queue)
+        assert all(j["status"] == PENDING and j["attempts"] == 1 for j in db[QUEUE_COLLECTION].docs)
+
+        for job in db[QUEUE_COLLECTION].docs:
+            job["next_attempt_at"] = job["created_at"]
+        await run_queue(queue)
+        return db
+
+    db = asyncio.run(with_stub(stub, scenario))
+    assert stub.bulk_requests == 2
+    assert all(j["status"] == SENT for j in db[QUEUE_COLLECTION].docs)
@@ -0,0 +1,83 @@
+"""
+Tests for keyset pagination
+Walks listings page by page against an in-memory collection that follows
+MongoDB's comparison rules (nulls sort first, ranges do not cross types)
+and checks the pages match one full sorted scan
+"""
+import sys
+import random
+import asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mongo_fakes import FakeCollection, sort_docs
+from services.pagination import paginate, iterate_keyset, encode_cursor, InvalidCursor
+
+
+def make_providers(count):
+    rng = random.Random(7)
+    return [{
+        "_id": i,
+        "provider_id": f"PRV-{i:04d}",
+        "is_premium": rng.choice([True, False, None]),
+        "rating": rng.choice([None, 3.5, 4.0, 4.5, 5.0]),
+        "password": "hash"
+    } for i in range(count)]
+
+
+def walk(collection, query, sort, limit, projection=None):
+    async def scenario():
+        pages, cursor = [], None
+        while True:
+            docs, cursor = await paginate(collection, query, sort, limit, cursor, projection)
+            pages.append(docs)
+            if not cursor:
+                return pages
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("sort", [
+    [("is_premium", -1), ("rating", -1), ("provider_id", -1)],
+    [("rating", 1), ("provider_id", 1)],
+])
+def test_pages_match_full_scan_with_nulls(sort):
+    providers = make_providers(137)
+    collection = FakeCollection(providers)
+    pages = walk(collection, {}, sort, 20, {"_id": 0, "password": 0})
+    assert [len(p) for p in pages] == [20] * 6 + [17]
+    seen = [d["provider_id"] for page in pages for d in page]
+    expected = [d["provider_id"] for d in sort_docs([dict(p) for p in providers], sort)]
+    assert seen == expected
+    assert "password" not in pages[0][0] and "_id" not in pages[0][0]
+
+
+def test_filter_is_kept_across_pages():
+    providers = make_providers(80)
+    collection = FakeCollection(providers)
+    pages = walk(collection, {"is_premium": True}, [("rating", -1), ("provider_id", -1)], 7)
+    seen = [d["provider_id"] for page in pages for d in page]
+    assert sorted(seen) == sorted(p["provider_id"] for p in providers if p["is_premium"] is True)
+    assert len(seen) == len(set(seen))
+
+
+def test_hidden_sort_keys_are_stripped():
+    collection = FakeCollection([{"_id": i, "email": f"u{i}@x.sn", "name": "x"} for i in range(5)])
+
+    async def scenario():
+        return [doc async for doc in iterate_keyset(collection, {}, [("_id", 1)], {"_id": 0, "email": 1}, batch_size=2)]
+
+    docs = asyncio.run(scenario())
+    assert docs == [{"email": f"u{i}@x.sn"} for i in range(5)]
+    assert collection.calls["find"] == 3
+
+
+def test_invalid_cursor_is_rejected():
+    collection = FakeCollection([])
+    with pytest.raises(InvalidCursor):
+        asyncio.run(paginate(collection, {}, [("a", 1), ("b", 1)], 10, "not-a-cursor"))
+    with pytest.raises(InvalidCursor):
+        asyncio.run(paginate(collection, {}, [("a", 1), ("b", 1)], 10, encode_cursor([1])))
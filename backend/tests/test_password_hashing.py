@@ -0,0 +1,81 @@
+"""
+Tests for the password hashing pool
+Hash/verify round trips off the event loop, the bounded queue (HashPoolBusy),
+work-factor upgrades and loop responsiveness while hashes are running
+"""
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+import bcrypt
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.password_hashing import PasswordHasher, HashPoolBusy, hash_cost
+
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(workers=2, rounds=4)
+
+    async def scenario():
+        hashed = await hasher.hash("sécurité")
+        assert hash_cost(hashed) == 4
+        assert await hasher.verify("sécurité", hashed)
+        assert not await hasher.verify("securite", hashed)
+        # legacy hashes made inline with bcrypt still verify
+        legacy = bcrypt.hashpw(b"admin123", bcrypt.gensalt(5)).decode()
+        assert await hasher.verify("admin123", legacy)
+        assert not await hasher.verify("admin123", "")
+        assert not await hasher.verify("admin123", "not-a-hash")
+
+    asyncio.run(scenario())
+    assert hasher.stats()["completed"] == 5
+    hasher.shutdown()
+
+
+def test_needs_rehash_follows_the_configured_cost():
+    hasher = PasswordHasher(rounds=5)
+    assert hasher.needs_rehash(bcrypt.hashpw(b"x", bcrypt.gensalt(4)).decode())
+    assert not hasher.needs_rehash(bcrypt.hashpw(b"x", bcrypt.gensalt(5)).decode())
+    assert not hasher.needs_rehash("")
+    assert hash_cost("$2b$12$abcdefghijklmnopqrstuu") == 12 and hash_cost("plain") is None
+
+
+def test_queue_is_bounded():
+    hasher = PasswordHasher(workers=1, queue_limit=2, rounds=8)
+
+    async def scenario():
+        running = [asyncio.ensure_future(hasher.hash("x")) for _ in range(3)]
+        await asyncio.sleep(0)
+        with pytest.raises(HashPoolBusy):
+            await hasher.hash("x")
+        assert await hasher.rehash("x") is None  # upgrades are skipped, not queued
+        await asyncio.gather(*running)
+        assert await hasher.rehash("x")
+
+    asyncio.run(scenario())
+    stats = hasher.stats()
+    assert stats["rejected"] == 2 and stats["rehashed"] == 1 and stats["in_flight"] == 0
+    hasher.shutdown()
+
+
+def test_event_loop_keeps_ticking_during_a_login_burst():
+    hasher = PasswordHasher(workers=2, rounds=10)
+
+    async def scenario():
+        burst = asyncio.gather(*(hasher.hash("motdepasse") for _ in range(8)))
+        lags = []
+        while not burst.done():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - started - 0.005)
+        await burst
+        return lags
+
+    lags = asyncio.run(scenario())
+    assert len(lags) > 5
+    # inline, each hash would have stalled the loop for its whole duration
+    assert max(lags) < 0.05
+    hasher.shutdown()
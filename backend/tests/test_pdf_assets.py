@@ -0,0 +1,130 @@
+"""
+Tests for the PDF asset cache
+Product images are served by a local aiohttp app: they are fetched once,
+stored as thumbnails and reused from disk; slow or broken hosts fall back
+to the placeholder within the timeout, and the order invoice renders from
+local files only
+"""
+import io
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from PIL import Image as PILImage
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.pdf_assets import PDFAssetCache, THUMBNAIL_SIZE
+from services.pdf_service import generate_order_invoice_pdf
+
+
+def png_bytes(size=(1200, 800)) -> bytes:
+    output = io.BytesIO()
+    PILImage.new("RGB", size, (200, 30, 30)).save(output, format="PNG")
+    return output.getvalue()
+
+
+async def image_host(hits: dict) -> TestServer:
+    async def image(request):
+        hits["image"] = hits.get("image", 0) + 1
+        return web.Response(body=png_bytes(), content_type="image/png")
+
+    async def slow(request):
+        await asyncio.sleep(5)
+        return web.Response(body=png_bytes(), content_type="image/png")
+
+    async def missing(request):
+        hits["missing"] = hits.get("missing", 0) + 1
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_get("/image.png", image)
+    app.router.add_get("/slow.png", slow)
+    app.router.add_get("/missing.png", missing)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+def test_images_are_fetched_once_and_downscaled(tmp_path):
+    async def scenario():
+        hits = {}
+        server = await image_host(hits)
+        cache = PDFAssetCache(tmp_path)
+        try:
+            url = str(server.make_url("/image.png"))
+            first, second = await asyncio.gather(cache.prefetch([url]), cache.prefetch([url, url]))
+            assert first[url] == second[url]
+            assert hits["image"] == 1
+            with PILImage.open(first[url]) as thumbnail:
+                assert max(thumbnail.size) == THUMBNAIL_SIZE
+            assert first["placeholder"] and Path(first["placeholder"]).exists()
+
+            # A new process reuses the thumbnail on disk
+            fresh = PDFAssetCache(tmp_path)
+            assert (await fresh.prefetch([url]))[url] == first[url]
+            assert hits["image"] == 1
+            await fresh.close()
+        finally:
+            await cache.close()
+            await server.close()
+
+    asyncio.run(scenario())
+
+
+def test_unreachable_images_fall_back_within_the_timeout(tmp_path):
+    async def scenario():
+        hits = {}
+        server = await image_host(hits)
+        cache = PDFAssetCache(tmp_path, timeout=0.3)
+        try:
+            slow = str(server.make_url("/slow.png"))
+            missing = str(server.make_url("/missing.png"))
+            started = time.perf_counter()
+            assets = await cache.prefetch([slow, missing, "/assets/images/relative.png"])
+            assert time.perf_counter() - started < 2
+            assert slow not in assets and missing not in assets
+            assert "/assets/images/relative.png" not in assets
+
+            # Failures are remembered: no second request to the broken host
+            await cache.prefetch([missing])
+            assert hits["missing"] == 1
+            assert cache.stats()["failing_urls"] == 2
+        finally:
+            await cache.close()
+            await server.close()
+
+    asyncio.run(scenario())
+
+
+def test_order_invoice_renders_from_local_assets(tmp_path):
+    source = tmp_path / "upload.png"
+    source.write_bytes(png_bytes())
+    resolve = lambda url: str(source) if url.startswith("/api/uploads/") else None
+
+    async def scenario():
+        cache = PDFAssetCache(tmp_path / "assets", resolve=resolve)
+        try:
+            return await cache.prefetch(["/api/uploads/photo.png", "https://unreachable.invalid/x.jpg"])
+        finally:
+            await cache.close()
+
+    assets = asyncio.run(scenario())
+    assert "/api/uploads/photo.png" in assets
+    order = {
+        "order_id": "ord_test",
+        "created_at": "2026-02-01T10:00:00+00:00",
+        "shipping": {"full_name": "Awa Diop", "phone": "770000000"},
+        "items": [
+            {"name": "Robe", "quantity": 1, "price": 15000, "image": "/api/uploads/photo.png"},
+            {"name": "Sac", "quantity": 2, "price": 9000, "image": "https://unreachable.invalid/x.jpg"}
+        ],
+        "subtotal": 33000, "shipping_cost": 0, "total": 33000
+    }
+    pdf = generate_order_invoice_pdf(order, assets=assets).getvalue()
+    assert pdf.startswith(b"%PDF")
+    # logo, product thumbnail and placeholder
+    assert pdf.count(b"/Subtype /Image") >= 3
@@ -0,0 +1,148 @@
+"""
+Tests for the bulk PDF export
+The ZIP is streamed as renders complete, with a bounded number in flight,
+failed documents listed in erreurs.txt and progress recorded; real quote
+PDFs go through PDFRenderer so a repeat export is served from its cache
+"""
+import io
+import sys
+import asyncio
+import zipfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mongo_fakes import FakeDB
+from services.pdf_export import (
+    PDFExportRequest, ExportProgress, export_query, stream_pdf_zip, get_export_progress, EXPORT_COLLECTION
+)
+from services.pdf_renderer import PDFRenderer
+from services.pdf_service import generate_quote_pdf
+
+
+async def collect(chunks) -> list:
+    return [chunk async for chunk in chunks]
+
+
+def test_export_query():
+    assert export_query(PDFExportRequest(ids=["a", "b", "a"]), "quote_id") == {"quote_id": {"$in": ["a", "b"]}}
+    query = export_query(PDFExportRequest(date_from="2026-01-01", date_to="2026-01-31"), "order_id")
+    assert query == {"created_at": {"$gte": "2026-01-01", "$lt": "2026-02-01"}}
+    # a timestamp on the last day is inside the range
+    assert query["created_at"]["$gte"] <= "2026-01-31T23:59:59+00:00" < query["created_at"]["$lt"]
+    with pytest.raises(ValueError):
+        export_query(PDFExportRequest(), "order_id")
+    with pytest.raises(ValueError):
+        export_query(PDFExportRequest(date_from="01/02/2026"), "order_id")
+
+
+def test_zip_is_streamed_in_completion_order_with_bounded_concurrency():
+    state = {"running": 0, "peak": 0}
+
+    def job(index: int, delay: float, fail: bool = False):
+        async def render():
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            try:
+                await asyncio.sleep(delay)
+                if fail:
+                    raise RuntimeError("rendu impossible")
+                return f"%PDF-{index}".encode() * 100
+            finally:
+                state["running"] -= 1
+        return f"doc_{index}.pdf", render
+
+    async def jobs():
+        for index, delay in enumerate([0.2, 0.01, 0.05, 0.01, 0.01, 0.02]):
+            yield job(index, delay, fail=index == 3)
+        yield job(6, 0.01)
+        # same file name twice: both are kept
+        yield "doc_6.pdf", job(7, 0.01)[1]
+
+    async def scenario():
+        db = FakeDB()
+        progress = ExportProgress(db, "quotes", total=8)
+        await progress.start()
+        chunks = await collect(stream_pdf_zip(jobs(), concurrency=3, progress=progress))
+        return db, progress, chunks
+
+    db, progress, chunks = asyncio.run(scenario())
+    # one chunk per completed batch, not one blob at the end
+    assert len(chunks) > 3
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    names = archive.namelist()
+    assert state["peak"] == 3
+    assert names.index("doc_1.pdf") < names.index("doc_0.pdf")
+    assert "doc_3.pdf" not in names
+    assert len([name for name in names if name.startswith("doc_6")]) == 2
+    assert archive.read("doc_2.pdf") == b"%PDF-2" * 100
+    assert "doc_3.pdf: rendu impossible" in archive.read("erreurs.txt").decode()
+
+    saved = asyncio.run(get_export_progress(db, progress.export_id))
+    assert saved["status"] == "completed"
+    assert (saved["done"], saved["failed"], saved["progress"]) == (7, 1, 100.0)
+    assert db[EXPORT_COLLECTION].docs[0]["created_at_dt"]
+
+
+def test_disconnect_cancels_pending_renders():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def jobs():
+        yield "fast.pdf", lambda: asyncio.sleep(0, b"%PDF")
+        for index in range(4):
+            yield f"slow_{index}.pdf", slow
+
+    async def scenario():
+        db = FakeDB()
+        progress = ExportProgress(db, "orders", total=5)
+        await progress.start()
+        stream = stream_pdf_zip(jobs(), concurrency=3, progress=progress)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0)
+        return await get_export_progress(db, progress.export_id)
+
+    saved = asyncio.run(scenario())
+    assert len(cancelled) == 2
+    assert saved["status"] == "cancelled" and saved["done"] == 1
+
+
+def test_repeat_export_reuses_rendered_pdfs(tmp_path):
+    partner = {"partner_id": "PTN-1", "name": "Boutique Test"}
+    items = [{"description": "Installation", "quantity": 1, "unit_price": 15000}]
+    renderer = PDFRenderer(tmp_path, workers=2)
+
+    def jobs():
+        async def generate():
+            for index in range(4):
+                yield f"Devis_DEV-{index}.pdf", lambda index=index: renderer.render(
+                    "quote", f"QUO-{index}", generate_quote_pdf,
+                    quote_number=f"DEV-{index}", partner=partner, items=items, title="Devis", date="01/02/2026"
+                )
+        return generate()
+
+    async def scenario():
+        first = b"".join(await collect(stream_pdf_zip(jobs(), concurrency=4)))
+        second = b"".join(await collect(stream_pdf_zip(jobs(), concurrency=4)))
+        return first, second
+
+    try:
+        first, second = asyncio.run(scenario())
+        stats = renderer.stats()
+    finally:
+        renderer.shutdown()
+    assert stats["renders"] == 4 and stats["memory_hits"] == 4
+    for data in (first, second):
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        assert sorted(archive.namelist()) == [f"Devis_DEV-{index}.pdf" for index in range(4)]
+        assert all(archive.read(name).startswith(b"%PDF") for name in archive.namelist())
@@ -0,0 +1,94 @@
+"""
+Tests for the PDF rendering service
+Renders real documents in the process pool: repeat downloads come from
+memory or disk, a changed document gets a new render, and concurrent
+requests for the same version share one render
+"""
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.pdf_renderer import PDFRenderer
+from services.pdf_service import generate_quote_pdf, generate_order_invoice_pdf
+
+PARTNER = {"partner_id": "PTN-1", "name": "Boutique Test", "city": "Dakar", "country": "Sénégal"}
+ITEMS = [{"description": "Installation", "quantity": 2, "unit_price": 15000}]
+
+
+def quote_args(**overrides):
+    args = dict(quote_number="DEV-2026-0001", partner=PARTNER, items=ITEMS, title="Devis test", date="01/02/2026")
+    args.update(overrides)
+    return args
+
+
+@pytest.fixture
+def renderer(tmp_path):
+    renderer = PDFRenderer(tmp_path, workers=2)
+    yield renderer
+    renderer.shutdown()
+
+
+def test_repeat_downloads_hit_memory_then_disk(renderer, tmp_path):
+    async def scenario():
+        first = await renderer.render("quote", "QUO-1", generate_quote_pdf, **quote_args())
+        started = time.perf_counter()
+        second = await renderer.render("quote", "QUO-1", generate_quote_pdf, **quote_args())
+        return first, second, time.perf_counter() - started
+
+    first, second, repeat_seconds = asyncio.run(scenario())
+    assert first.startswith(b"%PDF") and second == first
+    assert renderer.stats()["renders"] == 1 and renderer.stats()["memory_hits"] == 1
+    assert repeat_seconds < 0.01
+    assert len(list((tmp_path / "quote" / "QUO-1").glob("*.pdf"))) == 1
+
+    # Another worker process (fresh memory) reads the disk copy
+    other = PDFRenderer(tmp_path, workers=1)
+    try:
+        again = asyncio.run(other.render("quote", "QUO-1", generate_quote_pdf, **quote_args()))
+    finally:
+        other.shutdown()
+    assert again == first
+    assert other.stats()["disk_hits"] == 1 and other.stats()["renders"] == 0
+
+
+def test_changed_document_is_rendered_again(renderer, tmp_path):
+    async def scenario():
+        before = await renderer.render("quote", "QUO-2", generate_quote_pdf, **quote_args())
+        after = await renderer.render("quote", "QUO-2", generate_quote_pdf, **quote_args(title="Devis modifié"))
+        return before, after
+
+    before, after = asyncio.run(scenario())
+    assert before != after
+    assert renderer.stats()["renders"] == 2
+    # only the current version is kept on disk
+    assert len(list((tmp_path / "quote" / "QUO-2").glob("*.pdf"))) == 1
+
+    asyncio.run(renderer.invalidate("quote", "QUO-2"))
+    assert not (tmp_path / "quote" / "QUO-2").exists()
+    assert renderer.stats()["memory_entries"] == 0
+
+
+def test_concurrent_requests_share_one_render(renderer):
+    order = {
+        "order_id": "ord_abc123",
+        "created_at": "2026-02-01T10:00:00+00:00",
+        "shipping": {"full_name": "Awa Diop", "address": "Rue 10", "city": "Dakar", "phone": "770000000"},
+        "items": [{"product_id": "p1", "name": "Casque", "price": 25000, "quantity": 1}],
+        "subtotal": 25000, "shipping_cost": 2500, "total": 27500,
+        "payment_method": "wave", "payment_status": "paid"
+    }
+
+    async def scenario():
+        return await asyncio.gather(*(
+            renderer.render("order", order["order_id"], generate_order_invoice_pdf, order=order) for _ in range(5)
+        ))
+
+    results = asyncio.run(scenario())
+    assert all(pdf == results[0] for pdf in results) and results[0].startswith(b"%PDF")
+    stats = renderer.stats()
+    assert stats["renders"] == 1 and stats["shared"] == 4
@@ -0,0 +1,77 @@
+"""
+Tests for the batched product hydration service
+Counts Mongo round-trips with an in-memory collection: hydrating a cart must
+cost one query whatever the number of line items
+"""
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mongo_fakes import FakeDB
+from services.product_hydration import hydrate_products, product_cache, CART_PROJECTION
+
+
+def catalog(count):
+    return FakeDB(products=[
+        {"product_id": f"prod_{i}", "name": f"Produit {i}", "price": 1000 + i,
+         "images": [f"/api/uploads/{i}.jpg"], "stock": 10, "description": "x" * 200}
+        for i in range(count)
+    ])
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    product_cache.invalidate()
+    yield
+    product_cache.invalidate()
+
+
+@pytest.mark.parametrize("cart_size", [1, 15, 100, 1000])
+def test_round_trips_flat_as_cart_grows(cart_size):
+    db = catalog(cart_size)
+    ids = [f"prod_{i}" for i in range(cart_size)]
+
+    start = time.perf_counter()
+    products = asyncio.run(hydrate_products(db, ids, CART_PROJECTION, use_cache=False))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    assert db.products.round_trips == 1
+    assert set(products) == set(ids)
+    print(f"\ncart_size={cart_size} round_trips={db.products.round_trips} elapsed={elapsed_ms:.2f}ms")
+
+
+def test_projection_applied_and_product_id_kept():
+    db = catalog(3)
+    products = asyncio.run(hydrate_products(db, ["prod_0"], {"_id": 0, "name": 1}, use_cache=False))
+    assert products["prod_0"] == {"product_id": "prod_0", "name": "Produit 0"}
+
+
+def test_missing_and_duplicate_ids():
+    db = catalog(2)
+    products = asyncio.run(hydrate_products(db, ["prod_0", "prod_0", "unknown", None], use_cache=False))
+    assert list(products) == ["prod_0"]
+    assert db.products.round_trips == 1
+
+
+def test_empty_list_skips_query():
+    db = catalog(2)
+    assert asyncio.run(hydrate_products(db, [])) == {}
+    assert db.products.round_trips == 0
+
+
+def test_cache_serves_repeat_reads():
+    db = catalog(5)
+    ids = [f"prod_{i}" for i in range(5)]
+    asyncio.run(hydrate_products(db, ids, CART_PROJECTION))
+    asyncio.run(hydrate_products(db, ids, CART_PROJECTION))
+    assert db.products.round_trips == 1
+
+    product_cache.invalidate(["prod_2"])
+    asyncio.run(hydrate_products(db, ids, CART_PROJECTION))
+    assert db.products.round_trips == 2
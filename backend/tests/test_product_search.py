@@ -0,0 +1,95 @@
+"""
+Tests for the product search index
+Accent folding, field weights, typeahead prefixes, the all-words /
+any-word fallback, popularity ranking, filters and incremental refreshes
+from catalog events, against an in-memory products collection
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mongo_fakes import FakeDB, FakeCollection
+from services.product_search import ProductSearchIndex, fold, tokenize
+
+PRODUCTS = [
+    {"product_id": "p1", "name": "Réfrigérateur Samsung 300L", "category": "electromenager",
+     "description": "Grand frigo silencieux", "stock": 4},
+    {"product_id": "p2", "name": "Robe wax été", "category": "mode", "brand": "Yama",
+     "description": "Robe légère en tissu wax", "stock": 10},
+    {"product_id": "p3", "name": "Sac à main cuir", "category": "mode",
+     "description": "Idéal avec une robe de soirée", "stock": 3},
+    {"product_id": "p4", "name": "Climatiseur électroménager split", "category": "electromenager",
+     "description": "Froid rapide", "stock": 0},
+    {"product_id": "p5", "name": "Robes de soirée", "category": "mode", "stock": 2, "featured": True},
+]
+
+
+def build(products=PRODUCTS, sales=()):
+    db = FakeDB(products=products, sales_daily=FakeCollection(rows=sales))
+    index = ProductSearchIndex()
+    asyncio.run(index.build(db))
+    return index, db
+
+
+def ids(index, query, **kwargs):
+    return index.search(query, **kwargs)[0]
+
+
+def test_folding_and_tokens():
+    assert fold("Électroménager & Cœur") == "electromenager coeur"
+    assert tokenize("Les robes de l'été") == ["robe", "ete"]
+    assert tokenize(["Rouge", "Bleus"]) == ["rouge", "bleu"]
+
+
+def test_accents_plurals_and_prefixes():
+    index, _ = build()
+    assert ids(index, "electromenager")[:1] == ["p4"]  # in the name beats in the category
+    assert set(ids(index, "electromenager")) == {"p1", "p4"}
+    assert ids(index, "refri") == ["p1"]
+    assert ids(index, "refrigerateurs") == ["p1"]
+    assert ids(index, "REFRIGERATEUR samsung") == ["p1"]
+    assert ids(index, "refri", prefix=False) == []
+
+
+def test_name_outranks_description_and_all_words_required():
+    index, _ = build()
+    robes = ids(index, "robe")
+    assert robes[-1] == "p3"  # only mentioned in the description
+    assert ids(index, "robe wax") == ["p2"]
+    # no product has both words: fall back to any of them
+    assert set(ids(index, "robe samsung")) == {"p1", "p2", "p3", "p5"}
+
+
+def test_popularity_and_stock_break_ties():
+    twins = [
+        {"product_id": "a", "name": "Chaussure sport", "stock": 5},
+        {"product_id": "b", "name": "Chaussure sport", "stock": 5},
+        {"product_id": "c", "name": "Chaussure sport", "stock": 0},
+    ]
+    index, _ = build(twins, sales=[{"_id": "b", "quantity": 40}, {"_id": "a", "quantity": 2}])
+    assert ids(index, "chaussure") == ["b", "a", "c"]
+
+
+def test_filters_and_paging():
+    index, _ = build()
+    assert ids(index, "robe", filters={"category": "mode", "featured": True}) == ["p5"]
+    assert ids(index, "robe", filters={"category": "mode", "featured": None}) == ids(index, "robe", filters={"category": "mode"})
+    page, total = index.search("robe", limit=1, skip=1)
+    assert total == 3 and page == ids(index, "robe")[1:2]
+    assert index.search("de la", limit=10) == ([], 0)
+
+
+def test_refresh_follows_catalog_changes():
+    index, db = build()
+    db.products.get({"product_id": "p3"})["name"] = "Pochette cuir"
+    db.products.docs.append({"product_id": "p6", "name": "Ventilateur", "stock": 1})
+    db.products.docs.remove(db.products.get({"product_id": "p4"}))
+    asyncio.run(index.refresh(db, ["p3", "p4", "p6"]))
+    assert ids(index, "pochette") == ["p3"]
+    assert ids(index, "sac") == []
+    assert ids(index, "ventil") == ["p6"]
+    assert ids(index, "climatiseur") == []
+    assert index.stats()["products"] == 5
@@ -0,0 +1,131 @@
+"""
+Tests for the web push dispatcher
+Broadcasts to a local push service: every subscription is reached (no
+1000 cap), expired endpoints are deactivated in one bulk_write, and the
+payload decrypts with the subscriber's keys; single-user sends skip the
+broadcast bookkeeping
+"""
+import sys
+import json
+import base64
+import asyncio
+from pathlib import Path
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives import serialization
+from py_vapid import Vapid
+import http_ece
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mongo_fakes import FakeDB
+from services.push_dispatcher import PushDispatcher
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def vapid_private_key() -> str:
+    vapid = Vapid()
+    vapid.generate_keys()
+    return b64(vapid.private_key.private_numbers().private_value.to_bytes(32, "big"))
+
+
+SUBSCRIBER_KEY = ec.generate_private_key(ec.SECP256R1())
+SUBSCRIBER_AUTH = b"0123456789abcdef"
+SUBSCRIBER_KEYS = {
+    "p256dh": b64(SUBSCRIBER_KEY.public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)),
+    "auth": b64(SUBSCRIBER_AUTH)
+}
+
+
+class PushService:
+    def __init__(self):
+        self.received = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handle(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            body = await request.read()
+            await asyncio.sleep(0.001)
+            self.received.append((request.match_info["token"], dict(request.headers), body))
+            token = request.match_info["token"]
+            if token.startswith("gone"):
+                return web.Response(status=410)
+            if token.startswith("error"):
+                return web.Response(status=500)
+            return web.Response(status=201)
+        finally:
+            self.in_flight -= 1
+
+
+def run_broadcast(tokens, concurrency=8, user_id=None):
+    service = PushService()
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post("/push/{token}", service.handle)
+        server = TestServer(app)
+        await server.start_server()
+        docs = [{
+            "_id": i,
+            "endpoint": str(server.make_url(f"/push/{token}")),
+            "keys": SUBSCRIBER_KEYS,
+            "user_id": "user_1",
+            "is_active": True
+        } for i, token in enumerate(tokens)]
+        db = FakeDB(push_subscriptions=docs)
+        dispatcher = PushDispatcher(db, vapid_private_key(), "test@example.sn", concurrency=concurrency)
+        try:
+            if user_id:
+                stats = await dispatcher.send_to_user(user_id, {"title": "Soldes", "body": "-50%"})
+            else:
+                stats = await dispatcher.broadcast({"is_active": True}, {"title": "Soldes", "body": "-50%"}, label="Soldes")
+        finally:
+            await dispatcher.close()
+            await server.close()
+        return stats, db, dispatcher
+
+    stats, db, dispatcher = asyncio.run(scenario())
+    return stats, db, dispatcher, service
+
+
+def test_broadcast_reaches_every_subscription():
+    tokens = [f"ok{i}" for i in range(1200)] + [f"gone{i}" for i in range(30)] + ["error0"]
+    stats, db, dispatcher, service = run_broadcast(tokens)
+    assert stats["total"] == 1231
+    assert stats["sent"] == 1200
+    assert stats["expired"] == 30
+    assert stats["failed"] == 1
+    assert stats["per_second"] > 0
+    assert 1 < service.max_in_flight <= 8
+    # one bulk_write for all expired endpoints
+    assert db.push_subscriptions.calls["bulk_write"] == 1
+    assert sum(1 for d in db.push_subscriptions.docs if not d["is_active"]) == 30
+    assert dispatcher.stats()["broadcasts"][-1]["label"] == "Soldes"
+
+
+def test_payload_is_encrypted_for_the_subscriber():
+    stats, db, dispatcher, service = run_broadcast(["ok0"])
+    token, headers, body = service.received[0]
+    assert headers["Content-Encoding"] == "aes128gcm"
+    assert headers["Authorization"].startswith("vapid t=")
+    payload = json.loads(http_ece.decrypt(body, private_key=SUBSCRIBER_KEY, auth_secret=SUBSCRIBER_AUTH, version="aes128gcm"))
+    assert payload == {"title": "Soldes", "body": "-50%"}
+
+
+def test_user_notification_skips_the_broadcast_history():
+    stats, db, dispatcher, service = run_broadcast(["ok0", "ok1", "gone0"], user_id="user_1")
+    assert stats == {"total": 3, "sent": 2, "failed": 0, "expired": 1}
+    assert len(service.received) == 3
+    assert sum(1 for d in db.push_subscriptions.docs if not d["is_active"]) == 1
+    assert dispatcher.stats()["broadcasts"] == []
+    assert dispatcher.stats()["direct"] == {"sent": 2, "failed": 0, "expired": 1}
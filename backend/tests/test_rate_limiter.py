@@ -0,0 +1,122 @@
+"""
+Tests for the sliding-window rate limiter
+Window accounting, route weights, O(1) eviction, the shared backend over a
+fake Redis-protocol store, and a micro-benchmark of the per-request cost
+"""
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.cache import FakeSharedStore
+from services.rate_limiter import (
+    RateLimiter,
+    LocalRateLimitBackend,
+    SharedRateLimitBackend
+)
+
+WINDOW_START = 1_700_000_040.0  # aligned on a 60s window
+
+
+def run_checks(limiter, client, path, count, now):
+    async def scenario():
+        return [await limiter.check(client, path, now=now) for _ in range(count)]
+    return asyncio.run(scenario())
+
+
+class TestLocalBackend:
+
+    def test_limit_within_window(self):
+        limiter = RateLimiter(LocalRateLimitBackend(), limit=5, window=60, route_costs={})
+        results = run_checks(limiter, "1.2.3.4", "/api/products", 6, WINDOW_START + 1)
+        assert [r.allowed for r in results] == [True] * 5 + [False]
+        assert results[4].remaining == 0
+        assert results[5].retry_after > 0
+
+    def test_previous_window_is_weighted(self):
+        limiter = RateLimiter(LocalRateLimitBackend(), limit=10, window=60, route_costs={})
+        run_checks(limiter, "ip", "/api/products", 10, WINDOW_START + 59)
+        # Halfway through the next window, half of the previous 10 still count
+        results = run_checks(limiter, "ip", "/api/products", 6, WINDOW_START + 90)
+        assert [r.allowed for r in results] == [True] * 5 + [False]
+        # Two windows later everything has expired
+        results = run_checks(limiter, "ip", "/api/products", 10, WINDOW_START + 180)
+        assert all(r.allowed for r in results)
+
+    def test_route_costs(self):
+        limiter = RateLimiter(LocalRateLimitBackend(), limit=35, window=60,
+                              route_costs={"/api/auth/login": 10})
+        results = run_checks(limiter, "ip", "/api/auth/login", 4, WINDOW_START)
+        assert [r.allowed for r in results] == [True, True, True, False]
+        # Cheap routes still have room for the remaining units
+        assert run_checks(limiter, "ip", "/api/products", 1, WINDOW_START)[0].allowed
+
+    def test_clients_are_independent(self):
+        limiter = RateLimiter(LocalRateLimitBackend(), limit=1, window=60, route_costs={})
+        assert run_checks(limiter, "a", "/api/x", 1, WINDOW_START)[0].allowed
+        assert run_checks(limiter, "b", "/api/x", 1, WINDOW_START)[0].allowed
+        assert not run_checks(limiter, "a", "/api/x", 1, WINDOW_START)[0].allowed
+
+    def test_eviction_is_bounded(self):
+        backend = LocalRateLimitBackend(max_entries=100)
+        limiter = RateLimiter(backend, limit=10, window=60, route_costs={})
+
+        async def scenario():
+            for i in range(1000):
+                await limiter.check(f"10.0.{i // 256}.{i % 256}", "/api/products", now=WINDOW_START)
+
+        asyncio.run(scenario())
+        assert len(backend) == 100
+        assert backend.evictions == 900
+
+
+class TestSharedBackend:
+
+    def test_limit_holds_across_workers(self):
+        store = FakeSharedStore()
+        worker_a = RateLimiter(SharedRateLimitBackend(store), limit=6, window=60, route_costs={})
+        worker_b = RateLimiter(SharedRateLimitBackend(store), limit=6, window=60, route_costs={})
+
+        async def scenario():
+            results = []
+            for i in range(8):
+                worker = worker_a if i % 2 == 0 else worker_b
+                results.append(await worker.check("ip", "/api/products", now=WINDOW_START + 5))
+            return results
+
+        results = asyncio.run(scenario())
+        assert [r.allowed for r in results] == [True] * 6 + [False] * 2
+
+    def test_falls_back_to_local_on_store_errors(self):
+        class BrokenStore:
+            async def get(self, key):
+                raise ConnectionError("down")
+
+            async def incrby(self, key, amount):
+                raise ConnectionError("down")
+
+        backend = SharedRateLimitBackend(BrokenStore())
+        limiter = RateLimiter(backend, limit=2, window=60, route_costs={})
+        results = run_checks(limiter, "ip", "/api/products", 3, WINDOW_START)
+        assert [r.allowed for r in results] == [True, True, False]
+        assert backend.errors == 3
+
+
+def test_micro_benchmark_local_check_under_100_microseconds():
+    limiter = RateLimiter(LocalRateLimitBackend(max_entries=1000), limit=10**9, window=60)
+    clients = [f"192.168.{i // 256}.{i % 256}" for i in range(5000)]
+    paths = ["/api/products", "/api/cart", "/api/auth/login", "/api/game/spin"]
+    iterations = 50_000
+
+    async def scenario():
+        start = time.perf_counter()
+        for i in range(iterations):
+            await limiter.check(clients[i % len(clients)], paths[i % len(paths)])
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(scenario())
+    per_request_us = elapsed / iterations * 1_000_000
+    print(f"\nrate limiter: {per_request_us:.2f} µs/request over {iterations} requests")
+    assert per_request_us < 100
@@ -0,0 +1,102 @@
+"""
+Tests for the sales_daily rollup
+Incremental $inc operations on order creation and status transitions,
+applied to an in-memory collection and compared with a full recount
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.sales_rollup import (
+    ORDER_ROW,
+    ROLLUP_COLLECTION,
+    rollup_operations,
+    record_order,
+    record_order_transition
+)
+
+
+class FakeRollupCollection:
+    """Applies UpdateOne($inc/$set, upsert=True) operations to a dict"""
+
+    def __init__(self):
+        self.rows = {}
+        self.bulk_writes = 0
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes += 1
+        for op in operations:
+            key = tuple(sorted(op._filter.items()))
+            row = self.rows.setdefault(key, dict(op._filter))
+            for field, amount in op._doc.get("$inc", {}).items():
+                row[field] = row.get(field, 0) + amount
+            row.update(op._doc.get("$set", {}))
+
+
+class FakeDB:
+    def __init__(self):
+        self.collections = {ROLLUP_COLLECTION: FakeRollupCollection()}
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+
+def make_order(order_id, day, total, items, order_status="pending", payment_status="pending", method="wave"):
+    return {
+        "order_id": order_id,
+        "created_at": f"{day}T10:00:00+00:00",
+        "order_status": order_status,
+        "payment_status": payment_status,
+        "payment_method": method,
+        "total": total,
+        "items": items
+    }
+
+
+def totals(db, **match):
+    rows = [r for r in db[ROLLUP_COLLECTION].rows.values()
+            if all(r.get(k) == v for k, v in match.items())]
+    return sum(r.get("orders", 0) for r in rows), sum(r.get("revenue", 0) for r in rows)
+
+
+def test_operations_for_one_order():
+    order = make_order("ORD-1", "2026-03-01", 25000, [
+        {"product_id": "p1", "name": "Tapis", "price": 10000, "quantity": 2},
+        {"product_id": "p2", "name": "Vase", "price": 5000, "quantity": 1}
+    ])
+    ops = rollup_operations(order)
+    assert len(ops) == 3
+    assert ops[0]._filter == {"day": "2026-03-01", "order_status": "pending", "payment_status": "pending",
+                              "payment_method": "wave", "product_id": ORDER_ROW}
+    assert ops[0]._doc == {"$inc": {"orders": 1, "revenue": 25000}}
+    assert ops[1]._doc["$inc"] == {"orders": 1, "quantity": 2, "revenue": 20000}
+
+
+def test_incremental_updates_match_recount():
+    async def scenario():
+        db = FakeDB()
+        o1 = make_order("ORD-1", "2026-03-01", 20000, [{"product_id": "p1", "name": "Tapis", "price": 10000, "quantity": 2}])
+        o2 = make_order("ORD-2", "2026-03-01", 5000, [{"product_id": "p2", "name": "Vase", "price": 5000, "quantity": 1}])
+        await record_order(db, o1)
+        await record_order(db, o2)
+
+        # PayTech IPN marks ORD-1 paid; a replayed IPN must not double count
+        changes = {"payment_status": "paid", "order_status": "processing"}
+        await record_order_transition(db, o1, changes)
+        writes = db[ROLLUP_COLLECTION].bulk_writes
+        await record_order_transition(db, {**o1, **changes}, changes)
+        assert db[ROLLUP_COLLECTION].bulk_writes == writes
+
+        assert totals(db, product_id=ORDER_ROW) == (2, 25000)
+        assert totals(db, product_id=ORDER_ROW, payment_status="paid") == (1, 20000)
+        assert totals(db, product_id=ORDER_ROW, order_status="pending") == (1, 5000)
+        assert totals(db, product_id="p1", payment_status="pending") == (0, 0)
+        assert totals(db, product_id="p1", payment_status="paid") == (1, 20000)
+
+    asyncio.run(scenario())
+
+
+def test_orders_without_date_are_skipped():
+    assert rollup_operations({"order_id": "x", "total": 10, "items": []}) == []
@@ -0,0 +1,125 @@
+"""
+Tests for the typeahead suggestion trie
+Prefix lookups over product names, brands, categories and professions,
+ranking by popularity, incremental updates (cached tops recomputed only
+where needed) and lookup latency on a large synthetic catalog
+"""
+import sys
+import time
+import random
+import asyncio
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mongo_fakes import FakeDB, FakeCollection, FakeCursor
+from services.search_suggest import SuggestIndex, TOP_CACHE
+
+PRODUCTS = [
+    {"product_id": "p1", "name": "Samsung Galaxy A15", "brand": "Samsung", "category": "electronique"},
+    {"product_id": "p2", "name": "Réfrigérateur Samsung 300L", "brand": "Samsung", "category": "electromenager"},
+    {"product_id": "p3", "name": "Sac à main cuir", "category": "beaute"},
+    {"product_id": "p4", "name": "Salon d'été", "category": "decoration"},
+]
+
+
+def build(products=PRODUCTS, professions=(), popularity=None):
+    db = FakeDB(products=products, service_providers=FakeCollection(rows=professions))
+    index = SuggestIndex()
+    asyncio.run(index.build(db, popularity))
+    return index, db
+
+
+def texts(index, query, limit=8):
+    return [s["text"] for s in index.suggest(query, limit)]
+
+
+def test_prefixes_on_any_word_and_accents():
+    index, _ = build(professions=[{"_id": "Électricien", "providers": 3}, {"_id": "Plombier", "providers": 1}])
+    assert texts(index, "sams") == ["Samsung", "Réfrigérateur Samsung 300L", "Samsung Galaxy A15"]
+    assert texts(index, "refri") == ["Réfrigérateur Samsung 300L"]
+    assert texts(index, "gal sam") == ["Samsung Galaxy A15"]
+    assert texts(index, "electr") == ["Électricien", "electromenager", "electronique"]
+    assert index.suggest("plomb") == [{"text": "Plombier", "type": "profession", "value": "Plombier"}]
+    assert index.suggest("zzz") == [] and index.suggest("  ") == []
+
+
+def test_popularity_orders_suggestions():
+    index, _ = build(popularity={"p4": 1.0})
+    # the brand sums its two products; the sold product beats the unsold ones
+    assert texts(index, "sa", limit=3) == ["Samsung", "Salon d'été", "Réfrigérateur Samsung 300L"]
+    assert [s["type"] for s in index.suggest("sa", 3)] == ["brand", "product", "product"]
+    assert texts(build()[0], "sa", limit=2) == ["Samsung", "Réfrigérateur Samsung 300L"]
+
+
+def test_incremental_updates():
+    index, db = build()
+    assert texts(index, "sac") == ["Sac à main cuir"]
+    db.products.get({"product_id": "p3"}).update(name="Pochette cuir", brand="Yama")
+    db.products.docs.append({"product_id": "p5", "name": "Samsung Galaxy S24", "brand": "Samsung", "category": "electronique"})
+    db.products.docs.remove(db.products.get({"product_id": "p2"}))
+    asyncio.run(index.refresh(db, ["p2", "p3", "p5"], {"p5": 1.0}))
+    assert texts(index, "sac") == []
+    assert texts(index, "poch") == ["Pochette cuir"]
+    assert texts(index, "yam") == ["Yama"]
+    assert texts(index, "galaxy") == ["Samsung Galaxy S24", "Samsung Galaxy A15"]
+    assert texts(index, "refri") == [] and texts(index, "electrom") == []
+    # removing every product of a brand removes the brand
+    db.products.docs.remove(db.products.get({"product_id": "p3"}))
+    asyncio.run(index.refresh(db, ["p3"]))
+    assert texts(index, "yam") == []
+    assert index.stats()["entries"] == {"product": 3, "brand": 1, "category": 2}
+
+
+def test_changes_during_a_build_are_replayed_after_the_swap():
+    db = FakeDB(products=PRODUCTS)
+    index = SuggestIndex()
+    scan = db.products.find
+
+    class SlowScan(FakeCursor):
+        async def __anext__(self):
+            doc = await super().__anext__()
+            if doc["product_id"] == "p2":
+                # the catalog changes while it is being read; the event reaches the old trie
+                db.products.get({"product_id": "p1"})["name"] = "Samsung Galaxy A25"
+                await index.refresh(db, ["p1"])
+            return doc
+
+    def find(query, projection=None):
+        cursor = scan(query, projection)
+        return cursor if "product_id" in query else SlowScan(cursor.docs, projection)
+
+    db.products.find = find
+    asyncio.run(index.build(db))
+    assert texts(index, "galaxy") == ["Samsung Galaxy A25"]
+
+
+def test_professions_are_replaced():
+    index, _ = build(professions=[{"_id": "Plombier", "providers": 2}])
+    index.set_professions({"Menuisier": 1})
+    assert texts(index, "plomb") == [] and texts(index, "menu") == ["Menuisier"]
+
+
+def test_lookups_stay_fast_on_a_large_catalog():
+    rng = random.Random(3)
+    words = ["robe", "wax", "samsung", "galaxy", "climatiseur", "inverter", "sac", "cuir", "montre", "parfum",
+             "refrigerateur", "canape", "tapis", "casque", "bazin", "boubou", "mixeur", "ecran", "chaise", "lampe"]
+    products = [
+        {"product_id": f"p{i}", "name": " ".join(rng.sample(words, 3)) + f" {i}",
+         "brand": rng.choice(["Samsung", "LG", "Yama", None]), "category": rng.choice(["mode", "maison"])}
+        for i in range(20000)
+    ]
+    index, _ = build(products, popularity={f"p{i}": rng.random() for i in range(0, 20000, 7)})
+    queries = ["r", "ro", "sam", "gal sam", "cl", "montre cuir", "ca", "yama", "b", "lamp"]
+    for query in queries:
+        index.suggest(query)  # first lookup fills the cached tops
+    samples = []
+    for _ in range(20):
+        for query in queries:
+            started = time.perf_counter()
+            index.suggest(query)
+            samples.append(time.perf_counter() - started)
+    assert statistics.median(samples) < 0.001
+    assert len(index.suggest("r", limit=TOP_CACHE)) == TOP_CACHE
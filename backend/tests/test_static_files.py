@@ -0,0 +1,115 @@
+"""
+Tests for static file serving
+ETag/Last-Modified revalidation (304), byte ranges (206/416, If-Range)
+and the X-Accel-Redirect hand-off to nginx
+"""
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services import static_files
+from services.static_files import serve_file, parse_range, RangeNotSatisfiable
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "photo.jpg").write_bytes(CONTENT)
+    (tmp_path / "sub").mkdir()
+    app = FastAPI()
+
+    @app.get("/uploads/{filename}")
+    async def get_upload(filename: str, request: Request):
+        response = serve_file(request, tmp_path / filename, "image/jpeg",
+                              headers={"Cache-Control": "public, max-age=60"}, accel_path=filename)
+        if response is None:
+            raise HTTPException(status_code=404)
+        return response
+
+    return TestClient(app)
+
+
+def test_full_response_has_validators(client):
+    response = client.get("/uploads/photo.jpg")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["cache-control"] == "public, max-age=60"
+    assert response.headers["etag"].startswith('"') and response.headers["last-modified"]
+
+
+def test_revalidation_returns_304_without_body(client):
+    first = client.get("/uploads/photo.jpg")
+    etag = first.headers["etag"]
+    for headers in ({"If-None-Match": etag}, {"If-None-Match": f'"other", W/{etag}'},
+                    {"If-Modified-Since": first.headers["last-modified"]}):
+        response = client.get("/uploads/photo.jpg", headers=headers)
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+    assert client.get("/uploads/photo.jpg", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_byte_ranges(client):
+    response = client.get("/uploads/photo.jpg", headers={"Range": "bytes=100-1099"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:1100]
+    assert response.headers["content-range"] == f"bytes 100-1099/{len(CONTENT)}"
+    assert response.headers["content-length"] == "1000"
+
+    response = client.get("/uploads/photo.jpg", headers={"Range": "bytes=-100"})
+    assert response.status_code == 206 and response.content == CONTENT[-100:]
+
+    response = client.get("/uploads/photo.jpg", headers={"Range": "bytes=10000-"})
+    assert response.status_code == 206 and response.content == CONTENT[10000:]
+
+    response = client.get("/uploads/photo.jpg", headers={"Range": "bytes=20000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_if_range_with_stale_etag_sends_whole_file(client):
+    response = client.get("/uploads/photo.jpg", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200 and response.content == CONTENT
+
+
+def test_missing_files_and_directories_are_404(client):
+    assert client.get("/uploads/nope.jpg").status_code == 404
+    assert client.get("/uploads/sub").status_code == 404
+
+
+def test_accel_redirect_hands_body_to_nginx(client, monkeypatch):
+    monkeypatch.setattr(static_files, "UPLOADS_ACCEL_PREFIX", "/_uploads/")
+    response = client.get("/uploads/photo.jpg")
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"] == "/_uploads/photo.jpg"
+    assert response.content == b""
+    # revalidations are still answered by the backend
+    assert client.get("/uploads/photo.jpg", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-0", (0, 0)),
+    ("bytes=5-", (5, 99)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-5", None),
+    ("bytes=abc", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+def test_parse_range_outside_file():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=100-", 100)
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=-0", 100)
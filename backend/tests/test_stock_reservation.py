@@ -0,0 +1,141 @@
+"""
+Tests for all-or-nothing stock reservation
+Runs the reservation service against in-memory collections where each update
+is atomic but a bulk write yields to the event loop between its operations,
+the way the server applies an unordered bulk write to several documents, so
+concurrent checkouts interleave as they would against Mongo.
+"""
+import sys
+import asyncio
+from types import SimpleNamespace
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mongo_fakes import FakeDB, FakeCollection
+from services.stock_reservation import (
+    StockReservations, InsufficientStock, order_quantities, RESERVATION_COLLECTION, HOLD_FIELD
+)
+
+
+class FailingInserts(FakeCollection):
+    async def insert_one(self, doc, session=None):
+        await self._call("insert_one")
+        raise RuntimeError("insert failed")
+
+
+def shop(products, fail_order_inserts=False):
+    return FakeDB(products=products, orders=FailingInserts() if fail_order_inserts else FakeCollection())
+
+
+def stock(db):
+    return {doc["product_id"]: doc["stock"] for doc in db.products.docs}
+
+
+def order(order_id, **quantities):
+    return {"order_id": order_id, "items": [{"product_id": pid, "quantity": qty} for pid, qty in quantities.items()]}
+
+
+def test_order_quantities():
+    assert order_quantities([{"product_id": "p1", "quantity": 1}, {"product_id": "p1", "quantity": 2}]) == {"p1": 3}
+    for quantity in (0, -3):
+        with pytest.raises(ValueError):
+            order_quantities([{"product_id": "p1", "quantity": quantity}])
+
+
+def test_flash_sale_never_oversells():
+    db = shop([{"product_id": "hot", "stock": 50}])
+    reservations = StockReservations(None, db)
+
+    async def checkout(n):
+        try:
+            await reservations.place_order(order(f"o{n}", hot=1))
+            return True
+        except InsufficientStock:
+            return False
+
+    async def scenario():
+        return await asyncio.gather(*(checkout(n) for n in range(500)))
+
+    results = asyncio.run(scenario())
+    assert sum(results) == 50 and len(db.orders.docs) == 50
+    assert stock(db) == {"hot": 0}
+    assert reservations.stats()["rejected"] == 450
+
+
+def test_partial_shortage_gives_back_what_was_taken():
+    db = shop([{"product_id": "p1", "stock": 30}, {"product_id": "p2", "stock": 100}])
+    reservations = StockReservations(None, db)
+
+    async def checkout(n):
+        try:
+            await reservations.place_order(order(f"o{n}", p2=1, p1=1))
+            return True
+        except InsufficientStock as e:
+            assert e.product_ids == ["p1"]
+            return False
+
+    async def scenario():
+        return await asyncio.gather(*(checkout(n) for n in range(200)))
+
+    results = asyncio.run(scenario())
+    assert sum(results) == 30
+    assert stock(db) == {"p1": 0, "p2": 70}
+    assert all(not doc.get(HOLD_FIELD) for doc in db.products.docs)
+
+
+def test_failed_order_insert_restocks():
+    db = shop([{"product_id": "p1", "stock": 5}], fail_order_inserts=True)
+    reservations = StockReservations(None, db)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(reservations.place_order(order("o1", p1=2)))
+    assert stock(db) == {"p1": 5} and db.orders.docs == []
+
+
+def test_online_payment_hold_expires_and_is_reacquired_on_late_payment():
+    db = shop([{"product_id": "p1", "stock": 3}])
+    reservations = StockReservations(None, db, ttl=60)
+    held = db[RESERVATION_COLLECTION]
+
+    async def scenario():
+        await reservations.place_order(order("paid", p1=1), hold=True)
+        await reservations.place_order(order("late", p1=1), hold=True)
+        await reservations.place_order(order("gone", p1=1), hold=True)
+        assert stock(db) == {"p1": 0}
+        assert await reservations.expire_due() == []
+
+        assert await reservations.commit("paid")
+        past = datetime.now(timezone.utc) - timedelta(seconds=1)
+        for doc in held.docs:
+            doc["expires_at"] = past
+        released = await reservations.expire_due()
+        assert sorted(r["order_id"] for r in released) == ["gone", "late"]
+        assert stock(db) == {"p1": 2}
+
+        # paid after expiry: takes the stock again while there is some
+        await reservations.place_order(order("cash", p1=1))
+        assert await reservations.commit("late")
+        assert not await reservations.commit("gone")
+        assert stock(db) == {"p1": 0}
+
+    asyncio.run(scenario())
+    assert {doc["order_id"]: doc["status"] for doc in held.docs} == {
+        "paid": "committed", "late": "committed", "gone": "short"
+    }
+
+
+def test_transactions_detected_on_replica_sets():
+    def client(hello):
+        async def command(name):
+            return hello
+        return SimpleNamespace(admin=SimpleNamespace(command=command))
+
+    for hello, expected in (({"setName": "rs0"}, True), ({"msg": "isdbgrid"}, True), ({}, False)):
+        reservations = StockReservations(client(hello), None)
+        asyncio.run(reservations.detect_transactions())
+        assert reservations.transactions is expected
@@ -0,0 +1,217 @@
+"""
+Tests for content-addressed upload storage
+Deduplication and reference counting against an in-memory collection,
+pruning, the S3 backend against moto's fake S3, and the legacy upload
+migration rewriting products / orders / reviews / service_providers / gift boxes
+"""
+import io
+import sys
+import asyncio
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import pytest
+from PIL import Image as PILImage
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mongo_fakes import FakeDB, FakeCollection
+from services.upload_storage import (
+    UploadStore, LocalBackend, S3Backend, content_hash, stored_url, recount_refs,
+    migrate_legacy_uploads, STORE_COLLECTION
+)
+
+
+def storage_db():
+    return FakeDB(**{STORE_COLLECTION: FakeCollection(unique="digest")})
+
+
+def jpeg_bytes(color=(200, 30, 30), size=(900, 600)) -> bytes:
+    output = io.BytesIO()
+    PILImage.new("RGB", size, color).save(output, format="JPEG")
+    return output.getvalue()
+
+
+def test_same_bytes_are_stored_once_and_refs_count_documents(tmp_path):
+    db = storage_db()
+    store = UploadStore(db, LocalBackend(tmp_path))
+
+    async def scenario():
+        data = b"gif-bytes"
+        digest = content_hash(data)
+        first = await store.save(digest, f"{digest}.gif", {f"{digest}.gif": data})
+        # a concurrent upload of the same bytes keeps the first record
+        second = await store.save(digest, f"{digest}.gif", {f"{digest}.gif": data})
+        assert second["url"] == first["url"] == f"/api/uploads/{digest}.gif"
+        assert len(db[STORE_COLLECTION].docs) == 1
+        assert await store.file_names(f"{digest}.gif") == {f"{digest}.gif"}
+        assert await store.file_names("unknown.jpg") is None
+
+        absolute = f"https://groupeyamaplus.com{first['url']}"
+        await store.retain([first["url"], absolute, "/api/uploads/legacy.jpg", "https://cdn.example/x.jpg"])
+        await store.retain([first["url"]])
+        assert (await store.find(digest))["refs"] == 2
+        await store.replace([first["url"]], [])
+        assert (await store.find(digest))["refs"] == 1
+        return first
+
+    first = asyncio.run(scenario())
+    assert (tmp_path / first["filename"]).read_bytes() == b"gif-bytes"
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_prune_deletes_only_old_unreferenced_blobs(tmp_path):
+    db = storage_db()
+    store = UploadStore(db, LocalBackend(tmp_path))
+
+    async def scenario():
+        docs = {}
+        for name in ("old", "recent", "used"):
+            digest = content_hash(name.encode())
+            docs[name] = await store.save(digest, f"{digest}.gif", {f"{digest}.gif": name.encode()})
+        await store.retain([docs["used"]["url"]])
+        long_ago = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+        for doc in db[STORE_COLLECTION].docs:
+            if doc["digest"] != docs["recent"]["digest"]:
+                doc["updated_at"] = long_ago
+        dry = await store.prune(dry_run=True)
+        stats = await store.prune()
+        return docs, dry, stats
+
+    docs, dry, stats = asyncio.run(scenario())
+    assert dry["blobs"] == stats["blobs"] == 1
+    assert not (tmp_path / docs["old"]["filename"]).exists()
+    assert (tmp_path / docs["recent"]["filename"]).exists()
+    assert (tmp_path / docs["used"]["filename"]).exists()
+    assert {d["filename"] for d in db[STORE_COLLECTION].docs} == {docs["recent"]["filename"], docs["used"]["filename"]}
+
+
+def test_prune_recounts_first_and_keeps_gift_box_images(tmp_path):
+    db = storage_db()
+    store = UploadStore(db, LocalBackend(tmp_path))
+
+    async def scenario():
+        digest = content_hash(b"coffret")
+        doc = await store.save(digest, f"{digest}.gif", {f"{digest}.gif": b"coffret"})
+        # referenced by a gift box whose handler never retained it
+        await db.gift_box_products.insert_one({"product_id": "gbp_1", "image": f"https://groupeyamaplus.com{doc['url']}"})
+        db[STORE_COLLECTION].docs[0]["updated_at"] = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+        stats = await store.prune()
+        return doc, stats
+
+    doc, stats = asyncio.run(scenario())
+    assert stats["blobs"] == 0
+    assert (tmp_path / doc["filename"]).exists()
+    assert db[STORE_COLLECTION].docs[0]["refs"] == 1
+
+
+def test_prune_keeps_images_shown_by_orders_and_pages(tmp_path):
+    db = storage_db()
+    store = UploadStore(db, LocalBackend(tmp_path))
+    month_ago = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+
+    async def scenario():
+        blobs = {}
+        for name in ("ordered", "blog", "wrapping", "banner", "logo", "orphan"):
+            digest = content_hash(name.encode())
+            blobs[name] = await store.save(digest, f"{digest}.png", {f"{digest}.png": name.encode()})
+        # the product was deleted since: only the order still shows its image
+        await db.orders.insert_one({"order_id": "ORD-1", "items": [
+            {"product_id": "gone", "name": "Robe", "quantity": 1, "image": blobs["ordered"]["url"]}
+        ]})
+        await db.blog_posts.insert_one({"post_id": "post_1", "image": blobs["blog"]["url"]})
+        await db.gift_box_wrappings.insert_one({"wrapping_id": "wrap_1", "image": blobs["wrapping"]["url"]})
+        await db.gift_box_config.insert_one({"config_id": "main", "banner_image": blobs["banner"]["url"]})
+        await db.partners.insert_one({"partner_id": "PART-1", "logo_url": blobs["logo"]["url"]})
+        for doc in db[STORE_COLLECTION].docs:
+            doc["updated_at"] = month_ago
+        return blobs, await store.prune()
+
+    blobs, stats = asyncio.run(scenario())
+    assert stats["blobs"] == 1
+    assert not (tmp_path / blobs["orphan"]["filename"]).exists()
+    for name in ("ordered", "blog", "wrapping", "banner", "logo"):
+        assert (tmp_path / blobs[name]["filename"]).exists(), name
+
+
+def test_s3_backend_round_trip():
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="yama-uploads")
+        backend = S3Backend("yama-uploads", prefix="uploads/", client=client, public_url=None)
+
+        async def scenario():
+            await backend.put("a.webp", b"webp-bytes", "image/webp")
+            assert await backend.exists("a.webp")
+            assert not await backend.exists("missing.webp")
+            assert await backend.read("a.webp") == b"webp-bytes"
+            head = client.head_object(Bucket="yama-uploads", Key="uploads/a.webp")
+            assert head["ContentType"] == "image/webp"
+            assert "immutable" in head["CacheControl"]
+            assert "uploads/a.webp" in backend.url("a.webp")
+            await backend.delete("a.webp")
+            assert not await backend.exists("a.webp")
+
+        asyncio.run(scenario())
+    assert backend.path("a.webp") is None
+    assert S3Backend("b", client=object(), public_url="https://cdn.example/").url("x.jpg") == "https://cdn.example/uploads/x.jpg"
+
+
+def test_migration_rewrites_references_and_deduplicates(tmp_path):
+    photo = jpeg_bytes()
+    (tmp_path / "reviews").mkdir()
+    (tmp_path / "aaaa.jpg").write_bytes(photo)
+    (tmp_path / "bbbb.jpg").write_bytes(photo)  # same photo uploaded twice
+    (tmp_path / "reviews" / "review_1.mp4").write_bytes(b"video")
+
+    db = storage_db()
+    db.products.docs = [
+        {"_id": 1, "product_id": "p1", "images": ["/api/uploads/aaaa.jpg", "https://images.unsplash.com/x.jpg"]},
+        {"_id": 2, "product_id": "p2", "images": ["https://groupeyamaplus.com/api/uploads/bbbb.jpg", "/api/uploads/gone.jpg"]},
+    ]
+    db.reviews.docs = [{"_id": 1, "media": [{"type": "video", "url": "/api/uploads/reviews/review_1.mp4"}]}]
+    db.service_providers.docs = [{
+        "_id": 1, "photos": ["/api/uploads/aaaa.jpg"],
+        "gallery": [{"photo_id": "PHT-1", "image_url": "/api/uploads/aaaa.jpg", "caption": "x"}]
+    }]
+    db.orders.docs = [{"_id": 1, "order_id": "ORD-1", "items": [
+        {"product_id": "p1", "name": "Robe", "quantity": 2, "image": "/api/uploads/aaaa.jpg"},
+        {"product_id": "p9", "name": "Sac", "quantity": 1}
+    ]}]
+    store = UploadStore(db, LocalBackend(tmp_path))
+
+    dry = asyncio.run(migrate_legacy_uploads(db, store, tmp_path, dry_run=True))
+    assert dry["documents"] == 5 and not db[STORE_COLLECTION].docs
+
+    stats = asyncio.run(migrate_legacy_uploads(db, store, tmp_path))
+    assert stats["files"] == 3 and stats["stored"] == 2 and stats["deduplicated"] == 1
+    assert stats["missing"] == ["gone.jpg"]
+
+    photo_url = f"/api/uploads/{content_hash(photo)}.jpg"
+    video_url = f"/api/uploads/{content_hash(b'video')}.mp4"
+    assert db.products.docs[0]["images"] == [photo_url, "https://images.unsplash.com/x.jpg"]
+    assert db.products.docs[1]["images"] == [photo_url, "/api/uploads/gone.jpg"]
+    assert db.products.docs[0]["image_placeholders"][photo_url]["lqip"].startswith("data:image/webp")
+    assert db.reviews.docs[0]["media"] == [{"type": "video", "url": video_url}]
+    assert db.service_providers.docs[0]["photos"] == [photo_url]
+    assert db.service_providers.docs[0]["gallery"][0] == {"photo_id": "PHT-1", "image_url": photo_url, "caption": "x"}
+    assert db.orders.docs[0]["items"] == [
+        {"product_id": "p1", "name": "Robe", "quantity": 2, "image": photo_url},
+        {"product_id": "p9", "name": "Sac", "quantity": 1}
+    ]
+
+    photo_doc = asyncio.run(store.find(content_hash(photo)))
+    assert photo_doc["refs"] == 4  # two products, one provider and one order
+    assert photo_doc["widths"] == [200, 400, 800]
+    assert all((tmp_path / name).is_file() for name in photo_doc["files"])
+    assert asyncio.run(store.find(content_hash(b"video")))["refs"] == 1
+    assert stored_url(photo_url) == photo_url
+
+    # running it again changes nothing
+    again = asyncio.run(migrate_legacy_uploads(db, store, tmp_path))
+    assert again["documents"] == 0 and again["refs"]["updated"] == 0
+    assert asyncio.run(recount_refs(db))["referenced"] == 2
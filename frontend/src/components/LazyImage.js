@@ -1,11 +1,13 @@
 import { useState, useRef, useEffect } from 'react';
-import { cn } from '../lib/utils';
+import { cn, getImageSrcSet } from '../lib/utils';
 
 export default function LazyImage({ 
   src, 
   alt, 
   className = "", 
   placeholderSrc = null,
+  blurDataURL = null,
+  sizes = "(max-width: 640px) 50vw, 25vw",
   aspectRatio = null,
   ...props 
 }) {
@@ -49,24 +51,22 @@ export default function LazyImage({
     setIsLoaded(true);
   };
 
-  // Build srcSet for responsive images
-  const buildSrcSet = (originalSrc) => {
-    if (!originalSrc || originalSrc.startsWith('data:')) return null;
-    // For uploaded images, we don't have different sizes
-    // This is a placeholder for future CDN integration
-    return null;
-  };
+  // Uploaded images have width variants on the backend
+  const srcSet = error ? undefined : getImageSrcSet(src);
 
   const aspectRatioStyle = aspectRatio ? { aspectRatio } : {};
+  const blurStyle = blurDataURL && !isLoaded
+    ? { backgroundImage: `url(${blurDataURL})`, backgroundSize: 'cover', backgroundPosition: 'center' }
+    : {};
 
   return (
     <div 
       ref={imgRef}
       className={cn("relative overflow-hidden bg-[#F5F5F7] dark:bg-[#2C2C2E]", className)}
-      style={aspectRatioStyle}
+      style={{ ...aspectRatioStyle, ...blurStyle }}
     >
       {/* Placeholder/Skeleton */}
-      {!isLoaded && (
+      {!isLoaded && !blurDataURL && (
         <div className="absolute inset-0 animate-pulse bg-gradient-to-r from-gray-200 via-gray-100 to-gray-200 dark:from-gray-700 dark:via-gray-600 dark:to-gray-700" />
       )}
       
@@ -74,6 +74,8 @@ export default function LazyImage({
       {isInView && (
         <img
           src={error ? (placeholderSrc || defaultPlaceholder) : src}
+          srcSet={srcSet}
+          sizes={srcSet ? sizes : undefined}
           alt={alt}
           className={cn(
             "w-full h-full object-cover transition-opacity duration-300",
@@ -99,6 +101,7 @@ export function ProductImage({ product, size = "medium", className = "" }) {
   };
 
   const imageUrl = product?.images?.[0] || "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400";
+  const placeholder = product?.image_placeholders?.[imageUrl];
   
   // Add width parameter for optimization if using external URLs
   const optimizedUrl = imageUrl.includes('unsplash.com') 
@@ -109,6 +112,7 @@ export function ProductImage({ product, size = "medium", className = "" }) {
     <LazyImage
       src={optimizedUrl}
       alt={product?.name || "Product"}
+      blurDataURL={placeholder?.lqip}
       className={cn(sizes[size], "rounded-xl", className)}
       aspectRatio={size === "medium" ? "1/1" : undefined}
     />
@@ -2,7 +2,7 @@ import { useState, useEffect } from "react";
 import { Link } from "react-router-dom";
 import { motion, AnimatePresence } from "framer-motion";
 import { Heart, ShoppingBag, Check } from "lucide-react";
-import { formatPrice, calculateDiscount, getImageUrls, cn } from "../lib/utils";
+import { formatPrice, calculateDiscount, getImageUrls, getImageSrcSet, cn } from "../lib/utils";
 import { useCart } from "../contexts/CartContext";
 import { useWishlist } from "../contexts/WishlistContext";
 
@@ -18,6 +18,7 @@ export default function ProductCard({ product, index = 0 }) {
   // Auto-scroll images if product has multiple images (max 3)
   // Use centralized getImageUrls for consistent URL resolution
   const images = getImageUrls(product.images?.slice(0, 3), "/placeholder.jpg");
+  const placeholder = product.image_placeholders?.[product.images?.[currentImageIndex]];
   
   useEffect(() => {
     if (images.length <= 1) return;
@@ -58,13 +59,16 @@ export default function ProductCard({ product, index = 0 }) {
       {/* Image Container with Carousel */}
       <Link
         to={`/product/${product.product_id}`}
-        className="block relative aspect-[4/3] overflow-hidden bg-[#F5F5F7] dark:bg-[#2C2C2E]"
+        className="block relative aspect-[4/3] overflow-hidden bg-[#F5F5F7] dark:bg-[#2C2C2E] bg-cover bg-center"
+        style={placeholder ? { backgroundImage: `url(${placeholder.lqip})` } : undefined}
       >
         {/* Image Carousel */}
         <AnimatePresence mode="wait">
           <motion.img
             key={currentImageIndex}
             src={images[currentImageIndex]}
+            srcSet={getImageSrcSet(images[currentImageIndex])}
+            sizes="(max-width: 640px) 50vw, (max-width: 1024px) 33vw, 25vw"
             alt={product.name}
             className="w-full h-full object-cover"
             initial={{ opacity: 0 }}
@@ -90,6 +90,7 @@ export function getPaymentStatusDisplay(status) {
     pending: { label: "En attente", class: "status-pending" },
     paid: { label: "Payé", class: "status-delivered" },
     failed: { label: "Échoué", class: "status-cancelled" },
+    expired: { label: "Expiré", class: "status-cancelled" },
   };
   return statuses[status] || { label: status, class: "" };
 }
@@ -232,3 +233,18 @@ export function getImageUrls(images, fallback = PLACEHOLDER_IMAGE) {
   }
   return images.map(img => getImageUrl(img, fallback));
 }
+
+// Widths the backend generates for uploaded images (see /api/uploads/{filename}?w=)
+export const IMAGE_VARIANT_WIDTHS = [200, 400, 800, 1600];
+
+/**
+ * srcSet for an uploaded image, or undefined for external/static images.
+ * The backend serves the closest stored variant (WebP when accepted).
+ */
+export function getImageSrcSet(imageUrl) {
+  const url = getImageUrl(imageUrl, null);
+  if (!url || !/\/api\/uploads\/[^/]+\.jpg$/.test(url)) {
+    return undefined;
+  }
+  return IMAGE_VARIANT_WIDTHS.map((w) => `${url}?w=${w} ${w}w`).join(", ");
+}
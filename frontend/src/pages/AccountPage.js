@@ -105,11 +105,16 @@ export default function AccountPage() {
     
     setSaving(true);
     try {
-      await axios.put(`${API_URL}/api/auth/profile`, {
+      const response = await axios.put(`${API_URL}/api/auth/profile`, {
         name: editForm.name.trim(),
         phone: editForm.phone.trim() || null
       });
       
+      // The token carries the profile: keep the refreshed one
+      if (response.data.token) {
+        localStorage.setItem("auth_token", response.data.token);
+      }
+      
       // Refresh user data
       await checkAuth();
       setIsEditing(false);